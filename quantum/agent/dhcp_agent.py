@@ -17,6 +17,7 @@
 
 import os
 import socket
+import time
 import uuid
 
 import eventlet
@@ -48,12 +49,26 @@ NS_PREFIX = 'qdhcp-'
 METADATA_DEFAULT_PREFIX = 16
 METADATA_DEFAULT_IP = '169.254.169.254/%d' % METADATA_DEFAULT_PREFIX
 METADATA_PORT = 80
+# number of networks fetched by each get_networks_info call of a resync
+NETWORKS_PER_SYNC_CALL = 20
 
 
 class DhcpAgent(manager.Manager):
     OPTS = [
         cfg.IntOpt('resync_interval', default=5,
                    help=_("Interval to resync.")),
+        cfg.IntOpt('sync_workers', default=4,
+                   help=_("Number of networks synchronized concurrently. "
+                          "Networks receiving port events are synchronized "
+                          "first.")),
+        cfg.FloatOpt('dhcp_reload_delay', default=0.5,
+                     help=_("Seconds the reload of the allocations of a "
+                            "network waits for further port events, 0 to "
+                            "reload on each event.")),
+        cfg.FloatOpt('lease_update_interval', default=5.0,
+                     help=_("Seconds the lease expiration updates are "
+                            "buffered before being sent in a batch, 0 to "
+                            "send each update.")),
         cfg.StrOpt('dhcp_driver',
                    default='quantum.agent.linux.dhcp.Dnsmasq',
                    help=_("The driver used to manage the DHCP server.")),
@@ -75,6 +90,17 @@ class DhcpAgent(manager.Manager):
         self.needs_resync = False
         self.conf = cfg.CONF
         self.cache = NetworkCache()
+        self.pending_reloads = set()
+        self.sync_pool = eventlet.GreenPool(self.conf.sync_workers)
+        # networks of the current synchronization not picked up yet
+        self.sync_queue = []
+        self.sync_pending = set()
+        # networks receiving port events before they are synchronized
+        self.sync_priority = set()
+        self.sync_total = 0
+        self.sync_done = 0
+        # lease time remaining and time received, by network and address
+        self.pending_leases = {}
         self.root_helper = config.get_root_helper(self.conf)
         self.dhcp_driver_cls = importutils.import_class(self.conf.dhcp_driver)
         ctx = context.get_admin_context_without_session()
@@ -90,6 +116,7 @@ class DhcpAgent(manager.Manager):
         """Activate the DHCP agent."""
         self.sync_state()
         self.periodic_resync()
+        self.periodic_lease_flush()
         self.lease_relay.start()
 
     def _ns_name(self, network):
@@ -114,6 +141,11 @@ class DhcpAgent(manager.Manager):
             LOG.exception(_('Unable to %s dhcp.'), action)
 
     def update_lease(self, network_id, ip_address, time_remaining):
+        if self.conf.lease_update_interval > 0:
+            # a later renewal of the lease replaces the buffered one
+            self.pending_leases[(network_id, ip_address)] = (time_remaining,
+                                                             time.time())
+            return
         try:
             self.plugin_rpc.update_lease_expiration(network_id, ip_address,
                                                     time_remaining)
@@ -121,6 +153,35 @@ class DhcpAgent(manager.Manager):
             self.needs_resync = True
             LOG.exception(_('Unable to update lease'))
 
+    def flush_leases(self):
+        """Send the buffered lease expiration updates in one call."""
+        if not self.pending_leases:
+            return
+        pending, self.pending_leases = self.pending_leases, {}
+        now = time.time()
+        leases = [{'network_id': network_id,
+                   'ip_address': ip_address,
+                   'lease_remaining': max(0, int(time_remaining -
+                                                 (now - received)))}
+                  for (network_id, ip_address), (time_remaining, received)
+                  in pending.iteritems()]
+        try:
+            self.plugin_rpc.update_lease_expirations(leases)
+        except:
+            self.needs_resync = True
+            LOG.exception(_('Unable to update %d leases'), len(leases))
+
+    def _periodic_lease_flush_helper(self):
+        """Flush the lease updates at the configured interval."""
+        while True:
+            eventlet.sleep(self.conf.lease_update_interval)
+            self.flush_leases()
+
+    def periodic_lease_flush(self):
+        """Spawn a thread to periodically flush the lease updates."""
+        if self.conf.lease_update_interval > 0:
+            eventlet.spawn(self._periodic_lease_flush_helper)
+
     def sync_state(self):
         """Sync the local DHCP state with Quantum."""
         LOG.info(_('Synchronizing state'))
@@ -130,12 +191,65 @@ class DhcpAgent(manager.Manager):
             active_networks = set(self.plugin_rpc.get_active_networks())
             for deleted_id in known_networks - active_networks:
                 self.disable_dhcp_helper(deleted_id)
-
-            for network_id in active_networks:
-                self.refresh_dhcp_helper(network_id)
         except:
             self.needs_resync = True
             LOG.exception(_('Unable to sync network state.'))
+            return
+
+        # the queue is consumed from its end
+        self.sync_queue = sorted(active_networks,
+                                 key=lambda n: n in self.pending_reloads)
+        self.sync_pending = set(active_networks)
+        self.sync_total = len(active_networks)
+        self.sync_done = 0
+        workers = min(self.sync_pool.free(), len(self.sync_queue))
+        for i in xrange(workers):
+            self.sync_pool.spawn_n(self._sync_worker)
+        self.sync_pool.waitall()
+        LOG.info(_('Synchronized %d networks'), self.sync_done)
+
+    def _next_sync_networks(self):
+        """Pick the next networks to synchronize.
+
+        The networks which received port events go first.
+        """
+        network_ids = [network_id for network_id in self.sync_priority
+                       if network_id in self.sync_pending]
+        del network_ids[NETWORKS_PER_SYNC_CALL:]
+        self.sync_pending.difference_update(network_ids)
+        while len(network_ids) < NETWORKS_PER_SYNC_CALL and self.sync_queue:
+            network_id = self.sync_queue.pop()
+            if network_id in self.sync_pending:
+                self.sync_pending.remove(network_id)
+                network_ids.append(network_id)
+        self.sync_priority.difference_update(network_ids)
+        return network_ids
+
+    def _sync_worker(self):
+        while True:
+            network_ids = self._next_sync_networks()
+            if not network_ids:
+                return
+            try:
+                networks = self.plugin_rpc.get_networks_info(network_ids)
+            except:
+                self.needs_resync = True
+                LOG.exception(_('Networks %s RPC info call failed.'),
+                              network_ids)
+                networks = []
+            for network in networks:
+                try:
+                    self.refresh_dhcp_helper(network.id, network)
+                except:
+                    self.needs_resync = True
+                    LOG.exception(_('Unable to sync network %s.'),
+                                  network.id)
+            self.sync_done += len(network_ids)
+
+    def get_sync_progress(self):
+        """Return the progress of the current or last synchronization."""
+        return {'sync_networks': self.sync_total,
+                'sync_networks_done': self.sync_done}
 
     def _periodic_resync_helper(self):
         """Resync the dhcp state at the configured interval."""
@@ -149,14 +263,19 @@ class DhcpAgent(manager.Manager):
         """Spawn a thread to periodically resync the dhcp state."""
         eventlet.spawn(self._periodic_resync_helper)
 
-    def enable_dhcp_helper(self, network_id):
-        """Enable DHCP for a network that meets enabling criteria."""
-        try:
-            network = self.plugin_rpc.get_network_info(network_id)
-        except:
-            self.needs_resync = True
-            LOG.exception(_('Network %s RPC info call failed.'), network_id)
-            return
+    def enable_dhcp_helper(self, network_id, network=None):
+        """Enable DHCP for a network that meets enabling criteria.
+
+        network is the information of the network, if already fetched.
+        """
+        if network is None:
+            try:
+                network = self.plugin_rpc.get_network_info(network_id)
+            except:
+                self.needs_resync = True
+                LOG.exception(_('Network %s RPC info call failed.'),
+                              network_id)
+                return
 
         if not network.admin_state_up:
             return
@@ -178,22 +297,25 @@ class DhcpAgent(manager.Manager):
             if self.call_driver('disable', network):
                 self.cache.remove(network)
 
-    def refresh_dhcp_helper(self, network_id):
+    def refresh_dhcp_helper(self, network_id, network=None):
         """Refresh or disable DHCP for a network depending on the current state
         of the network.
 
+        network is the information of the network, if already fetched.
         """
         old_network = self.cache.get_network_by_id(network_id)
         if not old_network:
             # DHCP current not running for network.
-            return self.enable_dhcp_helper(network_id)
+            return self.enable_dhcp_helper(network_id, network)
 
-        try:
-            network = self.plugin_rpc.get_network_info(network_id)
-        except:
-            self.needs_resync = True
-            LOG.exception(_('Network %s RPC info call failed.'), network_id)
-            return
+        if network is None:
+            try:
+                network = self.plugin_rpc.get_network_info(network_id)
+            except:
+                self.needs_resync = True
+                LOG.exception(_('Network %s RPC info call failed.'),
+                              network_id)
+                return
 
         old_cidrs = set(s.cidr for s in old_network.subnets if s.enable_dhcp)
         new_cidrs = set(s.cidr for s in network.subnets if s.enable_dhcp)
@@ -239,13 +361,40 @@ class DhcpAgent(manager.Manager):
         if network:
             self.refresh_dhcp_helper(network.id)
 
+    def schedule_reload(self, network_id):
+        """Reload the allocations of a network after a short delay.
+
+        The port events received until the reload happens are served by the
+        same reload, so that a burst of events signals the DHCP server once.
+        """
+        if self.conf.dhcp_reload_delay <= 0:
+            return self._reload_allocations(network_id)
+        if network_id not in self.pending_reloads:
+            self.pending_reloads.add(network_id)
+            eventlet.spawn_after(self.conf.dhcp_reload_delay,
+                                 self._reload_allocations, network_id)
+
+    def _reload_allocations(self, network_id):
+        self.pending_reloads.discard(network_id)
+        network = self.cache.get_network_by_id(network_id)
+        if network:
+            self.call_driver('reload_allocations', network)
+
     def port_update_end(self, context, payload):
         """Handle the port.update.end notification event."""
         port = DictModel(payload['port'])
         network = self.cache.get_network_by_id(port.network_id)
-        if network:
+        if not network and port.network_id in self.sync_pending:
+            # the synchronization brings the port in
+            self.sync_priority.add(port.network_id)
+        elif network:
+            old_port = self.cache.get_port_by_id(port.id)
             self.cache.put_port(port)
-            self.call_driver('reload_allocations', network)
+            # updates of the name, status or device of a port do not change
+            # the DHCP configuration
+            if (not old_port or
+                _dhcp_allocations(old_port) != _dhcp_allocations(port)):
+                self.schedule_reload(network.id)
 
     # Use the update handler for the port create event.
     port_create_end = port_update_end
@@ -256,7 +405,7 @@ class DhcpAgent(manager.Manager):
         if port:
             network = self.cache.get_network_by_id(port.network_id)
             self.cache.remove_port(port)
-            self.call_driver('reload_allocations', network)
+            self.schedule_reload(network.id)
 
     def enable_isolated_metadata_proxy(self, network):
 
@@ -306,6 +455,12 @@ class DhcpAgent(manager.Manager):
         pm.disable()
 
 
+def _dhcp_allocations(port):
+    """Return the attributes of a port the DHCP server is configured with."""
+    return (port.mac_address,
+            sorted((ip.subnet_id, ip.ip_address) for ip in port.fixed_ips))
+
+
 class DhcpPluginApi(proxy.RpcProxy):
     """Agent side of the dhcp rpc API.
 
@@ -336,6 +491,15 @@ class DhcpPluginApi(proxy.RpcProxy):
                                                  host=self.host),
                                    topic=self.topic))
 
+    def get_networks_info(self, network_ids):
+        """Make a remote process call to retrieve the info of networks."""
+        networks = self.call(self.context,
+                             self.make_msg('get_networks_info',
+                                           network_ids=network_ids,
+                                           host=self.host),
+                             topic=self.topic)
+        return [DictModel(network) for network in networks]
+
     def get_dhcp_port(self, network_id, device_id):
         """Make a remote process call to create the dhcp port."""
         return DictModel(self.call(self.context,
@@ -374,6 +538,14 @@ class DhcpPluginApi(proxy.RpcProxy):
                                 host=self.host),
                   topic=self.topic)
 
+    def update_lease_expirations(self, leases):
+        """Make a remote process call to update a batch of ip leases."""
+        self.cast(self.context,
+                  self.make_msg('update_lease_expirations',
+                                leases=leases,
+                                host=self.host),
+                  topic=self.topic)
+
 
 class NetworkCache(object):
     """Agent cache of the current network state."""
@@ -676,6 +848,8 @@ class DhcpAgentWithStateReport(DhcpAgent):
         try:
             self.agent_state.get('configurations').update(
                 self.cache.get_state())
+            self.agent_state.get('configurations').update(
+                self.get_sync_progress())
             ctx = context.get_admin_context_without_session()
             self.state_rpc.report_state(ctx,
                                         self.agent_state)
@@ -683,7 +857,8 @@ class DhcpAgentWithStateReport(DhcpAgent):
             LOG.exception(_("Failed reporting state!"))
             return
         if self.agent_state.pop('start_flag', None):
-            self.run()
+            # keep reporting the state while the networks are synchronized
+            eventlet.spawn_n(self.run)
 
     def after_start(self):
         LOG.info(_("DHCP agent started"))
@@ -82,6 +82,15 @@ class FirewallDriver(object):
         """Stop filtering port"""
         raise NotImplementedError()
 
+    def update_security_group_members(self, sg_id, ips):
+        """Update the member ips of a source security group.
+
+        Only called when enable_ipset is set. The rules on a source group
+        are then passed to the driver with their source_group_id instead
+        of one rule per member ip.
+        """
+        pass
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule"""
         pass
@@ -124,6 +133,9 @@ class NoopFirewallDriver(FirewallDriver):
     def remove_port_filter(self, port):
         pass
 
+    def update_security_group_members(self, sg_id, ips):
+        pass
+
     def filter_defer_apply_on(self):
         pass
 
@@ -19,10 +19,12 @@
 #
 """
 
+import heapq
+import itertools
 import sys
+import time
 
 import eventlet
-from eventlet import semaphore
 import netaddr
 from oslo.config import cfg
 
@@ -52,6 +54,9 @@ LOG = logging.getLogger(__name__)
 NS_PREFIX = 'qrouter-'
 INTERNAL_DEV_PREFIX = 'qr-'
 EXTERNAL_DEV_PREFIX = 'qg-'
+# priorities of the queued routers, lower goes first
+PRIORITY_RPC = 0
+PRIORITY_SYNC = 1
 
 
 class L3PluginApi(proxy.RpcProxy):
@@ -78,6 +83,21 @@ class L3PluginApi(proxy.RpcProxy):
                                        router_ids=router_ids),
                          topic=self.topic)
 
+    def get_changed_routers(self, context, router_revisions, router_id=None):
+        """Make a remote process call to retrieve the changed routers.
+
+        router_revisions maps the ids of the routers known to the agent to
+        their revision. Returns a dict with the sync data of the routers
+        changed or added since, and the ids of the deleted ones.
+        """
+        router_ids = [router_id] if router_id else None
+        return self.call(context,
+                         self.make_msg('sync_changed_routers',
+                                       host=self.host,
+                                       router_revisions=router_revisions,
+                                       router_ids=router_ids),
+                         topic=self.topic)
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -113,6 +133,78 @@ class RouterInfo(object):
             return NS_PREFIX + self.router_id
 
 
+class RouterUpdateQueue(object):
+    """Priority queue of the routers waiting to be processed.
+
+    A router is queued at most once: queuing it again replaces its data
+    and keeps the more urgent of the two priorities. Router data doesn't
+    replace a queued deletion though, unless it is of a newer revision,
+    since it may have been fetched before the router was deleted. A router
+    which is being processed is not handed out again before done() is
+    called for it, so that two workers never work on the same router.
+    """
+
+    def __init__(self):
+        self._heap = []
+        # router id -> (priority, router, revision), router is None for a
+        # deletion
+        self._pending = {}
+        self._in_progress = set()
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def put(self, router_id, router, priority, revision=None):
+        """Queue the data of a router, or its deletion if router is None.
+
+        :param revision: for a deletion, the last known revision of the
+                         router.
+        """
+        queued = self._pending.get(router_id)
+        if router is not None:
+            revision = router.get('revision')
+            if queued and queued[1] is None and (
+                    revision is None or queued[2] is None or
+                    revision <= queued[2]):
+                LOG.debug(_("Ignoring data of deleted router %s"), router_id)
+                return
+        if queued and queued[0] <= priority:
+            self._pending[router_id] = (queued[0], router, revision)
+            return
+        self._pending[router_id] = (priority, router, revision)
+        heapq.heappush(self._heap,
+                       (priority, self._counter.next(), router_id))
+
+    def get(self):
+        """Return the id and data of the next router to process.
+
+        Returns None when every queued router is being processed.
+        """
+        busy = []
+        next_router = None
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            priority, _seq, router_id = entry
+            queued = self._pending.get(router_id)
+            if not queued or queued[0] != priority:
+                # superseded by a more urgent entry, or already handed out
+                continue
+            if router_id in self._in_progress:
+                busy.append(entry)
+                continue
+            del self._pending[router_id]
+            self._in_progress.add(router_id)
+            next_router = router_id, queued[1]
+            break
+        for entry in busy:
+            heapq.heappush(self._heap, entry)
+        return next_router
+
+    def done(self, router_id):
+        self._in_progress.discard(router_id)
+
+
 class L3NATAgent(manager.Manager):
 
     OPTS = [
@@ -146,6 +238,11 @@ class L3NATAgent(manager.Manager):
         cfg.StrOpt('l3_agent_manager',
                    default='quantum.agent.l3_agent.L3NATAgentWithStateReport',
                    help=_("The Quantum L3 Agent manager.")),
+        cfg.IntOpt('router_workers',
+                   default=4,
+                   help=_("Number of routers processed concurrently. "
+                          "Routers updated by the server are processed "
+                          "before the ones of a full synchronization.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -155,6 +252,10 @@ class L3NATAgent(manager.Manager):
             self.conf = cfg.CONF
         self.root_helper = config.get_root_helper(self.conf)
         self.router_info = {}
+        # revision of each router seen, processed or ignored by the agent
+        self.router_revisions = {}
+        # devices and addresses of the router namespaces found at startup
+        self.observed_routers = {}
 
         if not self.conf.interface_driver:
             raise SystemExit(_('An interface driver must be specified'))
@@ -169,11 +270,49 @@ class L3NATAgent(manager.Manager):
         self.context = context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.PLUGIN, host)
         self.fullsync = True
-        self.sync_sem = semaphore.Semaphore(1)
+        self.router_queue = RouterUpdateQueue()
+        self.router_pool = eventlet.GreenPool(self.conf.router_workers)
+        self.routers_processed = 0
+        self.router_process_time = 0.0
+        self.router_process_time_max = 0.0
         if self.conf.use_namespaces:
-            self._destroy_router_namespaces(self.conf.router_id)
+            self._load_router_namespaces(self.conf.router_id)
         super(L3NATAgent, self).__init__(host=self.conf.host)
 
+    def _load_router_namespaces(self, only_router_id=None):
+        """Record the state of the router namespaces found on the host.
+
+        The routers are taken over by the first processing of their sync
+        data, which only changes what differs from the recorded state.
+        Routers the server no longer has are destroyed, as are the
+        namespaces whose state cannot be read.
+        """
+        root_ip = ip_lib.IPWrapper(self.root_helper)
+        for ns in root_ip.get_namespaces(self.root_helper):
+            if not ns.startswith(NS_PREFIX):
+                continue
+            router_id = ns[len(NS_PREFIX):]
+            if only_router_id and router_id != only_router_id:
+                continue
+            try:
+                ns_ip = ip_lib.IPWrapper(self.root_helper, namespace=ns)
+                devices = dict(
+                    (d.name, set(addr['cidr'] for addr in d.addr.list()))
+                    for d in ns_ip.get_devices(exclude_loopback=True)
+                    if d.name.startswith((INTERNAL_DEV_PREFIX,
+                                          EXTERNAL_DEV_PREFIX)))
+            except Exception:
+                LOG.exception(_("Failed reading namespace '%s'"), ns)
+                try:
+                    self._destroy_router_namespace(ns)
+                except Exception:
+                    LOG.exception(_("Failed deleting namespace '%s'"), ns)
+                continue
+            self.observed_routers[router_id] = devices
+            # an unknown revision makes the server return the router, or
+            # report it deleted
+            self.router_revisions[router_id] = None
+
     def _destroy_router_namespaces(self, only_router_id=None):
         """Destroy router namespaces on the host to eliminate all stale
         linux devices, iptables rules, and namespaces.
@@ -237,8 +376,84 @@ class L3NATAgent(manager.Manager):
             ri.iptables_manager.ipv4['filter'].add_rule(c, r)
         for c, r in self.metadata_nat_rules():
             ri.iptables_manager.ipv4['nat'].add_rule(c, r)
+        devices = self.observed_routers.pop(router_id, None)
+        if devices is not None and router:
+            self._adopt_router_state(ri, devices)
         ri.iptables_manager.apply()
         self._spawn_metadata_proxy(ri)
+        return ri
+
+    def _adopt_router_state(self, ri, devices):
+        """Take over the state of a router found in its namespace.
+
+        devices maps the names of the router devices in the namespace to
+        their addresses. The interfaces, gateway and floating ips of
+        ri.router already in place are recorded in ri, and their iptables
+        rules rebuilt, without touching the devices: process_router then
+        only applies what differs. The devices and floating ip addresses
+        the router no longer has are removed.
+        """
+        internal_ports = [p for p in ri.router.get(l3_constants.INTERFACE_KEY,
+                                                   [])
+                          if p['admin_state_up'] and p['fixed_ips']]
+        for p in internal_ports:
+            self._set_subnet_info(p)
+            interface_name = self.get_internal_device_name(p['id'])
+            if p['ip_cidr'] in devices.get(interface_name, ()):
+                ri.internal_ports.append(p)
+        wanted_devices = set(self.get_internal_device_name(p['id'])
+                             for p in internal_ports)
+
+        ex_gw_port = self._get_ex_gw_port(ri)
+        if ex_gw_port and ex_gw_port['fixed_ips']:
+            self._set_subnet_info(ex_gw_port)
+            interface_name = self.get_external_device_name(ex_gw_port['id'])
+            wanted_devices.add(interface_name)
+            addresses = devices.get(interface_name, set())
+            if ex_gw_port['ip_cidr'] in addresses:
+                self._adopt_external_gateway(ri, ex_gw_port, interface_name,
+                                             addresses)
+
+        for name in set(devices) - wanted_devices:
+            LOG.debug(_("Removing stale device %(name)s of router "
+                        "%(router_id)s"),
+                      {'name': name, 'router_id': ri.router_id})
+            if name.startswith(INTERNAL_DEV_PREFIX):
+                self.driver.unplug(name, namespace=ri.ns_name(),
+                                   prefix=INTERNAL_DEV_PREFIX)
+            else:
+                self.driver.unplug(name,
+                                   bridge=self.conf.external_network_bridge,
+                                   namespace=ri.ns_name(),
+                                   prefix=EXTERNAL_DEV_PREFIX)
+
+    def _adopt_external_gateway(self, ri, ex_gw_port, interface_name,
+                                addresses):
+        ri.ex_gw_port = ex_gw_port
+        ex_gw_ip = ex_gw_port['fixed_ips'][0]['ip_address']
+        internal_cidrs = [p['ip_cidr'] for p in ri.internal_ports]
+        for c, r in self.external_gateway_nat_rules(ex_gw_ip, internal_cidrs,
+                                                    interface_name):
+            ri.iptables_manager.ipv4['nat'].add_rule(c, r)
+
+        wanted_addresses = set([ex_gw_port['ip_cidr']])
+        for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
+            ip_cidr = str(fip['floating_ip_address']) + '/32'
+            if not fip['port_id'] or ip_cidr not in addresses:
+                continue
+            ri.floating_ips.append(fip)
+            wanted_addresses.add(ip_cidr)
+            for chain, rule in self.floating_forward_rules(
+                    fip['floating_ip_address'], fip['fixed_ip_address']):
+                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule)
+
+        device = ip_lib.IPDevice(interface_name, self.root_helper,
+                                 namespace=ri.ns_name())
+        for ip_cidr in addresses - wanted_addresses:
+            if ip_cidr.endswith('/32'):
+                # a floating ip removed while the agent was down
+                net = netaddr.IPNetwork(ip_cidr)
+                device.addr.delete(net.version, ip_cidr)
 
     def _router_removed(self, router_id):
         ri = self.router_info[router_id]
@@ -546,29 +761,23 @@ class L3NATAgent(manager.Manager):
 
     def router_deleted(self, context, router_id):
         """Deal with router deletion RPC message."""
-        with self.sync_sem:
-            if router_id in self.router_info:
-                try:
-                    self._router_removed(router_id)
-                except Exception:
-                    msg = _("Failed dealing with router "
-                            "'%s' deletion RPC message")
-                    LOG.debug(msg, router_id)
-                    self.fullsync = True
+        revision = self.router_revisions.pop(router_id, None)
+        self.router_queue.put(router_id, None, PRIORITY_RPC, revision)
+        self._process_router_queue()
 
     def routers_updated(self, context, routers):
         """Deal with routers modification and creation RPC message."""
         if not routers:
             return
-        with self.sync_sem:
-            try:
-                self._process_routers(routers)
-            except Exception:
-                msg = _("Failed dealing with routers update RPC message")
-                LOG.debug(msg)
-                self.fullsync = True
+        try:
+            self._process_routers(routers)
+            self._process_router_queue()
+        except Exception:
+            msg = _("Failed dealing with routers update RPC message")
+            LOG.debug(msg)
+            self.fullsync = True
 
-    def _process_routers(self, routers):
+    def _process_routers(self, routers, priority=PRIORITY_RPC):
         if (self.conf.external_network_bridge and
             not ip_lib.device_exists(self.conf.external_network_bridge)):
             LOG.error(_("The external network bridge '%s' does not exist"),
@@ -578,47 +787,107 @@ class L3NATAgent(manager.Manager):
         target_ex_net_id = self._fetch_external_net_id()
 
         for r in routers:
-            if not r['admin_state_up']:
+            if 'revision' in r:
+                self.router_revisions[r['id']] = r['revision']
+            if self._router_ignored(r, target_ex_net_id):
+                if (r['id'] in self.router_info or
+                        r['id'] in self.observed_routers):
+                    self.router_queue.put(r['id'], None, priority,
+                                          r.get('revision'))
                 continue
+            self.router_queue.put(r['id'], r, priority)
 
-            # If namespaces are disabled, only process the router associated
-            # with the configured agent id.
-            if (not self.conf.use_namespaces and
-                r['id'] != self.conf.router_id):
-                continue
+    def _router_ignored(self, r, target_ex_net_id):
+        """Whether the agent does not implement a router."""
+        if not r['admin_state_up']:
+            return True
 
-            ex_net_id = (r['external_gateway_info'] or {}).get('network_id')
-            if not ex_net_id and not self.conf.handle_internal_only_routers:
-                continue
+        # If namespaces are disabled, only process the router associated
+        # with the configured agent id.
+        if (not self.conf.use_namespaces and
+            r['id'] != self.conf.router_id):
+            return True
 
-            if ex_net_id and ex_net_id != target_ex_net_id:
-                continue
+        ex_net_id = (r['external_gateway_info'] or {}).get('network_id')
+        if not ex_net_id and not self.conf.handle_internal_only_routers:
+            return True
 
-            if r['id'] not in self.router_info:
-                self._router_added(r['id'])
+        return bool(ex_net_id and ex_net_id != target_ex_net_id)
 
-            ri = self.router_info[r['id']]
-            ri.router = r
-            self.process_router(ri)
+    def _process_router_queue(self, wait=False):
+        """Process the queued routers with the pool of workers.
+
+        The workers run until the queue is empty, queuing more routers
+        meanwhile, for instance from a RPC message, makes them pick those
+        up in order of priority. With wait, returns once they are done;
+        RPC handlers don't wait, so as not to block on a full resync.
+        """
+        workers = min(self.router_pool.free(), len(self.router_queue))
+        for i in xrange(workers):
+            self.router_pool.spawn_n(self._router_worker)
+        if wait:
+            self.router_pool.waitall()
+
+    def _router_worker(self):
+        while True:
+            next_router = self.router_queue.get()
+            if not next_router:
+                return
+            router_id, router = next_router
+            start = time.time()
+            try:
+                self._process_router_update(router_id, router)
+            except Exception:
+                LOG.exception(_("Failed processing router '%s'"), router_id)
+                # have the next synchronization fetch the router again
+                self.router_revisions.pop(router_id, None)
+                self.fullsync = True
+            finally:
+                self.router_queue.done(router_id)
+            elapsed = time.time() - start
+            self.routers_processed += 1
+            self.router_process_time += elapsed
+            self.router_process_time_max = max(self.router_process_time_max,
+                                               elapsed)
+            LOG.debug(_("Processed router '%(router_id)s' in %(elapsed).3f "
+                        "seconds"), {'router_id': router_id,
+                                     'elapsed': elapsed})
+
+    def _process_router_update(self, router_id, router):
+        ri = self.router_info.get(router_id)
+        if router is None:
+            if ri:
+                self._router_removed(router_id)
+            elif self.observed_routers.pop(router_id, None) is not None:
+                self._destroy_router_namespace(NS_PREFIX + router_id)
+            return
+        if not ri:
+            ri = self._router_added(router_id, router)
+        ri.router = router
+        self.process_router(ri)
 
     @periodic_task.periodic_task
     def _sync_routers_task(self, context):
-        # we need to sync with router deletion RPC message
-        with self.sync_sem:
-            if self.fullsync:
-                try:
-                    if not self.conf.use_namespaces:
-                        router_id = self.conf.router_id
-                    else:
-                        router_id = None
-                    routers = self.plugin_rpc.get_routers(
-                        context, router_id)
-                    self.router_info = {}
-                    self._process_routers(routers)
-                    self.fullsync = False
-                except Exception:
-                    LOG.exception(_("Failed synchronizing routers"))
-                    self.fullsync = True
+        if self.fullsync:
+            # failures from now on require another synchronization
+            self.fullsync = False
+            try:
+                if not self.conf.use_namespaces:
+                    router_id = self.conf.router_id
+                else:
+                    router_id = None
+                # only the routers changed since last seen are returned
+                changes = self.plugin_rpc.get_changed_routers(
+                    context, dict(self.router_revisions), router_id)
+                for deleted_id in changes['deleted']:
+                    revision = self.router_revisions.pop(deleted_id, None)
+                    self.router_queue.put(deleted_id, None, PRIORITY_SYNC,
+                                          revision)
+                self._process_routers(changes['routers'], PRIORITY_SYNC)
+                self._process_router_queue(wait=True)
+            except Exception:
+                LOG.exception(_("Failed synchronizing routers"))
+                self.fullsync = True
 
     def after_start(self):
         LOG.info(_("L3 agent started"))
@@ -697,6 +966,21 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        # The processing times are logged rather than reported: they
+        # change on every report and the server only stores the
+        # configurations when they change
+        if self.routers_processed or self.router_queue:
+            LOG.debug(_("Processed %(processed)d routers since the last "
+                        "report, in %(avg).3f s on average and %(max).3f s "
+                        "at most; %(queued)d routers are queued"),
+                      {'processed': self.routers_processed,
+                       'avg': (self.router_process_time /
+                               max(self.routers_processed, 1)),
+                       'max': self.router_process_time_max,
+                       'queued': len(self.router_queue)})
+        self.routers_processed = 0
+        self.router_process_time = 0.0
+        self.router_process_time_max = 0.0
         try:
             self.state_rpc.report_state(self.context,
                                         self.agent_state)
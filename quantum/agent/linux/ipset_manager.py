@@ -0,0 +1,88 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from quantum.agent.linux import utils
+from quantum.common import constants
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+# ipset names are limited to 31 characters
+MAX_NAME_LEN = 31
+SET_FAMILY = {constants.IPv4: 'inet',
+              constants.IPv6: 'inet6'}
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps the members of the sets it created, so that an update of a set
+    only adds and deletes the ips which changed, all in a single call of
+    ipset restore.
+    """
+
+    def __init__(self, _execute=None, root_helper=None):
+        if _execute:
+            self.execute = _execute
+        else:
+            self.execute = utils.execute
+        self.root_helper = root_helper
+        # name of the set -> set of its member ips
+        self.ipsets = {}
+
+    @staticmethod
+    def get_name(id, ethertype):
+        """Return the name of the set of the given id and ethertype."""
+        return ('%s%s' % (ethertype, id))[:MAX_NAME_LEN]
+
+    def set_exists(self, name):
+        return name in self.ipsets
+
+    def set_members(self, name, ethertype, member_ips):
+        """Create the set if needed and make member_ips its members."""
+        member_ips = set(member_ips)
+        commands = []
+        if name in self.ipsets:
+            current_ips = self.ipsets[name]
+        else:
+            # the set may be left over from a previous run
+            LOG.debug(_("Creating ipset %s"), name)
+            commands += ['create %s hash:ip family %s' %
+                         (name, SET_FAMILY[ethertype]),
+                         'flush %s' % name]
+            current_ips = set()
+        commands += ['add %s %s' % (name, ip)
+                     for ip in member_ips - current_ips]
+        commands += ['del %s %s' % (name, ip)
+                     for ip in current_ips - member_ips]
+        if commands:
+            self._restore(commands)
+        self.ipsets[name] = member_ips
+
+    def destroy(self, name):
+        """Destroy the set, it must not be used by iptables anymore."""
+        if name not in self.ipsets:
+            return
+        LOG.debug(_("Destroying ipset %s"), name)
+        self.execute(['ipset', 'destroy', name],
+                     root_helper=self.root_helper)
+        del self.ipsets[name]
+
+    def _restore(self, commands):
+        self.execute(['ipset', 'restore', '-exist'],
+                     process_input='\n'.join(commands) + '\n',
+                     root_helper=self.root_helper)
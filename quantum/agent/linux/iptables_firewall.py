@@ -19,15 +19,20 @@ import netaddr
 from oslo.config import cfg
 
 from quantum.agent import firewall
+from quantum.agent.linux import ipset_manager
 from quantum.agent.linux import iptables_manager
 from quantum.common import constants
 from quantum.openstack.common import log as logging
 
 
+cfg.CONF.import_opt('enable_ipset', 'quantum.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
 LOG = logging.getLogger(__name__)
 SG_CHAIN = 'sg-chain'
 INGRESS_DIRECTION = 'ingress'
 EGRESS_DIRECTION = 'egress'
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o'}
 LINUX_DEV_LEN = 14
@@ -42,9 +47,15 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.iptables = iptables_manager.IptablesManager(
             root_helper=cfg.CONF.AGENT.root_helper,
             use_ipv6=True)
+        self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
         # list of port which has security group
         self.filtered_ports = {}
         self._add_fallback_chain_v4v6()
+        self._add_chain_by_name_v4v6(SG_CHAIN)
+        self._add_rule_to_chain_v4v6(SG_CHAIN, ['-j ACCEPT'], ['-j ACCEPT'])
 
     @property
     def ports(self):
@@ -52,11 +63,14 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
 
     def prepare_port_filter(self, port):
         LOG.debug(_("Preparing device (%s) filter"), port['device'])
-        self._remove_chains()
+        old_port = self.filtered_ports.get(port['device'])
+        if old_port:
+            # the agent prepares the filters of all its ports again on resync
+            self._remove_chains(old_port)
         self.filtered_ports[port['device']] = port
         # each security group has it own chains
-        self._setup_chains()
-        self.iptables.apply()
+        self._setup_chains(port)
+        self._apply()
 
     def update_port_filter(self, port):
         LOG.debug(_("Updating device (%s) filter"), port['device'])
@@ -64,10 +78,10 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             LOG.info(_('Attempted to update port filter which is not '
                        'filtered %s'), port['device'])
             return
-        self._remove_chains()
+        self._remove_chains(self.filtered_ports[port['device']])
         self.filtered_ports[port['device']] = port
-        self._setup_chains()
-        self.iptables.apply()
+        self._setup_chains(port)
+        self._apply()
 
     def remove_port_filter(self, port):
         LOG.debug(_("Removing device (%s) filter"), port['device'])
@@ -75,34 +89,69 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             LOG.info(_('Attempted to remove port filter which is not '
                        'filtered %r'), port)
             return
-        self._remove_chains()
-        self.filtered_ports.pop(port['device'], None)
-        self._setup_chains()
+        self._remove_chains(self.filtered_ports.pop(port['device']))
+        self._apply()
+
+    def update_security_group_members(self, sg_id, ips):
+        LOG.debug(_("Updating members of security group %s"), sg_id)
+        if not self.enable_ipset:
+            return
+        for ethertype in (constants.IPv4, constants.IPv6):
+            self.ipset.set_members(
+                self.ipset.get_name(sg_id, ethertype), ethertype,
+                [ip for ip in ips
+                 if 'IPv%s' % netaddr.IPAddress(ip).version == ethertype])
+
+    def _apply(self):
         self.iptables.apply()
+        if not self.iptables.iptables_apply_deferred:
+            self._remove_unused_ipsets()
 
-    def _setup_chains(self):
-        """Setup ingress and egress chain for a port. """
-        self._add_chain_by_name_v4v6(SG_CHAIN)
-        for port in self.filtered_ports.values():
-            self._setup_chain(port, INGRESS_DIRECTION)
-            self._setup_chain(port, EGRESS_DIRECTION)
-            self.iptables.ipv4['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
-            self.iptables.ipv6['filter'].add_rule(SG_CHAIN, '-j ACCEPT')
+    def _remove_unused_ipsets(self):
+        """Destroy the sets no rule refers to anymore.
 
-    def _remove_chains(self):
-        """Remove ingress and egress chain for a port"""
+        This must be done once iptables has been applied, the kernel does
+        not destroy a set which is still used by a rule.
+        """
+        if not self.enable_ipset:
+            return
+        used = set()
         for port in self.filtered_ports.values():
-            self._remove_chain(port, INGRESS_DIRECTION)
-            self._remove_chain(port, EGRESS_DIRECTION)
-        self._remove_chain_by_name_v4v6(SG_CHAIN)
+            for rule in port.get('security_group_rules', []):
+                if rule.get('source_group_id'):
+                    used.add(self._ipset_name(rule))
+        for name in self.ipset.ipsets.keys():
+            if name not in used:
+                self.ipset.destroy(name)
+
+    def _setup_chains(self, port):
+        """Setup ingress and egress chain for a port.
+
+        Only the chains of the given port are touched, the accept rule is
+        moved behind them so that it stays the last rule of SG_CHAIN.
+        """
+        self._remove_rule_from_chain_v4v6(SG_CHAIN, ['-j ACCEPT'],
+                                          ['-j ACCEPT'])
+        self._setup_chain(port, INGRESS_DIRECTION)
+        self._setup_chain(port, EGRESS_DIRECTION)
+        self._add_rule_to_chain_v4v6(SG_CHAIN, ['-j ACCEPT'], ['-j ACCEPT'])
+
+    def _remove_chains(self, port):
+        """Remove ingress and egress chain for a port"""
+        self._remove_chain(port, INGRESS_DIRECTION)
+        self._remove_chain(port, EGRESS_DIRECTION)
 
     def _setup_chain(self, port, DIRECTION):
         self._add_chain(port, DIRECTION)
         self._add_rule_by_security_group(port, DIRECTION)
 
     def _remove_chain(self, port, DIRECTION):
+        # removing the chain also removes the rules jumping to it, only
+        # the jump to SG_CHAIN is left to be removed
         chain_name = self._port_chain_name(port, DIRECTION)
         self._remove_chain_by_name_v4v6(chain_name)
+        jump_rule = [self._sg_chain_jump_rule(port, DIRECTION)]
+        self._remove_rule_from_chain_v4v6('FORWARD', jump_rule, jump_rule)
 
     def _add_fallback_chain_v4v6(self):
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
@@ -125,6 +174,14 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         for rule in ipv6_rules:
             self.iptables.ipv6['filter'].add_rule(chain_name, rule)
 
+    def _remove_rule_from_chain_v4v6(self, chain_name, ipv4_rules,
+                                     ipv6_rules):
+        for rule in ipv4_rules:
+            self.iptables.ipv4['filter'].remove_rule(chain_name, rule)
+
+        for rule in ipv6_rules:
+            self.iptables.ipv6['filter'].remove_rule(chain_name, rule)
+
     def _get_device_name(self, port):
         return port['device']
 
@@ -138,14 +195,11 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         # We accept the packet at the end of SG_CHAIN.
 
         # jump to the security group chain
-        device = self._get_device_name(port)
-        jump_rule = ['-m physdev --physdev-is-bridged --%s '
-                     '%s -j $%s' % (self.IPTABLES_DIRECTION[direction],
-                                    device,
-                                    SG_CHAIN)]
+        jump_rule = [self._sg_chain_jump_rule(port, direction)]
         self._add_rule_to_chain_v4v6('FORWARD', jump_rule, jump_rule)
 
         # jump to the chain based on the device
+        device = self._get_device_name(port)
         jump_rule = ['-m physdev --physdev-is-bridged --%s '
                      '%s -j $%s' % (self.IPTABLES_DIRECTION[direction],
                                     device,
@@ -155,6 +209,12 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         if direction == EGRESS_DIRECTION:
             self._add_rule_to_chain_v4v6('INPUT', jump_rule, jump_rule)
 
+    def _sg_chain_jump_rule(self, port, direction):
+        return ('-m physdev --physdev-is-bridged --%s '
+                '%s -j $%s' % (self.IPTABLES_DIRECTION[direction],
+                               self._get_device_name(port),
+                               SG_CHAIN))
+
     def _split_sgr_by_ethertype(self, security_group_rules):
         ipv4_sg_rules = []
         ipv6_sg_rules = []
@@ -234,6 +294,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                         rule.get('source_ip_prefix'))
             args += self._ip_prefix_arg('d',
                                         rule.get('dest_ip_prefix'))
+            args += self._source_group_arg(rule)
             iptables_rules += [' '.join(args)]
 
         iptables_rules += ['-j $sg-fallback']
@@ -273,6 +334,18 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             return ['-%s' % direction, ip_prefix]
         return []
 
+    def _source_group_arg(self, rule):
+        #NOTE: source_group_id is only left in the rules when ipset is
+        # enabled, the rule then matches the set of the group members
+        if not (self.enable_ipset and rule.get('source_group_id')):
+            return []
+        return ['-m set', '--match-set', self._ipset_name(rule),
+                IPSET_DIRECTION[rule['direction']]]
+
+    def _ipset_name(self, rule):
+        return self.ipset.get_name(rule['source_group_id'],
+                                   rule['ethertype'])
+
     def _port_chain_name(self, port, direction):
         return '%s%s' % (CHAIN_NAME_PREFIX[direction],
                          port['device'][3:])
@@ -282,6 +355,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
 
     def filter_defer_apply_off(self):
         self.iptables.defer_apply_off()
+        self._remove_unused_ipsets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -73,12 +73,18 @@ class IptablesRule(object):
 
 
 class IptablesTable(object):
-    """An iptables table."""
+    """An iptables table.
+
+    The table is dirty when its rules or chains changed since the last time
+    IptablesManager applied it. Tables that are not dirty are skipped.
+
+    """
 
     def __init__(self):
         self.rules = []
         self.chains = set()
         self.unwrapped_chains = set()
+        self.dirty = True
 
     def add_chain(self, name, wrap=True):
         """Adds a named chain to the table.
@@ -93,10 +99,10 @@ class IptablesTable(object):
 
         """
         name = name[:MAX_CHAIN_LEN]
-        if wrap:
-            self.chains.add(name)
-        else:
-            self.unwrapped_chains.add(name)
+        chain_set = self._select_chain_set(wrap)
+        if name not in chain_set:
+            chain_set.add(name)
+            self.dirty = True
 
     def _select_chain_set(self, wrap):
         if wrap:
@@ -135,13 +141,14 @@ class IptablesTable(object):
             return
 
         chain_set.remove(name)
-        self.rules = filter(lambda r: r.chain != name, self.rules)
         if wrap:
             jump_snippet = '-j %s-%s' % (binary_name, name)
         else:
             jump_snippet = '-j %s' % (name,)
 
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        self.rules = [r for r in self.rules
+                      if r.chain != name and jump_snippet not in r.rule]
+        self.dirty = True
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
@@ -161,6 +168,7 @@ class IptablesTable(object):
             rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
 
         self.rules.append(IptablesRule(chain, rule, wrap, top))
+        self.dirty = True
 
     def _wrap_target_chain(self, s):
         if s.startswith('$'):
@@ -175,8 +183,12 @@ class IptablesTable(object):
         CLI tool.
 
         """
+        if '$' in rule:
+            rule = ' '.join(map(self._wrap_target_chain, rule.split(' ')))
+
         try:
             self.rules.remove(IptablesRule(chain, rule, wrap, top))
+            self.dirty = True
         except ValueError:
             LOG.warn(_('Tried to remove rule that was not there:'
                        ' %(chain)r %(rule)r %(wrap)r %(top)r'),
@@ -186,10 +198,11 @@ class IptablesTable(object):
     def empty_chain(self, chain, wrap=True):
         """Remove all rules from a chain."""
         chain = chain[:MAX_CHAIN_LEN]
-        chained_rules = [rule for rule in self.rules
-                         if rule.chain == chain and rule.wrap == wrap]
-        for rule in chained_rules:
-            self.rules.remove(rule)
+        rules = [rule for rule in self.rules
+                 if rule.chain != chain or rule.wrap != wrap]
+        if len(rules) != len(self.rules):
+            self.rules = rules
+            self.dirty = True
 
 
 class IptablesManager(object):
@@ -305,7 +318,8 @@ class IptablesManager(object):
 
         This will blow away any rules left over from previous runs of the
         same component of Nova, and replace them with our current set of
-        rules. This happens atomically, thanks to iptables-restore.
+        rules. This happens atomically, thanks to iptables-restore. Tables
+        which did not change since they were last applied are left alone.
 
         """
         s = [('iptables', self.ipv4)]
@@ -314,6 +328,8 @@ class IptablesManager(object):
 
         for cmd, tables in s:
             for table in tables:
+                if not tables[table].dirty:
+                    continue
                 args = ['%s-save' % cmd, '-t', table]
                 if self.namespace:
                     args = ['ip', 'netns', 'exec', self.namespace] + args
@@ -328,6 +344,7 @@ class IptablesManager(object):
                 self.execute(args,
                              process_input='\n'.join(new_filter),
                              root_helper=self.root_helper)
+                tables[table].dirty = False
         LOG.debug(_("IPTablesManager.apply completed with success"))
 
     def _modify_rules(self, current_lines, table, binary=None):
@@ -335,9 +352,18 @@ class IptablesManager(object):
         chains = table.chains
         rules = table.rules
 
+        our_rules = [str(rule) for rule in rules]
+        # rule.top == True means we want this rule to be at the top.
+        # Further down, we weed out duplicates from the bottom of the
+        # list, so here we remove the dupes ahead of time.
+        top_rules = set(rule_str.strip()
+                        for rule, rule_str in zip(rules, our_rules)
+                        if rule.top)
+
         # Remove any trace of our rules
-        new_filter = filter(lambda line: binary_name
-                            not in line, current_lines)
+        new_filter = [line for line in current_lines
+                      if binary_name not in line and
+                      line.strip() not in top_rules]
 
         seen_chains = False
         rules_index = 0
@@ -349,38 +375,19 @@ class IptablesManager(object):
                 if not rule.startswith(':'):
                     break
 
-        our_rules = []
-        for rule in rules:
-            rule_str = str(rule)
-            if rule.top:
-                # rule.top == True means we want this rule to be at the top.
-                # Further down, we weed out duplicates from the bottom of the
-                # list, so here we remove the dupes ahead of time.
-                new_filter = filter(lambda s: s.strip() != rule_str.strip(),
-                                    new_filter)
-            our_rules += [rule_str]
-
-        new_filter[rules_index:rules_index] = our_rules
-
-        new_filter[rules_index:rules_index] = [':%s - [0:0]' % (name)
-                                               for name in unwrapped_chains]
-        new_filter[rules_index:rules_index] = [':%s-%s - [0:0]' %
-                                               (binary_name, name)
-                                               for name in chains]
-
-        seen_lines = set()
-
-        def _weed_out_duplicates(line):
-            line = line.strip()
-            if line in seen_lines:
-                return False
-            else:
-                seen_lines.add(line)
-                return True
+        new_filter[rules_index:rules_index] = (
+            [':%s-%s - [0:0]' % (binary_name, name) for name in chains] +
+            [':%s - [0:0]' % (name) for name in unwrapped_chains] +
+            our_rules)
 
         # We filter duplicates, letting the *last* occurrence take
         # precedence.
-        new_filter.reverse()
-        new_filter = filter(_weed_out_duplicates, new_filter)
-        new_filter.reverse()
-        return new_filter
+        seen_lines = set()
+        unique_lines = []
+        for line in reversed(new_filter):
+            stripped = line.strip()
+            if stripped not in seen_lines:
+                seen_lines.add(stripped)
+                unique_lines.append(line)
+        unique_lines.reverse()
+        return unique_lines
@@ -18,9 +18,18 @@
 # @author: Dan Wendlandt, Nicira Networks, Inc.
 # @author: Dave Lapsley, Nicira Networks, Inc.
 
+import contextlib
+import itertools
 import re
+import shlex
+
+import eventlet
+from eventlet.green import subprocess
+from eventlet import queue
 
 from quantum.agent.linux import utils
+from quantum.common import utils as q_utils
+from quantum.openstack.common import jsonutils
 from quantum.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
@@ -46,6 +55,9 @@ class OVSBridge:
         self.br_name = br_name
         self.root_helper = root_helper
         self.re_id = self.re_compile_id()
+        self._batch_depth = 0
+        self._vsctl_batch = []
+        self._flows_batch = []
 
     def re_compile_id(self):
         external = 'external_ids\s*'
@@ -57,13 +69,77 @@ class OVSBridge:
                ' \s+ %(name)s \s+ %(port)s' % locals())
         return re.compile(_re, re.M | re.X)
 
-    def run_vsctl(self, args):
+    def run_vsctl(self, args, check_error=False):
         full_args = ["ovs-vsctl", "--timeout=2"] + args
         try:
             return utils.execute(full_args, root_helper=self.root_helper)
         except Exception, e:
             LOG.error(_("Unable to execute %(cmd)s. Exception: %(exception)s"),
                       {'cmd': full_args, 'exception': e})
+            if check_error:
+                raise
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Queue changes to the bridge and apply them when the block exits.
+
+        Database changes are joined into a single ovs-vsctl transaction and
+        flow mods are fed to ovs-ofctl add-flows/del-flows on stdin, so a
+        block wiring many ports only costs a handful of commands. Queries
+        still run immediately and don't see the queued changes. Batches
+        may be nested, the outermost one applies the changes.
+
+        If the transaction fails, e.g. because one of the ports went away,
+        its commands are run one by one and the error of the last failing
+        one is raised once the rest of the batch is applied.
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self._apply_batch()
+
+    def _apply_batch(self):
+        vsctl_batch, self._vsctl_batch = self._vsctl_batch, []
+        flows_batch, self._flows_batch = self._flows_batch, []
+        error = None
+        if vsctl_batch:
+            args = []
+            for cmd in vsctl_batch:
+                if cmd[0] != "--":
+                    args.append("--")
+                args.extend(cmd)
+            try:
+                self.run_vsctl(args, check_error=True)
+            except Exception:
+                LOG.warn(_("Applying the ovs-vsctl commands queued for "
+                           "%s one by one"), self.br_name)
+                for cmd in vsctl_batch:
+                    try:
+                        self.run_vsctl(cmd, check_error=True)
+                    except Exception, e:
+                        error = e
+        # Consecutive mods of the same kind are applied by a single call,
+        # keeping additions and deletions in order. Deleting all flows has
+        # no flow expression and so can't be read from stdin.
+        for action, mods in itertools.groupby(
+                flows_batch, lambda mod: mod[0] if mod[1] else None):
+            if action:
+                flows = "".join("%s\n" % flow_str for _act, flow_str in mods)
+                self.run_ofctl("%s-flows" % action, ["-"],
+                               process_input=flows)
+            else:
+                self.run_ofctl("del-flows", [])
+        if error:
+            raise error
+
+    def _run_or_queue_vsctl(self, args):
+        if self._batch_depth:
+            self._vsctl_batch.append(args)
+        else:
+            self.run_vsctl(args)
 
     def reset_bridge(self):
         self.run_vsctl(["--", "--if-exists", "del-br", self.br_name])
@@ -75,21 +151,24 @@ class OVSBridge:
         return self.get_port_ofport(port_name)
 
     def delete_port(self, port_name):
-        self.run_vsctl(["--", "--if-exists", "del-port", self.br_name,
-                        port_name])
+        self._run_or_queue_vsctl(["--", "--if-exists", "del-port",
+                                  self.br_name, port_name])
 
     def set_db_attribute(self, table_name, record, column, value):
         args = ["set", table_name, record, "%s=%s" % (column, value)]
-        self.run_vsctl(args)
+        self._run_or_queue_vsctl(args)
 
     def clear_db_attribute(self, table_name, record, column):
         args = ["clear", table_name, record, column]
-        self.run_vsctl(args)
+        self._run_or_queue_vsctl(args)
 
-    def run_ofctl(self, cmd, args):
+    def run_ofctl(self, cmd, args, process_input=None):
         full_args = ["ovs-ofctl", cmd, self.br_name] + args
         try:
-            return utils.execute(full_args, root_helper=self.root_helper)
+            if process_input is None:
+                return utils.execute(full_args, root_helper=self.root_helper)
+            return utils.execute(full_args, root_helper=self.root_helper,
+                                 process_input=process_input)
         except Exception, e:
             LOG.error(_("Unable to execute %(cmd)s. Exception: %(exception)s"),
                       {'cmd': full_args, 'exception': e})
@@ -99,7 +178,10 @@ class OVSBridge:
         return len(flow_list) - 1
 
     def remove_all_flows(self):
-        self.run_ofctl("del-flows", [])
+        if self._batch_depth:
+            self._flows_batch.append(("del", None))
+        else:
+            self.run_ofctl("del-flows", [])
 
     def get_port_ofport(self, port_name):
         return self.db_get_val("Interface", port_name, "ofport")
@@ -149,7 +231,10 @@ class OVSBridge:
         flow_expr_arr = self._build_flow_expr_arr(**kwargs)
         flow_expr_arr.append("actions=%s" % (kwargs["actions"]))
         flow_str = ",".join(flow_expr_arr)
-        self.run_ofctl("add-flow", [flow_str])
+        if self._batch_depth:
+            self._flows_batch.append(("add", flow_str))
+        else:
+            self.run_ofctl("add-flow", [flow_str])
 
     def delete_flows(self, **kwargs):
         kwargs['delete'] = True
@@ -157,23 +242,22 @@ class OVSBridge:
         if "actions" in kwargs:
             flow_expr_arr.append("actions=%s" % (kwargs["actions"]))
         flow_str = ",".join(flow_expr_arr)
-        self.run_ofctl("del-flows", [flow_str])
+        if self._batch_depth:
+            self._flows_batch.append(("del", flow_str))
+        else:
+            self.run_ofctl("del-flows", [flow_str])
 
     def add_tunnel_port(self, port_name, remote_ip):
-        self.run_vsctl(["add-port", self.br_name, port_name])
-        self.set_db_attribute("Interface", port_name, "type", "gre")
-        self.set_db_attribute("Interface", port_name, "options:remote_ip",
-                              remote_ip)
-        self.set_db_attribute("Interface", port_name, "options:in_key", "flow")
-        self.set_db_attribute("Interface", port_name, "options:out_key",
-                              "flow")
+        self.run_vsctl(["--", "add-port", self.br_name, port_name,
+                        "--", "set", "Interface", port_name, "type=gre",
+                        "options:remote_ip=%s" % remote_ip,
+                        "options:in_key=flow", "options:out_key=flow"])
         return self.get_port_ofport(port_name)
 
     def add_patch_port(self, local_name, remote_name):
-        self.run_vsctl(["add-port", self.br_name, local_name])
-        self.set_db_attribute("Interface", local_name, "type", "patch")
-        self.set_db_attribute("Interface", local_name, "options:peer",
-                              remote_name)
+        self.run_vsctl(["--", "add-port", self.br_name, local_name,
+                        "--", "set", "Interface", local_name, "type=patch",
+                        "options:peer=%s" % remote_name])
         return self.get_port_ofport(local_name)
 
     def db_get_map(self, table, record, column):
@@ -238,19 +322,24 @@ class OVSBridge:
 
         return edge_ports
 
+    def get_vif_id(self, external_ids):
+        """Return the VIF id of an interface given its external_ids."""
+        if "iface-id" in external_ids and "attached-mac" in external_ids:
+            return external_ids['iface-id']
+        elif ("xs-vif-uuid" in external_ids and
+              "attached-mac" in external_ids):
+            # if this is a xenserver and iface-id is not automatically
+            # synced to OVS from XAPI, we grab it from XAPI directly
+            return self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
+
     def get_vif_port_set(self):
         edge_ports = set()
         port_names = self.get_port_name_list()
         for name in port_names:
             external_ids = self.db_get_map("Interface", name, "external_ids")
-            if "iface-id" in external_ids and "attached-mac" in external_ids:
-                edge_ports.add(external_ids['iface-id'])
-            elif ("xs-vif-uuid" in external_ids and
-                  "attached-mac" in external_ids):
-                # if this is a xenserver and iface-id is not automatically
-                # synced to OVS from XAPI, we grab it from XAPI directly
-                iface_id = self.get_xapi_iface_id(external_ids["xs-vif-uuid"])
-                edge_ports.add(iface_id)
+            vif_id = self.get_vif_id(external_ids)
+            if vif_id:
+                edge_ports.add(vif_id)
         return edge_ports
 
     def get_vif_port_by_id(self, port_id):
@@ -281,6 +370,94 @@ class OVSBridge:
             self.delete_port(port_name)
 
 
+class InterfaceMonitor(object):
+    """Stream changes of the OVS Interface table.
+
+    A long running 'ovsdb-client monitor' process reports every row of the
+    Interface table that is inserted, modified or deleted. Each change is
+    queued as an (added, external_ids) tuple, where added is False for
+    deleted rows, and handed out by get_events().
+    """
+
+    def __init__(self, root_helper):
+        self.root_helper = root_helper
+        self._process = None
+        self._events = queue.LightQueue()
+        self._external_ids = {}
+
+    @property
+    def is_active(self):
+        return self._process is not None
+
+    def start(self):
+        cmd = ['ovsdb-client', 'monitor', 'Interface', 'name,external_ids',
+               '--format=json']
+        if self.root_helper:
+            cmd = shlex.split(self.root_helper) + cmd
+        LOG.debug(_("Running command: %s"), cmd)
+        self._external_ids = {}
+        self._process = q_utils.subprocess_popen(cmd,
+                                                 stdout=subprocess.PIPE)
+        eventlet.spawn_n(self._read_events, self._process)
+
+    def stop(self):
+        process = self._process
+        self._process = None
+        if process:
+            # ovsdb-client exits on its next write to the closed pipe
+            process.stdout.close()
+
+    def _read_events(self, process):
+        for line in iter(process.stdout.readline, ''):
+            try:
+                self._parse_update(jsonutils.loads(line))
+            except (ValueError, TypeError):
+                LOG.warn(_("Unable to parse ovsdb-client output: %s"), line)
+        if self._process is process:
+            LOG.warn(_("ovsdb-client monitor exited unexpectedly"))
+            self._process = None
+
+    @staticmethod
+    def _to_map(value):
+        # OVSDB JSON encodes maps as ["map", [[key, value], ...]]
+        if isinstance(value, list) and len(value) == 2 and value[0] == 'map':
+            return dict(value[1])
+        return {}
+
+    def _parse_update(self, update):
+        headings = update.get('headings', [])
+        for row in update.get('data', []):
+            values = dict(zip(headings, row))
+            uuid = values.get('row')
+            action = values.get('action')
+            if action == 'delete':
+                external_ids = (self._external_ids.pop(uuid, None) or
+                                self._to_map(values.get('external_ids')))
+                self._events.put((False, external_ids))
+            elif action in ('initial', 'insert', 'new'):
+                if 'external_ids' in values:
+                    external_ids = self._to_map(values['external_ids'])
+                else:
+                    external_ids = self._external_ids.get(uuid, {})
+                self._external_ids[uuid] = external_ids
+                self._events.put((True, external_ids))
+
+    def get_events(self, timeout=None):
+        """Return the queued events.
+
+        If none are queued, wait up to timeout seconds for the first one.
+        """
+        events = []
+        try:
+            if timeout:
+                events.append(self._events.get(timeout=timeout))
+            while True:
+                events.append(self._events.get_nowait())
+        except queue.Empty:
+            pass
+        return events
+
+
 def get_bridge_for_iface(root_helper, iface):
     args = ["ovs-vsctl", "--timeout=2", "iface-to-br", iface]
     try:
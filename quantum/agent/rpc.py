@@ -69,6 +69,8 @@ class PluginApi(proxy.RpcProxy):
 
     API version history:
         1.0 - Initial version.
+        1.2 - get_devices_details_list (1.1 is the security group rpc
+              version served by the same plugin callbacks).
 
     '''
 
@@ -84,6 +86,12 @@ class PluginApi(proxy.RpcProxy):
                                        agent_id=agent_id),
                          topic=self.topic)
 
+    def get_devices_details_list(self, context, devices, agent_id):
+        return self.call(context,
+                         self.make_msg('get_devices_details_list',
+                                       devices=devices, agent_id=agent_id),
+                         topic=self.topic, version='1.2')
+
     def update_device_down(self, context, device, agent_id):
         return self.call(context,
                          self.make_msg('update_device_down', device=device,
@@ -16,19 +16,36 @@
 #    under the License.
 #
 
+import netaddr
 from oslo.config import cfg
 
+from quantum.common import constants
 from quantum.common import topics
 from quantum.openstack.common import importutils
 from quantum.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+# version of the plugin rpc api which provides security_group_info_for_*
+SG_INFO_RPC_VERSION = "1.2"
+
+IP_MASK = {constants.IPv4: 32,
+           constants.IPv6: 128}
+
+DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
+                       'egress': 'dest_ip_prefix'}
 
 security_group_opts = [
     cfg.StrOpt(
         'firewall_driver',
-        default='quantum.agent.firewall.NoopFirewallDriver')
+        default='quantum.agent.firewall.NoopFirewallDriver'),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_("Match the rules on a source security group against an "
+               "ipset of its member ips, instead of one rule per member. "
+               "Requires the ipset tool and a firewall driver which "
+               "supports it.")),
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -45,6 +62,145 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
+    def security_group_info_for_groups(self, context, security_groups):
+        LOG.debug(_("Get security group information "
+                    "for security groups via rpc %r"), security_groups)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_groups',
+                                       security_groups=security_groups),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
+
+class SecurityGroupInfoCache(object):
+    """Security groups, rules and members of the ports of an agent.
+
+    The rules of each security group and the member ips of each source
+    group are kept once, as returned by the security_group_info_for_*
+    calls, so that an update of a group only needs the information of
+    that group. The port dicts expected by the firewall driver are built
+    from them on demand.
+    """
+
+    def __init__(self):
+        self.devices = {}
+        self.security_groups = {}
+        self.sg_member_ips = {}
+
+    def update(self, info):
+        for device in info.get('devices', {}).values():
+            self.devices[device['device']] = device
+        self.security_groups.update(info.get('security_groups', {}))
+        self.sg_member_ips.update(info.get('sg_member_ips', {}))
+
+    def remove_device(self, device_id):
+        if not self.devices.pop(device_id, None):
+            return
+        security_group_ids = self._security_group_ids(self.devices.keys())
+        for sgid in self.security_groups.keys():
+            if sgid not in security_group_ids:
+                del self.security_groups[sgid]
+        source_group_ids = self._source_group_ids(security_group_ids)
+        for sgid in self.sg_member_ips.keys():
+            if sgid not in source_group_ids:
+                del self.sg_member_ips[sgid]
+
+    def devices_for_groups(self, security_group_ids):
+        """Return the devices bound to any of the security groups."""
+        security_group_ids = set(security_group_ids)
+        return [device_id for device_id, device in self.devices.items()
+                if security_group_ids.intersection(
+                    device.get('security_groups', []))]
+
+    def devices_for_source_groups(self, security_group_ids):
+        """Return the devices with rules on members of the groups."""
+        security_group_ids = set(security_group_ids)
+        return self.devices_for_groups(
+            sgid for sgid, rules in self.security_groups.items()
+            if any(rule.get('source_group_id') in security_group_ids
+                   for rule in rules))
+
+    def source_groups_for_devices(self, device_ids):
+        """Return the source groups used by the rules of the devices."""
+        return self._source_group_ids(self._security_group_ids(device_ids))
+
+    def get_port(self, device_id, expand_source_groups=True):
+        """Build the port of a device as expected by the firewall driver.
+
+        The rules of the security groups of the port are appended to the
+        provider rules of the device. Unless expand_source_groups is False,
+        the rules on a source group are converted to one rule per member ip.
+        """
+        device = self.devices.get(device_id)
+        if not device:
+            return
+        port = device.copy()
+        port['security_group_source_groups'] = []
+        sg_rules = []
+        for sgid in device.get('security_groups', []):
+            sg_rules.extend(self.security_groups.get(sgid, []))
+        rules = []
+        for rule in sg_rules:
+            source_group_id = rule.get('source_group_id')
+            if not source_group_id:
+                rules.append(rule.copy())
+                continue
+            port['security_group_source_groups'].append(source_group_id)
+            if not expand_source_groups:
+                rules.append(rule.copy())
+                continue
+            direction_ip_prefix = DIRECTION_IP_PREFIX[rule['direction']]
+            for ip in self.sg_member_ips.get(source_group_id, []):
+                if ip in port.get('fixed_ips', []):
+                    continue
+                ethertype = 'IPv%s' % netaddr.IPAddress(ip).version
+                if rule['ethertype'] != ethertype:
+                    continue
+                ip_rule = rule.copy()
+                ip_rule[direction_ip_prefix] = "%s/%s" % (
+                    ip, IP_MASK[ethertype])
+                rules.append(ip_rule)
+        for ethertype in (constants.IPv4, constants.IPv6):
+            rules.extend(self._default_egress_rule(port, ethertype,
+                                                   sg_rules))
+        port['security_group_rules'] = rules + [
+            rule.copy() for rule in device.get('security_group_rules', [])]
+        return port
+
+    def _default_egress_rule(self, port, ethertype, sg_rules):
+        """Allow all egress traffic if no egress rule is defined."""
+        for rule in sg_rules:
+            if (rule['direction'] == 'egress' and
+                    rule['ethertype'] == ethertype):
+                return []
+        for ip in port.get('fixed_ips', []):
+            if 'IPv%s' % netaddr.IPAddress(ip).version == ethertype:
+                return [{'direction': 'egress', 'ethertype': ethertype}]
+        return []
+
+    def _security_group_ids(self, device_ids):
+        security_group_ids = set()
+        for device_id in device_ids:
+            if device_id in self.devices:
+                security_group_ids.update(
+                    self.devices[device_id].get('security_groups', []))
+        return security_group_ids
+
+    def _source_group_ids(self, security_group_ids):
+        return set(rule['source_group_id']
+                   for sgid in security_group_ids
+                   for rule in self.security_groups.get(sgid, [])
+                   if rule.get('source_group_id'))
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -90,39 +246,81 @@ class SecurityGroupAgentRpcMixin(object):
         firewall_driver = cfg.CONF.SECURITYGROUP.firewall_driver
         LOG.debug(_("Init firewall settings (driver=%s)"), firewall_driver)
         self.firewall = importutils.import_object(firewall_driver)
+        self.sg_cache = SecurityGroupInfoCache()
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
+        info = self.plugin_rpc.security_group_info_for_devices(
             self.context, list(device_ids))
+        self.sg_cache.update(info)
+        device_ids = [device['device'] for device in info['devices'].values()]
         with self.firewall.defer_apply():
-            for device in devices.values():
-                self.firewall.prepare_port_filter(device)
+            self._update_security_group_members(
+                self.sg_cache.source_groups_for_devices(device_ids))
+            for device_id in device_ids:
+                self.firewall.prepare_port_filter(
+                    self._get_port(device_id))
 
     def security_groups_rule_updated(self, security_groups):
         LOG.info(_("Security group "
                    "rule updated %r"), security_groups)
         self._security_group_updated(
             security_groups,
-            'security_groups')
+            self.sg_cache.devices_for_groups(security_groups))
 
     def security_groups_member_updated(self, security_groups):
         LOG.info(_("Security group "
                    "member updated %r"), security_groups)
+        if cfg.CONF.SECURITYGROUP.enable_ipset:
+            self._security_group_members_updated(security_groups)
+            return
         self._security_group_updated(
             security_groups,
-            'security_group_source_groups')
+            self.sg_cache.devices_for_source_groups(security_groups))
+
+    def _security_group_members_updated(self, security_groups):
+        """Update the member sets of the source groups in use.
+
+        The rules of the ports match the sets of their source groups, so
+        they do not change with the members.
+        """
+        source_group_ids = self.sg_cache.source_groups_for_devices(
+            self.sg_cache.devices.keys()).intersection(security_groups)
+        if not source_group_ids:
+            return
+        info = self.plugin_rpc.security_group_info_for_groups(
+            self.context, list(source_group_ids))
+        self.sg_cache.update(info)
+        with self.firewall.defer_apply():
+            self._update_security_group_members(source_group_ids)
+
+    def _update_security_group_members(self, source_group_ids):
+        if not cfg.CONF.SECURITYGROUP.enable_ipset:
+            return
+        for source_group_id in source_group_ids:
+            self.firewall.update_security_group_members(
+                source_group_id,
+                self.sg_cache.sg_member_ips.get(source_group_id, []))
 
-    def _security_group_updated(self, security_groups, attribute):
-        #check need update or not
-        for device in self.firewall.ports.values():
-            if set(device.get(attribute,
-                              [])).intersection(
-                    set(security_groups)):
-                    self.refresh_firewall()
-                    return
+    def _get_port(self, device_id):
+        return self.sg_cache.get_port(
+            device_id,
+            expand_source_groups=not cfg.CONF.SECURITYGROUP.enable_ipset)
+
+    def _security_group_updated(self, security_groups, device_ids):
+        """Update the cached groups and the filters of affected devices.
+
+        Only the rules and members of the updated groups are fetched, and
+        only the filters of the devices using them are rebuilt.
+        """
+        if not device_ids:
+            return
+        info = self.plugin_rpc.security_group_info_for_groups(
+            self.context, list(security_groups))
+        self.sg_cache.update(info)
+        self._update_devices_filter(device_ids)
 
     def security_groups_provider_updated(self):
         LOG.info(_("Provider rule updated"))
@@ -134,6 +332,7 @@ class SecurityGroupAgentRpcMixin(object):
         LOG.info(_("Remove device filter for %r"), device_ids)
         with self.firewall.defer_apply():
             for device_id in device_ids:
+                self.sg_cache.remove_device(device_id)
                 device = self.firewall.ports.get(device_id)
                 if not device:
                     continue
@@ -144,10 +343,20 @@ class SecurityGroupAgentRpcMixin(object):
         device_ids = self.firewall.ports.keys()
         if not device_ids:
             return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
+        info = self.plugin_rpc.security_group_info_for_devices(
             self.context, device_ids)
+        self.sg_cache.update(info)
+        self._update_devices_filter(
+            [device['device'] for device in info['devices'].values()])
+
+    def _update_devices_filter(self, device_ids):
         with self.firewall.defer_apply():
-            for device in devices.values():
+            self._update_security_group_members(
+                self.sg_cache.source_groups_for_devices(device_ids))
+            for device_id in device_ids:
+                device = self._get_port(device_id)
+                if not device:
+                    continue
                 LOG.debug(_("Update port filter for %s"), device)
                 self.firewall.update_port_filter(device)
 
@@ -93,7 +93,17 @@ def _validate_range(data, valid_values=None):
         return msg
 
 
+def _is_fast_match(regex, data):
+    """Check data against the regex of a common format of a value.
+
+    Values in other formats are left to the more lenient parsers.
+    """
+    return isinstance(data, basestring) and regex.match(data) is not None
+
+
 def _validate_mac_address(data, valid_values=None):
+    if _is_fast_match(_MAC_RE, data):
+        return
     try:
         netaddr.EUI(data)
     except Exception:
@@ -103,6 +113,8 @@ def _validate_mac_address(data, valid_values=None):
 
 
 def _validate_ip_address(data, valid_values=None):
+    if _is_fast_match(_IPV4_RE, data):
+        return
     try:
         netaddr.IPAddress(data)
     except Exception:
@@ -177,7 +189,7 @@ def _validate_nameservers(data, valid_values=None):
         msg = _validate_ip_address(ip)
         if msg:
             # This may be a hostname
-            msg = _validate_regex(ip, HOSTNAME_PATTERN)
+            msg = _validate_regex(ip, _HOSTNAME_RE)
             if msg:
                 msg = _("'%s' is not a valid nameserver") % ip
                 LOG.debug(msg)
@@ -224,6 +236,8 @@ def _validate_ip_address_or_none(data, valid_values=None):
 
 
 def _validate_subnet(data, valid_values=None):
+    if _is_fast_match(_IPV4_CIDR_RE, data):
+        return
     try:
         netaddr.IPNetwork(data)
         if len(data.split('/')) == 2:
@@ -249,6 +263,8 @@ def _validate_regex(data, valid_values=None):
 
 
 def _validate_uuid(data, valid_values=None):
+    if _is_fast_match(_UUID_RE, data):
+        return
     if not uuidutils.is_uuid_like(data):
         msg = _("'%s' is not a valid UUID") % data
         LOG.debug(msg)
@@ -428,6 +444,17 @@ UUID_PATTERN = '-'.join([HEX_ELEM + '{8}', HEX_ELEM + '{4}',
 # must be even.
 MAC_PATTERN = "^%s[aceACE02468](:%s{2}){5}$" % (HEX_ELEM, HEX_ELEM)
 
+_HOSTNAME_RE = re.compile(HOSTNAME_PATTERN)
+# Common formats of UUIDs, MAC and IPv4 addresses and subnets, matched
+# before trying the parsers
+_UUID_RE = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-'
+                      r'[0-9a-f]{12}\Z')
+_MAC_RE = re.compile(r'%s{2}(:%s{2}){5}\Z' % (HEX_ELEM, HEX_ELEM))
+_IPV4_OCTET = r'(25[0-5]|2[0-4][0-9]|1[0-9][0-9]|[1-9]?[0-9])'
+_IPV4_RE = re.compile(r'%s(\.%s){3}\Z' % (_IPV4_OCTET, _IPV4_OCTET))
+_IPV4_CIDR_RE = re.compile(r'%s(\.%s){3}/(3[0-2]|[12]?[0-9])\Z' %
+                           (_IPV4_OCTET, _IPV4_OCTET))
+
 # Dictionary that maintains a list of validation functions
 validators = {'type:dict': _validate_dict,
               'type:dict_or_none': _validate_dict_or_none,
@@ -449,6 +476,31 @@ validators = {'type:dict': _validate_dict,
               'type:uuid_list': _validate_uuid_list,
               'type:values': _validate_values}
 
+
+def compile_validators(attr_info):
+    """Compile the conversion and validation of the attributes of a resource.
+
+    :param attr_info: attribute map of the resource
+    :returns: list of (attribute name, convert_to function or None, list of
+              (validator name, parameters)) for the attributes which are
+              converted or validated. Regular expressions are compiled.
+
+    Validators are looked up by name when they run, as extensions may
+    register theirs after the resource was compiled.
+    """
+    pipeline = []
+    for attr, attr_vals in attr_info.iteritems():
+        if 'convert_to' not in attr_vals and 'validate' not in attr_vals:
+            continue
+        rules = []
+        for rule, params in attr_vals.get('validate', {}).iteritems():
+            if rule == 'type:regex' and isinstance(params, basestring):
+                params = re.compile(params)
+            rules.append((rule, params))
+        pipeline.append((attr, attr_vals.get('convert_to'), rules))
+    return pipeline
+
+
 # Note: a default of ATTR_NOT_SPECIFIED indicates that an
 # attribute is not required, but will be generated by the plugin
 # if it is not specified.  Particularly, a value of ATTR_NOT_SPECIFIED
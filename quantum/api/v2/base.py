@@ -67,6 +67,7 @@ class Controller(object):
         self._native_sorting = self._is_native_sorting_supported()
         self._policy_attrs = [name for (name, info) in self._attr_info.items()
                               if info.get('required_by_policy')]
+        self._validators = attributes.compile_validators(self._attr_info)
         self._publisher_id = notifier_api.publisher_id('network')
         self._dhcp_agent_notifier = dhcp_rpc_agent_api.DhcpAgentNotifyAPI()
         self._member_actions = member_actions
@@ -188,6 +189,13 @@ class Controller(object):
         pagination_helper.update_fields(original_fields, fields_to_add)
         if parent_id:
             kwargs[self._parent_id_name] = parent_id
+        if do_authz and 'tenant_id' in self._attr_info:
+            # Let the plugin leave out the items the policy would omit when
+            # it only depends on their tenant
+            tenant_ids = policy.get_tenant_filter(
+                request.context, self._plugin_handlers[self.SHOW])
+            if tenant_ids is not None:
+                filters.setdefault('tenant_id', tenant_ids)
         obj_getter = getattr(self._plugin, self._plugin_handlers[self.LIST])
         obj_list = obj_getter(request.context, **kwargs)
         obj_list = sorting_helper.sort(obj_list)
@@ -198,11 +206,9 @@ class Controller(object):
             # FIXME(salvatore-orlando): obj_getter might return references to
             # other resources. Must check authZ on them too.
             # Omit items from list that should not be visible
-            obj_list = [obj for obj in obj_list
-                        if policy.check(request.context,
-                                        self._plugin_handlers[self.SHOW],
-                                        obj,
-                                        plugin=self._plugin)]
+            obj_list = policy.check_collection(
+                request.context, self._plugin_handlers[self.SHOW], obj_list,
+                plugin=self._plugin)
         collection = {self._collection:
                       [self._view(obj,
                                   fields_to_strip=fields_to_add)
@@ -301,17 +307,16 @@ class Controller(object):
                             body)
         body = Controller.prepare_request_body(request.context, body, True,
                                                self._resource, self._attr_info,
-                                               allow_bulk=self._allow_bulk)
+                                               allow_bulk=self._allow_bulk,
+                                               validators=self._validators)
         action = self._plugin_handlers[self.CREATE]
         # Check authz
         if self._collection in body:
             # Have to account for bulk create
             items = body[self._collection]
-            deltas = {}
-            bulk = True
         else:
             items = [body]
-            bulk = False
+        deltas = {}
         for item in items:
             self._validate_network_tenant_ownership(request,
                                                     item[self._resource])
@@ -319,24 +324,18 @@ class Controller(object):
                            action,
                            item[self._resource],
                            plugin=self._plugin)
+            tenant_id = item[self._resource]['tenant_id']
+            deltas[tenant_id] = deltas.get(tenant_id, 0) + 1
+        # Check the quota once per tenant rather than once per item
+        for tenant_id, delta in deltas.iteritems():
             try:
-                tenant_id = item[self._resource]['tenant_id']
-                count = quota.QUOTAS.count(request.context, self._resource,
-                                           self._plugin, self._collection,
-                                           tenant_id)
-                if bulk:
-                    delta = deltas.get(tenant_id, 0) + 1
-                    deltas[tenant_id] = delta
-                else:
-                    delta = 1
-                kwargs = {self._resource: count + delta}
+                quota.QUOTAS.limit_check_delta(request.context, tenant_id,
+                                               self._resource, delta,
+                                               self._plugin,
+                                               self._collection)
             except exceptions.QuotaResourceUnknown as e:
                 # We don't want to quota this resource
                 LOG.debug(e)
-            else:
-                quota.QUOTAS.limit_check(request.context,
-                                         item[self._resource]['tenant_id'],
-                                         **kwargs)
 
         def notify(create_result):
             notifier_method = self._resource + '.create.end'
@@ -420,7 +419,8 @@ class Controller(object):
                             payload)
         body = Controller.prepare_request_body(request.context, body, False,
                                                self._resource, self._attr_info,
-                                               allow_bulk=self._allow_bulk)
+                                               allow_bulk=self._allow_bulk,
+                                               validators=self._validators)
         action = self._plugin_handlers[self.UPDATE]
         # Load object to check authz
         # but pass only attributes in the original body and required
@@ -479,7 +479,7 @@ class Controller(object):
 
     @staticmethod
     def prepare_request_body(context, body, is_create, resource, attr_info,
-                             allow_bulk=False):
+                             allow_bulk=False, validators=None):
         """ verifies required attributes are in request body, and that
             an attribute is only specified if it is allowed for the given
             operation (create/update).
@@ -487,27 +487,33 @@ class Controller(object):
             optional.
 
             body argument must be the deserialized body
+            validators argument is the attributes.compile_validators
+            result for attr_info, it is compiled here if not given
         """
         collection = resource + "s"
         if not body:
             raise webob.exc.HTTPBadRequest(_("Resource body required"))
 
-        prep_req_body = lambda x: Controller.prepare_request_body(
-            context,
-            x if resource in x else {resource: x},
-            is_create,
-            resource,
-            attr_info,
-            allow_bulk)
+        if validators is None:
+            validators = attributes.compile_validators(attr_info)
         if collection in body:
             if not allow_bulk:
                 raise webob.exc.HTTPBadRequest(_("Bulk operation "
                                                  "not supported"))
-            bulk_body = [prep_req_body(item) for item in body[collection]]
+            bulk_body = [Controller._prepare_resource_body(
+                context, item if resource in item else {resource: item},
+                is_create, resource, attr_info, validators)
+                for item in body[collection]]
             if not bulk_body:
                 raise webob.exc.HTTPBadRequest(_("Resources required"))
             return {collection: bulk_body}
+        return Controller._prepare_resource_body(context, body, is_create,
+                                                 resource, attr_info,
+                                                 validators)
 
+    @staticmethod
+    def _prepare_resource_body(context, body, is_create, resource, attr_info,
+                               validators):
         res_dict = body.get(resource)
         if res_dict is None:
             msg = _("Unable to find '%s' in request body") % resource
@@ -537,19 +543,16 @@ class Controller(object):
                     msg = _("Cannot update read-only attribute %s") % attr
                     raise webob.exc.HTTPBadRequest(msg)
 
-        for attr, attr_vals in attr_info.iteritems():
+        for attr, convert_to, rules in validators:
             if (attr not in res_dict or
                 res_dict[attr] is attributes.ATTR_NOT_SPECIFIED):
                 continue
             # Convert values if necessary
-            if 'convert_to' in attr_vals:
-                res_dict[attr] = attr_vals['convert_to'](res_dict[attr])
+            if convert_to:
+                res_dict[attr] = convert_to(res_dict[attr])
             # Check that configured values are correct
-            if 'validate' not in attr_vals:
-                continue
-            for rule in attr_vals['validate']:
-                res = attributes.validators[rule](res_dict[attr],
-                                                  attr_vals['validate'][rule])
+            for rule, params in rules:
+                res = attributes.validators[rule](res_dict[attr], params)
                 if res:
                     msg_dict = dict(attr=attr, reason=res)
                     msg = _("Invalid input for %(attr)s. "
@@ -39,6 +39,9 @@ core_opts = [
                help=_("The host IP to bind to")),
     cfg.IntOpt('bind_port', default=9696,
                help=_("The port to bind to")),
+    cfg.IntOpt('api_workers', default=0,
+               help=_("Number of separate worker processes serving the "
+                      "API, 0 serves it in the server process")),
     cfg.StrOpt('api_paste_config', default="api-paste.ini",
                help=_("The API paste config file to use")),
     cfg.StrOpt('api_extensions_path', default="",
@@ -71,6 +74,9 @@ core_opts = [
                help=_("Maximum number of host routes per subnet")),
     cfg.IntOpt('dhcp_lease_duration', default=120,
                help=_("DHCP lease duration")),
+    cfg.IntOpt('dhcp_lease_update_slack', default=10,
+               help=_("Lease expiration updates within this many seconds of "
+                      "the stored expiration are not written")),
     cfg.BoolOpt('dhcp_agent_notification', default=True,
                 help=_("Allow sending resource operation"
                        " notification to DHCP agent")),
@@ -15,9 +15,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+
 import sqlalchemy as sa
 from sqlalchemy.orm import exc
+from sqlalchemy import sql
 
+from quantum import context as quantum_context
 from quantum.db import model_base
 from quantum.db import models_v2
 from quantum.extensions import agent as ext_agent
@@ -25,12 +29,18 @@ from quantum import manager
 from quantum.openstack.common import cfg
 from quantum.openstack.common import jsonutils
 from quantum.openstack.common import log as logging
+from quantum.openstack.common import loopingcall
 from quantum.openstack.common import timeutils
 
 LOG = logging.getLogger(__name__)
-cfg.CONF.register_opt(
+cfg.CONF.register_opts([
     cfg.IntOpt('agent_down_time', default=5,
-               help=_("Seconds to regard the agent is down.")))
+               help=_("Seconds to regard the agent is down.")),
+    cfg.IntOpt('agent_heartbeat_flush_interval', default=0,
+               help=_("Seconds between the writes of the buffered agent "
+                      "heartbeats, 0 to write each of them as it is "
+                      "reported.")),
+])
 
 
 class Agent(model_base.BASEV2, models_v2.HasId):
@@ -57,9 +67,28 @@ class Agent(model_base.BASEV2, models_v2.HasId):
     configurations = sa.Column(sa.String(4095), nullable=False)
 
 
+class AgentHeartbeats(object):
+    """The agent reports received by this server."""
+
+    def __init__(self):
+        # (agent_type, host) -> (agent id, digest of the configurations)
+        self.agents = {}
+        # agent id -> time of the last report
+        self.last_seen = {}
+        # ids of the agents whose last report is not written yet
+        self.pending = set()
+        self.flusher = None
+
+
 class AgentDbMixin(ext_agent.AgentPluginBase):
     """Mixin class to add agent extension to db_plugin_base_v2."""
 
+    def _agent_heartbeats(self):
+        heartbeats = getattr(self, '_heartbeats', None)
+        if heartbeats is None:
+            heartbeats = self._heartbeats = AgentHeartbeats()
+        return heartbeats
+
     def _get_agent(self, context, id):
         try:
             agent = self._get_by_id(context, Agent, id)
@@ -76,6 +105,10 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
             ext_agent.RESOURCE_NAME + 's')
         res = dict((k, agent[k]) for k in attr
                    if k not in ['alive', 'configurations'])
+        # the last report may not be written yet
+        last_seen = self._agent_heartbeats().last_seen.get(res['id'])
+        if last_seen and last_seen > res['heartbeat_timestamp']:
+            res['heartbeat_timestamp'] = last_seen
         res['alive'] = not self._is_agent_down(res['heartbeat_timestamp'])
         try:
             res['configurations'] = jsonutils.loads(agent['configurations'])
@@ -91,6 +124,10 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
         with context.session.begin(subtransactions=True):
             agent = self._get_agent(context, id)
             context.session.delete(agent)
+        heartbeats = self._agent_heartbeats()
+        heartbeats.agents.pop((agent['agent_type'], agent['host']), None)
+        heartbeats.last_seen.pop(id, None)
+        heartbeats.pending.discard(id)
 
     def update_agent(self, context, id, agent):
         agent_data = agent['agent']
@@ -99,10 +136,19 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
             agent.update(agent_data)
         return self._make_agent_dict(agent)
 
-    def get_agents(self, context, filters=None, fields=None):
-        return self._get_collection(context, Agent,
-                                    self._make_agent_dict,
-                                    filters=filters, fields=fields)
+    def get_agents(self, context, filters=None, fields=None,
+                   sorts=None, limit=None, marker=None, page_reverse=False):
+        marker_obj = self._get_marker_obj(context, 'agent', limit, marker)
+        # the configurations are converted from json, the collection can't
+        # be read from the requested columns only
+        agents = self._get_collection(context, Agent,
+                                      self._make_agent_dict,
+                                      filters=filters,
+                                      sorts=sorts,
+                                      limit=limit,
+                                      marker_obj=marker_obj,
+                                      page_reverse=page_reverse)
+        return [self._fields(agent, fields) for agent in agents]
 
     def _get_agent_by_type_and_host(self, context, agent_type, host):
         query = self._model_query(context, Agent)
@@ -123,12 +169,23 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
 
     def create_or_update_agent(self, context, agent):
         """Create or update agent according to report."""
+        configurations = jsonutils.dumps(agent.get('configurations', {}))
+        digest = hashlib.md5(configurations).hexdigest()
+        key = (agent['agent_type'], agent['host'])
+        heartbeats = self._agent_heartbeats()
+        known = heartbeats.agents.get(key)
+        if (known and known[1] == digest and
+                not agent.get('start_flag')):
+            # Only the heartbeat changed, so no need to look the agent up
+            # or to write its configurations again
+            self._add_agent_heartbeat(context, known[0])
+            return
+
         with context.session.begin(subtransactions=True):
             res_keys = ['agent_type', 'binary', 'host', 'topic']
             res = dict((k, agent[k]) for k in res_keys)
 
-            configurations_dict = agent.get('configurations', {})
-            res['configurations'] = jsonutils.dumps(configurations_dict)
+            res['configurations'] = configurations
             current_time = timeutils.utcnow()
             try:
                 agent_db = self._get_agent_by_type_and_host(
@@ -144,6 +201,51 @@ class AgentDbMixin(ext_agent.AgentPluginBase):
                 res['admin_state_up'] = True
                 agent_db = Agent(**res)
                 context.session.add(agent_db)
+        heartbeats.agents[key] = (agent_db['id'], digest)
+        heartbeats.last_seen[agent_db['id']] = current_time
+        heartbeats.pending.discard(agent_db['id'])
+
+    def _add_agent_heartbeat(self, context, agent_id):
+        heartbeats = self._agent_heartbeats()
+        heartbeats.last_seen[agent_id] = timeutils.utcnow()
+        heartbeats.pending.add(agent_id)
+        interval = cfg.CONF.agent_heartbeat_flush_interval
+        if interval <= 0:
+            self._flush_agent_heartbeats(context)
+        elif not heartbeats.flusher:
+            heartbeats.flusher = loopingcall.LoopingCall(
+                self._flush_agent_heartbeats)
+            heartbeats.flusher.start(interval=interval)
+
+    def _flush_agent_heartbeats(self, context=None):
+        """Write the pending heartbeats with a single UPDATE."""
+        heartbeats = self._agent_heartbeats()
+        if not heartbeats.pending:
+            return
+        pending, heartbeats.pending = heartbeats.pending, set()
+        timestamps = dict((agent_id, heartbeats.last_seen[agent_id])
+                          for agent_id in pending
+                          if agent_id in heartbeats.last_seen)
+        if not timestamps:
+            return
+        context = context or quantum_context.get_admin_context()
+        try:
+            with context.session.begin(subtransactions=True):
+                query = context.session.query(Agent).filter(
+                    Agent.id.in_(timestamps.keys()))
+                updated = query.update(
+                    {'heartbeat_timestamp': sql.case(timestamps,
+                                                     value=Agent.id)},
+                    synchronize_session=False)
+        except Exception:
+            LOG.exception(_("Unable to write the heartbeats of %d agents"),
+                          len(timestamps))
+            heartbeats.pending.update(timestamps)
+            return
+        if updated < len(timestamps):
+            # Some agents were deleted, let their next reports find out
+            # which ones and register them again
+            heartbeats.agents.clear()
 
 
 class AgentExtRpcCallback(object):
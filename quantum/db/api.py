@@ -158,6 +158,16 @@ def configure_db():
                 retry_registration(remaining, reconnect_interval)
 
 
+def dispose():
+    """Close the pooled connections of the engine.
+
+    New connections are opened on demand, which lets forked processes
+    each use their own connections.
+    """
+    if _ENGINE:
+        _ENGINE.dispose()
+
+
 def clear_db(base=BASE):
     global _ENGINE, _MAKER
     assert _ENGINE
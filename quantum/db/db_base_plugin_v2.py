@@ -16,17 +16,20 @@
 #    under the License.
 
 import datetime
+import functools
 import random
 
 import netaddr
 from oslo.config import cfg
 from sqlalchemy import orm
+from sqlalchemy import sql
 from sqlalchemy.orm import exc
 
 from quantum.api.v2 import attributes
 from quantum.common import constants
 from quantum.common import exceptions as q_exc
 from quantum.db import api as db
+from quantum.db import ipam
 from quantum.db import models_v2
 from quantum.db import sqlalchemyutils
 from quantum.openstack.common import log as logging
@@ -224,13 +227,18 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
+                        page_reverse=False, load_related=None,
+                        plain_fields=None):
         query = self._get_collection_query(context, model, filters=filters,
                                            sorts=sorts,
                                            limit=limit,
                                            marker_obj=marker_obj,
                                            page_reverse=page_reverse)
-        items = [dict_func(c, fields) for c in query.all()]
+        if load_related:
+            load_related = functools.partial(load_related, context)
+        items = sqlalchemyutils.query_collection(query, model, dict_func,
+                                                 fields, load_related,
+                                                 plain_fields)
         if limit and page_reverse:
             items.reverse()
         return items
@@ -238,17 +246,61 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
     def _get_collection_count(self, context, model, filters=None):
         return self._get_collection_query(context, model, filters).count()
 
+    def _get_related_rows(self, context, model, key, ids):
+        """Returns the rows of model whose key is in ids, grouped by key.
+
+        The related rows of all the items of a list are read in one query,
+        instead of one query per item when making their dicts.
+        """
+        related = dict((id, []) for id in ids)
+        if related:
+            query = context.session.query(model)
+            for row in query.filter(getattr(model, key).in_(related.keys())):
+                related[row[key]].append(row)
+        return related
+
+    def _load_network_related(self, context, networks):
+        ids = [network['id'] for network in networks]
+        subnets = self._get_related_rows(context, models_v2.Subnet,
+                                         'network_id', ids)
+        return [dict(network, subnets=subnets[network['id']])
+                for network in networks]
+
+    def _load_subnet_related(self, context, subnets):
+        ids = [subnet['id'] for subnet in subnets]
+        pools = self._get_related_rows(context, models_v2.IPAllocationPool,
+                                       'subnet_id', ids)
+        dns = self._get_related_rows(context, models_v2.DNSNameServer,
+                                     'subnet_id', ids)
+        routes = self._get_related_rows(context, models_v2.SubnetRoute,
+                                        'subnet_id', ids)
+        return [dict(subnet,
+                     allocation_pools=pools[subnet['id']],
+                     dns_nameservers=dns[subnet['id']],
+                     routes=routes[subnet['id']])
+                for subnet in subnets]
+
+    def _load_port_related(self, context, ports):
+        fixed_ips = self._get_related_rows(context, models_v2.IPAllocation,
+                                           'port_id',
+                                           [port['id'] for port in ports])
+        return [dict(port, fixed_ips=fixed_ips[port['id']]) for port in ports]
+
     @staticmethod
-    def _generate_mac(context, network_id):
+    def _random_mac():
         base_mac = cfg.CONF.base_mac.split(':')
+        mac = [int(base_mac[0], 16), int(base_mac[1], 16),
+               int(base_mac[2], 16), random.randint(0x00, 0xff),
+               random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
+        if base_mac[3] != '00':
+            mac[3] = int(base_mac[3], 16)
+        return ':'.join(map(lambda x: "%02x" % x, mac))
+
+    @staticmethod
+    def _generate_mac(context, network_id):
         max_retries = cfg.CONF.mac_generation_retries
         for i in range(max_retries):
-            mac = [int(base_mac[0], 16), int(base_mac[1], 16),
-                   int(base_mac[2], 16), random.randint(0x00, 0xff),
-                   random.randint(0x00, 0xff), random.randint(0x00, 0xff)]
-            if base_mac[3] != '00':
-                mac[3] = int(base_mac[3], 16)
-            mac_address = ':'.join(map(lambda x: "%02x" % x, mac))
+            mac_address = QuantumDbPluginV2._random_mac()
             if QuantumDbPluginV2._check_unique_mac(context, network_id,
                                                    mac_address):
                 LOG.debug(_("Generated mac for network %(network_id)s "
@@ -263,6 +315,37 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                   max_retries)
         raise q_exc.MacAddressGenerationFailure(net_id=network_id)
 
+    @staticmethod
+    def _generate_macs(context, network_id, count, exclude=None):
+        """Generate count unique MAC addresses on the network.
+
+        Each attempt checks all the candidates with a single query.
+        """
+        max_retries = cfg.CONF.mac_generation_retries
+        macs = set()
+        exclude = set(exclude or [])
+        for i in range(max_retries):
+            candidates = set(QuantumDbPluginV2._random_mac()
+                             for x in xrange(count - len(macs)))
+            candidates -= macs | exclude
+            if candidates:
+                mac_qry = context.session.query(models_v2.Port.mac_address)
+                mac_qry = mac_qry.filter(
+                    models_v2.Port.network_id == network_id,
+                    models_v2.Port.mac_address.in_(candidates))
+                candidates -= set(row[0] for row in mac_qry)
+                macs |= candidates
+            if len(macs) == count:
+                LOG.debug(_("Generated %(count)d macs for network "
+                            "%(network_id)s"), locals())
+                return list(macs)
+            LOG.debug(_("Generated macs exist. Remaining attempts "
+                        "%(max_retries)s."),
+                      {'max_retries': max_retries - (i + 1)})
+        LOG.error(_("Unable to generate mac address after %s attempts"),
+                  max_retries)
+        raise q_exc.MacAddressGenerationFailure(net_id=network_id)
+
     @staticmethod
     def _check_unique_mac(context, network_id, mac_address):
         mac_qry = context.session.query(models_v2.Port)
@@ -305,11 +388,20 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         expired_qry = expired_qry.filter(
             models_v2.IPAllocation.expiration <= timeutils.utcnow())
 
+        # Release the expired addresses of each subnet in one batch
+        expired_by_subnet = {}
         for expired in expired_qry.all():
-            QuantumDbPluginV2._recycle_ip(context,
-                                          network_id,
-                                          expired['subnet_id'],
-                                          expired['ip_address'])
+            expired_by_subnet.setdefault(expired['subnet_id'],
+                                         []).append(expired)
+        driver = ipam.get_driver()
+        for subnet_id, allocations in expired_by_subnet.iteritems():
+            LOG.debug(_("Recycle %(count)d expired IP's from subnet "
+                        "%(subnet_id)s"),
+                      {'count': len(allocations), 'subnet_id': subnet_id})
+            driver.release_ips(context, subnet_id,
+                               [a['ip_address'] for a in allocations])
+            for allocation in allocations:
+                context.session.delete(allocation)
 
         if hasattr(context, '_recycled_networks'):
             context._recycled_networks.add(network_id)
@@ -321,79 +413,7 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         """Return an IP address to the pool of free IP's on the network
         subnet.
         """
-        # Grab all allocation pools for the subnet
-        pool_qry = context.session.query(models_v2.IPAllocationPool)
-        allocation_pools = pool_qry.filter_by(subnet_id=subnet_id).all()
-        # Find the allocation pool for the IP to recycle
-        pool_id = None
-        for allocation_pool in allocation_pools:
-            allocation_pool_range = netaddr.IPRange(
-                allocation_pool['first_ip'],
-                allocation_pool['last_ip'])
-            if netaddr.IPAddress(ip_address) in allocation_pool_range:
-                pool_id = allocation_pool['id']
-                break
-        if not pool_id:
-            error_message = _("No allocation pool found for "
-                              "ip address:%s") % ip_address
-            raise q_exc.InvalidInput(error_message=error_message)
-        # Two requests will be done on the database. The first will be to
-        # search if an entry starts with ip_address + 1 (r1). The second
-        # will be to see if an entry ends with ip_address -1 (r2).
-        # If 1 of the above holds true then the specific entry will be
-        # modified. If both hold true then the two ranges will be merged.
-        # If there are no entries then a single entry will be added.
-        range_qry = context.session.query(models_v2.IPAvailabilityRange)
-        ip_first = str(netaddr.IPAddress(ip_address) + 1)
-        ip_last = str(netaddr.IPAddress(ip_address) - 1)
-        LOG.debug(_("Recycle %s"), ip_address)
-        try:
-            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     first_ip=ip_first).one()
-            LOG.debug(_("Recycle: first match for %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
-        except exc.NoResultFound:
-            r1 = []
-        try:
-            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
-                                     last_ip=ip_last).one()
-            LOG.debug(_("Recycle: last match for %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
-        except exc.NoResultFound:
-            r2 = []
-
-        if r1 and r2:
-            # Merge the two ranges
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=r2['first_ip'],
-                last_ip=r1['last_ip'])
-            context.session.add(ip_range)
-            LOG.debug(_("Recycle: merged %(first_ip1)s-%(last_ip1)s and "
-                        "%(first_ip2)s-%(last_ip2)s"),
-                      {'first_ip1': r2['first_ip'], 'last_ip1': r2['last_ip'],
-                       'first_ip2': r1['first_ip'], 'last_ip2': r1['last_ip']})
-            context.session.delete(r1)
-            context.session.delete(r2)
-        elif r1:
-            # Update the range with matched first IP
-            r1['first_ip'] = ip_address
-            LOG.debug(_("Recycle: updated first %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
-        elif r2:
-            # Update the range with matched last IP
-            r2['last_ip'] = ip_address
-            LOG.debug(_("Recycle: updated last %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
-        else:
-            # Create a new range
-            ip_range = models_v2.IPAvailabilityRange(
-                allocation_pool_id=pool_id,
-                first_ip=ip_address,
-                last_ip=ip_address)
-            context.session.add(ip_range)
-            LOG.debug(_("Recycle: created new %(first_ip)s-%(last_ip)s"),
-                      {'first_ip': ip_address, 'last_ip': ip_address})
+        ipam.get_driver().release_ip(context, subnet_id, ip_address)
         QuantumDbPluginV2._delete_ip_allocation(context, network_id, subnet_id,
                                                 ip_address)
 
@@ -404,21 +424,51 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
 
     def update_fixed_ip_lease_expiration(self, context, network_id,
                                          ip_address, lease_remaining):
+        self.update_fixed_ip_lease_expirations(
+            context, network_id, {ip_address: lease_remaining})
 
-        expiration = (timeutils.utcnow() +
-                      datetime.timedelta(seconds=lease_remaining))
+    def update_fixed_ip_lease_expirations(self, context, network_id, leases):
+        """Update the lease expirations of IP addresses of a network.
 
-        query = context.session.query(models_v2.IPAllocation)
-        query = query.filter_by(network_id=network_id, ip_address=ip_address)
+        leases maps the IP addresses to the seconds remaining of their
+        leases. The allocations whose stored expiration is within
+        dhcp_lease_update_slack seconds of the new one are not written, the
+        others are updated with a single statement.
+        """
+        now = timeutils.utcnow()
+        expirations = dict(
+            (ip_address, now + datetime.timedelta(seconds=lease_remaining))
+            for ip_address, lease_remaining in leases.iteritems())
+        slack = datetime.timedelta(seconds=cfg.CONF.dhcp_lease_update_slack)
 
-        try:
-            with context.session.begin(subtransactions=True):
-                fixed_ip = query.one()
-                fixed_ip.expiration = expiration
-        except exc.NoResultFound:
-            LOG.debug(_("No fixed IP found that matches the network "
-                        "%(network_id)s and ip address %(ip_address)s."),
-                      locals())
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(models_v2.IPAllocation.ip_address,
+                                          models_v2.IPAllocation.expiration)
+            query = query.filter(
+                models_v2.IPAllocation.network_id == network_id,
+                models_v2.IPAllocation.ip_address.in_(expirations))
+            stored = dict(query)
+
+            for ip_address in set(expirations) - set(stored):
+                LOG.debug(_("No fixed IP found that matches the network "
+                            "%(network_id)s and ip address %(ip_address)s."),
+                          locals())
+            updates = dict(
+                (ip_address, expirations[ip_address])
+                for ip_address, expiration in stored.iteritems()
+                if (expiration is None or
+                    abs(expirations[ip_address] - expiration) > slack))
+            if not updates:
+                return
+
+            query = context.session.query(models_v2.IPAllocation)
+            query = query.filter(
+                models_v2.IPAllocation.network_id == network_id,
+                models_v2.IPAllocation.ip_address.in_(updates))
+            query.update(
+                {'expiration': sql.case(
+                    updates, value=models_v2.IPAllocation.ip_address)},
+                synchronize_session=False)
 
     @staticmethod
     def _delete_ip_allocation(context, network_id, subnet_id, ip_address):
@@ -436,68 +486,14 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         """Generate an IP address.
 
         The IP address will be generated from one of the subnets defined on
-        the network.
+        the network by the configured IPAM driver.
         """
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange).join(
-                models_v2.IPAllocationPool)
-        for subnet in subnets:
-            range = range_qry.filter_by(subnet_id=subnet['id']).first()
-            if not range:
-                LOG.debug(_("All IP's from subnet %(subnet_id)s (%(cidr)s) "
-                            "allocated"),
-                          {'subnet_id': subnet['id'], 'cidr': subnet['cidr']})
-                continue
-            ip_address = range['first_ip']
-            LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
-                        "to %(last_ip)s"),
-                      {'ip_address': ip_address,
-                       'first_ip': range['first_ip'],
-                       'last_ip': range['last_ip']})
-            if range['first_ip'] == range['last_ip']:
-                # No more free indices on subnet => delete
-                LOG.debug(_("No more free IP's in slice. Deleting allocation "
-                            "pool."))
-                context.session.delete(range)
-            else:
-                # increment the first free
-                range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-            return {'ip_address': ip_address, 'subnet_id': subnet['id']}
-        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+        return ipam.get_driver().generate_ip(context, subnets)
 
     @staticmethod
     def _allocate_specific_ip(context, subnet_id, ip_address):
         """Allocate a specific IP address on the subnet."""
-        ip = int(netaddr.IPAddress(ip_address))
-        range_qry = context.session.query(
-            models_v2.IPAvailabilityRange,
-            models_v2.IPAllocationPool).join(
-                models_v2.IPAllocationPool)
-        results = range_qry.filter_by(subnet_id=subnet_id).all()
-        for (range, pool) in results:
-            first = int(netaddr.IPAddress(range['first_ip']))
-            last = int(netaddr.IPAddress(range['last_ip']))
-            if first <= ip <= last:
-                if first == last:
-                    context.session.delete(range)
-                    return
-                elif first == ip:
-                    range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
-                    return
-                elif last == ip:
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    return
-                else:
-                    # Split into two ranges
-                    new_first = str(netaddr.IPAddress(ip_address) + 1)
-                    new_last = range['last_ip']
-                    range['last_ip'] = str(netaddr.IPAddress(ip_address) - 1)
-                    ip_range = models_v2.IPAvailabilityRange(
-                        allocation_pool_id=pool['id'],
-                        first_ip=new_first,
-                        last_ip=new_last)
-                    context.session.add(ip_range)
-                    return
+        ipam.get_driver().allocate_specific_ip(context, subnet_id, ip_address)
 
     @staticmethod
     def _check_unique_ip(context, network_id, subnet_id, ip_address):
@@ -672,6 +668,12 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
         p = port['port']
         ips = []
 
+        # Addresses may have been reserved by create_port_bulk
+        reserved = getattr(context, '_reserved_port_ips', {}).pop(
+            p.get('id'), None)
+        if reserved is not None:
+            return reserved
+
         fixed_configured = p['fixed_ips'] is not attributes.ATTR_NOT_SPECIFIED
         if fixed_configured:
             configured_ips = self._test_fixed_ips_for_port(context,
@@ -998,7 +1000,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    load_related=self._load_network_related,
+                                    plain_fields=('id', 'name', 'tenant_id',
+                                                  'admin_state_up', 'status',
+                                                  'shared'))
 
     def get_networks_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Network,
@@ -1233,14 +1239,108 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    load_related=self._load_subnet_related,
+                                    plain_fields=('id', 'name', 'tenant_id',
+                                                  'network_id', 'ip_version',
+                                                  'cidr', 'gateway_ip',
+                                                  'enable_dhcp', 'shared'))
 
     def get_subnets_count(self, context, filters=None):
         return self._get_collection_count(context, models_v2.Subnet,
                                           filters=filters)
 
+    def _reserve_requested_ips(self, context, subnets, ports):
+        """Remove the fixed IP addresses requested by ports from the pools.
+
+        Addresses which are not free are left alone; create_port() reports
+        them when it validates the fixed IPs of the port.
+        """
+        for p in ports:
+            for fixed in p['fixed_ips']:
+                if 'ip_address' not in fixed:
+                    continue
+                subnet_id = fixed.get('subnet_id')
+                if not subnet_id:
+                    for subnet in subnets:
+                        if QuantumDbPluginV2._check_subnet_ip(
+                                subnet['cidr'], fixed['ip_address']):
+                            subnet_id = subnet['id']
+                            break
+                    else:
+                        continue
+                QuantumDbPluginV2._allocate_specific_ip(
+                    context, subnet_id, fixed['ip_address'])
+
+    def _reserve_bulk_port_addresses(self, context, ports):
+        """Reserve MAC and IP addresses for a bulk of ports at once.
+
+        Ports are assigned an id and the MAC addresses and IP addresses they
+        need are taken per network in a single pass; create_port() then picks
+        them up from the context instead of generating them one by one.
+        """
+        ports_by_net = {}
+        for item in ports:
+            p = item['port']
+            p.setdefault('id', uuidutils.generate_uuid())
+            ports_by_net.setdefault(p['network_id'], []).append(p)
+
+        filters = {'network_id': ports_by_net.keys()}
+        subnets_by_net = {}
+        for subnet in self.get_subnets(context, filters=filters):
+            subnets_by_net.setdefault(subnet['network_id'], []).append(subnet)
+
+        macs = {}
+        ips = {}
+        for network_id, net_ports in ports_by_net.iteritems():
+            need_mac = [p for p in net_ports
+                        if p['mac_address'] is attributes.ATTR_NOT_SPECIFIED]
+            if need_mac:
+                requested = [p['mac_address'] for p in net_ports
+                             if (p['mac_address'] is not
+                                 attributes.ATTR_NOT_SPECIFIED)]
+                generated = self._generate_macs(context, network_id,
+                                                len(need_mac),
+                                                exclude=requested)
+                for p, mac_address in zip(need_mac, generated):
+                    macs[p['id']] = mac_address
+
+            need_ips = [p for p in net_ports
+                        if p['fixed_ips'] is attributes.ATTR_NOT_SPECIFIED]
+            if not need_ips:
+                continue
+            self._recycle_expired_ip_allocations(context, network_id)
+            # Take the addresses other ports of the bulk ask for out of the
+            # free space first, so that they are not generated as well
+            self._reserve_requested_ips(
+                context, subnets_by_net.get(network_id, []),
+                [p for p in net_ports
+                 if p['fixed_ips'] is not attributes.ATTR_NOT_SPECIFIED])
+            for p in need_ips:
+                ips[p['id']] = []
+            # Split into v4 and v6 subnets, as in _allocate_ips_for_port
+            for version in (4, 6):
+                subnets = [subnet for subnet in
+                           subnets_by_net.get(network_id, [])
+                           if subnet['ip_version'] == version]
+                if not subnets:
+                    continue
+                generated = ipam.get_driver().generate_ips(
+                    context, subnets, len(need_ips))
+                for p, ip in zip(need_ips, generated):
+                    ips[p['id']].append(ip)
+
+        context._reserved_port_macs = macs
+        context._reserved_port_ips = ips
+
     def create_port_bulk(self, context, ports):
-        return self._create_bulk('port', context, ports)
+        with context.session.begin(subtransactions=True):
+            try:
+                self._reserve_bulk_port_addresses(context, ports['ports'])
+                return self._create_bulk('port', context, ports)
+            finally:
+                context._reserved_port_macs = {}
+                context._reserved_port_ips = {}
 
     def create_port(self, context, port):
         p = port['port']
@@ -1258,8 +1358,11 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
             # Ensure that a MAC address is defined and it is unique on the
             # network
             if mac_address is attributes.ATTR_NOT_SPECIFIED:
-                mac_address = QuantumDbPluginV2._generate_mac(context,
-                                                              network_id)
+                mac_address = getattr(context, '_reserved_port_macs',
+                                      {}).pop(port_id, None)
+                if not mac_address:
+                    mac_address = QuantumDbPluginV2._generate_mac(context,
+                                                                  network_id)
             else:
                 # Ensure that the mac on the network is unique
                 if not QuantumDbPluginV2._check_unique_mac(context,
@@ -1411,7 +1514,12 @@ class QuantumDbPluginV2(quantum_plugin_base_v2.QuantumPluginBaseV2):
                                       sorts=sorts, limit=limit,
                                       marker_obj=marker_obj,
                                       page_reverse=page_reverse)
-        items = [self._make_port_dict(c, fields) for c in query.all()]
+        items = sqlalchemyutils.query_collection(
+            query, models_v2.Port, self._make_port_dict, fields,
+            functools.partial(self._load_port_related, context),
+            plain_fields=('id', 'name', 'network_id', 'tenant_id',
+                          'mac_address', 'admin_state_up', 'status',
+                          'device_id', 'device_owner'))
         if limit and page_reverse:
             items.reverse()
         return items
@@ -47,6 +47,29 @@ class DhcpRpcCallbackMixin(object):
         network['ports'] = plugin.get_ports(context, filters=filters)
         return network
 
+    def get_networks_info(self, context, **kwargs):
+        """Retrieve and return the extended information of networks."""
+        network_ids = kwargs.get('network_ids')
+        host = kwargs.get('host')
+        LOG.debug(_('Info of %(count)d networks requested from %(host)s'),
+                  {'count': len(network_ids), 'host': host})
+        plugin = manager.QuantumManager.get_plugin()
+        filters = dict(id=network_ids)
+        networks = dict((network['id'], network) for network in
+                        plugin.get_networks(context, filters=filters))
+        for network in networks.itervalues():
+            network['subnets'] = []
+            network['ports'] = []
+        if not networks:
+            return []
+
+        filters = dict(network_id=networks.keys())
+        for subnet in plugin.get_subnets(context, filters=filters):
+            networks[subnet['network_id']]['subnets'].append(subnet)
+        for port in plugin.get_ports(context, filters=filters):
+            networks[port['network_id']]['ports'].append(port)
+        return networks.values()
+
     def get_dhcp_port(self, context, **kwargs):
         """Allocate a DHCP port for the host and return port information.
 
@@ -168,3 +191,24 @@ class DhcpRpcCallbackMixin(object):
 
         plugin.update_fixed_ip_lease_expiration(context, network_id,
                                                 ip_address, lease_remaining)
+
+    def update_lease_expirations(self, context, **kwargs):
+        """Update the expiration of a batch of leases.
+
+        leases is a list of dicts with the network_id, ip_address and
+        lease_remaining of each lease.
+        """
+        host = kwargs.get('host')
+        leases = kwargs.get('leases')
+
+        LOG.debug(_('Updating %(count)d lease expirations from %(host)s.'),
+                  {'count': len(leases), 'host': host})
+        by_network = {}
+        for lease in leases:
+            by_network.setdefault(lease['network_id'], {})[
+                lease['ip_address']] = lease['lease_remaining']
+
+        plugin = manager.QuantumManager.get_plugin()
+        for network_id, network_leases in by_network.iteritems():
+            plugin.update_fixed_ip_lease_expirations(context, network_id,
+                                                     network_leases)
@@ -0,0 +1,357 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""IP address management drivers for the Quantum DB plugin.
+
+The free address space of each allocation pool is stored as a set of
+non-overlapping intervals in the IPAvailabilityRange table. The drivers in
+this module only differ in how they carve addresses out of those intervals.
+"""
+
+import random
+
+import netaddr
+from oslo.config import cfg
+from sqlalchemy.orm import exc
+
+from quantum.common import exceptions as q_exc
+from quantum.db import models_v2
+from quantum.openstack.common import importutils
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+ipam_opts = [
+    cfg.StrOpt('ipam_driver',
+               default='quantum.db.ipam.RangeTableIpamDriver',
+               help=_("The driver used to allocate IP addresses from "
+                      "subnet allocation pools")),
+    cfg.IntOpt('ipam_shard_count', default=16,
+               help=_("Number of availability ranges the sharded IPAM "
+                      "driver spreads concurrent allocations over")),
+]
+cfg.CONF.register_opts(ipam_opts)
+
+_drivers = {}
+
+
+def get_driver():
+    """Return the IPAM driver selected by the ipam_driver option."""
+    driver_name = cfg.CONF.ipam_driver
+    if driver_name not in _drivers:
+        _drivers[driver_name] = importutils.import_object(driver_name)
+    return _drivers[driver_name]
+
+
+def merge_intervals(intervals):
+    """Merge overlapping or adjacent (first, last) integer intervals.
+
+    Returns a sorted list of disjoint intervals.
+    """
+    merged = []
+    for first, last in sorted(intervals):
+        if merged and first <= merged[-1][1] + 1:
+            if last > merged[-1][1]:
+                merged[-1] = (merged[-1][0], last)
+        else:
+            merged.append((first, last))
+    return merged
+
+
+class RangeTableIpamDriver(object):
+    """Allocate the first free address of the first availability range.
+
+    This is the historical behaviour of the DB plugin: addresses are handed
+    out sequentially, so every allocation on a subnet updates the same row.
+    """
+
+    def _get_ranges(self, context, subnet_id):
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange).join(
+                models_v2.IPAllocationPool)
+        return range_qry.filter_by(subnet_id=subnet_id)
+
+    @staticmethod
+    def _take_first(context, ip_range):
+        ip_address = ip_range['first_ip']
+        if ip_range['first_ip'] == ip_range['last_ip']:
+            # No more free indices on subnet => delete
+            LOG.debug(_("No more free IP's in slice. Deleting allocation "
+                        "pool."))
+            context.session.delete(ip_range)
+        else:
+            # increment the first free
+            ip_range['first_ip'] = str(netaddr.IPAddress(ip_address) + 1)
+        return ip_address
+
+    def _allocate_from_subnet(self, context, subnet):
+        ip_range = self._get_ranges(context, subnet['id']).first()
+        if not ip_range:
+            return
+        LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
+                    "to %(last_ip)s"),
+                  {'ip_address': ip_range['first_ip'],
+                   'first_ip': ip_range['first_ip'],
+                   'last_ip': ip_range['last_ip']})
+        return self._take_first(context, ip_range)
+
+    def generate_ip(self, context, subnets):
+        """Generate an IP address from one of the given subnets.
+
+        :raises: IpAddressGenerationFailure if all subnets are exhausted
+        """
+        for subnet in subnets:
+            ip_address = self._allocate_from_subnet(context, subnet)
+            if ip_address:
+                return {'ip_address': ip_address, 'subnet_id': subnet['id']}
+            LOG.debug(_("All IP's from subnet %(subnet_id)s (%(cidr)s) "
+                        "allocated"),
+                      {'subnet_id': subnet['id'], 'cidr': subnet['cidr']})
+        raise q_exc.IpAddressGenerationFailure(net_id=subnets[0]['network_id'])
+
+    def generate_ips(self, context, subnets, count):
+        """Generate count IP addresses from the given subnets.
+
+        Addresses are taken in bulk from the availability ranges, lowest
+        first, spilling over to the next subnet when one is exhausted.
+
+        :raises: IpAddressGenerationFailure if not enough addresses are free
+        """
+        ips = []
+        for subnet in subnets:
+            ranges = sorted(
+                self._get_ranges(context, subnet['id']),
+                key=lambda r: int(netaddr.IPAddress(r['first_ip'])))
+            for ip_range in ranges:
+                if len(ips) == count:
+                    return ips
+                first = netaddr.IPAddress(ip_range['first_ip'])
+                size = int(netaddr.IPAddress(ip_range['last_ip'])) - int(first)
+                taken = min(count - len(ips), size + 1)
+                ips.extend({'ip_address': str(first + i),
+                            'subnet_id': subnet['id']}
+                           for i in xrange(taken))
+                if taken > size:
+                    context.session.delete(ip_range)
+                else:
+                    ip_range['first_ip'] = str(first + taken)
+        if len(ips) < count:
+            raise q_exc.IpAddressGenerationFailure(
+                net_id=subnets[0]['network_id'])
+        return ips
+
+    def allocate_specific_ip(self, context, subnet_id, ip_address):
+        """Remove a specific IP address from the subnet free space."""
+        ip = int(netaddr.IPAddress(ip_address))
+        range_qry = context.session.query(
+            models_v2.IPAvailabilityRange,
+            models_v2.IPAllocationPool).join(
+                models_v2.IPAllocationPool)
+        results = range_qry.filter_by(subnet_id=subnet_id).all()
+        for (ip_range, pool) in results:
+            first = int(netaddr.IPAddress(ip_range['first_ip']))
+            last = int(netaddr.IPAddress(ip_range['last_ip']))
+            if first <= ip <= last:
+                if first == last:
+                    context.session.delete(ip_range)
+                    return
+                elif first == ip:
+                    ip_range['first_ip'] = str(
+                        netaddr.IPAddress(ip_address) + 1)
+                    return
+                elif last == ip:
+                    ip_range['last_ip'] = str(
+                        netaddr.IPAddress(ip_address) - 1)
+                    return
+                else:
+                    # Split into two ranges
+                    new_first = str(netaddr.IPAddress(ip_address) + 1)
+                    new_last = ip_range['last_ip']
+                    ip_range['last_ip'] = str(
+                        netaddr.IPAddress(ip_address) - 1)
+                    new_range = models_v2.IPAvailabilityRange(
+                        allocation_pool_id=pool['id'],
+                        first_ip=new_first,
+                        last_ip=new_last)
+                    context.session.add(new_range)
+                    return
+
+    @staticmethod
+    def _find_pool_id(pools, ip_address):
+        ip = netaddr.IPAddress(ip_address)
+        for pool in pools:
+            if ip in netaddr.IPRange(pool['first_ip'], pool['last_ip']):
+                return pool['id']
+        error_message = _("No allocation pool found for "
+                          "ip address:%s") % ip_address
+        raise q_exc.InvalidInput(error_message=error_message)
+
+    def release_ip(self, context, subnet_id, ip_address):
+        """Return an IP address to the free space of its allocation pool."""
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        pool_id = self._find_pool_id(
+            pool_qry.filter_by(subnet_id=subnet_id).all(), ip_address)
+        # Two requests will be done on the database. The first will be to
+        # search if an entry starts with ip_address + 1 (r1). The second
+        # will be to see if an entry ends with ip_address -1 (r2).
+        # If 1 of the above holds true then the specific entry will be
+        # modified. If both hold true then the two ranges will be merged.
+        # If there are no entries then a single entry will be added.
+        range_qry = context.session.query(models_v2.IPAvailabilityRange)
+        ip_first = str(netaddr.IPAddress(ip_address) + 1)
+        ip_last = str(netaddr.IPAddress(ip_address) - 1)
+        LOG.debug(_("Recycle %s"), ip_address)
+        try:
+            r1 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     first_ip=ip_first).one()
+            LOG.debug(_("Recycle: first match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        except exc.NoResultFound:
+            r1 = []
+        try:
+            r2 = range_qry.filter_by(allocation_pool_id=pool_id,
+                                     last_ip=ip_last).one()
+            LOG.debug(_("Recycle: last match for %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        except exc.NoResultFound:
+            r2 = []
+
+        if r1 and r2:
+            # Merge the two ranges
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=r2['first_ip'],
+                last_ip=r1['last_ip'])
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: merged %(first_ip1)s-%(last_ip1)s and "
+                        "%(first_ip2)s-%(last_ip2)s"),
+                      {'first_ip1': r2['first_ip'], 'last_ip1': r2['last_ip'],
+                       'first_ip2': r1['first_ip'], 'last_ip2': r1['last_ip']})
+            context.session.delete(r1)
+            context.session.delete(r2)
+        elif r1:
+            # Update the range with matched first IP
+            r1['first_ip'] = ip_address
+            LOG.debug(_("Recycle: updated first %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r1['first_ip'], 'last_ip': r1['last_ip']})
+        elif r2:
+            # Update the range with matched last IP
+            r2['last_ip'] = ip_address
+            LOG.debug(_("Recycle: updated last %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': r2['first_ip'], 'last_ip': r2['last_ip']})
+        else:
+            # Create a new range
+            ip_range = models_v2.IPAvailabilityRange(
+                allocation_pool_id=pool_id,
+                first_ip=ip_address,
+                last_ip=ip_address)
+            context.session.add(ip_range)
+            LOG.debug(_("Recycle: created new %(first_ip)s-%(last_ip)s"),
+                      {'first_ip': ip_address, 'last_ip': ip_address})
+
+    def release_ips(self, context, subnet_id, ip_addresses):
+        """Return several IP addresses of a subnet to the free space.
+
+        The allocation pools and availability ranges of the subnet are read
+        once, the released addresses are merged into them in memory and only
+        the ranges which actually changed are written back.
+        """
+        pool_qry = context.session.query(models_v2.IPAllocationPool)
+        pools = pool_qry.filter_by(subnet_id=subnet_id).all()
+        released = {}
+        for ip_address in ip_addresses:
+            pool_id = self._find_pool_id(pools, ip_address)
+            ip = int(netaddr.IPAddress(ip_address))
+            released.setdefault(pool_id, []).append((ip, ip))
+
+        ranges = {}
+        for ip_range in self._get_ranges(context, subnet_id):
+            ranges.setdefault(ip_range['allocation_pool_id'],
+                              []).append(ip_range)
+
+        for pool in pools:
+            if pool['id'] not in released:
+                continue
+            version = netaddr.IPAddress(pool['first_ip']).version
+            current = dict(((int(netaddr.IPAddress(r['first_ip'])),
+                             int(netaddr.IPAddress(r['last_ip']))), r)
+                           for r in ranges.get(pool['id'], []))
+            merged = merge_intervals(current.keys() + released[pool['id']])
+            keep = set(merged)
+            for interval, ip_range in current.iteritems():
+                if interval not in keep:
+                    context.session.delete(ip_range)
+            for first, last in merged:
+                if (first, last) in current:
+                    continue
+                context.session.add(models_v2.IPAvailabilityRange(
+                    allocation_pool_id=pool['id'],
+                    first_ip=str(netaddr.IPAddress(first, version)),
+                    last_ip=str(netaddr.IPAddress(last, version))))
+            LOG.debug(_("Recycled %(count)d IP's into allocation pool "
+                        "%(pool_id)s"),
+                      {'count': len(released[pool['id']]),
+                       'pool_id': pool['id']})
+
+
+class ShardedRangeIpamDriver(RangeTableIpamDriver):
+    """Spread allocations over several availability ranges of a subnet.
+
+    Up to ipam_shard_count ranges are read and one of them is picked at
+    random. While a subnet has fewer ranges than that, the picked range is
+    split at a random address, so a fresh pool quickly becomes a handful of
+    ranges and concurrent allocations update different rows instead of all
+    contending for the first one. The cost of an allocation is bounded by
+    the shard count rather than by the fragmentation of the pool.
+    """
+
+    def _allocate_from_subnet(self, context, subnet):
+        shard_count = max(cfg.CONF.ipam_shard_count, 1)
+        range_model = models_v2.IPAvailabilityRange
+        bounds_qry = context.session.query(
+            range_model.allocation_pool_id,
+            range_model.first_ip,
+            range_model.last_ip).join(models_v2.IPAllocationPool)
+        bounds = bounds_qry.filter_by(
+            subnet_id=subnet['id']).limit(shard_count).all()
+        if not bounds:
+            return
+
+        pool_id, first_ip, last_ip = random.choice(bounds)
+        ip_range = context.session.query(range_model).filter_by(
+            allocation_pool_id=pool_id, first_ip=first_ip).one()
+        first = netaddr.IPAddress(first_ip)
+        size = int(netaddr.IPAddress(last_ip)) - int(first) + 1
+        offset = random.randrange(size) if len(bounds) < shard_count else 0
+        if not offset:
+            ip_address = self._take_first(context, ip_range)
+        else:
+            ip = first + offset
+            ip_address = str(ip)
+            if ip_address != last_ip:
+                context.session.add(range_model(
+                    allocation_pool_id=pool_id,
+                    first_ip=str(ip + 1),
+                    last_ip=last_ip))
+            ip_range['last_ip'] = str(ip - 1)
+        LOG.debug(_("Allocated IP - %(ip_address)s from %(first_ip)s "
+                    "to %(last_ip)s"),
+                  {'ip_address': ip_address,
+                   'first_ip': first_ip,
+                   'last_ip': last_ip})
+        return ip_address
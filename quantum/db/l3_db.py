@@ -52,6 +52,9 @@ class Router(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
     admin_state_up = sa.Column(sa.Boolean)
     gw_port_id = sa.Column(sa.String(36), sa.ForeignKey('ports.id'))
     gw_port = orm.relationship(models_v2.Port)
+    # bumped whenever the router or its related resources change
+    revision = sa.Column(sa.Integer, nullable=False, default=0,
+                         server_default='0')
 
 
 class ExternalNetwork(model_base.BASEV2):
@@ -101,6 +104,16 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         _network_model_hook,
         _network_filter_hook)
 
+    def _routers_updated(self, context, router_ids):
+        """Bump the revisions of routers and notify the l3 agents."""
+        with context.session.begin(subtransactions=True):
+            query = context.session.query(Router)
+            query = query.filter(Router.id.in_(router_ids))
+            query.update({Router.revision: Router.revision + 1},
+                         synchronize_session=False)
+        routers = self.get_sync_data(context.elevated(), router_ids)
+        l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+
     def _get_router(self, context, id):
         try:
             router = self._get_by_id(context, Router, id)
@@ -158,9 +171,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             # Ensure we actually have something to update
             if r.keys():
                 router_db.update(r)
-        routers = self.get_sync_data(context.elevated(),
-                                     [router_db['id']])
-        l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+        self._routers_updated(context, [router_db['id']])
         return self._make_router_dict(router_db)
 
     def _update_router_gw_info(self, context, router_id, info):
@@ -265,7 +276,9 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'name', 'tenant_id',
+                                                  'admin_state_up', 'status'))
 
     def get_routers_count(self, context, filters=None):
         return self._get_collection_count(context, Router,
@@ -359,8 +372,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                  'device_owner': DEVICE_OWNER_ROUTER_INTF,
                  'name': ''}})
 
-        routers = self.get_sync_data(context.elevated(), [router_id])
-        l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+        self._routers_updated(context, [router_id])
         info = {'port_id': port['id'],
                 'subnet_id': port['fixed_ips'][0]['subnet_id']}
         notifier_api.notify(context,
@@ -437,8 +449,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             if not found:
                 raise l3.RouterInterfaceNotFoundForSubnet(router_id=router_id,
                                                           subnet_id=subnet_id)
-        routers = self.get_sync_data(context.elevated(), [router_id])
-        l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+        self._routers_updated(context, [router_id])
         notifier_api.notify(context,
                             notifier_api.publisher_id('network'),
                             'router.interface.delete',
@@ -648,8 +659,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             raise
         router_id = floatingip_db['router_id']
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+            self._routers_updated(context, [router_id])
         return self._make_floatingip_dict(floatingip_db)
 
     def update_floatingip(self, context, id, floatingip):
@@ -670,8 +680,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         if router_id and router_id != before_router_id:
             router_ids.append(router_id)
         if router_ids:
-            routers = self.get_sync_data(context.elevated(), router_ids)
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+            self._routers_updated(context, router_ids)
         return self._make_floatingip_dict(floatingip_db)
 
     def delete_floatingip(self, context, id):
@@ -683,8 +692,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                              floatingip['floating_port_id'],
                              l3_port_check=False)
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+            self._routers_updated(context, [router_id])
 
     def get_floatingip(self, context, id, fields=None):
         floatingip = self._get_floatingip(context, id)
@@ -701,7 +709,12 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                                     sorts=sorts,
                                     limit=limit,
                                     marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'tenant_id',
+                                                  'floating_ip_address',
+                                                  'floating_network_id',
+                                                  'router_id',
+                                                  'fixed_ip_address'))
 
     def get_floatingips_count(self, context, filters=None):
         return self._get_collection_count(context, FloatingIP,
@@ -738,8 +751,7 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                 raise Exception(_('Multiple floating IPs found for port %s')
                                 % port_id)
         if router_id:
-            routers = self.get_sync_data(context.elevated(), [router_id])
-            l3_rpc_agent_api.L3AgentNotify.routers_updated(context, routers)
+            self._routers_updated(context, [router_id])
 
     def _check_l3_view_auth(self, context, network):
         return policy.check(context,
@@ -764,6 +776,19 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             network[l3.EXTERNAL] = self._network_is_external(
                 context, network['id'])
 
+    def _extend_network_dicts_l3(self, context, networks):
+        """Same as _extend_network_dict_l3() for many networks.
+
+        The external networks among them are read in one query.
+        """
+        external = self._get_related_rows(context, ExternalNetwork,
+                                          'network_id',
+                                          [network['id']
+                                           for network in networks])
+        for network in networks:
+            if self._check_l3_view_auth(context, network):
+                network[l3.EXTERNAL] = bool(external[network['id']])
+
     def _process_l3_create(self, context, net_data, net_id):
         external = net_data.get(l3.EXTERNAL)
         external_set = attributes.is_attr_set(external)
@@ -829,58 +854,104 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
                            if it is None, all of routers will be queried.
         @return: a list of dicted routers with dicted gw_port populated if any
         """
-        router_query = context.session.query(Router)
+        router_query = context.session.query(
+            Router.id, Router.name, Router.tenant_id, Router.admin_state_up,
+            Router.status, Router.gw_port_id, Router.revision)
         if router_ids:
             router_query = router_query.filter(Router.id.in_(router_ids))
         routers = router_query.all()
-        gw_port_ids = []
         if not routers:
             return []
+        gw_port_ids = [router.gw_port_id for router in routers
+                       if router.gw_port_id]
+        gw_ports = dict((gw_port['id'], gw_port) for gw_port in
+                        self._get_sync_gw_ports(context, gw_port_ids))
+        routers_list = []
         for router in routers:
-            gw_port_id = router.gw_port_id
-            if gw_port_id:
-                gw_port_ids.append(gw_port_id)
-        gw_ports = []
-        if gw_port_ids:
-            gw_ports = self._get_sync_gw_ports(context, gw_port_ids)
-        gw_port_id_gw_port_dict = {}
-        for gw_port in gw_ports:
-            gw_port_id_gw_port_dict[gw_port['id']] = gw_port
-        router_id_gw_port_id_dict = {}
-        for router in routers:
-            router_id_gw_port_id_dict[router.id] = router.gw_port_id
-        routers_list = [self._make_router_dict(c, None) for c in routers]
-        for router in routers_list:
-            gw_port_id = router_id_gw_port_id_dict[router['id']]
-            if gw_port_id:
-                router['gw_port'] = gw_port_id_gw_port_dict[gw_port_id]
+            router_dict = {'id': router.id,
+                           'name': router.name,
+                           'tenant_id': router.tenant_id,
+                           'admin_state_up': router.admin_state_up,
+                           'status': router.status,
+                           'external_gateway_info': None,
+                           'revision': router.revision}
+            gw_port = gw_ports.get(router.gw_port_id)
+            if gw_port:
+                router_dict['external_gateway_info'] = {
+                    'network_id': gw_port['network_id']}
+                router_dict['gw_port'] = gw_port
+            routers_list.append(router_dict)
         return routers_list
 
     def _get_sync_floating_ips(self, context, router_ids):
         """Query floating_ips that relate to list of router_ids."""
         if not router_ids:
             return []
-        return self.get_floatingips(context, {'router_id': router_ids})
+        query = context.session.query(
+            FloatingIP.id, FloatingIP.tenant_id,
+            FloatingIP.floating_ip_address, FloatingIP.floating_network_id,
+            FloatingIP.router_id, FloatingIP.fixed_port_id,
+            FloatingIP.fixed_ip_address)
+        query = query.filter(FloatingIP.router_id.in_(router_ids))
+        return [{'id': fip.id,
+                 'tenant_id': fip.tenant_id,
+                 'floating_ip_address': fip.floating_ip_address,
+                 'floating_network_id': fip.floating_network_id,
+                 'router_id': fip.router_id,
+                 'port_id': fip.fixed_port_id,
+                 'fixed_ip_address': fip.fixed_ip_address}
+                for fip in query]
+
+    def _get_sync_ports(self, context, *criteria):
+        """Query the ports matching criteria, with their fixed ips.
+
+        The ports hold the attributes of the core port resource only,
+        their fixed ips come from the same query.
+        """
+        port_model = models_v2.Port
+        ip_model = models_v2.IPAllocation
+        query = context.session.query(
+            port_model.id, port_model.name, port_model.network_id,
+            port_model.tenant_id, port_model.mac_address,
+            port_model.admin_state_up, port_model.status,
+            port_model.device_id, port_model.device_owner,
+            ip_model.subnet_id, ip_model.ip_address)
+        query = query.outerjoin(ip_model, ip_model.port_id == port_model.id)
+        query = query.filter(*criteria)
+        ports = {}
+        for row in query:
+            port = ports.get(row.id)
+            if not port:
+                port = ports[row.id] = {'id': row.id,
+                                        'name': row.name,
+                                        'network_id': row.network_id,
+                                        'tenant_id': row.tenant_id,
+                                        'mac_address': row.mac_address,
+                                        'admin_state_up': row.admin_state_up,
+                                        'status': row.status,
+                                        'fixed_ips': [],
+                                        'device_id': row.device_id,
+                                        'device_owner': row.device_owner}
+            if row.ip_address:
+                port['fixed_ips'].append({'subnet_id': row.subnet_id,
+                                          'ip_address': row.ip_address})
+        ports = ports.values()
+        self._populate_subnet_for_ports(context, ports)
+        return ports
 
     def _get_sync_gw_ports(self, context, gw_port_ids):
         if not gw_port_ids:
             return []
-        filters = {'id': gw_port_ids}
-        gw_ports = self.get_ports(context, filters)
-        if gw_ports:
-            self._populate_subnet_for_ports(context, gw_ports)
-        return gw_ports
+        return self._get_sync_ports(context,
+                                    models_v2.Port.id.in_(gw_port_ids))
 
     def _get_sync_interfaces(self, context, router_ids):
         """Query router interfaces that relate to list of router_ids."""
         if not router_ids:
             return []
-        filters = {'device_id': router_ids,
-                   'device_owner': [DEVICE_OWNER_ROUTER_INTF]}
-        interfaces = self.get_ports(context, filters)
-        if interfaces:
-            self._populate_subnet_for_ports(context, interfaces)
-        return interfaces
+        return self._get_sync_ports(
+            context, models_v2.Port.device_id.in_(router_ids),
+            models_v2.Port.device_owner == DEVICE_OWNER_ROUTER_INTF)
 
     def _populate_subnet_for_ports(self, context, ports):
         """Populate ports with subnet.
@@ -903,17 +974,19 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             subnet_id_ports_dict[fixed_ip['subnet_id']] = my_ports
         if not subnet_id_ports_dict:
             return
-        filters = {'id': subnet_id_ports_dict.keys()}
-        fields = ['id', 'cidr', 'gateway_ip']
-        subnet_dicts = self.get_subnets(context, filters, fields)
-        for subnet_dict in subnet_dicts:
-            ports = subnet_id_ports_dict.get(subnet_dict['id'], [])
+        subnet_query = context.session.query(models_v2.Subnet.id,
+                                             models_v2.Subnet.cidr,
+                                             models_v2.Subnet.gateway_ip)
+        subnet_query = subnet_query.filter(
+            models_v2.Subnet.id.in_(subnet_id_ports_dict.keys()))
+        for subnet in subnet_query:
+            ports = subnet_id_ports_dict.get(subnet.id, [])
             for port in ports:
                 # TODO(gongysh) stash the subnet into fixed_ips
                 # to make the payload smaller.
-                port['subnet'] = {'id': subnet_dict['id'],
-                                  'cidr': subnet_dict['cidr'],
-                                  'gateway_ip': subnet_dict['gateway_ip']}
+                port['subnet'] = {'id': subnet.id,
+                                  'cidr': subnet.cidr,
+                                  'gateway_ip': subnet.gateway_ip}
 
     def _process_sync_data(self, routers, interfaces, floating_ips):
         routers_dict = {}
@@ -944,6 +1017,13 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
             interfaces = self._get_sync_interfaces(context, router_ids)
         return self._process_sync_data(routers, interfaces, floating_ips)
 
+    def get_router_revisions(self, context, router_ids=None):
+        """Return the revision of each router, by router id."""
+        query = context.session.query(Router.id, Router.revision)
+        if router_ids:
+            query = query.filter(Router.id.in_(router_ids))
+        return dict(query)
+
     def get_external_network_id(self, context):
         nets = self.get_networks(context, {'router:external': [True]})
         if len(nets) > 1:
@@ -42,6 +42,36 @@ class L3RpcCallbackMixin(object):
                   jsonutils.dumps(routers, indent=5))
         return routers
 
+    def sync_changed_routers(self, context, **kwargs):
+        """Sync the routers changed since the revisions seen by an agent.
+
+        @param context: contain user information
+        @param kwargs: host, router_revisions, the revision of each router
+                       known to the agent, and router_ids, to restrict the
+                       routers to sync
+        @return: a dict with the changed or new routers, with their
+                 interfaces and floating_ips, and the ids of the known
+                 routers which are deleted
+        """
+        router_revisions = kwargs.get('router_revisions') or {}
+        router_ids = kwargs.get('router_ids')
+        context = quantum_context.get_admin_context()
+        plugin = manager.QuantumManager.get_plugin()
+        revisions = plugin.get_router_revisions(context, router_ids)
+        changed_ids = [router_id for router_id, revision
+                       in revisions.iteritems()
+                       if router_revisions.get(router_id) != revision]
+        routers = []
+        if changed_ids:
+            routers = plugin.get_sync_data(context, changed_ids)
+        deleted_ids = [router_id for router_id in router_revisions
+                       if router_id not in revisions]
+        LOG.debug(_("Routers returned to l3 agent %(host)s: %(changed)d "
+                    "changed out of %(count)d, %(deleted)d deleted"),
+                  {'host': kwargs.get('host'), 'changed': len(routers),
+                   'count': len(revisions), 'deleted': len(deleted_ids)})
+        return {'routers': routers, 'deleted': deleted_ids}
+
     def get_external_network_id(self, context, **kwargs):
         """Get one external network id for l3 agent.
 
@@ -27,6 +27,7 @@ from quantum.common import exceptions as q_exc
 from quantum.db import db_base_plugin_v2
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.db import sqlalchemyutils
 from quantum.extensions import loadbalancer
 from quantum.extensions.loadbalancer import LoadBalancerPluginBase
 from quantum.openstack.common import log as logging
@@ -181,16 +182,32 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
                     query = query.filter(column.in_(value))
         return query
 
-    def _get_collection_query(self, context, model, filters=None):
+    def _get_collection_query(self, context, model, filters=None,
+                              sorts=None, limit=None, marker_obj=None,
+                              page_reverse=False):
         collection = self._model_query(context, model)
         collection = self._apply_filters_to_query(collection, model, filters)
+        if limit and page_reverse and sorts:
+            sorts = [(s[0], not s[1]) for s in sorts]
+        collection = sqlalchemyutils.paginate_query(collection, model, limit,
+                                                    sorts,
+                                                    marker_obj=marker_obj)
         return collection
 
     def _get_collection(self, context, model, dict_func, filters=None,
                         fields=None, sorts=None, limit=None, marker_obj=None,
-                        page_reverse=False):
-        query = self._get_collection_query(context, model, filters)
-        return [dict_func(c, fields) for c in query.all()]
+                        page_reverse=False, plain_fields=None):
+        query = self._get_collection_query(context, model, filters=filters,
+                                           sorts=sorts,
+                                           limit=limit,
+                                           marker_obj=marker_obj,
+                                           page_reverse=page_reverse)
+        items = sqlalchemyutils.query_collection(query, model, dict_func,
+                                                 fields,
+                                                 plain_fields=plain_fields)
+        if limit and page_reverse:
+            items.reverse()
+        return items
 
     def _get_collection_count(self, context, model, filters=None):
         return self._get_collection_query(context, model, filters).count()
@@ -218,6 +235,11 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
             v_db = self._get_resource(context, model, id)
             v_db.update({'status': status})
 
+    def _get_marker_obj(self, context, model, limit, marker):
+        if limit and marker:
+            return self._get_resource(context, model, marker)
+        return None
+
     def _get_resource(self, context, model, id):
         try:
             r = self._get_by_id(context, model, id)
@@ -389,10 +411,23 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
         vip = self._get_resource(context, Vip, id)
         return self._make_vip_dict(vip, fields)
 
-    def get_vips(self, context, filters=None, fields=None):
+    def get_vips(self, context, filters=None, fields=None,
+                 sorts=None, limit=None, marker=None,
+                 page_reverse=False):
+        marker_obj = self._get_marker_obj(context, Vip, limit, marker)
         return self._get_collection(context, Vip,
                                     self._make_vip_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts,
+                                    limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'tenant_id', 'name',
+                                                  'description', 'subnet_id',
+                                                  'address', 'port',
+                                                  'protocol', 'pool_id',
+                                                  'connection_limit',
+                                                  'admin_state_up', 'status'))
 
     ########################################################
     # Pool DB access
@@ -495,11 +530,26 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
         pool = self._get_resource(context, Pool, id)
         return self._make_pool_dict(context, pool, fields)
 
-    def get_pools(self, context, filters=None, fields=None):
-        collection = self._model_query(context, Pool)
-        collection = self._apply_filters_to_query(collection, Pool, filters)
-        return [self._make_pool_dict(context, c, fields)
-                for c in collection.all()]
+    def get_pools(self, context, filters=None, fields=None,
+                  sorts=None, limit=None, marker=None,
+                  page_reverse=False):
+        marker_obj = self._get_marker_obj(context, Pool, limit, marker)
+
+        def _make_pool_dict(pool, fields):
+            return self._make_pool_dict(context, pool, fields)
+
+        return self._get_collection(context, Pool,
+                                    _make_pool_dict,
+                                    filters=filters, fields=fields,
+                                    sorts=sorts,
+                                    limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'tenant_id', 'name',
+                                                  'description', 'subnet_id',
+                                                  'protocol', 'vip_id',
+                                                  'lb_method',
+                                                  'admin_state_up', 'status'))
 
     def get_stats(self, context, pool_id):
         with context.session.begin(subtransactions=True):
@@ -623,10 +673,20 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
         member = self._get_resource(context, Member, id)
         return self._make_member_dict(member, fields)
 
-    def get_members(self, context, filters=None, fields=None):
+    def get_members(self, context, filters=None, fields=None,
+                    sorts=None, limit=None, marker=None,
+                    page_reverse=False):
+        marker_obj = self._get_marker_obj(context, Member, limit, marker)
         return self._get_collection(context, Member,
                                     self._make_member_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts,
+                                    limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'tenant_id', 'pool_id',
+                                                  'address', 'port', 'weight',
+                                                  'admin_state_up', 'status'))
 
     ########################################################
     # HealthMonitor DB access
@@ -690,7 +750,21 @@ class LoadBalancerPluginDb(LoadBalancerPluginBase):
         healthmonitor = self._get_resource(context, HealthMonitor, id)
         return self._make_health_monitor_dict(healthmonitor, fields)
 
-    def get_health_monitors(self, context, filters=None, fields=None):
+    def get_health_monitors(self, context, filters=None, fields=None,
+                            sorts=None, limit=None, marker=None,
+                            page_reverse=False):
+        marker_obj = self._get_marker_obj(context, HealthMonitor, limit,
+                                          marker)
         return self._get_collection(context, HealthMonitor,
                                     self._make_health_monitor_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    sorts=sorts,
+                                    limit=limit,
+                                    marker_obj=marker_obj,
+                                    page_reverse=page_reverse,
+                                    # the HTTP attributes are only returned
+                                    # for HTTP monitors
+                                    plain_fields=('id', 'tenant_id', 'type',
+                                                  'delay', 'timeout',
+                                                  'max_retries',
+                                                  'admin_state_up', 'status'))
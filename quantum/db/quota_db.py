@@ -15,11 +15,16 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from oslo.config import cfg
 import sqlalchemy as sa
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import orm
 
 from quantum.common import exceptions
 from quantum.db import model_base
 from quantum.db import models_v2
+from quantum.openstack.common import timeutils
+from quantum import quota
 
 
 class Quota(model_base.BASEV2, models_v2.HasId):
@@ -33,6 +38,20 @@ class Quota(model_base.BASEV2, models_v2.HasId):
     limit = sa.Column(sa.Integer)
 
 
+class QuotaUsage(model_base.BASEV2, models_v2.HasId):
+    """Represent the number of a resource that a tenant is using.
+
+    The row is created when the usage is first counted and is then kept
+    up to date as resources are created and deleted.
+    """
+    __table_args__ = (sa.UniqueConstraint('tenant_id', 'resource'),)
+
+    tenant_id = sa.Column(sa.String(255), index=True)
+    resource = sa.Column(sa.String(255))
+    in_use = sa.Column(sa.Integer, nullable=False, default=0)
+    counted_at = sa.Column(sa.DateTime)
+
+
 class DbQuotaDriver(object):
     """
     Driver to perform necessary checks to enforce quotas and obtain
@@ -184,3 +203,146 @@ class DbQuotaDriver(object):
                  if quotas[key] >= 0 and quotas[key] < val]
         if overs:
             raise exceptions.OverQuota(overs=sorted(overs))
+
+
+def _resource_tables():
+    """Map the tables of the countable resources to their names."""
+    tables = model_base.BASEV2.metadata.tables
+    resources = {}
+    for name in quota.QUOTAS.resources:
+        # NOTE: models are named after their resource, so the table of
+        # security_group is securitygroups
+        table = name.replace('_', '') + 's'
+        if table in tables:
+            resources[table] = name
+    return resources
+
+
+def _track_usage(session, flush_context):
+    """Apply the resources added and deleted by a flush to the usages."""
+    resources = None
+    deltas = {}
+    for objs, delta in ((session.new, 1), (session.deleted, -1)):
+        for obj in objs:
+            tenant_id = getattr(obj, 'tenant_id', None)
+            if not tenant_id:
+                continue
+            if resources is None:
+                resources = _resource_tables()
+            resource = resources.get(getattr(obj, '__tablename__', None))
+            if resource:
+                key = (tenant_id, resource)
+                deltas[key] = deltas.get(key, 0) + delta
+
+    table = QuotaUsage.__table__
+    for (tenant_id, resource), delta in deltas.iteritems():
+        if delta:
+            session.execute(
+                table.update().
+                where(sa.and_(table.c.tenant_id == tenant_id,
+                              table.c.resource == resource)).
+                values(in_use=table.c.in_use + delta))
+
+
+_USAGE_TRACKING = []
+
+
+def _register_usage_tracking():
+    if not _USAGE_TRACKING:
+        sa.event.listen(orm.Session, 'after_flush', _track_usage)
+        _USAGE_TRACKING.append(_track_usage)
+
+
+class UsageTrackingQuotaDriver(DbQuotaDriver):
+    """
+    Database quota driver which keeps track of the resources in use, so
+    that creates do not have to count the resources of the tenant.
+
+    The usage of each tenant and resource is adjusted in the transaction
+    which adds or deletes the resources, and is counted again once it is
+    older than quota_usage_refresh_interval seconds or would put the
+    tenant over its quota. Resources removed by bulk query deletes are
+    only caught up with by those recounts.
+    """
+
+    def __init__(self):
+        _register_usage_tracking()
+
+    @classmethod
+    def _check_usage(cls, context, tenant_id, resource, count, args, delta,
+                     limit):
+        try:
+            return cls._lock_usage(context, tenant_id, resource, count, args,
+                                   delta, limit)
+        except sa_exc.IntegrityError:
+            # A concurrent request created the usage row first
+            return cls._lock_usage(context, tenant_id, resource, count, args,
+                                   delta, limit)
+
+    @staticmethod
+    def _lock_usage(context, tenant_id, resource, count, args, delta, limit):
+        """Check delta more of a resource against the locked usage row.
+
+        The usage is counted again when it is missing or stale, and when
+        it would fail the check: bulk query deletes, like the subnets of a
+        deleted network, are not tracked and leave the usage too high.
+        Returns whether the delta is within the limit.
+        """
+        session = context.session
+        with session.begin(subtransactions=True):
+            usage = (session.query(QuotaUsage).
+                     filter_by(tenant_id=tenant_id, resource=resource).
+                     with_lockmode('update').first())
+            if usage is None:
+                usage = QuotaUsage(tenant_id=tenant_id, resource=resource)
+                session.add(usage)
+                session.flush()
+            interval = cfg.CONF.QUOTAS.quota_usage_refresh_interval
+            if (usage.counted_at is None or
+                    timeutils.is_older_than(usage.counted_at, interval) or
+                    usage.in_use + delta > limit):
+                usage.in_use = count(context, *(args + (tenant_id,)))
+                usage.counted_at = timeutils.utcnow()
+            return usage.in_use + delta <= limit
+
+    def limit_check_delta(self, context, tenant_id, resources, resource,
+                          delta, *args):
+        """Check that delta more of a resource are within the quota.
+
+        All the items of a bulk request are checked together while the
+        usage row of the tenant is locked once. The lock is released
+        before the resources are created, so as with the other drivers
+        concurrent requests can still together go over the quota.
+
+        This method will raise a QuotaResourceUnknown exception if the
+        resource is unknown, and an OverQuota exception if the delta
+        would put the tenant over its quota.
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resources: A dictionary of the registered resources.
+        :param resource: The name of the resource to check.
+        :param delta: The number of resources to be created.
+        :param args: Passed, followed by tenant_id, to the count function
+                     of the resource when the usage has to be counted.
+        """
+        if resource not in resources:
+            raise exceptions.QuotaResourceUnknown(unknown=[resource])
+        if delta < 0:
+            raise exceptions.InvalidQuotaValue(unders=[resource])
+
+        limit = self.get_tenant_quotas(
+            context, {resource: resources[resource]}, tenant_id)[resource]
+        if limit < 0:
+            return
+
+        count = resources[resource].count
+        if resource not in _resource_tables().values():
+            # Nothing keeps the usage of this resource up to date
+            within = count(context, *(args + (tenant_id,))) + delta <= limit
+        else:
+            within = self._check_usage(context, tenant_id, resource, count,
+                                       args, delta, limit)
+
+        if not within:
+            raise exceptions.OverQuota(overs=[resource])
@@ -126,7 +126,9 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
                                     filters=filters, fields=fields,
                                     sorts=sorts,
                                     limit=limit, marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'name', 'tenant_id',
+                                                  'description'))
 
     def get_security_groups_count(self, context, filters=None):
         return self._get_collection_count(context, SecurityGroup,
@@ -200,7 +202,9 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
         return self._get_collection(context,
                                     SecurityGroupPortBinding,
                                     self._make_security_group_binding_dict,
-                                    filters=filters, fields=fields)
+                                    filters=filters, fields=fields,
+                                    plain_fields=('port_id',
+                                                  'security_group_id'))
 
     def _delete_port_security_group_bindings(self, context, port_id):
         query = self._model_query(context, SecurityGroupPortBinding)
@@ -349,7 +353,15 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
                                     filters=filters, fields=fields,
                                     sorts=sorts,
                                     limit=limit, marker_obj=marker_obj,
-                                    page_reverse=page_reverse)
+                                    page_reverse=page_reverse,
+                                    plain_fields=('id', 'tenant_id',
+                                                  'security_group_id',
+                                                  'ethertype', 'direction',
+                                                  'protocol',
+                                                  'port_range_min',
+                                                  'port_range_max',
+                                                  'source_ip_prefix',
+                                                  'source_group_id'))
 
     def get_security_group_rules_count(self, context, filters=None):
         return self._get_collection_count(context, SecurityGroupRule,
@@ -384,6 +396,20 @@ class SecurityGroupDbMixin(ext_sg.SecurityGroupPluginBase):
                 security_group_id['security_group_id'])
         return port
 
+    def _extend_port_dicts_security_group(self, context, ports):
+        """Same as _extend_port_dict_security_group() for many ports.
+
+        The security group bindings of all the ports are read in one query.
+        """
+        bindings = self._get_related_rows(context, SecurityGroupPortBinding,
+                                          'port_id',
+                                          [port['id'] for port in ports])
+        for port in ports:
+            port[ext_sg.SECURITYGROUPS] = [
+                binding['security_group_id']
+                for binding in bindings[port['id']]]
+        return ports
+
     def _process_port_create_security_group(self, context, port_id,
                                             security_group_id):
         if not attr.is_attr_set(security_group_id):
@@ -16,6 +16,7 @@
 #    under the License.
 
 import netaddr
+from oslo.config import cfg
 
 from quantum.common import constants as q_const
 from quantum.common import utils
@@ -26,6 +27,18 @@ from quantum.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+security_group_server_opts = [
+    cfg.BoolOpt(
+        'enable_server_cache',
+        default=False,
+        help=_("Cache the rules and the member ips of security groups "
+               "in the server, for the security group rpc calls of the "
+               "agents. The cache only sees the changes made by its own "
+               "process, do not enable it when several server processes "
+               "share the database.")),
+]
+cfg.CONF.register_opts(security_group_server_opts, 'SECURITYGROUP')
+
 
 IP_MASK = {q_const.IPv4: 32,
            q_const.IPv6: 128}
@@ -35,6 +48,92 @@ DIRECTION_IP_PREFIX = {'ingress': 'source_ip_prefix',
                        'egress': 'dest_ip_prefix'}
 
 
+class SecurityGroupServerCache(object):
+    """Rules and member ips of security groups, kept by the server.
+
+    The entries of a security group are dropped when its rules or its
+    members change, they are read again from the database on next use.
+    """
+
+    def __init__(self):
+        # security group id -> list of rule dicts
+        self.rules = {}
+        # security group id -> list of member ips
+        self.member_ips = {}
+        # bumped on every invalidation, so that what was read from the
+        # database before a change is not cached after it
+        self.generation = 0
+
+    @staticmethod
+    def get(entries, security_group_ids):
+        """Return the cached entries and the ids which are not cached."""
+        found = {}
+        missing = []
+        for sgid in security_group_ids:
+            if sgid in entries:
+                found[sgid] = entries[sgid]
+            else:
+                missing.append(sgid)
+        return found, missing
+
+    def update(self, entries, values, generation):
+        if generation == self.generation:
+            entries.update(values)
+
+    def invalidate_rules(self, security_group_ids):
+        self.generation += 1
+        for sgid in security_group_ids or []:
+            self.rules.pop(sgid, None)
+
+    def invalidate_members(self, security_group_ids):
+        self.generation += 1
+        for sgid in security_group_ids or []:
+            self.member_ips.pop(sgid, None)
+
+    def clear(self):
+        self.generation += 1
+        self.rules.clear()
+        self.member_ips.clear()
+
+
+SG_CACHE = SecurityGroupServerCache()
+
+
+def make_port_dicts(session, plugin, ports_and_sgs):
+    """Make the port dicts of (port, security group id) rows.
+
+    The rows come from a query of ports outer joined with their security
+    group bindings. The dicts are the ones of get_port_from_device(), keyed
+    by port id, and the fixed ips of all the ports are read in one query.
+    """
+    ports = {}
+    security_groups = {}
+    for port, sg_id in ports_and_sgs:
+        ports[port['id']] = port
+        port_sgs = security_groups.setdefault(port['id'], [])
+        if sg_id:
+            port_sgs.append(sg_id)
+    if not ports:
+        return {}
+    fixed_ips = dict((port_id, []) for port_id in ports)
+    query = session.query(models_v2.IPAllocation)
+    query = query.filter(models_v2.IPAllocation.port_id.in_(ports.keys()))
+    for ip in query:
+        fixed_ips[ip['port_id']].append(ip)
+    port_dicts = {}
+    for port_id, port in ports.iteritems():
+        values = dict(port)
+        values['fixed_ips'] = fixed_ips[port_id]
+        port_dict = plugin._make_port_dict(values)
+        port_dict[ext_sg.SECURITYGROUPS] = security_groups[port_id]
+        port_dict['security_group_rules'] = []
+        port_dict['security_group_source_groups'] = []
+        port_dict['fixed_ips'] = [ip['ip_address']
+                                  for ip in fixed_ips[port_id]]
+        port_dicts[port_id] = port_dict
+    return port_dicts
+
+
 class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
 
     def create_security_group_rule(self, context, security_group_rule):
@@ -42,6 +141,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.create_security_group_rule_bulk_native(context,
                                                            bulk_rule)[0]
         sgids = [rule['security_group_id']]
+        SG_CACHE.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, sgids)
         return rule
 
@@ -51,6 +151,7 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
                       self).create_security_group_rule_bulk_native(
                           context, security_group_rule)
         sgids = set([r['security_group_id'] for r in rules])
+        SG_CACHE.invalidate_rules(sgids)
         self.notifier.security_groups_rule_updated(context, list(sgids))
         return rules
 
@@ -58,9 +159,26 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         rule = self.get_security_group_rule(context, sgrid)
         super(SecurityGroupServerRpcMixin,
               self).delete_security_group_rule(context, sgrid)
+        SG_CACHE.invalidate_rules([rule['security_group_id']])
         self.notifier.security_groups_rule_updated(context,
                                                    [rule['security_group_id']])
 
+    def delete_security_group(self, context, id):
+        super(SecurityGroupServerRpcMixin,
+              self).delete_security_group(context, id)
+        # rules of other groups with this group as source are gone too
+        SG_CACHE.clear()
+
+    def notify_security_groups_member_updated(self, context, port):
+        """ notify agents that the members of the groups of port changed
+
+        This also drops the members of the groups from the server cache.
+        """
+        security_groups = port.get(ext_sg.SECURITYGROUPS)
+        SG_CACHE.invalidate_members(security_groups)
+        self.notifier.security_groups_member_updated(context,
+                                                     security_groups)
+
     def update_security_group_on_port(self, context, id, port,
                                       original_port, updated_port):
         """ update security groups on port
@@ -70,6 +188,10 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
         It is because another changes for the port may require notification.
         """
         need_notify = False
+        if ext_sg.SECURITYGROUPS not in original_port:
+            # is_security_group_member_updated() needs the groups the port
+            # is leaving, read them before the bindings are replaced
+            self._extend_port_dict_security_group(context, original_port)
         if ext_sg.SECURITYGROUPS in port['port']:
             # delete the port binding and read it with the new rules
             port['port'][ext_sg.SECURITYGROUPS] = (
@@ -96,8 +218,10 @@ class SecurityGroupServerRpcMixin(sg_db.SecurityGroupDbMixin):
             not utils.compare_elements(
                 original_port.get(ext_sg.SECURITYGROUPS),
                 updated_port.get(ext_sg.SECURITYGROUPS))):
-            self.notifier.security_groups_member_updated(
-                context, updated_port.get(ext_sg.SECURITYGROUPS))
+            # the port may have left some groups too
+            SG_CACHE.invalidate_members(
+                original_port.get(ext_sg.SECURITYGROUPS))
+            self.notify_security_groups_member_updated(context, updated_port)
             need_notify = True
         return need_notify
 
@@ -118,16 +242,122 @@ class SecurityGroupServerRpcCallbackMixin(object):
         :returns: port correspond to the devices with security group rules
         """
         devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        return self._security_group_rules_for_ports(context, ports)
 
-        ports = {}
+    def security_group_info_for_devices(self, context, **kwargs):
+        """ return security groups of each port with their rules and members
+
+        Unlike security_group_rules_for_devices, the rules of a security
+        group are sent once instead of being expanded on every port, so
+        that the agent can cache them and apply group level updates.
+
+        :params devices: list of devices
+        :returns: dict with
+                  devices: port correspond to the devices, with the
+                  provider rules as security_group_rules
+                  security_groups: rules of the security groups of the ports
+                  sg_member_ips: ips of each source group of those rules
+        """
+        devices = kwargs.get('devices')
+        ports = self._select_ports_for_devices(devices)
+        self._apply_provider_rule(context, ports, default_egress=False)
+        security_group_ids = set()
+        for port in ports.values():
+            security_group_ids.update(port.get(ext_sg.SECURITYGROUPS, []))
+        info = self._security_group_info(context, security_group_ids)
+        info['devices'] = ports
+        return info
+
+    def security_group_info_for_groups(self, context, **kwargs):
+        """ return rules and members of security groups
+
+        This is the delta an agent needs to apply a rule or member update
+        of the security groups to its cached security groups.
+
+        :params security_groups: list of security group ids
+        :returns: dict with
+                  security_groups: rules of the security groups
+                  sg_member_ips: ips of the security groups and of the
+                  source groups of their rules
+        """
+        security_group_ids = set(kwargs.get('security_groups', []))
+        return self._security_group_info(context, security_group_ids,
+                                         security_group_ids)
+
+    def get_ports_from_devices(self, devices):
+        """ return the ports of the devices found in the database
+
+        The ports are the ones of get_port_from_device, which is called
+        for each device. Plugins can override this to look all the devices
+        up with a few queries.
+        """
+        ports = []
         for device in devices:
             port = self.get_port_from_device(device)
-            if not port:
-                continue
+            if port:
+                ports.append(port)
+        return ports
+
+    def _select_ports_for_devices(self, devices):
+        ports = {}
+        for port in self.get_ports_from_devices(devices or []):
             if port['device_owner'].startswith('network:'):
                 continue
             ports[port['id']] = port
-        return self._security_group_rules_for_ports(context, ports)
+        return ports
+
+    def _security_group_info(self, context, security_group_ids,
+                             source_group_ids=()):
+        security_groups = self._get_rules_for_groups(context,
+                                                     security_group_ids)
+        source_group_ids = set(source_group_ids)
+        for rules in security_groups.values():
+            for rule in rules:
+                if rule.get('source_group_id'):
+                    source_group_ids.add(rule['source_group_id'])
+        ips = self._get_ips_for_source_groups(context, source_group_ids)
+        return {'security_groups': security_groups,
+                'sg_member_ips': ips}
+
+    def _get_rules_for_groups(self, context, security_group_ids):
+        """ return the rule dicts of each group, from the cache if enabled
+        """
+        use_cache = cfg.CONF.SECURITYGROUP.enable_server_cache
+        if use_cache:
+            generation = SG_CACHE.generation
+            rules, missing = SG_CACHE.get(SG_CACHE.rules, security_group_ids)
+        else:
+            rules, missing = {}, security_group_ids
+        fetched = dict((sgid, []) for sgid in missing)
+        for rule_in_db in self._select_rules_for_groups(context, missing):
+            rule_dict = self._make_rule_dict(rule_in_db)
+            fetched[rule_dict['security_group_id']].append(rule_dict)
+        if use_cache:
+            SG_CACHE.update(SG_CACHE.rules, fetched, generation)
+        rules.update(fetched)
+        return rules
+
+    def _get_ips_for_source_groups(self, context, source_group_ids):
+        """ return the member ips of each group, from the cache if enabled
+        """
+        if not cfg.CONF.SECURITYGROUP.enable_server_cache:
+            return self._select_ips_for_source_group(context,
+                                                     list(source_group_ids))
+        generation = SG_CACHE.generation
+        ips, missing = SG_CACHE.get(SG_CACHE.member_ips, source_group_ids)
+        fetched = self._select_ips_for_source_group(context, missing)
+        SG_CACHE.update(SG_CACHE.member_ips, fetched, generation)
+        ips.update(fetched)
+        return ips
+
+    def _select_rules_for_groups(self, context, security_group_ids):
+        if not security_group_ids:
+            return []
+        sgr_sgid = sg_db.SecurityGroupRule.security_group_id
+        query = context.session.query(sg_db.SecurityGroupRule)
+        query = query.filter(sgr_sgid.in_(list(security_group_ids)))
+        return query.all()
 
     def _select_rules_for_ports(self, context, ports):
         if not ports:
@@ -195,10 +425,28 @@ class SecurityGroupServerRpcCallbackMixin(object):
             ips[port['network_id']].append(ip)
         return ips
 
+    def _members_by_ethertype(self, ips):
+        """ group the member ips of each group by ethertype
+
+        Each ip is parsed once and comes with its prefix, instead of being
+        parsed again for every rule of every port using its group.
+        """
+        members = {}
+        for source_group_id, group_ips in ips.iteritems():
+            by_ethertype = members[source_group_id] = {q_const.IPv4: [],
+                                                       q_const.IPv6: []}
+            for ip in group_ips:
+                ethertype = 'IPv%s' % netaddr.IPAddress(ip).version
+                by_ethertype[ethertype].append(
+                    (ip, "%s/%s" % (ip, IP_MASK[ethertype])))
+        return members
+
     def _convert_source_group_id_to_ip_prefix(self, context, ports):
-        source_group_ids = self._select_source_group_ids(ports)
-        ips = self._select_ips_for_source_group(context, source_group_ids)
+        source_group_ids = set(self._select_source_group_ids(ports))
+        ips = self._get_ips_for_source_groups(context, source_group_ids)
+        members = self._members_by_ethertype(ips)
         for port in ports.values():
+            fixed_ips = set(port.get('fixed_ips', []))
             updated_rule = []
             for rule in port.get('security_group_rules'):
                 source_group_id = rule.get('source_group_id')
@@ -209,17 +457,13 @@ class SecurityGroupServerRpcCallbackMixin(object):
                     continue
 
                 port['security_group_source_groups'].append(source_group_id)
-                base_rule = rule
-                for ip in ips[source_group_id]:
-                    if ip in port.get('fixed_ips', []):
-                        continue
-                    ip_rule = base_rule.copy()
-                    version = netaddr.IPAddress(ip).version
-                    ethertype = 'IPv%s' % version
-                    if base_rule['ethertype'] != ethertype:
+                group_members = members[source_group_id].get(
+                    rule['ethertype'], [])
+                for ip, ip_prefix in group_members:
+                    if ip in fixed_ips:
                         continue
-                    ip_rule[direction_ip_prefix] = "%s/%s" % (
-                        ip, IP_MASK[ethertype])
+                    ip_rule = rule.copy()
+                    ip_rule[direction_ip_prefix] = ip_prefix
                     updated_rule.append(ip_rule)
             port['security_group_rules'] = updated_rule
         return ports
@@ -269,33 +513,48 @@ class SecurityGroupServerRpcCallbackMixin(object):
                                                      IP_MASK[q_const.IPv6])
             port['security_group_rules'].append(ra_rule)
 
-    def _apply_provider_rule(self, context, ports):
+    def _apply_provider_rule(self, context, ports, default_egress=True):
         network_ids = self._select_network_ids(ports)
         ips = self._select_dhcp_ips_for_network_ids(context, network_ids)
         for port in ports.values():
-            self._add_default_egress_rule(port, q_const.IPv4, ips)
-            self._add_default_egress_rule(port, q_const.IPv6, ips)
+            if default_egress:
+                self._add_default_egress_rule(port, q_const.IPv4, ips)
+                self._add_default_egress_rule(port, q_const.IPv6, ips)
             self._add_ingress_ra_rule(port, ips)
             self._add_ingress_dhcp_rule(port, ips)
 
     def _security_group_rules_for_ports(self, context, ports):
-        rules_in_db = self._select_rules_for_ports(context, ports)
-        for (binding, rule_in_db) in rules_in_db:
-            port_id = binding['port_id']
-            port = ports[port_id]
-            direction = rule_in_db['direction']
-            rule_dict = {
-                'security_group_id': rule_in_db['security_group_id'],
-                'direction': direction,
-                'ethertype': rule_in_db['ethertype'],
-            }
-            for key in ('protocol', 'port_range_min', 'port_range_max',
-                        'source_ip_prefix', 'source_group_id'):
-                if rule_in_db.get(key):
-                    if key == 'source_ip_prefix' and direction == 'egress':
-                        rule_dict['dest_ip_prefix'] = rule_in_db[key]
-                        continue
-                    rule_dict[key] = rule_in_db[key]
-            port['security_group_rules'].append(rule_dict)
+        if cfg.CONF.SECURITYGROUP.enable_server_cache:
+            # the rules of a group are made once and shared by its ports
+            security_group_ids = set()
+            for port in ports.values():
+                security_group_ids.update(port[ext_sg.SECURITYGROUPS])
+            rules = self._get_rules_for_groups(context, security_group_ids)
+            for port in ports.values():
+                for sgid in port[ext_sg.SECURITYGROUPS]:
+                    port['security_group_rules'].extend(rules[sgid])
+        else:
+            rules_in_db = self._select_rules_for_ports(context, ports)
+            for (binding, rule_in_db) in rules_in_db:
+                port_id = binding['port_id']
+                port = ports[port_id]
+                port['security_group_rules'].append(
+                    self._make_rule_dict(rule_in_db))
         self._apply_provider_rule(context, ports)
         return self._convert_source_group_id_to_ip_prefix(context, ports)
+
+    def _make_rule_dict(self, rule_in_db):
+        direction = rule_in_db['direction']
+        rule_dict = {
+            'security_group_id': rule_in_db['security_group_id'],
+            'direction': direction,
+            'ethertype': rule_in_db['ethertype'],
+        }
+        for key in ('protocol', 'port_range_min', 'port_range_max',
+                    'source_ip_prefix', 'source_group_id'):
+            if rule_in_db.get(key):
+                if key == 'source_ip_prefix' and direction == 'egress':
+                    rule_dict['dest_ip_prefix'] = rule_in_db[key]
+                    continue
+                rule_dict[key] = rule_in_db[key]
+        return rule_dict
@@ -0,0 +1,322 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Allocation of segmentation ids (vlan or tunnel ids) for L2 plugins.
+
+The free ids of a pool are stored as non-overlapping ranges in the
+segment_ranges table, while the allocation table of the plugin only holds
+the allocated ids. Both tables stay proportional to the number of networks
+and of configured ranges rather than to the size of the ranges.
+"""
+
+import random
+
+import sqlalchemy as sa
+
+from quantum.db import ipam
+from quantum.db import model_base
+from quantum.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# number of free ranges an allocation picks from at random
+MAX_CANDIDATE_RANGES = 16
+
+
+class SegmentRange(model_base.BASEV2):
+    """Represents a range of free segmentation ids of a pool"""
+    __tablename__ = 'segment_ranges'
+
+    pool = sa.Column(sa.String(32), nullable=False, primary_key=True)
+    physical_network = sa.Column(sa.String(64), nullable=False,
+                                 primary_key=True)
+    first_id = sa.Column(sa.Integer, nullable=False, primary_key=True,
+                         autoincrement=False)
+    last_id = sa.Column(sa.Integer, nullable=False)
+
+    def __repr__(self):
+        return "<SegmentRange(%s,%s,%d-%d)>" % (self.pool,
+                                                self.physical_network,
+                                                self.first_id, self.last_id)
+
+
+def _subtract_ids(intervals, ids):
+    """Return the intervals left once the sorted ids are taken out."""
+    free = []
+    ids = iter(ids)
+    segment_id = next(ids, None)
+    for first, last in intervals:
+        while segment_id is not None and segment_id <= last:
+            if segment_id >= first:
+                if segment_id > first:
+                    free.append((first, segment_id - 1))
+                first = segment_id + 1
+            segment_id = next(ids, None)
+        if first <= last:
+            free.append((first, last))
+    return free
+
+
+class SegmentAllocator(object):
+    """Allocate the segmentation ids of a pool.
+
+    The allocated ids are rows of model, an allocation model of the plugin
+    with a constructor taking the physical network, if the pool has any,
+    and the id. Ids are picked at random among the free ranges, so that
+    concurrent allocations do not all update the same row. The ranges an
+    allocation changes are locked and read again first.
+
+    :param pool: name of the pool in the segment_ranges table
+    :param model: allocation model of the plugin
+    :param id_attr: name of the segmentation id attribute of the model
+    :param physical_network_attr: name of the physical network attribute of
+                                  the model, None if the ids of the pool are
+                                  not bound to physical networks
+    """
+
+    def __init__(self, pool, model, id_attr, physical_network_attr=None):
+        self.pool = pool
+        self.model = model
+        self.id_attr = id_attr
+        self.physical_network_attr = physical_network_attr
+
+    def _make_allocation(self, physical_network, segment_id):
+        if self.physical_network_attr:
+            return self.model(physical_network, segment_id)
+        return self.model(segment_id)
+
+    def _physical_network(self, alloc):
+        if self.physical_network_attr:
+            return getattr(alloc, self.physical_network_attr)
+        return ''
+
+    def _query_allocation(self, session, physical_network, segment_id):
+        filters = {self.id_attr: segment_id}
+        if self.physical_network_attr:
+            filters[self.physical_network_attr] = physical_network
+        return session.query(self.model).filter_by(**filters)
+
+    def _query_ranges(self, session, physical_network=None, lock=False):
+        query = session.query(SegmentRange).filter_by(pool=self.pool)
+        if physical_network is not None:
+            query = query.filter_by(physical_network=physical_network)
+        if lock:
+            # read the ranges again even if they are in the session, a
+            # concurrent allocation may have changed them
+            query = query.with_lockmode('update').populate_existing()
+        return query
+
+    def _find_range(self, session, physical_network, segment_id,
+                    lock=False):
+        query = self._query_ranges(session, physical_network or '', lock)
+        return query.filter(SegmentRange.first_id <= segment_id,
+                            SegmentRange.last_id >= segment_id).first()
+
+    def sync(self, session, ranges):
+        """Make the free ranges match the configured ranges.
+
+        :param ranges: dict of physical network -> list of (first, last)
+                       ranges of ids, the physical network is ignored for a
+                       pool without physical networks
+
+        The ids which are allocated stay so, even when they are not in the
+        configured ranges anymore.
+        """
+        with session.begin(subtransactions=True):
+            # rows of free ids were kept before the ranges were introduced
+            unallocated = session.query(self.model).filter_by(allocated=False)
+            unallocated.delete(synchronize_session=False)
+
+            allocated = {}
+            for alloc in session.query(self.model):
+                allocated.setdefault(self._physical_network(alloc),
+                                     []).append(getattr(alloc, self.id_attr))
+
+            wanted = set()
+            for physical_network, id_ranges in ranges.iteritems():
+                physical_network = physical_network or ''
+                free = _subtract_ids(
+                    ipam.merge_intervals(id_ranges),
+                    sorted(allocated.get(physical_network, [])))
+                wanted.update((physical_network, first, last)
+                              for first, last in free)
+
+            for id_range in self._query_ranges(session):
+                key = (id_range.physical_network, id_range.first_id,
+                       id_range.last_id)
+                if key in wanted:
+                    wanted.remove(key)
+                else:
+                    LOG.debug(_("Removing range %(first)s-%(last)s on "
+                                "physical network %(physical_network)s "
+                                "from pool %(pool)s"),
+                              {'first': id_range.first_id,
+                               'last': id_range.last_id,
+                               'physical_network': id_range.physical_network,
+                               'pool': self.pool})
+                    session.delete(id_range)
+            # deletions may free primary keys of the new ranges
+            session.flush()
+            for physical_network, first, last in sorted(wanted):
+                LOG.debug(_("Adding range %(first)s-%(last)s on physical "
+                            "network %(physical_network)s to pool %(pool)s"),
+                          {'first': first, 'last': last,
+                           'physical_network': physical_network,
+                           'pool': self.pool})
+                session.add(SegmentRange(pool=self.pool,
+                                         physical_network=physical_network,
+                                         first_id=first, last_id=last))
+
+    def get_allocation(self, session, physical_network, segment_id):
+        """Return the allocation of an id.
+
+        An id in a free range gets a new unallocated allocation, which is
+        not added to the session. None is returned for an id which is
+        neither allocated nor in the pool.
+        """
+        alloc = self._query_allocation(session, physical_network,
+                                       segment_id).first()
+        if alloc:
+            return alloc
+        if self._find_range(session, physical_network, segment_id):
+            return self._make_allocation(physical_network, segment_id)
+
+    def _take(self, session, id_range, segment_id):
+        """Remove segment_id from the free range id_range."""
+        first, last = id_range.first_id, id_range.last_id
+        if first == last:
+            session.delete(id_range)
+        elif segment_id == first:
+            id_range.first_id = first + 1
+        elif segment_id == last:
+            id_range.last_id = last - 1
+        else:
+            # split the range in two
+            id_range.last_id = segment_id - 1
+            session.add(SegmentRange(pool=self.pool,
+                                     physical_network=id_range.
+                                     physical_network,
+                                     first_id=segment_id + 1,
+                                     last_id=last))
+
+    def _allocate(self, session, physical_network, segment_id):
+        alloc = self._make_allocation(physical_network, segment_id)
+        alloc.allocated = True
+        session.add(alloc)
+        return alloc
+
+    def reserve(self, session):
+        """Allocate a free id of the pool.
+
+        :returns: (physical network, id), or None if the pool is exhausted
+        """
+        with session.begin(subtransactions=True):
+            candidates = self._query_ranges(session).limit(
+                MAX_CANDIDATE_RANGES).all()
+            if not candidates:
+                return
+            # Only the chosen range is locked, so that concurrent
+            # allocations can pick other ranges
+            id_range = random.choice(candidates)
+            id_range = self._query_ranges(
+                session, id_range.physical_network, lock=True).filter_by(
+                    first_id=id_range.first_id).first()
+            if not id_range:
+                # the range was taken meanwhile, lock all the candidates
+                candidates = self._query_ranges(session, lock=True).limit(
+                    MAX_CANDIDATE_RANGES).all()
+                if not candidates:
+                    return
+                id_range = random.choice(candidates)
+            physical_network = id_range.physical_network
+            segment_id = random.randint(id_range.first_id, id_range.last_id)
+            self._take(session, id_range, segment_id)
+            self._allocate(session, physical_network, segment_id)
+        return physical_network, segment_id
+
+    def reserve_specific(self, session, physical_network, segment_id):
+        """Allocate a given id, inside or outside the pool.
+
+        :returns: False if the id already is allocated, True otherwise
+        """
+        with session.begin(subtransactions=True):
+            if self._query_allocation(session, physical_network,
+                                      segment_id).first():
+                return False
+            id_range = self._find_range(session, physical_network,
+                                        segment_id, lock=True)
+            if id_range:
+                LOG.debug(_("Reserving specific id %(segment_id)s on "
+                            "physical network %(physical_network)s from "
+                            "pool %(pool)s"),
+                          {'segment_id': segment_id,
+                           'physical_network': physical_network,
+                           'pool': self.pool})
+                self._take(session, id_range, segment_id)
+            else:
+                LOG.debug(_("Reserving specific id %(segment_id)s on "
+                            "physical network %(physical_network)s outside "
+                            "pool %(pool)s"),
+                          {'segment_id': segment_id,
+                           'physical_network': physical_network,
+                           'pool': self.pool})
+            self._allocate(session, physical_network, segment_id)
+        return True
+
+    def release(self, session, physical_network, segment_id, ranges):
+        """Free an allocated id.
+
+        The id goes back to the free ranges if it is in one of the
+        configured ranges of its physical network.
+
+        :param ranges: dict of physical network -> list of (first, last)
+        :returns: False if the id was not allocated, True otherwise
+        """
+        physical_network = physical_network or ''
+        with session.begin(subtransactions=True):
+            alloc = self._query_allocation(session, physical_network,
+                                           segment_id).first()
+            if not alloc:
+                return False
+            session.delete(alloc)
+            inside = False
+            for first, last in ranges.get(physical_network, []):
+                if first <= segment_id <= last:
+                    inside = True
+                    break
+            if inside:
+                self._add_free_id(session, physical_network, segment_id)
+        return True
+
+    def _add_free_id(self, session, physical_network, segment_id):
+        query = self._query_ranges(session, physical_network, lock=True)
+        after = query.filter_by(first_id=segment_id + 1).first()
+        before = query.filter_by(last_id=segment_id - 1).first()
+        if before and after:
+            before.last_id = after.last_id
+            session.delete(after)
+        elif before:
+            before.last_id = segment_id
+        elif after:
+            after.first_id = segment_id
+        elif not self._find_range(session, physical_network, segment_id,
+                                  lock=True):
+            session.add(SegmentRange(pool=self.pool,
+                                     physical_network=physical_network,
+                                     first_id=segment_id,
+                                     last_id=segment_id))
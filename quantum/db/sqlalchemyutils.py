@@ -16,6 +16,7 @@
 #    under the License.
 
 import sqlalchemy
+from sqlalchemy.orm.properties import ColumnProperty
 from sqlalchemy.orm.properties import RelationshipProperty
 
 from quantum.common import exceptions as q_exc
@@ -106,3 +107,56 @@ def paginate_query(query, model, limit, sorts, marker_obj=None):
         query = query.limit(limit)
 
     return query
+
+
+def get_projection(model, fields, plain_fields=None):
+    """Returns the fields and the columns to select for them, or None.
+
+    A collection only needs to read the requested fields when the dict
+    function of the plugin returns all of them as they are stored in the
+    columns of the same name. Relationships, attributes computed by the
+    plugins and fields the plugins leave out of some items require the
+    full rows.
+
+    :param model: the ORM model class
+    :param fields: the requested fields
+    :param plain_fields: the fields which the dict function copies from
+                         the columns of the same name
+    :return: (list of the fields without duplicates, list of their columns),
+             or None if the full rows must be read
+    """
+    if not fields or not plain_fields:
+        return None
+    keys = []
+    columns = []
+    for key in fields:
+        if key in keys:
+            continue
+        if key not in plain_fields:
+            return None
+        column = getattr(model, key, None)
+        if not isinstance(getattr(column, 'property', None), ColumnProperty):
+            return None
+        keys.append(key)
+        columns.append(column)
+    return keys, columns
+
+
+def query_collection(query, model, dict_func, fields, load_related=None,
+                     plain_fields=None):
+    """Returns the dicts of the rows of query.
+
+    Only the columns of the requested fields are read when they all are
+    in plain_fields, otherwise dict_func builds the dicts of the full rows.
+    load_related, if given, is called with the full rows and returns the
+    values passed to dict_func, with the related rows of all the items
+    read in batches.
+    """
+    projection = get_projection(model, fields, plain_fields)
+    if projection:
+        keys, columns = projection
+        return [dict(zip(keys, row)) for row in query.with_entities(*columns)]
+    rows = query.all()
+    if load_related:
+        rows = load_related(rows)
+    return [dict_func(row, fields) for row in rows]
@@ -31,6 +31,7 @@ RESOURCE_NAME = 'quota'
 RESOURCE_COLLECTION = RESOURCE_NAME + "s"
 QUOTAS = quota.QUOTAS
 DB_QUOTA_DRIVER = 'quantum.db.quota_db.DbQuotaDriver'
+USAGE_TRACKING_QUOTA_DRIVER = 'quantum.db.quota_db.UsageTrackingQuotaDriver'
 EXTENDED_ATTRIBUTES_2_0 = {
     RESOURCE_COLLECTION: {}
 }
@@ -156,6 +157,7 @@ class Quotasv2(extensions.ExtensionDescriptor):
             return {}
 
     def check_env(self):
-        if cfg.CONF.QUOTAS.quota_driver != DB_QUOTA_DRIVER:
+        if cfg.CONF.QUOTAS.quota_driver not in (DB_QUOTA_DRIVER,
+                                                USAGE_TRACKING_QUOTA_DRIVER):
             msg = _('Quota driver %s is needed.') % DB_QUOTA_DRIVER
             raise exceptions.InvalidExtenstionEnv(reason=msg)
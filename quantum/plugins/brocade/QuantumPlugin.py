@@ -32,7 +32,6 @@ from oslo.config import cfg
 from quantum.agent import securitygroups_rpc as sg_rpc
 from quantum.common import rpc as q_rpc
 from quantum.common import topics
-from quantum.common import utils
 from quantum.db import api as db
 from quantum.db import db_base_plugin_v2
 from quantum.db import dhcp_rpc_base
@@ -74,10 +73,12 @@ class BridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
                          sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
     """Agent callback."""
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     # history
     #   1.1 Support Security Group RPC
+    #   1.2 Support get_devices_details_list and
+    #       security_group_info_for_devices/groups
     TAP_PREFIX_LEN = 3
 
     def create_rpc_dispatcher(self):
@@ -135,6 +136,14 @@ class BridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("%s can not be found in database"), device)
         return entry
 
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests details of several devices at once."""
+
+        agent_id = kwargs.get('agent_id')
+        return [self.get_device_details(rpc_context, device=device,
+                                        agent_id=agent_id)
+                for device in kwargs.get('devices', [])]
+
     def update_device_down(self, rpc_context, **kwargs):
         """Device no longer exists on agent."""
 
@@ -379,12 +388,7 @@ class BrocadePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
         if original_port['admin_state_up'] != port['admin_state_up']:
             port_updated = True
 
-        if (original_port['fixed_ips'] != port['fixed_ips'] or
-            not utils.compare_elements(
-                original_port.get(ext_sg.SECURITYGROUPS),
-                port.get(ext_sg.SECURITYGROUPS))):
-            self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+        self.is_security_group_member_updated(context, original_port, port)
 
         if port_updated:
             self._notify_port_updated(context, port)
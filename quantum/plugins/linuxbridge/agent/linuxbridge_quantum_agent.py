@@ -65,8 +65,8 @@ class LinuxBridgeManager:
         self.ip = ip_lib.IPWrapper(self.root_helper)
 
         self.udev = pyudev.Context()
-        monitor = pyudev.Monitor.from_netlink(self.udev)
-        monitor.filter_by('net')
+        self.monitor = pyudev.Monitor.from_netlink(self.udev)
+        self.monitor.filter_by('net')
 
     def device_exists(self, device):
         """Check if ethernet device exists."""
@@ -377,6 +377,37 @@ class LinuxBridgeManager:
                 'added': added,
                 'removed': removed}
 
+    def start_device_monitor(self):
+        """Start receiving the udev events of the net devices."""
+        self.monitor.start()
+
+    def get_device_events(self, timeout):
+        """Return the last udev action of each tap device with events.
+
+        Waits up to timeout seconds for a first event, then collects the
+        events already queued.
+        """
+        actions = {}
+        device = self.monitor.poll(timeout)
+        while device is not None:
+            name = self.udev_get_name(device)
+            if self.is_tap_device(name):
+                actions[name] = device.action
+            device = self.monitor.poll(0)
+        return actions
+
+    def update_devices_from_events(self, registered_devices, timeout):
+        actions = self.get_device_events(timeout)
+        added = set(name for name, action in actions.iteritems()
+                    if action == 'add') - registered_devices
+        removed = set(name for name, action in actions.iteritems()
+                      if action == 'remove') & registered_devices
+        if not added and not removed:
+            return
+        return {'current': (registered_devices | added) - removed,
+                'added': added,
+                'removed': removed}
+
     def udev_get_tap_devices(self):
         devices = set()
         for device in self.udev.list_devices(subsystem='net'):
@@ -461,8 +492,9 @@ class LinuxBridgePluginApi(agent_rpc.PluginApi,
 class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
     def __init__(self, interface_mappings, polling_interval,
-                 root_helper):
+                 root_helper, device_resync_interval=0):
         self.polling_interval = polling_interval
+        self.device_resync_interval = device_resync_interval
         self.root_helper = root_helper
         self.setup_linux_bridge(interface_mappings)
         self.agent_state = {
@@ -540,19 +572,17 @@ class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
         return (resync_a | resync_b)
 
     def treat_devices_added(self, devices):
-        resync = False
         self.prepare_devices_filter(devices)
-        for device in devices:
+        try:
+            devices_details_list = self.plugin_rpc.get_devices_details_list(
+                self.context, list(devices), self.agent_id)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"), locals())
+            return True
+        for details in devices_details_list:
+            device = details['device']
             LOG.debug(_("Port %s added"), device)
-            try:
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"), locals())
-                resync = True
-                continue
             if 'port_id' in details:
                 LOG.info(_("Port %(device)s updated. Details: %(details)s"),
                          locals())
@@ -567,7 +597,7 @@ class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
                                              details['port_id'])
             else:
                 LOG.info(_("Device %s not defined on plugin"), device)
-        return resync
+        return False
 
     def treat_devices_removed(self, devices):
         resync = False
@@ -592,8 +622,12 @@ class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
     def daemon_loop(self):
         sync = True
         devices = set()
+        last_resync = None
 
         LOG.info(_("LinuxBridge Agent RPC Daemon Started!"))
+        if self.device_resync_interval:
+            # devices added during the first enumeration come as events
+            self.br_mgr.start_device_monitor()
 
         while True:
             start = time.time()
@@ -601,8 +635,24 @@ class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
                 LOG.info(_("Agent out of sync with plugin!"))
                 devices.clear()
                 sync = False
-
-            device_info = self.br_mgr.update_devices(devices)
+                last_resync = None
+
+            resync = (not self.device_resync_interval or
+                      last_resync is None or
+                      start - last_resync >= self.device_resync_interval)
+            if resync:
+                device_info = self.br_mgr.update_devices(devices)
+                last_resync = start
+            else:
+                # wait for udev events instead of enumerating the devices
+                try:
+                    device_info = self.br_mgr.update_devices_from_events(
+                        devices, self.polling_interval)
+                except EnvironmentError:
+                    # events were lost, e.g. the socket buffer overflowed
+                    LOG.exception(_("Unable to receive device events"))
+                    last_resync = None
+                    continue
 
             # notify plugin about device deltas
             if device_info:
@@ -611,6 +661,8 @@ class LinuxBridgeQuantumAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
                 sync = self.process_network_devices(device_info)
                 devices = device_info['current']
 
+            if not resync:
+                continue
             # sleep till end of polling interval
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
@@ -638,9 +690,11 @@ def main():
 
     polling_interval = cfg.CONF.AGENT.polling_interval
     root_helper = cfg.CONF.AGENT.root_helper
+    device_resync_interval = cfg.CONF.AGENT.device_resync_interval
     plugin = LinuxBridgeQuantumAgentRPC(interface_mappings,
                                         polling_interval,
-                                        root_helper)
+                                        root_helper,
+                                        device_resync_interval)
     LOG.info(_("Agent initialized successfully, now running... "))
     plugin.daemon_loop()
     sys.exit(0)
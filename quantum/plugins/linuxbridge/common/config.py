@@ -45,6 +45,11 @@ agent_opts = [
     cfg.IntOpt('polling_interval', default=2,
                help=_("The number of seconds the agent will wait between "
                       "polling for local device changes.")),
+    cfg.IntOpt('device_resync_interval', default=60,
+               help=_("The number of seconds between full enumerations of "
+                      "the local devices. In between, the devices added "
+                      "or removed are reported by udev events. 0 enumerates "
+                      "the devices every polling interval.")),
 ]
 
 
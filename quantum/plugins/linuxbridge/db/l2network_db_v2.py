@@ -13,13 +13,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-
+import sqlalchemy as sa
 from sqlalchemy.orm import exc
 
 from quantum.common import exceptions as q_exc
 import quantum.db.api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
+from quantum.db import segment_allocator
 from quantum import manager
 from quantum.openstack.common import log as logging
 # NOTE (e0ne): this import is needed for config init
@@ -29,146 +31,60 @@ from quantum.plugins.linuxbridge.db import l2network_models_v2
 
 LOG = logging.getLogger(__name__)
 
+_vlan_allocator = segment_allocator.SegmentAllocator(
+    'lb_vlan', l2network_models_v2.NetworkState, 'vlan_id',
+    'physical_network')
+
 
 def initialize():
     db.configure_db()
 
 
 def sync_network_states(network_vlan_ranges):
-    """Synchronize network_states table with current configured VLAN ranges."""
+    """Synchronize free vlan ranges with current configured VLAN ranges."""
 
     session = db.get_session()
-    with session.begin():
-        # get existing allocations for all physical networks
-        allocations = dict()
-        states = (session.query(l2network_models_v2.NetworkState).
-                  all())
-        for state in states:
-            if state.physical_network not in allocations:
-                allocations[state.physical_network] = set()
-            allocations[state.physical_network].add(state)
-
-        # process vlan ranges for each configured physical network
-        for physical_network, vlan_ranges in network_vlan_ranges.iteritems():
-            # determine current configured allocatable vlans for this
-            # physical network
-            vlan_ids = set()
-            for vlan_range in vlan_ranges:
-                vlan_ids |= set(xrange(vlan_range[0], vlan_range[1] + 1))
-
-            # remove from table unallocated vlans not currently allocatable
-            if physical_network in allocations:
-                for state in allocations[physical_network]:
-                    try:
-                        # see if vlan is allocatable
-                        vlan_ids.remove(state.vlan_id)
-                    except KeyError:
-                        # it's not allocatable, so check if its allocated
-                        if not state.allocated:
-                            # it's not, so remove it from table
-                            LOG.debug(_("Removing vlan %(vlan_id)s on "
-                                        "physical network %(physical_network)s"
-                                        " from pool"),
-                                      {'vlan_id': state.vlan_id,
-                                       'physical_network': physical_network})
-                            session.delete(state)
-                del allocations[physical_network]
-
-            # add missing allocatable vlans to table
-            for vlan_id in sorted(vlan_ids):
-                state = l2network_models_v2.NetworkState(physical_network,
-                                                         vlan_id)
-                session.add(state)
-
-        # remove from table unallocated vlans for any unconfigured physical
-        # networks
-        for states in allocations.itervalues():
-            for state in states:
-                if not state.allocated:
-                    LOG.debug(_("Removing vlan %(vlan_id)s on physical "
-                                "network %(physical_network)s"
-                                " from pool"),
-                              {'vlan_id': state.vlan_id,
-                               'physical_network': physical_network})
-                    session.delete(state)
+    _vlan_allocator.sync(session, network_vlan_ranges)
 
 
 def get_network_state(physical_network, vlan_id):
     """Get state of specified network"""
 
     session = db.get_session()
-    try:
-        state = (session.query(l2network_models_v2.NetworkState).
-                 filter_by(physical_network=physical_network,
-                           vlan_id=vlan_id).
-                 one())
-        return state
-    except exc.NoResultFound:
-        return None
+    return _vlan_allocator.get_allocation(session, physical_network, vlan_id)
 
 
 def reserve_network(session):
     with session.begin(subtransactions=True):
-        state = (session.query(l2network_models_v2.NetworkState).
-                 filter_by(allocated=False).
-                 first())
-        if not state:
+        allocation = _vlan_allocator.reserve(session)
+        if not allocation:
             raise q_exc.NoNetworkAvailable()
         LOG.debug(_("Reserving vlan %(vlan_id)s on physical network "
                     "%(physical_network)s from pool"),
-                  {'vlan_id': state.vlan_id,
-                   'physical_network': state.physical_network})
-        state.allocated = True
-    return (state.physical_network, state.vlan_id)
+                  {'vlan_id': allocation[1],
+                   'physical_network': allocation[0]})
+    return allocation
 
 
 def reserve_specific_network(session, physical_network, vlan_id):
     with session.begin(subtransactions=True):
-        try:
-            state = (session.query(l2network_models_v2.NetworkState).
-                     filter_by(physical_network=physical_network,
-                               vlan_id=vlan_id).
-                     one())
-            if state.allocated:
-                if vlan_id == constants.FLAT_VLAN_ID:
-                    raise q_exc.FlatNetworkInUse(
-                        physical_network=physical_network)
-                else:
-                    raise q_exc.VlanIdInUse(vlan_id=vlan_id,
-                                            physical_network=physical_network)
-            LOG.debug(_("Reserving specific vlan %(vlan_id)s on physical "
-                        "network %(physical_network)s from pool"), locals())
-            state.allocated = True
-        except exc.NoResultFound:
-            LOG.debug(_("Reserving specific vlan %(vlan_id)s on physical "
-                        "network %(physical_network)s outside pool"), locals())
-            state = l2network_models_v2.NetworkState(physical_network, vlan_id)
-            state.allocated = True
-            session.add(state)
+        if not _vlan_allocator.reserve_specific(session, physical_network,
+                                                vlan_id):
+            if vlan_id == constants.FLAT_VLAN_ID:
+                raise q_exc.FlatNetworkInUse(
+                    physical_network=physical_network)
+            else:
+                raise q_exc.VlanIdInUse(vlan_id=vlan_id,
+                                        physical_network=physical_network)
 
 
 def release_network(session, physical_network, vlan_id, network_vlan_ranges):
     with session.begin(subtransactions=True):
-        try:
-            state = (session.query(l2network_models_v2.NetworkState).
-                     filter_by(physical_network=physical_network,
-                               vlan_id=vlan_id).
-                     one())
-            state.allocated = False
-            inside = False
-            for vlan_range in network_vlan_ranges.get(physical_network, []):
-                if vlan_id >= vlan_range[0] and vlan_id <= vlan_range[1]:
-                    inside = True
-                    break
-            if inside:
-                LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
-                            "%(physical_network)s to pool"),
-                          locals())
-            else:
-                LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
-                          "%(physical_network)s outside pool"), locals())
-                session.delete(state)
-        except exc.NoResultFound:
+        if _vlan_allocator.release(session, physical_network, vlan_id,
+                                   network_vlan_ranges):
+            LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
+                        "%(physical_network)s"), locals())
+        else:
             LOG.warning(_("vlan_id %(vlan_id)s on physical network "
                           "%(physical_network)s not found"), locals())
 
@@ -190,6 +106,16 @@ def get_network_binding(session, network_id):
         return
 
 
+def get_network_bindings(session, network_ids):
+    """Get the bindings of networks in one query, keyed by network id."""
+    if not network_ids:
+        return {}
+    query = session.query(l2network_models_v2.NetworkBinding)
+    query = query.filter(
+        l2network_models_v2.NetworkBinding.network_id.in_(network_ids))
+    return dict((binding.network_id, binding) for binding in query)
+
+
 def get_port_from_device(device):
     """Get port from database"""
     LOG.debug(_("get_port_from_device() called"))
@@ -218,6 +144,62 @@ def get_port_from_device(device):
     return port_dict
 
 
+def _filter_port_id_prefixes(query, prefixes):
+    prefixes_by_length = {}
+    for prefix in prefixes:
+        prefixes_by_length.setdefault(len(prefix), set()).add(prefix)
+    return query.filter(sa.or_(*[
+        sa.func.substr(models_v2.Port.id, 1, length).in_(prefixes)
+        for length, prefixes in prefixes_by_length.iteritems()]))
+
+
+def _port_id_prefix(port_id, prefixes):
+    for prefix in prefixes:
+        if port_id.startswith(prefix):
+            return prefix
+
+
+def get_ports_from_devices(devices):
+    """Get ports from database, keyed by device.
+
+    Same as get_port_from_device() for many devices, with one query for the
+    ports and their security groups and one for their ips.
+    """
+    if not devices:
+        return {}
+    session = db.get_session()
+    sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+
+    query = session.query(models_v2.Port,
+                          sg_db.SecurityGroupPortBinding.security_group_id)
+    query = query.outerjoin(sg_db.SecurityGroupPortBinding,
+                            models_v2.Port.id == sg_binding_port)
+    query = _filter_port_id_prefixes(query, devices)
+    plugin = manager.QuantumManager.get_plugin()
+    ports = sg_db_rpc.make_port_dicts(session, plugin, query)
+    return dict((_port_id_prefix(port_id, devices), port)
+                for port_id, port in ports.iteritems())
+
+
+def get_ports_and_bindings_from_devices(devices):
+    """Get ports and their network bindings, keyed by device.
+
+    As in get_port_from_device(), each device is a prefix of a port id.
+    """
+    if not devices:
+        return {}
+    session = db.get_session()
+    query = session.query(models_v2.Port,
+                          l2network_models_v2.NetworkBinding)
+    query = query.outerjoin(
+        l2network_models_v2.NetworkBinding,
+        l2network_models_v2.NetworkBinding.network_id ==
+        models_v2.Port.network_id)
+    query = _filter_port_id_prefixes(query, devices)
+    return dict((_port_id_prefix(port['id'], devices), (port, binding))
+                for port, binding in query)
+
+
 def set_port_status(port_id, status):
     """Set the port status"""
     LOG.debug(_("set_port_status as %s called"), status)
@@ -229,3 +211,15 @@ def set_port_status(port_id, status):
         session.flush()
     except exc.NoResultFound:
         raise q_exc.PortNotFound(port_id=port_id)
+
+
+def set_ports_status(port_ids, status):
+    """Set the status of several ports"""
+    LOG.debug(_("set_ports_status as %s called"), status)
+    if not port_ids:
+        return
+    session = db.get_session()
+    with session.begin():
+        query = session.query(models_v2.Port)
+        query = query.filter(models_v2.Port.id.in_(port_ids))
+        query.update({'status': status}, synchronize_session=False)
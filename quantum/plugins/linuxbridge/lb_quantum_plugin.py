@@ -54,7 +54,9 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
 
     # history
     #   1.1 Support Security Group RPC
-    RPC_API_VERSION = '1.1'
+    #   1.2 Support get_devices_details_list and
+    #       security_group_info_for_devices/groups
+    RPC_API_VERSION = '1.2'
     # Device names start with "tap"
     TAP_PREFIX_LEN = 3
 
@@ -74,6 +76,15 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             port['device'] = device
         return port
 
+    @classmethod
+    def get_ports_from_devices(cls, devices):
+        devices_by_prefix = dict((device[cls.TAP_PREFIX_LEN:], device)
+                                 for device in devices)
+        ports = db.get_ports_from_devices(devices_by_prefix.keys())
+        for prefix, port in ports.iteritems():
+            port['device'] = devices_by_prefix[prefix]
+        return ports.values()
+
     def get_device_details(self, rpc_context, **kwargs):
         """Agent requests device details"""
         agent_id = kwargs.get('agent_id')
@@ -84,14 +95,8 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
         if port:
             binding = db.get_network_binding(db_api.get_session(),
                                              port['network_id'])
-            entry = {'device': device,
-                     'physical_network': binding.physical_network,
-                     'vlan_id': binding.vlan_id,
-                     'network_id': port['network_id'],
-                     'port_id': port['id'],
-                     'admin_state_up': port['admin_state_up']}
-            new_status = (q_const.PORT_STATUS_ACTIVE if port['admin_state_up']
-                          else q_const.PORT_STATUS_DOWN)
+            entry = self._make_device_details(device, port, binding)
+            new_status = self._get_new_port_status(port)
             if port['status'] != new_status:
                 db.set_port_status(port['id'], new_status)
         else:
@@ -99,6 +104,48 @@ class LinuxBridgeRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("%s can not be found in database"), device)
         return entry
 
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests details of several devices at once"""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        LOG.debug(_("Details of %(count)d devices requested from "
+                    "%(agent_id)s"), {'count': len(devices),
+                                      'agent_id': agent_id})
+        ports = db.get_ports_and_bindings_from_devices(
+            [device[self.TAP_PREFIX_LEN:] for device in devices])
+        entries = []
+        status_updates = {}
+        for device in devices:
+            port_and_binding = ports.get(device[self.TAP_PREFIX_LEN:])
+            if port_and_binding:
+                port, binding = port_and_binding
+                entries.append(self._make_device_details(device, port,
+                                                         binding))
+                new_status = self._get_new_port_status(port)
+                if port['status'] != new_status:
+                    status_updates.setdefault(new_status, []).append(
+                        port['id'])
+            else:
+                entries.append({'device': device})
+                LOG.debug(_("%s can not be found in database"), device)
+        for status, port_ids in status_updates.iteritems():
+            db.set_ports_status(port_ids, status)
+        return entries
+
+    @staticmethod
+    def _make_device_details(device, port, binding):
+        return {'device': device,
+                'physical_network': binding.physical_network,
+                'vlan_id': binding.vlan_id,
+                'network_id': port['network_id'],
+                'port_id': port['id'],
+                'admin_state_up': port['admin_state_up']}
+
+    @staticmethod
+    def _get_new_port_status(port):
+        return (q_const.PORT_STATUS_ACTIVE if port['admin_state_up']
+                else q_const.PORT_STATUS_DOWN)
+
     def update_device_down(self, rpc_context, **kwargs):
         """Device no longer exists on agent"""
         # (TODO) garyk - live migration and port status
@@ -269,9 +316,11 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
     # REVISIT(rkukura) Use core mechanism for attribute authorization
     # when available.
 
-    def _extend_network_dict_provider(self, context, network):
+    def _extend_network_dict_provider(self, context, network, binding=None):
         if self._check_view_auth(context, network, self.network_view):
-            binding = db.get_network_binding(context.session, network['id'])
+            if not binding:
+                binding = db.get_network_binding(context.session,
+                                                 network['id'])
             if binding.vlan_id == constants.FLAT_VLAN_ID:
                 network[provider.NETWORK_TYPE] = constants.TYPE_FLAT
                 network[provider.PHYSICAL_NETWORK] = binding.physical_network
@@ -285,6 +334,13 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
                 network[provider.PHYSICAL_NETWORK] = binding.physical_network
                 network[provider.SEGMENTATION_ID] = binding.vlan_id
 
+    def _extend_network_dicts_provider(self, context, networks):
+        bindings = db.get_network_bindings(
+            context.session, [network['id'] for network in networks])
+        for network in networks:
+            self._extend_network_dict_provider(context, network,
+                                               bindings.get(network['id']))
+
     def _process_provider_create(self, context, attrs):
         network_type = attrs.get(provider.NETWORK_TYPE)
         physical_network = attrs.get(provider.PHYSICAL_NETWORK)
@@ -445,9 +501,8 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
             nets = super(LinuxBridgePluginV2,
                          self).get_networks(context, filters, None, sorts,
                                             limit, marker, page_reverse)
-            for net in nets:
-                self._extend_network_dict_provider(context, net)
-                self._extend_network_dict_l3(context, net)
+            self._extend_network_dicts_provider(context, nets)
+            self._extend_network_dicts_l3(context, nets)
 
             # TODO(rkukura): Filter on extended provider attributes.
             nets = self._filter_nets_l3(context, nets, filters)
@@ -479,8 +534,8 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
                           self).get_ports(context, filters, fields, sorts,
                                           limit, marker, page_reverse)
             #TODO(nati) filter by security group
+            self._extend_port_dicts_security_group(context, ports)
             for port in ports:
-                self._extend_port_dict_security_group(context, port)
                 self._extend_port_dict_binding(context, port)
                 res_ports.append(self._fields(port, fields))
         return res_ports
@@ -501,8 +556,7 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
             self.notifier.security_groups_provider_updated(context)
         else:
-            self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+            self.notify_security_groups_member_updated(context, port)
         return self._extend_port_dict_binding(context, port)
 
     def update_port(self, context, id, port):
@@ -540,8 +594,7 @@ class LinuxBridgePluginV2(db_base_plugin_v2.QuantumDbPluginV2,
             self._delete_port_security_group_bindings(context, id)
             super(LinuxBridgePluginV2, self).delete_port(context, id)
 
-        self.notifier.security_groups_member_updated(
-            context, port.get(ext_sg.SECURITYGROUPS))
+        self.notify_security_groups_member_updated(context, port)
 
     def _notify_port_updated(self, context, port):
         binding = db.get_network_binding(context.session,
@@ -374,8 +374,7 @@ class NECPluginV2(nec_plugin_base.NECPluginV2Base,
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
             self.notifier.security_groups_provider_updated(context)
         else:
-            self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+            self.notify_security_groups_member_updated(context, port)
 
         self._update_resource_status(context, "port", port['id'],
                                      OperationalStatus.BUILD)
@@ -441,8 +440,7 @@ class NECPluginV2(nec_plugin_base.NECPluginV2Base,
             self.disassociate_floatingips(context, id)
             self._delete_port_security_group_bindings(context, id)
             super(NECPluginV2, self).delete_port(context, id)
-        self.notifier.security_groups_member_updated(
-            context, port.get(ext_sg.SECURITYGROUPS))
+        self.notify_security_groups_member_updated(context, port)
 
     def get_port(self, context, id, fields=None):
         with context.session.begin(subtransactions=True):
@@ -616,7 +614,7 @@ class L3RpcCallback(l3_rpc_base.L3RpcCallbackMixin):
 class SecurityGroupServerRpcCallback(
     sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
 
-    RPC_API_VERSION = sg_rpc.SG_RPC_VERSION
+    RPC_API_VERSION = sg_rpc.SG_INFO_RPC_VERSION
 
     @staticmethod
     def get_port_from_device(device):
@@ -20,6 +20,7 @@
 # @author: Dave Lapsley, Nicira Networks, Inc.
 # @author: Aaron Rosen, Nicira Networks, Inc.
 
+import contextlib
 import sys
 import time
 
@@ -152,7 +153,8 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
 
     def __init__(self, integ_br, tun_br, local_ip,
                  bridge_mappings, root_helper,
-                 polling_interval, enable_tunneling):
+                 polling_interval, enable_tunneling,
+                 minimize_polling=False, resync_interval=60):
         '''Constructor.
 
         :param integ_br: name of the integration bridge.
@@ -162,6 +164,10 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         :param root_helper: utility to use when running shell cmds.
         :param polling_interval: interval (secs) to poll DB.
         :param enable_tunneling: if True enable GRE networks.
+        :param minimize_polling: if True monitor the ovsdb for interface
+               changes and only scan the integration bridge every
+               resync_interval seconds.
+        :param resync_interval: interval (secs) between full scans.
         '''
         self.root_helper = root_helper
         self.available_local_vlans = set(
@@ -172,6 +178,11 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         self.local_vlan_map = {}
 
         self.polling_interval = polling_interval
+        self.minimize_polling = minimize_polling
+        self.resync_interval = resync_interval
+        self.interface_monitor = ovs_lib.InterfaceMonitor(root_helper)
+        self.pending_events = []
+        self.last_full_scan = 0
 
         self.enable_tunneling = enable_tunneling
         self.local_ip = local_ip
@@ -587,6 +598,44 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                 'added': added,
                 'removed': removed}
 
+    def scan_ports(self, registered_ports, sync=False):
+        """Return the changes to the ports of the integration bridge.
+
+        With minimize_polling the bridge is only scanned when the ovsdb
+        monitor reported interface events, on resync, when the monitor is
+        (re)started and every resync_interval seconds as a safety net.
+        The events don't say which bridge an interface is on, so they are
+        only a hint that the ports of the integration bridge may have
+        changed.
+        """
+        if not self.minimize_polling:
+            return self.update_ports(registered_ports)
+
+        now = time.time()
+        if (sync or not self.interface_monitor.is_active or
+                now - self.last_full_scan >= self.resync_interval):
+            if not self.interface_monitor.is_active:
+                LOG.info(_("Starting ovsdb interface monitor"))
+                self.interface_monitor.start()
+            # The full scan supersedes the events queued so far
+            self.interface_monitor.get_events()
+            self.pending_events = []
+            self.last_full_scan = now
+            return self.update_ports(registered_ports)
+
+        events = self.pending_events + self.interface_monitor.get_events()
+        self.pending_events = []
+        if events:
+            return self.update_ports(registered_ports)
+
+    def wait_for_changes(self, timeout):
+        """Sleep for timeout seconds or until the ovsdb monitor fires."""
+        if self.minimize_polling and self.interface_monitor.is_active:
+            self.pending_events.extend(
+                self.interface_monitor.get_events(timeout=timeout))
+        else:
+            time.sleep(timeout)
+
     def treat_vif_port(self, vif_port, port_id, network_id, network_type,
                        physical_network, segmentation_id, admin_state_up):
         if vif_port:
@@ -598,56 +647,71 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         else:
             LOG.debug(_("No VIF port for port %s defined on agent."), port_id)
 
+    def _batch_bridges(self):
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.enable_tunneling:
+            bridges.append(self.tun_br)
+        return contextlib.nested(*[br.batch() for br in bridges])
+
     def treat_devices_added(self, devices):
-        resync = False
         self.sg_agent.prepare_devices_filter(devices)
-        for device in devices:
-            LOG.info(_("Port %s added"), device)
-            try:
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"), locals())
-                resync = True
-                continue
-            port = self.int_br.get_vif_port_by_id(details['device'])
-            if 'port_id' in details:
-                LOG.info(_("Port %(device)s updated. Details: %(details)s"),
-                         locals())
-                self.treat_vif_port(port, details['port_id'],
-                                    details['network_id'],
-                                    details['network_type'],
-                                    details['physical_network'],
-                                    details['segmentation_id'],
-                                    details['admin_state_up'])
-            else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
-                if (port and int(port.ofport) != -1):
-                    self.port_dead(port)
-        return resync
+        try:
+            devices_details_list = self.plugin_rpc.get_devices_details_list(
+                self.context, list(devices), self.agent_id)
+        except Exception as e:
+            LOG.debug(_("Unable to get port details for "
+                        "%(devices)s: %(e)s"), locals())
+            return True
+        try:
+            with self._batch_bridges():
+                for details in devices_details_list:
+                    device = details['device']
+                    LOG.info(_("Port %s added"), device)
+                    port = self.int_br.get_vif_port_by_id(device)
+                    if 'port_id' in details:
+                        LOG.info(_("Port %(device)s updated. "
+                                   "Details: %(details)s"), locals())
+                        self.treat_vif_port(port, details['port_id'],
+                                            details['network_id'],
+                                            details['network_type'],
+                                            details['physical_network'],
+                                            details['segmentation_id'],
+                                            details['admin_state_up'])
+                    else:
+                        LOG.debug(_("Device %s not defined on plugin"),
+                                  device)
+                        if (port and int(port.ofport) != -1):
+                            self.port_dead(port)
+        except Exception as e:
+            LOG.warn(_("Unable to wire the added ports: %s"), e)
+            return True
+        return False
 
     def treat_devices_removed(self, devices):
         resync = False
         self.sg_agent.remove_devices_filter(devices)
-        for device in devices:
-            LOG.info(_("Attachment %s removed"), device)
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          locals())
-                resync = True
-                continue
-            if details['exists']:
-                LOG.info(_("Port %s updated."), device)
-                # Nothing to do regarding local networking
-            else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
-                self.port_unbound(device)
+        try:
+            with self._batch_bridges():
+                for device in devices:
+                    LOG.info(_("Attachment %s removed"), device)
+                    try:
+                        details = self.plugin_rpc.update_device_down(
+                            self.context, device, self.agent_id)
+                    except Exception as e:
+                        LOG.debug(_("port_removed failed for %(device)s: "
+                                    "%(e)s"), locals())
+                        resync = True
+                        continue
+                    if details['exists']:
+                        LOG.info(_("Port %s updated."), device)
+                        # Nothing to do regarding local networking
+                    else:
+                        LOG.debug(_("Device %s not defined on plugin"),
+                                  device)
+                        self.port_unbound(device)
+        except Exception as e:
+            LOG.warn(_("Unable to unwire the removed ports: %s"), e)
+            resync = True
         return resync
 
     def process_network_ports(self, port_info):
@@ -683,6 +747,7 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
         while True:
             try:
                 start = time.time()
+                resync = sync
                 if sync:
                     LOG.info(_("Agent out of sync with plugin!"))
                     ports.clear()
@@ -693,7 +758,7 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
                     LOG.info(_("Agent tunnel out of sync with plugin!"))
                     tunnel_sync = self.tunnel_sync()
 
-                port_info = self.update_ports(ports)
+                port_info = self.scan_ports(ports, resync)
 
                 # notify plugin about port deltas
                 if port_info:
@@ -710,7 +775,7 @@ class OVSQuantumAgent(sg_rpc.SecurityGroupAgentRpcCallbackMixin):
             # sleep till end of polling interval
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
-                time.sleep(self.polling_interval - elapsed)
+                self.wait_for_changes(self.polling_interval - elapsed)
             else:
                 LOG.debug(_("Loop iteration exceeded interval "
                             "(%(polling_interval)s vs. %(elapsed)s)!"),
@@ -740,6 +805,8 @@ def create_agent_config_map(config):
         root_helper=config.AGENT.root_helper,
         polling_interval=config.AGENT.polling_interval,
         enable_tunneling=config.OVS.enable_tunneling,
+        minimize_polling=config.AGENT.minimize_polling,
+        resync_interval=config.AGENT.resync_interval,
     )
 
     if kwargs['enable_tunneling'] and not kwargs['local_ip']:
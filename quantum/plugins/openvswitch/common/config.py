@@ -57,6 +57,12 @@ agent_opts = [
     cfg.IntOpt('polling_interval', default=2,
                help=_("The number of seconds the agent will wait between "
                       "polling for local device changes.")),
+    cfg.BoolOpt('minimize_polling', default=False,
+                help=_("Monitor the ovsdb for interface changes instead of "
+                       "scanning the integration bridge on every poll.")),
+    cfg.IntOpt('resync_interval', default=60,
+               help=_("The number of seconds between full scans of the "
+                      "integration bridge when minimize_polling is set.")),
 ]
 
 
@@ -24,6 +24,8 @@ from quantum.common import exceptions as q_exc
 import quantum.db.api as db
 from quantum.db import models_v2
 from quantum.db import securitygroups_db as sg_db
+from quantum.db import securitygroups_rpc_base as sg_db_rpc
+from quantum.db import segment_allocator
 from quantum.extensions import securitygroup as ext_sg
 from quantum import manager
 from quantum.openstack.common import log as logging
@@ -32,6 +34,11 @@ from quantum.plugins.openvswitch import ovs_models_v2
 
 LOG = logging.getLogger(__name__)
 
+_vlan_allocator = segment_allocator.SegmentAllocator(
+    'ovs_vlan', ovs_models_v2.VlanAllocation, 'vlan_id', 'physical_network')
+_tunnel_allocator = segment_allocator.SegmentAllocator(
+    'ovs_tunnel', ovs_models_v2.TunnelAllocation, 'tunnel_id')
+
 
 def initialize():
     db.configure_db()
@@ -48,6 +55,16 @@ def get_network_binding(session, network_id):
         return
 
 
+def get_network_bindings(session, network_ids):
+    """Get the bindings of networks in one query, keyed by network id."""
+    if not network_ids:
+        return {}
+    query = session.query(ovs_models_v2.NetworkBinding)
+    query = query.filter(
+        ovs_models_v2.NetworkBinding.network_id.in_(network_ids))
+    return dict((binding.network_id, binding) for binding in query)
+
+
 def add_network_binding(session, network_id, network_type,
                         physical_network, segmentation_id):
     with session.begin(subtransactions=True):
@@ -58,240 +75,86 @@ def add_network_binding(session, network_id, network_type,
 
 
 def sync_vlan_allocations(network_vlan_ranges):
-    """Synchronize vlan_allocations table with configured VLAN ranges"""
+    """Synchronize free vlan ranges with configured VLAN ranges"""
 
     session = db.get_session()
-    with session.begin():
-        # get existing allocations for all physical networks
-        allocations = dict()
-        allocs = (session.query(ovs_models_v2.VlanAllocation).
-                  all())
-        for alloc in allocs:
-            if alloc.physical_network not in allocations:
-                allocations[alloc.physical_network] = set()
-            allocations[alloc.physical_network].add(alloc)
-
-        # process vlan ranges for each configured physical network
-        for physical_network, vlan_ranges in network_vlan_ranges.iteritems():
-            # determine current configured allocatable vlans for this
-            # physical network
-            vlan_ids = set()
-            for vlan_range in vlan_ranges:
-                vlan_ids |= set(xrange(vlan_range[0], vlan_range[1] + 1))
-
-            # remove from table unallocated vlans not currently allocatable
-            if physical_network in allocations:
-                for alloc in allocations[physical_network]:
-                    try:
-                        # see if vlan is allocatable
-                        vlan_ids.remove(alloc.vlan_id)
-                    except KeyError:
-                        # it's not allocatable, so check if its allocated
-                        if not alloc.allocated:
-                            # it's not, so remove it from table
-                            LOG.debug(_("Removing vlan %(vlan_id)s on "
-                                        "physical network "
-                                        "%(physical_network)s from pool"),
-                                      {'vlan_id': alloc.vlan_id,
-                                       'physical_network': physical_network})
-                            session.delete(alloc)
-                del allocations[physical_network]
-
-            # add missing allocatable vlans to table
-            for vlan_id in sorted(vlan_ids):
-                alloc = ovs_models_v2.VlanAllocation(physical_network, vlan_id)
-                session.add(alloc)
-
-        # remove from table unallocated vlans for any unconfigured physical
-        # networks
-        for allocs in allocations.itervalues():
-            for alloc in allocs:
-                if not alloc.allocated:
-                    LOG.debug(_("Removing vlan %(vlan_id)s on physical "
-                                "network %(physical_network)s from pool"),
-                              {'vlan_id': alloc.vlan_id,
-                               'physical_network': alloc.physical_network})
-                    session.delete(alloc)
+    _vlan_allocator.sync(session, network_vlan_ranges)
 
 
 def get_vlan_allocation(physical_network, vlan_id):
     session = db.get_session()
-    try:
-        alloc = (session.query(ovs_models_v2.VlanAllocation).
-                 filter_by(physical_network=physical_network,
-                           vlan_id=vlan_id).
-                 one())
-        return alloc
-    except exc.NoResultFound:
-        return
+    return _vlan_allocator.get_allocation(session, physical_network, vlan_id)
 
 
 def reserve_vlan(session):
     with session.begin(subtransactions=True):
-        alloc = (session.query(ovs_models_v2.VlanAllocation).
-                 filter_by(allocated=False).
-                 first())
-        if alloc:
+        allocation = _vlan_allocator.reserve(session)
+        if allocation:
             LOG.debug(_("Reserving vlan %(vlan_id)s on physical network "
                         "%(physical_network)s from pool"),
-                      {'vlan_id': alloc.vlan_id,
-                       'physical_network': alloc.physical_network})
-            alloc.allocated = True
-            return (alloc.physical_network, alloc.vlan_id)
+                      {'vlan_id': allocation[1],
+                       'physical_network': allocation[0]})
+            return allocation
     raise q_exc.NoNetworkAvailable()
 
 
 def reserve_specific_vlan(session, physical_network, vlan_id):
     with session.begin(subtransactions=True):
-        try:
-            alloc = (session.query(ovs_models_v2.VlanAllocation).
-                     filter_by(physical_network=physical_network,
-                               vlan_id=vlan_id).
-                     one())
-            if alloc.allocated:
-                if vlan_id == constants.FLAT_VLAN_ID:
-                    raise q_exc.FlatNetworkInUse(
-                        physical_network=physical_network)
-                else:
-                    raise q_exc.VlanIdInUse(vlan_id=vlan_id,
-                                            physical_network=physical_network)
-            LOG.debug(_("Reserving specific vlan %(vlan_id)s on physical "
-                        "network %(physical_network)s from pool"), locals())
-            alloc.allocated = True
-        except exc.NoResultFound:
-            LOG.debug(_("Reserving specific vlan %(vlan_id)s on physical "
-                        "network %(physical_network)s outside pool"),
-                      locals())
-            alloc = ovs_models_v2.VlanAllocation(physical_network, vlan_id)
-            alloc.allocated = True
-            session.add(alloc)
+        if not _vlan_allocator.reserve_specific(session, physical_network,
+                                                vlan_id):
+            if vlan_id == constants.FLAT_VLAN_ID:
+                raise q_exc.FlatNetworkInUse(
+                    physical_network=physical_network)
+            else:
+                raise q_exc.VlanIdInUse(vlan_id=vlan_id,
+                                        physical_network=physical_network)
 
 
 def release_vlan(session, physical_network, vlan_id, network_vlan_ranges):
     with session.begin(subtransactions=True):
-        try:
-            alloc = (session.query(ovs_models_v2.VlanAllocation).
-                     filter_by(physical_network=physical_network,
-                               vlan_id=vlan_id).
-                     one())
-            alloc.allocated = False
-            inside = False
-            for vlan_range in network_vlan_ranges.get(physical_network, []):
-                if vlan_id >= vlan_range[0] and vlan_id <= vlan_range[1]:
-                    inside = True
-                    break
-            if not inside:
-                session.delete(alloc)
-                LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
-                            "%(physical_network)s outside pool"),
-                          locals())
-            else:
-                LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
-                            "%(physical_network)s to pool"),
-                          locals())
-        except exc.NoResultFound:
+        if _vlan_allocator.release(session, physical_network, vlan_id,
+                                   network_vlan_ranges):
+            LOG.debug(_("Releasing vlan %(vlan_id)s on physical network "
+                        "%(physical_network)s"), locals())
+        else:
             LOG.warning(_("vlan_id %(vlan_id)s on physical network "
                           "%(physical_network)s not found"),
                         locals())
 
 
 def sync_tunnel_allocations(tunnel_id_ranges):
-    """Synchronize tunnel_allocations table with configured tunnel ranges"""
-
-    # determine current configured allocatable tunnels
-    tunnel_ids = set()
-    for tunnel_id_range in tunnel_id_ranges:
-        tun_min, tun_max = tunnel_id_range
-        if tun_max + 1 - tun_min > 1000000:
-            LOG.error(_("Skipping unreasonable tunnel ID range "
-                        "%(tun_min)s:%(tun_max)s"),
-                      locals())
-        else:
-            tunnel_ids |= set(xrange(tun_min, tun_max + 1))
+    """Synchronize free tunnel ranges with configured tunnel ranges"""
 
     session = db.get_session()
-    with session.begin():
-        # remove from table unallocated tunnels not currently allocatable
-        allocs = (session.query(ovs_models_v2.TunnelAllocation).
-                  all())
-        for alloc in allocs:
-            try:
-                # see if tunnel is allocatable
-                tunnel_ids.remove(alloc.tunnel_id)
-            except KeyError:
-                # it's not allocatable, so check if its allocated
-                if not alloc.allocated:
-                    # it's not, so remove it from table
-                    LOG.debug(_("Removing tunnel %s from pool"),
-                              alloc.tunnel_id)
-                    session.delete(alloc)
-
-        # add missing allocatable tunnels to table
-        for tunnel_id in sorted(tunnel_ids):
-            alloc = ovs_models_v2.TunnelAllocation(tunnel_id)
-            session.add(alloc)
+    _tunnel_allocator.sync(session, {'': tunnel_id_ranges})
 
 
 def get_tunnel_allocation(tunnel_id):
     session = db.get_session()
-    try:
-        alloc = (session.query(ovs_models_v2.TunnelAllocation).
-                 filter_by(tunnel_id=tunnel_id).
-                 one())
-        return alloc
-    except exc.NoResultFound:
-        return
+    return _tunnel_allocator.get_allocation(session, None, tunnel_id)
 
 
 def reserve_tunnel(session):
     with session.begin(subtransactions=True):
-        alloc = (session.query(ovs_models_v2.TunnelAllocation).
-                 filter_by(allocated=False).
-                 first())
-        if alloc:
-            LOG.debug(_("Reserving tunnel %s from pool"), alloc.tunnel_id)
-            alloc.allocated = True
-            return alloc.tunnel_id
+        allocation = _tunnel_allocator.reserve(session)
+        if allocation:
+            LOG.debug(_("Reserving tunnel %s from pool"), allocation[1])
+            return allocation[1]
     raise q_exc.NoNetworkAvailable()
 
 
 def reserve_specific_tunnel(session, tunnel_id):
     with session.begin(subtransactions=True):
-        try:
-            alloc = (session.query(ovs_models_v2.TunnelAllocation).
-                     filter_by(tunnel_id=tunnel_id).
-                     one())
-            if alloc.allocated:
-                raise q_exc.TunnelIdInUse(tunnel_id=tunnel_id)
-            LOG.debug(_("Reserving specific tunnel %s from pool"), tunnel_id)
-            alloc.allocated = True
-        except exc.NoResultFound:
-            LOG.debug(_("Reserving specific tunnel %s outside pool"),
-                      tunnel_id)
-            alloc = ovs_models_v2.TunnelAllocation(tunnel_id)
-            alloc.allocated = True
-            session.add(alloc)
+        if not _tunnel_allocator.reserve_specific(session, None, tunnel_id):
+            raise q_exc.TunnelIdInUse(tunnel_id=tunnel_id)
 
 
 def release_tunnel(session, tunnel_id, tunnel_id_ranges):
     with session.begin(subtransactions=True):
-        try:
-            alloc = (session.query(ovs_models_v2.TunnelAllocation).
-                     filter_by(tunnel_id=tunnel_id).
-                     one())
-            alloc.allocated = False
-            inside = False
-            for tunnel_id_range in tunnel_id_ranges:
-                if (tunnel_id >= tunnel_id_range[0]
-                    and tunnel_id <= tunnel_id_range[1]):
-                    inside = True
-                    break
-            if not inside:
-                session.delete(alloc)
-                LOG.debug(_("Releasing tunnel %s outside pool"), tunnel_id)
-            else:
-                LOG.debug(_("Releasing tunnel %s to pool"), tunnel_id)
-        except exc.NoResultFound:
+        if _tunnel_allocator.release(session, None, tunnel_id,
+                                     {'': tunnel_id_ranges}):
+            LOG.debug(_("Releasing tunnel %s"), tunnel_id)
+        else:
             LOG.warning(_("tunnel_id %s not found"), tunnel_id)
 
 
@@ -304,6 +167,19 @@ def get_port(port_id):
     return port
 
 
+def get_ports_and_bindings(port_ids):
+    """Get ports and their network bindings, keyed by port id."""
+    if not port_ids:
+        return {}
+    session = db.get_session()
+    query = session.query(models_v2.Port, ovs_models_v2.NetworkBinding)
+    query = query.outerjoin(
+        ovs_models_v2.NetworkBinding,
+        ovs_models_v2.NetworkBinding.network_id == models_v2.Port.network_id)
+    query = query.filter(models_v2.Port.id.in_(port_ids))
+    return dict((port['id'], (port, binding)) for port, binding in query)
+
+
 def get_port_from_device(port_id):
     """Get port from database"""
     LOG.debug(_("get_port_with_securitygroups() called:port_id=%s"), port_id)
@@ -330,6 +206,26 @@ def get_port_from_device(port_id):
     return port_dict
 
 
+def get_ports_from_devices(port_ids):
+    """Get ports from database, keyed by port id.
+
+    Same as get_port_from_device() for many ports, with one query for the
+    ports and their security groups and one for their ips.
+    """
+    if not port_ids:
+        return {}
+    session = db.get_session()
+    sg_binding_port = sg_db.SecurityGroupPortBinding.port_id
+
+    query = session.query(models_v2.Port,
+                          sg_db.SecurityGroupPortBinding.security_group_id)
+    query = query.outerjoin(sg_db.SecurityGroupPortBinding,
+                            models_v2.Port.id == sg_binding_port)
+    query = query.filter(models_v2.Port.id.in_(port_ids))
+    plugin = manager.QuantumManager.get_plugin()
+    return sg_db_rpc.make_port_dicts(session, plugin, query)
+
+
 def set_port_status(port_id, status):
     session = db.get_session()
     try:
@@ -341,6 +237,16 @@ def set_port_status(port_id, status):
         raise q_exc.PortNotFound(port_id=port_id)
 
 
+def set_ports_status(port_ids, status):
+    if not port_ids:
+        return
+    session = db.get_session()
+    with session.begin():
+        query = session.query(models_v2.Port)
+        query = query.filter(models_v2.Port.id.in_(port_ids))
+        query.update({'status': status}, synchronize_session=False)
+
+
 def get_tunnel_endpoints():
     session = db.get_session()
     try:
@@ -60,8 +60,10 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
     # history
     #   1.0 Initial version
     #   1.1 Support Security Group RPC
+    #   1.2 Support get_devices_details_list and
+    #       security_group_info_for_devices/groups
 
-    RPC_API_VERSION = '1.1'
+    RPC_API_VERSION = '1.2'
 
     def __init__(self, notifier):
         self.notifier = notifier
@@ -82,6 +84,13 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             port['device'] = device
         return port
 
+    @classmethod
+    def get_ports_from_devices(cls, devices):
+        ports = ovs_db_v2.get_ports_from_devices(devices)
+        for device, port in ports.iteritems():
+            port['device'] = device
+        return ports.values()
+
     def get_device_details(self, rpc_context, **kwargs):
         """Agent requests device details"""
         agent_id = kwargs.get('agent_id')
@@ -91,15 +100,8 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
         port = ovs_db_v2.get_port(device)
         if port:
             binding = ovs_db_v2.get_network_binding(None, port['network_id'])
-            entry = {'device': device,
-                     'network_id': port['network_id'],
-                     'port_id': port['id'],
-                     'admin_state_up': port['admin_state_up'],
-                     'network_type': binding.network_type,
-                     'segmentation_id': binding.segmentation_id,
-                     'physical_network': binding.physical_network}
-            new_status = (q_const.PORT_STATUS_ACTIVE if port['admin_state_up']
-                          else q_const.PORT_STATUS_DOWN)
+            entry = self._make_device_details(device, port, binding)
+            new_status = self._get_new_port_status(port)
             if port['status'] != new_status:
                 ovs_db_v2.set_port_status(port['id'], new_status)
         else:
@@ -107,6 +109,47 @@ class OVSRpcCallbacks(dhcp_rpc_base.DhcpRpcCallbackMixin,
             LOG.debug(_("%s can not be found in database"), device)
         return entry
 
+    def get_devices_details_list(self, rpc_context, **kwargs):
+        """Agent requests details of several devices at once"""
+        agent_id = kwargs.get('agent_id')
+        devices = kwargs.get('devices', [])
+        LOG.debug(_("Details of %(count)d devices requested from "
+                    "%(agent_id)s"), {'count': len(devices),
+                                      'agent_id': agent_id})
+        ports = ovs_db_v2.get_ports_and_bindings(devices)
+        entries = []
+        status_updates = {}
+        for device in devices:
+            if device in ports:
+                port, binding = ports[device]
+                entries.append(self._make_device_details(device, port,
+                                                         binding))
+                new_status = self._get_new_port_status(port)
+                if port['status'] != new_status:
+                    status_updates.setdefault(new_status, []).append(
+                        port['id'])
+            else:
+                entries.append({'device': device})
+                LOG.debug(_("%s can not be found in database"), device)
+        for status, port_ids in status_updates.iteritems():
+            ovs_db_v2.set_ports_status(port_ids, status)
+        return entries
+
+    @staticmethod
+    def _make_device_details(device, port, binding):
+        return {'device': device,
+                'network_id': port['network_id'],
+                'port_id': port['id'],
+                'admin_state_up': port['admin_state_up'],
+                'network_type': binding.network_type,
+                'segmentation_id': binding.segmentation_id,
+                'physical_network': binding.physical_network}
+
+    @staticmethod
+    def _get_new_port_status(port):
+        return (q_const.PORT_STATUS_ACTIVE if port['admin_state_up']
+                else q_const.PORT_STATUS_DOWN)
+
     def update_device_down(self, rpc_context, **kwargs):
         """Device no longer exists on agent"""
         # (TODO) garyk - live migration and port status
@@ -331,10 +374,11 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
     def _enforce_set_auth(self, context, resource, action):
         policy.enforce(context, action, resource)
 
-    def _extend_network_dict_provider(self, context, network):
+    def _extend_network_dict_provider(self, context, network, binding=None):
         if self._check_view_auth(context, network, self.network_view):
-            binding = ovs_db_v2.get_network_binding(context.session,
-                                                    network['id'])
+            if not binding:
+                binding = ovs_db_v2.get_network_binding(context.session,
+                                                        network['id'])
             network[provider.NETWORK_TYPE] = binding.network_type
             if binding.network_type == constants.TYPE_GRE:
                 network[provider.PHYSICAL_NETWORK] = None
@@ -349,6 +393,13 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
                 network[provider.PHYSICAL_NETWORK] = None
                 network[provider.SEGMENTATION_ID] = None
 
+    def _extend_network_dicts_provider(self, context, networks):
+        bindings = ovs_db_v2.get_network_bindings(
+            context.session, [network['id'] for network in networks])
+        for network in networks:
+            self._extend_network_dict_provider(context, network,
+                                               bindings.get(network['id']))
+
     def _process_provider_create(self, context, attrs):
         network_type = attrs.get(provider.NETWORK_TYPE)
         physical_network = attrs.get(provider.PHYSICAL_NETWORK)
@@ -534,9 +585,8 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
             nets = super(OVSQuantumPluginV2,
                          self).get_networks(context, filters, None, sorts,
                                             limit, marker, page_reverse)
-            for net in nets:
-                self._extend_network_dict_provider(context, net)
-                self._extend_network_dict_l3(context, net)
+            self._extend_network_dicts_provider(context, nets)
+            self._extend_network_dicts_l3(context, nets)
 
             # TODO(rkukura): Filter on extended provider attributes.
             nets = self._filter_nets_l3(context, nets, filters)
@@ -567,8 +617,7 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
         if port['device_owner'] == q_const.DEVICE_OWNER_DHCP:
             self.notifier.security_groups_provider_updated(context)
         else:
-            self.notifier.security_groups_member_updated(
-                context, port.get(ext_sg.SECURITYGROUPS))
+            self.notify_security_groups_member_updated(context, port)
         return self._extend_port_dict_binding(context, port)
 
     def get_port(self, context, id, fields=None):
@@ -587,8 +636,8 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
                 context, filters, fields, sorts, limit, marker,
                 page_reverse)
             #TODO(nati) filter by security group
+            self._extend_port_dicts_security_group(context, ports)
             for port in ports:
-                self._extend_port_dict_security_group(context, port)
                 self._extend_port_dict_binding(context, port)
         return [self._fields(port, fields) for port in ports]
 
@@ -634,5 +683,4 @@ class OVSQuantumPluginV2(db_base_plugin_v2.QuantumDbPluginV2,
             self._delete_port_security_group_bindings(context, id)
             super(OVSQuantumPluginV2, self).delete_port(context, id)
 
-        self.notifier.security_groups_member_updated(
-            context, port.get(ext_sg.SECURITYGROUPS))
+        self.notify_security_groups_member_updated(context, port)
@@ -37,6 +37,9 @@ class LoadBalancerPlugin(loadbalancer_db.LoadBalancerPluginDb):
     """
     supported_extension_aliases = ["lbaas"]
 
+    __native_pagination_support = True
+    __native_sorting_support = True
+
     def __init__(self):
         """
         Do the initialization for the loadbalancer service plugin here.
@@ -97,9 +100,11 @@ class LoadBalancerPlugin(loadbalancer_db.LoadBalancerPluginDb):
         LOG.debug(_("Get vip: %s"), id)
         return res
 
-    def get_vips(self, context, filters=None, fields=None):
+    def get_vips(self, context, filters=None, fields=None,
+                 sorts=None, limit=None, marker=None,
+                 page_reverse=False):
         res = super(LoadBalancerPlugin, self).get_vips(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get vips"))
         return res
 
@@ -137,9 +142,11 @@ class LoadBalancerPlugin(loadbalancer_db.LoadBalancerPluginDb):
         LOG.debug(_("Get pool: %s"), id)
         return res
 
-    def get_pools(self, context, filters=None, fields=None):
+    def get_pools(self, context, filters=None, fields=None,
+                  sorts=None, limit=None, marker=None,
+                  page_reverse=False):
         res = super(LoadBalancerPlugin, self).get_pools(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get Pools"))
         return res
 
@@ -172,9 +179,11 @@ class LoadBalancerPlugin(loadbalancer_db.LoadBalancerPluginDb):
         LOG.debug(_("Get member: %s"), id)
         return res
 
-    def get_members(self, context, filters=None, fields=None):
+    def get_members(self, context, filters=None, fields=None,
+                    sorts=None, limit=None, marker=None,
+                    page_reverse=False):
         res = super(LoadBalancerPlugin, self).get_members(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get members"))
         return res
 
@@ -214,9 +223,11 @@ class LoadBalancerPlugin(loadbalancer_db.LoadBalancerPluginDb):
         LOG.debug(_("Get health_monitor: %s"), id)
         return res
 
-    def get_health_monitors(self, context, filters=None, fields=None):
+    def get_health_monitors(self, context, filters=None, fields=None,
+                            sorts=None, limit=None, marker=None,
+                            page_reverse=False):
         res = super(LoadBalancerPlugin, self).get_health_monitors(
-            context, filters, fields)
+            context, filters, fields, sorts, limit, marker, page_reverse)
         LOG.debug(_("Get health_monitors"))
         return res
 
@@ -19,6 +19,8 @@
 Policy engine for quantum.  Largely copied from nova.
 """
 
+import re
+
 from oslo.config import cfg
 
 from quantum.api.v2 import attributes
@@ -31,14 +33,17 @@ from quantum.openstack.common import policy
 LOG = logging.getLogger(__name__)
 _POLICY_PATH = None
 _POLICY_CACHE = {}
+_COMPILER = None
 cfg.CONF.import_opt('policy_file', 'quantum.common.config')
 
 
 def reset():
     global _POLICY_PATH
     global _POLICY_CACHE
+    global _COMPILER
     _POLICY_PATH = None
     _POLICY_CACHE = {}
+    _COMPILER = None
     policy.reset()
 
 
@@ -74,11 +79,15 @@ def _is_attribute_explicitly_set(attribute_name, resource, target):
             target[attribute_name] != resource[attribute_name]['default'])
 
 
-def _build_target(action, original_target, plugin, context):
+def _build_target(action, original_target, plugin, context, keys=None,
+                  parent_tenants=None):
     """Augment dictionary of target attributes for policy engine.
 
     This routine adds to the dictionary attributes belonging to the
-    "parent" resource of the targeted one.
+    "parent" resource of the targeted one. The parent is not looked up
+    when keys, the target attributes the rule depends on, do not include
+    its attributes. parent_tenants caches the tenants of the parents
+    already looked up.
     """
     target = original_target.copy()
     resource, _a = get_resource_and_action(action)
@@ -87,11 +96,19 @@ def _build_target(action, original_target, plugin, context):
         # use the 'singular' version of the resource name
         parent_resource = hierarchy_info['parent'][:-1]
         parent_id = hierarchy_info['identified_by']
-        f = getattr(plugin, 'get_%s' % parent_resource)
-        # f *must* exist, if not found it is better to let quantum explode
-        # Note: we do not use admin context
-        data = f(context, target[parent_id], fields=['tenant_id'])
-        target['%s_tenant_id' % parent_resource] = data['tenant_id']
+        parent_key = '%s_tenant_id' % parent_resource
+        if keys is not None and parent_key not in keys:
+            return target
+        if parent_tenants is None:
+            parent_tenants = {}
+        if target[parent_id] not in parent_tenants:
+            f = getattr(plugin, 'get_%s' % parent_resource)
+            # f *must* exist, if not found it is better to let quantum
+            # explode
+            # Note: we do not use admin context
+            data = f(context, target[parent_id], fields=['tenant_id'])
+            parent_tenants[target[parent_id]] = data['tenant_id']
+        target[parent_key] = parent_tenants[target[parent_id]]
     return target
 
 
@@ -158,6 +175,225 @@ class FieldCheck(policy.Check):
         return target_value == self.value
 
 
+def _deny(target, creds):
+    return False
+
+
+def _allow(target, creds):
+    return True
+
+
+def _all_of(matchers):
+    def matcher(target, creds):
+        for match in matchers:
+            if not match(target, creds):
+                return False
+        return True
+    return matcher
+
+
+def _any_of(matchers):
+    def matcher(target, creds):
+        for match in matchers:
+            if match(target, creds):
+                return True
+        return False
+    return matcher
+
+
+def _none_of(match):
+    def matcher(target, creds):
+        return not match(target, creds)
+    return matcher
+
+
+def _rule_matcher(match):
+    def matcher(target, creds):
+        try:
+            return match(target, creds)
+        except KeyError:
+            # like RuleCheck, a rule which can not be evaluated fails closed
+            return False
+    return matcher
+
+
+def _role_matcher(role):
+    def matcher(target, creds):
+        return role in [x.lower() for x in creds['roles']]
+    return matcher
+
+
+def _generic_matcher(kind, match):
+    def matcher(target, creds):
+        value = match % target
+        if kind in creds:
+            return value == unicode(creds[kind])
+        return False
+    return matcher
+
+
+def _field_matcher(field, value):
+    def matcher(target, creds):
+        target_value = target.get(field)
+        # target_value might be a boolean, explicitly compare with None
+        return target_value is not None and target_value == value
+    return matcher
+
+
+class _RuleCompiler(object):
+    """Compile the Check trees of a set of rules into matcher functions.
+
+    A matcher takes the same (target, creds) arguments as a Check. The
+    rule references are resolved and the nested and/or checks are
+    flattened once, rather than every time a rule is evaluated. Each
+    matcher comes with the keys of the target it depends on, or None when
+    it might depend on the whole target.
+    """
+
+    _format_keys = re.compile(r'%\(([^)]*)\)')
+
+    def __init__(self, rules):
+        self.rules = rules
+        self._matchers = {}
+
+    def rule(self, name):
+        """Return the matcher and keys of the named rule."""
+        if name not in self._matchers:
+            # refuse a rule referring to itself rather than recursing
+            self._matchers[name] = (_deny, frozenset())
+            try:
+                check = self.rules[name]
+            except (KeyError, TypeError):
+                # no such rule, nor default rule, or no rules at all
+                self._matchers[name] = (_deny, frozenset())
+            else:
+                match, keys = self.compile(check)
+                self._matchers[name] = (_rule_matcher(match), keys)
+        return self._matchers[name]
+
+    def _compile_all(self, checks, kind):
+        matchers = []
+        keys = frozenset()
+        for check in checks:
+            if isinstance(check, kind):
+                # (a and (b and c)) is (a and b and c)
+                match, check_keys = self._compile_all(check.rules, kind)
+            else:
+                match, check_keys = self.compile(check)
+            matchers.append(match)
+            if keys is not None:
+                keys = None if check_keys is None else keys | check_keys
+        if len(matchers) == 1:
+            return matchers[0], keys
+        if kind is policy.AndCheck:
+            return _all_of(matchers), keys
+        return _any_of(matchers), keys
+
+    def compile(self, check):
+        """Return the matcher and keys of a Check tree."""
+        if isinstance(check, policy.TrueCheck):
+            return _allow, frozenset()
+        elif isinstance(check, policy.FalseCheck):
+            return _deny, frozenset()
+        elif isinstance(check, policy.NotCheck):
+            match, keys = self.compile(check.rule)
+            return _none_of(match), keys
+        elif isinstance(check, (policy.AndCheck, policy.OrCheck)):
+            return self._compile_all(check.rules, type(check))
+        elif type(check) is policy.RuleCheck:
+            return self.rule(check.match)
+        elif type(check) is policy.RoleCheck:
+            return _role_matcher(check.match.lower()), frozenset()
+        elif type(check) is policy.GenericCheck:
+            return (_generic_matcher(check.kind, check.match),
+                    frozenset(self._format_keys.findall(check.match)))
+        elif type(check) is FieldCheck:
+            return (_field_matcher(check.field, check.value),
+                    frozenset([check.field]))
+        # checks registered elsewhere are evaluated as they are
+        return check, None
+
+    def tenants(self, check, creds, seen=()):
+        """Reduce a Check tree to a condition on the target tenant.
+
+        :returns: True or False if the check does not depend on the target
+                  for these credentials, the set of tenant ids the
+                  tenant_id of the target must belong to, or None if the
+                  check depends on other attributes.
+        """
+        if isinstance(check, policy.TrueCheck):
+            return True
+        elif isinstance(check, policy.FalseCheck):
+            return False
+        elif isinstance(check, policy.NotCheck):
+            result = self.tenants(check.rule, creds, seen)
+            return not result if isinstance(result, bool) else None
+        elif isinstance(check, policy.AndCheck):
+            results = [self.tenants(c, creds, seen) for c in check.rules]
+            if False in results:
+                return False
+            return self._combine(results, frozenset.intersection)
+        elif isinstance(check, policy.OrCheck):
+            results = [self.tenants(c, creds, seen) for c in check.rules]
+            if True in results:
+                return True
+            return self._combine(results, frozenset.union)
+        elif type(check) is policy.RuleCheck:
+            if check.match in seen:
+                return None
+            try:
+                rule = self.rules[check.match]
+            except (KeyError, TypeError):
+                return False
+            return self.tenants(rule, creds, seen + (check.match,))
+        elif type(check) is policy.RoleCheck:
+            return check.match.lower() in [x.lower() for x in creds['roles']]
+        elif type(check) is policy.GenericCheck:
+            if check.match == '%(tenant_id)s':
+                if check.kind not in creds:
+                    return False
+                if creds[check.kind] is not None:
+                    return frozenset([unicode(creds[check.kind])])
+            elif not self._format_keys.search(check.match):
+                return _generic_matcher(check.kind, check.match)({}, creds)
+        elif type(check) is FieldCheck and check.field == 'tenant_id':
+            return frozenset([check.value])
+
+    @staticmethod
+    def _combine(results, merge):
+        tenant_ids = [r for r in results if not isinstance(r, bool)]
+        if None in tenant_ids:
+            return None
+        if not tenant_ids:
+            # only the neutral element of the operation is left
+            return merge is frozenset.intersection
+        return reduce(merge, tenant_ids)
+
+
+def _get_compiler():
+    """Return the compiler of the rules currently in use.
+
+    The rules are compiled lazily, once per load of the policy file.
+    """
+    global _COMPILER
+    if _COMPILER is None or _COMPILER.rules is not policy._rules:
+        _COMPILER = _RuleCompiler(policy._rules)
+    return _COMPILER
+
+
+def _check(context, action, target, plugin):
+    init()
+    compiler = _get_compiler()
+    resource, is_write = get_resource_and_action(action)
+    if is_write:
+        keys = None
+    else:
+        keys = compiler.rule(action)[1]
+    real_target = _build_target(action, target, plugin, context, keys)
+    match, _keys = compiler.compile(_build_match_rule(action, real_target))
+    return match(real_target, context.to_dict())
+
+
 def check(context, action, target, plugin=None):
     """Verifies that the action is valid on the target in this context.
 
@@ -172,11 +408,7 @@ def check(context, action, target, plugin=None):
 
     :return: Returns True if access is permitted else False.
     """
-    init()
-    real_target = _build_target(action, target, plugin, context)
-    match_rule = _build_match_rule(action, real_target)
-    credentials = context.to_dict()
-    return policy.check(match_rule, real_target, credentials)
+    return _check(context, action, target, plugin)
 
 
 def enforce(context, action, target, plugin=None):
@@ -191,12 +423,70 @@ def enforce(context, action, target, plugin=None):
     :param plugin: quantum plugin used to retrieve information required
         for augmenting the target
 
-    :raises quantum.exceptions.PolicyNotAllowed: if verification fails.
+    :raises quantum.exceptions.PolicyNotAuthorized: if verification fails.
     """
+    result = _check(context, action, target, plugin)
+    if result is False:
+        raise exceptions.PolicyNotAuthorized(action=action)
+    return result
+
+
+def check_collection(context, action, targets, plugin=None):
+    """Return the targets on which a read action is valid in this context.
 
+    The rule of the action is evaluated once for all the targets sharing
+    the values of the attributes it depends on, and the parent resources
+    of the targets are looked up only if the rule depends on them.
+
+    :param context: quantum context
+    :param action: string representing a read action, e.g. get_port
+    :param targets: list of dictionaries representing the objects of the
+        action
+    :param plugin: quantum plugin used to retrieve information required
+        for augmenting the targets
+    """
+    resource, is_write = get_resource_and_action(action)
+    if is_write:
+        return [target for target in targets
+                if check(context, action, target, plugin)]
     init()
-    real_target = _build_target(action, target, plugin, context)
-    match_rule = _build_match_rule(action, real_target)
+    match, keys = _get_compiler().rule(action)
     credentials = context.to_dict()
-    return policy.check(match_rule, real_target, credentials,
-                        exceptions.PolicyNotAuthorized, action=action)
+    parent_tenants = {}
+    results = {}
+    allowed = []
+    for target in targets:
+        real_target = _build_target(action, target, plugin, context, keys,
+                                    parent_tenants)
+        if keys is None:
+            result = match(real_target, credentials)
+        else:
+            values = tuple(real_target.get(key) for key in keys)
+            try:
+                result = results[values]
+            except KeyError:
+                result = results[values] = match(real_target, credentials)
+            except TypeError:
+                # unhashable attribute values are not memoized
+                result = match(real_target, credentials)
+        if result:
+            allowed.append(target)
+    return allowed
+
+
+def get_tenant_filter(context, action):
+    """Return the tenants whose objects a read action may be valid on.
+
+    :returns: a list of tenant ids when, for this context, the rule of the
+              action only depends on the tenant of the target, None
+              otherwise.
+    """
+    init()
+    compiler = _get_compiler()
+    try:
+        rule = compiler.rules[action]
+    except (KeyError, TypeError):
+        return
+    tenant_ids = compiler.tenants(rule, context.to_dict())
+    if isinstance(tenant_ids, frozenset):
+        return sorted(tenant_ids)
@@ -47,6 +47,10 @@ quota_opts = [
     cfg.StrOpt('quota_driver',
                default='quantum.quota.ConfDriver',
                help=_('Default driver to use for quota checks')),
+    cfg.IntOpt('quota_usage_refresh_interval',
+               default=600,
+               help=_('Number of seconds after which the usage tracked by '
+                      'UsageTrackingQuotaDriver is counted again')),
 ]
 # Register the configuration options
 cfg.CONF.register_opts(quota_opts, 'QUOTAS')
@@ -259,6 +263,29 @@ class QuotaEngine(object):
         return self._driver.limit_check(context, tenant_id,
                                         self._resources, values)
 
+    def limit_check_delta(self, context, tenant_id, resource, delta,
+                          *args):
+        """Check that delta more of a resource are within the quota.
+
+        Drivers which keep track of the usage check the delta against it.
+        Otherwise the resource is counted, passing the arguments following
+        delta and the tenant_id to its count function, and the result is
+        checked with limit_check().
+
+        :param context: The request context, for access checks.
+        :param tenant_id: The tenant_id to check the quota.
+        :param resource: The name of the resource, as a string.
+        :param delta: The number of resources to be created.
+        """
+
+        check_delta = getattr(self._driver, 'limit_check_delta', None)
+        if check_delta:
+            return check_delta(context, tenant_id, self._resources,
+                               resource, delta, *args)
+        count = self.count(context, resource, *(args + (tenant_id,)))
+        return self.limit_check(context, tenant_id,
+                                **{resource: count + delta})
+
     @property
     def resources(self):
         return self._resources
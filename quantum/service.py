@@ -101,13 +101,38 @@ def serve_wsgi(cls):
     return service
 
 
+# Options which keep state in the memory of the server process. The API
+# workers don't share it with the RPC consumers of the parent process.
+_PROCESS_LOCAL_OPTS = [('enable_server_cache', 'SECURITYGROUP', False),
+                       ('agent_heartbeat_flush_interval', None, 0)]
+
+
+def _check_api_workers_options():
+    if not cfg.CONF.api_workers:
+        return
+    for name, group, value in _PROCESS_LOCAL_OPTS:
+        try:
+            conf = cfg.CONF[group] if group else cfg.CONF
+            if conf[name] == value:
+                continue
+        except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+            # not used by the loaded plugin
+            continue
+        LOG.warn(_("%(name)s is not supported with api_workers, "
+                   "setting it to %(value)s"),
+                 {'name': name, 'value': value})
+        cfg.CONF.set_override(name, value, group)
+
+
 def _run_wsgi(app_name):
     app = config.load_paste_app(app_name)
     if not app:
         LOG.error(_('No known API applications configured.'))
         return
+    _check_api_workers_options()
     server = wsgi.Server("Quantum")
-    server.start(app, cfg.CONF.bind_port, cfg.CONF.bind_host)
+    server.start(app, cfg.CONF.bind_port, cfg.CONF.bind_host,
+                 workers=cfg.CONF.api_workers)
     # Dump all option values here after all options are parsed
     cfg.CONF.log_opt_values(LOG, std_logging.DEBUG)
     LOG.info(_("Quantum service started, listening on %(host)s:%(port)s"),
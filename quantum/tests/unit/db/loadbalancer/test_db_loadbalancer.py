@@ -446,7 +446,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['vips'][0][k], v)
 
-    def test_list_vips_with_sort_emulated(self):
+    def test_list_vips_with_sort_native(self):
         with contextlib.nested(self.vip(name='vip1', port=81),
                                self.vip(name='vip2', port=82),
                                self.vip(name='vip3', port=82)
@@ -454,7 +454,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             self._test_list_with_sort('vip', (vip1, vip3, vip2),
                                       [('port', 'asc'), ('name', 'desc')])
 
-    def test_list_vips_with_pagination_emulated(self):
+    def test_list_vips_with_pagination_native(self):
         with contextlib.nested(self.vip(name='vip1'),
                                self.vip(name='vip2'),
                                self.vip(name='vip3')
@@ -463,7 +463,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                             (vip1, vip2, vip3),
                                             ('name', 'asc'), 2, 2)
 
-    def test_list_vips_with_pagination_reverse_emulated(self):
+    def test_list_vips_with_pagination_reverse_native(self):
         with contextlib.nested(self.vip(name='vip1'),
                                self.vip(name='vip2'),
                                self.vip(name='vip3')
@@ -554,7 +554,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['pool'][k], v)
 
-    def test_list_pools_with_sort_emulated(self):
+    def test_list_pools_with_sort_native(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -562,7 +562,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             self._test_list_with_sort('pool', (p3, p2, p1),
                                       [('name', 'desc')])
 
-    def test_list_pools_with_pagination_emulated(self):
+    def test_list_pools_with_pagination_native(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -571,7 +571,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                             (p1, p2, p3),
                                             ('name', 'asc'), 2, 2)
 
-    def test_list_pools_with_pagination_reverse_emulated(self):
+    def test_list_pools_with_pagination_reverse_native(self):
         with contextlib.nested(self.pool(name='p1'),
                                self.pool(name='p2'),
                                self.pool(name='p3')
@@ -702,7 +702,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                 for k, v in keys:
                     self.assertEqual(res['member'][k], v)
 
-    def test_list_members_with_sort_emulated(self):
+    def test_list_members_with_sort_native(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                port=81),
@@ -714,7 +714,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                 self._test_list_with_sort('member', (m3, m2, m1),
                                           [('port', 'desc')])
 
-    def test_list_members_with_pagination_emulated(self):
+    def test_list_members_with_pagination_native(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                port=81),
@@ -727,7 +727,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                                 (m1, m2, m3),
                                                 ('port', 'asc'), 2, 2)
 
-    def test_list_members_with_pagination_reverse_emulated(self):
+    def test_list_members_with_pagination_reverse_native(self):
         with self.pool() as pool:
             with contextlib.nested(self.member(pool_id=pool['pool']['id'],
                                                port=81),
@@ -752,6 +752,13 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(monitor['health_monitor'][k], v)
 
+    def test_list_healthmonitors_with_http_fields(self):
+        with self.health_monitor(type='PING'):
+            res = self._list('health_monitors',
+                             query_params='fields=url_path')
+            self.assertEqual(len(res['health_monitors']), 1)
+            self.assertNotIn('url_path', res['health_monitors'][0])
+
     def test_update_healthmonitor(self):
         keys = [('type', "TCP"),
                 ('tenant_id', self._tenant_id),
@@ -795,7 +802,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             for k, v in keys:
                 self.assertEqual(res['health_monitor'][k], v)
 
-    def test_list_healthmonitors_with_sort_emulated(self):
+    def test_list_healthmonitors_with_sort_native(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
@@ -803,7 +810,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
             self._test_list_with_sort('health_monitor', (m3, m2, m1),
                                       [('delay', 'desc')])
 
-    def test_list_healthmonitors_with_pagination_emulated(self):
+    def test_list_healthmonitors_with_pagination_native(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
@@ -812,7 +819,7 @@ class TestLoadBalancer(LoadBalancerPluginDbTestCase):
                                             (m1, m2, m3),
                                             ('delay', 'asc'), 2, 2)
 
-    def test_list_healthmonitors_with_pagination_reverse_emulated(self):
+    def test_list_healthmonitors_with_pagination_reverse_native(self):
         with contextlib.nested(self.health_monitor(delay=30),
                                self.health_monitor(delay=31),
                                self.health_monitor(delay=32)
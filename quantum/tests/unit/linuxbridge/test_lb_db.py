@@ -15,9 +15,13 @@
 
 import unittest2
 
+from quantum.common import constants as q_const
 from quantum.common import exceptions as q_exc
+from quantum import context
 from quantum.db import api as db
+from quantum.db import models_v2
 from quantum.plugins.linuxbridge.db import l2network_db_v2 as lb_db
+from quantum.plugins.linuxbridge import lb_quantum_plugin as plb
 from quantum.tests.unit import test_db_plugin as test_plugin
 
 PHYS_NET = 'physnet1'
@@ -162,3 +166,44 @@ class NetworkBindingsTest(test_plugin.QuantumDbPluginV2TestCase):
             self.assertEqual(binding.network_id, TEST_NETWORK_ID)
             self.assertEqual(binding.physical_network, PHYS_NET)
             self.assertEqual(binding.vlan_id, 1234)
+
+    def test_get_ports_and_bindings_from_devices(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            lb_db.add_network_binding(self.session, network_id, PHYS_NET,
+                                      1234)
+            with self.subnet(network=network) as subnet:
+                with self.port(subnet=subnet) as port1:
+                    with self.port(subnet=subnet) as port2:
+                        port_ids = [port1['port']['id'], port2['port']['id']]
+                        devices = [port_id[:11] for port_id in port_ids]
+                        ports = lb_db.get_ports_and_bindings_from_devices(
+                            devices + ['fake_device'])
+                        self.assertEqual(sorted(ports.keys()), sorted(devices))
+                        for device, port_id in zip(devices, port_ids):
+                            port, binding = ports[device]
+                            self.assertEqual(port['id'], port_id)
+                            self.assertEqual(binding.vlan_id, 1234)
+
+    def test_get_devices_details_list(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            lb_db.add_network_binding(self.session, network_id, PHYS_NET,
+                                      1234)
+            with self.subnet(network=network) as subnet:
+                with self.port(subnet=subnet,
+                               admin_state_up=False) as port:
+                    port_id = port['port']['id']
+                    device = 'tap' + port_id[:11]
+                    callbacks = plb.LinuxBridgeRpcCallbacks()
+                    entries = callbacks.get_devices_details_list(
+                        context.get_admin_context(),
+                        devices=[device, 'tapfake_dev'],
+                        agent_id='fake_agent_id')
+                    self.assertEqual(entries[0]['device'], device)
+                    self.assertEqual(entries[0]['port_id'], port_id)
+                    self.assertEqual(entries[0]['vlan_id'], 1234)
+                    self.assertFalse(entries[0]['admin_state_up'])
+                    self.assertEqual(entries[1], {'device': 'tapfake_dev'})
+                    port = self.session.query(models_v2.Port).get(port_id)
+                    self.assertEqual(port['status'], q_const.PORT_STATUS_DOWN)
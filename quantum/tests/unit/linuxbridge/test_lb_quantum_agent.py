@@ -51,3 +51,89 @@ class TestLinuxBridge(unittest.TestCase):
             result = self.linux_bridge.ensure_physical_in_bridge(
                 'network_id', 'physnet1', 7)
         self.assertTrue(vlan_bridge_func.called)
+
+    def _mock_device(self, name, action):
+        device = mock.Mock(action=action)
+        device.sys_name = name
+        return device
+
+    def test_get_device_events(self):
+        events = [self._mock_device('tap1', 'add'),
+                  self._mock_device('eth1', 'add'),
+                  self._mock_device('tap2', 'add'),
+                  self._mock_device('tap2', 'remove'),
+                  None]
+        with mock.patch.object(self.linux_bridge, 'monitor') as monitor:
+            monitor.poll.side_effect = events
+            actions = self.linux_bridge.get_device_events(2)
+            self.assertEqual(actions, {'tap1': 'add', 'tap2': 'remove'})
+            self.assertEqual(monitor.poll.mock_calls[0], mock.call(2))
+            self.assertEqual(monitor.poll.mock_calls[1], mock.call(0))
+
+    def test_update_devices_from_events(self):
+        with mock.patch.object(self.linux_bridge,
+                               'get_device_events') as events:
+            events.return_value = {'tap1': 'add', 'tap2': 'remove',
+                                   'tap3': 'add', 'tap4': 'remove'}
+            device_info = self.linux_bridge.update_devices_from_events(
+                set(['tap2', 'tap3', 'tap5']), 2)
+            self.assertEqual(device_info,
+                             {'current': set(['tap1', 'tap3', 'tap5']),
+                              'added': set(['tap1']),
+                              'removed': set(['tap2'])})
+
+    def test_update_devices_from_events_no_change(self):
+        with mock.patch.object(self.linux_bridge,
+                               'get_device_events') as events:
+            events.return_value = {'tap1': 'add'}
+            self.assertIsNone(self.linux_bridge.update_devices_from_events(
+                set(['tap1']), 2))
+
+
+class TestLinuxBridgeAgentDaemonLoop(unittest.TestCase):
+
+    def setUp(self):
+        self.addCleanup(cfg.CONF.reset)
+        cls = linuxbridge_quantum_agent.LinuxBridgeQuantumAgentRPC
+        for method in ('setup_linux_bridge', 'setup_rpc', 'init_firewall'):
+            patcher = mock.patch.object(cls, method)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.agent = cls({'physnet1': 'eth1'}, 2, 'sudo',
+                         device_resync_interval=60)
+        self.agent.br_mgr = mock.Mock()
+        self.agent.process_network_devices = mock.Mock(return_value=False)
+        sleep_p = mock.patch.object(linuxbridge_quantum_agent.time, 'sleep')
+        sleep_p.start()
+        self.addCleanup(sleep_p.stop)
+
+    def test_daemon_loop_uses_device_events(self):
+        br_mgr = self.agent.br_mgr
+        br_mgr.update_devices.return_value = {'current': set(['tap1']),
+                                              'added': set(['tap1']),
+                                              'removed': set()}
+        br_mgr.update_devices_from_events.side_effect = [
+            None,
+            {'current': set(['tap1', 'tap2']), 'added': set(['tap2']),
+             'removed': set()},
+            RuntimeError]
+
+        self.assertRaises(RuntimeError, self.agent.daemon_loop)
+        br_mgr.start_device_monitor.assert_called_once_with()
+        br_mgr.update_devices.assert_called_once_with(set())
+        self.assertEqual(br_mgr.update_devices_from_events.mock_calls,
+                         [mock.call(set(['tap1']), 2),
+                          mock.call(set(['tap1']), 2),
+                          mock.call(set(['tap1', 'tap2']), 2)])
+        self.assertEqual(len(self.agent.process_network_devices.mock_calls),
+                         2)
+
+    def test_daemon_loop_resyncs_on_lost_events(self):
+        br_mgr = self.agent.br_mgr
+        br_mgr.update_devices.side_effect = [None, RuntimeError]
+        br_mgr.update_devices_from_events.side_effect = EnvironmentError
+
+        self.assertRaises(RuntimeError, self.agent.daemon_loop)
+        self.assertEqual(len(br_mgr.update_devices.mock_calls), 2)
+        self.assertEqual(len(br_mgr.update_devices_from_events.mock_calls),
+                         1)
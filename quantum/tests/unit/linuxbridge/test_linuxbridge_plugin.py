@@ -55,3 +55,8 @@ class TestLinuxBridgePortsV2(test_plugin.TestPortsV2,
 class TestLinuxBridgeNetworksV2(test_plugin.TestNetworksV2,
                                 LinuxBridgePluginV2TestCase):
     pass
+
+
+class TestLinuxBridgeListQueryCount(LinuxBridgePluginV2TestCase,
+                                    test_plugin.TestListQueryCount):
+    pass
@@ -581,6 +581,9 @@ class TestMidonetPortsV2(test_plugin.TestPortsV2,
     def test_list_ports_public_network(self):
         pass
 
+    def test_list_ports_with_fields_reads_columns(self):
+        pass
+
     def test_show_port(self):
         self._setup_port_mocks()
         super(TestMidonetPortsV2, self).test_show_port()
@@ -718,6 +721,12 @@ class TestMidonetPortsV2(test_plugin.TestPortsV2,
         super(TestMidonetPortsV2,
               self).test_update_fixed_ip_lease_expiration()
 
+    def test_update_fixed_ip_lease_expirations(self):
+        pass
+
+    def test_update_fixed_ip_lease_expirations_within_slack(self):
+        pass
+
     def test_port_delete_holds_ip(self):
         self._setup_port_mocks()
         super(TestMidonetPortsV2, self).test_port_delete_holds_ip()
@@ -54,3 +54,8 @@ class TestOpenvswitchPortsV2(test_plugin.TestPortsV2,
 class TestOpenvswitchNetworksV2(test_plugin.TestNetworksV2,
                                 OpenvswitchPluginV2TestCase):
     pass
+
+
+class TestOpenvswitchListQueryCount(OpenvswitchPluginV2TestCase,
+                                    test_plugin.TestListQueryCount):
+    pass
@@ -15,9 +15,12 @@
 
 import unittest2
 
+from quantum.common import constants as q_const
 from quantum.common import exceptions as q_exc
+from quantum import context
 from quantum.db import api as db
 from quantum.plugins.openvswitch import ovs_db_v2
+from quantum.plugins.openvswitch import ovs_quantum_plugin as povs
 from quantum.tests.unit import test_db_plugin as test_plugin
 
 PHYS_NET = 'physnet1'
@@ -275,3 +278,43 @@ class NetworkBindingsTest(test_plugin.QuantumDbPluginV2TestCase):
             self.assertEqual(binding.network_type, 'vlan')
             self.assertEqual(binding.physical_network, PHYS_NET)
             self.assertEqual(binding.segmentation_id, 1234)
+
+    def test_get_ports_and_bindings(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            ovs_db_v2.add_network_binding(self.session, network_id,
+                                          'vlan', PHYS_NET, 1234)
+            with self.subnet(network=network) as subnet:
+                with self.port(subnet=subnet) as port1:
+                    with self.port(subnet=subnet) as port2:
+                        port_ids = [port1['port']['id'], port2['port']['id']]
+                        ports = ovs_db_v2.get_ports_and_bindings(
+                            port_ids + ['fake_port_id'])
+                        self.assertEqual(sorted(ports.keys()),
+                                         sorted(port_ids))
+                        for port_id in port_ids:
+                            port, binding = ports[port_id]
+                            self.assertEqual(port['id'], port_id)
+                            self.assertEqual(binding.segmentation_id, 1234)
+
+    def test_get_devices_details_list(self):
+        with self.network() as network:
+            network_id = network['network']['id']
+            ovs_db_v2.add_network_binding(self.session, network_id,
+                                          'vlan', PHYS_NET, 1234)
+            with self.subnet(network=network) as subnet:
+                with self.port(subnet=subnet,
+                               admin_state_up=False) as port:
+                    port_id = port['port']['id']
+                    callbacks = povs.OVSRpcCallbacks(None)
+                    entries = callbacks.get_devices_details_list(
+                        context.get_admin_context(),
+                        devices=[port_id, 'fake_port_id'],
+                        agent_id='fake_agent_id')
+                    self.assertEqual(entries[0]['port_id'], port_id)
+                    self.assertEqual(entries[0]['network_id'], network_id)
+                    self.assertEqual(entries[0]['segmentation_id'], 1234)
+                    self.assertFalse(entries[0]['admin_state_up'])
+                    self.assertEqual(entries[1], {'device': 'fake_port_id'})
+                    self.assertEqual(ovs_db_v2.get_port(port_id)['status'],
+                                     q_const.PORT_STATUS_DOWN)
@@ -185,18 +185,10 @@ class OVS_Lib_Test(unittest.TestCase):
         ip = "9.9.9.9"
         ofport = "6"
 
-        utils.execute(["ovs-vsctl", self.TO, "add-port",
-                       self.BR_NAME, pname], root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set", "Interface",
-                       pname, "type=gre"], root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set", "Interface",
-                       pname, "options:remote_ip=" + ip],
-                      root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set", "Interface",
-                       pname, "options:in_key=flow"],
-                      root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set", "Interface",
-                       pname, "options:out_key=flow"],
+        utils.execute(["ovs-vsctl", self.TO, "--", "add-port",
+                       self.BR_NAME, pname, "--", "set", "Interface",
+                       pname, "type=gre", "options:remote_ip=" + ip,
+                       "options:in_key=flow", "options:out_key=flow"],
                       root_helper=self.root_helper)
         utils.execute(["ovs-vsctl", self.TO, "get",
                        "Interface", pname, "ofport"],
@@ -211,12 +203,9 @@ class OVS_Lib_Test(unittest.TestCase):
         peer = "bar10"
         ofport = "6"
 
-        utils.execute(["ovs-vsctl", self.TO, "add-port",
-                       self.BR_NAME, pname], root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set", "Interface",
-                       pname, "type=patch"], root_helper=self.root_helper)
-        utils.execute(["ovs-vsctl", self.TO, "set",
-                       "Interface", pname, "options:peer=" + peer],
+        utils.execute(["ovs-vsctl", self.TO, "--", "add-port",
+                       self.BR_NAME, pname, "--", "set", "Interface",
+                       pname, "type=patch", "options:peer=" + peer],
                       root_helper=self.root_helper)
         utils.execute(["ovs-vsctl", self.TO, "get",
                        "Interface", pname, "ofport"],
@@ -226,6 +215,80 @@ class OVS_Lib_Test(unittest.TestCase):
         self.assertEqual(self.br.add_patch_port(pname, peer), ofport)
         self.mox.VerifyAll()
 
+    def test_batch(self):
+        utils.execute(["ovs-vsctl", self.TO, "--", "set", "Port", "tap5",
+                       "tag=1", "--", "--if-exists", "del-port",
+                       self.BR_NAME, "tap6", "--", "clear", "Port", "tap7",
+                       "tag"], root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "add-flows", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=2,in_port=5,actions=drop\n"
+                      "hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=normal\n",
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "del-flows", self.BR_NAME, "-"],
+                      process_input="in_port=5\ndl_vlan=1\n",
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "del-flows", self.BR_NAME],
+                      root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "add-flows", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=drop\n",
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.batch():
+            self.br.set_db_attribute("Port", "tap5", "tag", "1")
+            self.br.add_flow(priority=2, in_port=5, actions="drop")
+            with self.br.batch():
+                self.br.delete_port("tap6")
+                self.br.add_flow(priority=1, actions="normal")
+            self.br.delete_flows(in_port=5)
+            self.br.delete_flows(dl_vlan=1)
+            self.br.remove_all_flows()
+            self.br.clear_db_attribute("Port", "tap7", "tag")
+            self.br.add_flow(priority=1, actions="drop")
+        self.mox.VerifyAll()
+
+    def test_batch_falls_back_to_single_commands(self):
+        utils.execute(["ovs-vsctl", self.TO, "--", "set", "Port", "tap5",
+                       "tag=1", "--", "set", "Port", "tap6", "tag=2", "--",
+                       "set", "Port", "tap7", "tag=3"],
+                      root_helper=self.root_helper).AndRaise(RuntimeError)
+        utils.execute(["ovs-vsctl", self.TO, "set", "Port", "tap5",
+                       "tag=1"], root_helper=self.root_helper)
+        utils.execute(["ovs-vsctl", self.TO, "set", "Port", "tap6",
+                       "tag=2"],
+                      root_helper=self.root_helper).AndRaise(RuntimeError)
+        utils.execute(["ovs-vsctl", self.TO, "set", "Port", "tap7",
+                       "tag=3"], root_helper=self.root_helper)
+        utils.execute(["ovs-ofctl", "add-flows", self.BR_NAME, "-"],
+                      process_input="hard_timeout=0,idle_timeout=0,"
+                      "priority=1,actions=normal\n",
+                      root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.assertRaises(RuntimeError):
+            with self.br.batch():
+                self.br.set_db_attribute("Port", "tap5", "tag", "1")
+                self.br.set_db_attribute("Port", "tap6", "tag", "2")
+                self.br.set_db_attribute("Port", "tap7", "tag", "3")
+                self.br.add_flow(priority=1, actions="normal")
+        self.mox.VerifyAll()
+
+    def test_batch_queries_run_immediately(self):
+        utils.execute(["ovs-vsctl", self.TO, "get",
+                       "Interface", "tap5", "ofport"],
+                      root_helper=self.root_helper).AndReturn("5")
+        utils.execute(["ovs-vsctl", self.TO, "--", "set", "Port", "tap5",
+                       "tag=1"], root_helper=self.root_helper)
+        self.mox.ReplayAll()
+
+        with self.br.batch():
+            self.br.set_db_attribute("Port", "tap5", "tag", "1")
+            self.assertEqual(self.br.get_port_ofport("tap5"), "5")
+        self.mox.VerifyAll()
+
     def _test_get_vif_ports(self, is_xen=False):
         pname = "tap99"
         ofport = "6"
@@ -347,3 +410,38 @@ class OVS_Lib_Test(unittest.TestCase):
         self.mox.ReplayAll()
         self.assertEqual(ovs_lib.get_bridges(root_helper), bridges)
         self.mox.VerifyAll()
+
+
+class InterfaceMonitorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.monitor = ovs_lib.InterfaceMonitor('sudo')
+
+    def _update(self, *rows):
+        return {'headings': ['row', 'action', 'name', 'external_ids'],
+                'data': list(rows)}
+
+    def test_insert_and_delete(self):
+        external_ids = ['map', [['attached-mac', 'ca:fe:de:ad:be:ef'],
+                                ['iface-id', 'port1']]]
+        self.monitor._parse_update(self._update(
+            ['uuid1', 'insert', 'tap1', external_ids]))
+        self.monitor._parse_update(self._update(
+            ['uuid1', 'delete', 'tap1', ['map', []]]))
+        expected = {'attached-mac': 'ca:fe:de:ad:be:ef', 'iface-id': 'port1'}
+        self.assertEqual(self.monitor.get_events(),
+                         [(True, expected), (False, expected)])
+        self.assertEqual(self.monitor.get_events(), [])
+
+    def test_modify_keeps_known_external_ids(self):
+        self.monitor._parse_update(self._update(
+            ['uuid1', 'initial', 'tap1', ['map', [['iface-id', 'port1']]]]))
+        self.monitor._parse_update(
+            {'headings': ['row', 'action', 'name'],
+             'data': [['uuid1', 'old', 'tap1'], ['uuid1', 'new', 'tap2']]})
+        events = self.monitor.get_events()
+        self.assertEqual(events, [(True, {'iface-id': 'port1'}),
+                                  (True, {'iface-id': 'port1'})])
+
+    def test_get_events_waits_for_timeout(self):
+        self.assertEqual(self.monitor.get_events(timeout=0.01), [])
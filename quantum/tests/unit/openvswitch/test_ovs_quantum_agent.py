@@ -14,6 +14,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import time
+
 import mock
 from oslo.config import cfg
 import unittest2 as unittest
@@ -54,7 +57,7 @@ class TestOvsQuantumAgent(unittest.TestCase):
         kwargs = ovs_quantum_agent.create_agent_config_map(cfg.CONF)
         with mock.patch('quantum.plugins.openvswitch.agent.ovs_quantum_agent.'
                         'OVSQuantumAgent.setup_integration_br',
-                        return_value=mock.Mock()):
+                        return_value=mock.MagicMock()):
             with mock.patch('quantum.agent.linux.utils.get_interface_mac',
                             return_value='000000000001'):
                 self.agent = ovs_quantum_agent.OVSQuantumAgent(**kwargs)
@@ -97,7 +100,8 @@ class TestOvsQuantumAgent(unittest.TestCase):
         self.assertEqual(expected, actual)
 
     def test_treat_devices_added_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'get_devices_details_list',
                                side_effect=Exception()):
             self.assertTrue(self.agent.treat_devices_added([{}]))
 
@@ -109,8 +113,9 @@ class TestOvsQuantumAgent(unittest.TestCase):
         :param func_name: the function that should be called
         :returns: whether the named function was called
         """
-        with mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
-                               return_value=details):
+        with mock.patch.object(self.agent.plugin_rpc,
+                               'get_devices_details_list',
+                               return_value=[details]):
             with mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                                    return_value=port):
                 with mock.patch.object(self.agent, func_name) as func:
@@ -149,6 +154,25 @@ class TestOvsQuantumAgent(unittest.TestCase):
                 self.assertFalse(self.agent.treat_devices_removed([{}]))
         self.assertEqual(port_unbound.called, not port_exists)
 
+    def test_treat_devices_returns_true_for_failed_batch(self):
+        details = mock.MagicMock()
+        details.__contains__.side_effect = lambda x: True
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+                              return_value={'exists': False}),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id'),
+            mock.patch.object(self.agent, 'treat_vif_port'),
+            mock.patch.object(self.agent, 'port_unbound'),
+            mock.patch.object(self.agent, '_batch_bridges')
+        ) as (get_details, update_down, get_port, treat_vif_port,
+              port_unbound, batch_bridges):
+            batch_bridges.return_value.__exit__.side_effect = RuntimeError
+            self.assertTrue(self.agent.treat_devices_added([{}]))
+            self.assertTrue(self.agent.treat_devices_removed([{}]))
+
     def test_treat_devices_removed_unbinds_port(self):
         self.mock_treat_devices_removed(False)
 
@@ -186,3 +210,51 @@ class TestOvsQuantumAgent(unittest.TestCase):
                 self.assertFalse(self.agent.process_network_ports(reply))
                 self.assertTrue(device_added.called)
                 self.assertTrue(device_removed.called)
+
+    def test_scan_ports_without_minimize_polling(self):
+        with mock.patch.object(self.agent, 'update_ports') as update_ports:
+            self.agent.scan_ports(set())
+            update_ports.assert_called_once_with(set())
+
+    def test_scan_ports_starts_monitor_with_full_scan(self):
+        self.agent.minimize_polling = True
+        monitor = mock.Mock()
+        monitor.is_active = False
+        self.agent.interface_monitor = monitor
+        with mock.patch.object(self.agent, 'update_ports') as update_ports:
+            self.agent.scan_ports(set())
+            update_ports.assert_called_once_with(set())
+        monitor.start.assert_called_once_with()
+
+    def _active_monitor(self, events):
+        self.agent.minimize_polling = True
+        self.agent.last_full_scan = time.time()
+        monitor = mock.Mock()
+        monitor.is_active = True
+        monitor.get_events.return_value = events
+        self.agent.interface_monitor = monitor
+
+    def test_scan_ports_rescans_on_monitor_events(self):
+        self._active_monitor([(True, {'iface-id': 'port2'})])
+        self.agent.pending_events = [(True, {'iface-id': 'port1'})]
+        with mock.patch.object(self.agent, 'update_ports') as update_ports:
+            self.agent.scan_ports(set(['port3']))
+            update_ports.assert_called_once_with(set(['port3']))
+        self.assertEqual(self.agent.pending_events, [])
+
+    def test_scan_ports_without_monitor_events(self):
+        self._active_monitor([])
+        with mock.patch.object(self.agent, 'update_ports') as update_ports:
+            self.assertIsNone(self.agent.scan_ports(set(['port3'])))
+            self.assertFalse(update_ports.called)
+
+    def test_scan_ports_resyncs_periodically(self):
+        self.agent.minimize_polling = True
+        self.agent.last_full_scan = time.time() - self.agent.resync_interval
+        monitor = mock.Mock()
+        monitor.is_active = True
+        self.agent.interface_monitor = monitor
+        with mock.patch.object(self.agent, 'update_ports') as update_ports:
+            self.agent.scan_ports(set(['port1']))
+            update_ports.assert_called_once_with(set(['port1']))
+        self.assertFalse(monitor.start.called)
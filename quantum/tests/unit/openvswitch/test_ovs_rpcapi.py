@@ -31,11 +31,12 @@ from quantum.plugins.openvswitch import ovs_quantum_plugin as povs
 
 class rpcApiTestCase(unittest2.TestCase):
 
-    def _test_ovs_api(self, rpcapi, topic, method, rpc_method, **kwargs):
+    def _test_ovs_api(self, rpcapi, topic, method, rpc_method, version=None,
+                      **kwargs):
         ctxt = context.RequestContext('fake_user', 'fake_project')
         expected_retval = 'foo' if method == 'call' else None
         expected_msg = rpcapi.make_msg(method, **kwargs)
-        expected_msg['version'] = rpcapi.BASE_RPC_API_VERSION
+        expected_msg['version'] = version or rpcapi.BASE_RPC_API_VERSION
         if rpc_method == 'cast' and method == 'run_instance':
             kwargs['call'] = False
 
@@ -96,6 +97,13 @@ class rpcApiTestCase(unittest2.TestCase):
                            device='fake_device',
                            agent_id='fake_agent_id')
 
+    def test_devices_details_list(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_ovs_api(rpcapi, topics.PLUGIN,
+                           'get_devices_details_list', rpc_method='call',
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id', version='1.2')
+
     def test_update_device_down(self):
         rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
         self._test_ovs_api(rpcapi, topics.PLUGIN,
@@ -88,6 +88,30 @@ class TestOpenvswitchSecurityGroups(OpenvswitchSecurityGroupsTestCase,
         port_dict = plugin.callbacks.get_port_from_device('bad_device_id')
         self.assertEqual(None, port_dict)
 
+    def test_security_group_get_ports_from_devices(self):
+        with self.network() as n:
+            with self.subnet(n):
+                with self.security_group() as sg:
+                    security_group_id = sg['security_group']['id']
+                    res1 = self._create_port(
+                        self.fmt, n['network']['id'],
+                        security_groups=[security_group_id])
+                    port1 = self.deserialize(self.fmt, res1)['port']
+                    res2 = self._create_port(self.fmt, n['network']['id'])
+                    port2 = self.deserialize(self.fmt, res2)['port']
+                    plugin = manager.QuantumManager.get_plugin()
+                    ports = plugin.callbacks.get_ports_from_devices(
+                        [port1['id'], port2['id'], 'bad_device_id'])
+                    for port in ports:
+                        self.assertEqual(
+                            port, plugin.callbacks.get_port_from_device(
+                                port['device']))
+                    self.assertEqual(
+                        sorted(port['id'] for port in ports),
+                        sorted([port1['id'], port2['id']]))
+                    self._delete('ports', port1['id'])
+                    self._delete('ports', port2['id'])
+
 
 class TestOpenvswitchSecurityGroupsXML(TestOpenvswitchSecurityGroups):
     fmt = 'xml'
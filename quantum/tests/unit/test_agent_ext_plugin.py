@@ -16,8 +16,10 @@
 #    under the License.
 
 import copy
+import datetime
 import time
 
+import mock
 from webob import exc
 
 from quantum.common import constants
@@ -27,8 +29,10 @@ from quantum import context
 from quantum.db import agents_db
 from quantum.db import db_base_plugin_v2
 from quantum.extensions import agent
+from quantum import manager
 from quantum.openstack.common import cfg
 from quantum.openstack.common import log as logging
+from quantum.openstack.common import timeutils
 from quantum.openstack.common import uuidutils
 from quantum.tests.unit import test_api_v2
 from quantum.tests.unit import test_db_plugin
@@ -61,6 +65,9 @@ class TestAgentPlugin(db_base_plugin_v2.QuantumDbPluginV2,
                       agents_db.AgentDbMixin):
     supported_extension_aliases = ["agent"]
 
+    __native_pagination_support = True
+    __native_sorting_support = True
+
 
 class AgentDBTestCase(test_db_plugin.QuantumDbPluginV2TestCase):
     fmt = 'json'
@@ -143,6 +150,15 @@ class AgentDBTestCase(test_db_plugin.QuantumDbPluginV2TestCase):
                 break
         self.assertEqual(len(agents), len(res['agents']))
 
+    def test_list_agent_with_pagination(self):
+        self._register_agent_states()
+        agents = self._list('agents')['agents']
+        agents.sort(key=lambda agent: (agent['host'], agent['id']))
+        self._test_list_with_pagination('agent',
+                                        [{'agent': agent}
+                                         for agent in agents],
+                                        ('host', 'asc'), 3, 2)
+
     def test_show_agent(self):
         self._register_agent_states()
         agents = self._list_agents(
@@ -175,6 +191,81 @@ class AgentDBTestCase(test_db_plugin.QuantumDbPluginV2TestCase):
             query_string='binary=quantum-l3-agent&host=' + L3_HOSTB)
         self.assertFalse(agents['agents'][0]['alive'])
 
+    def _get_agent_db(self, host, agent_type=constants.AGENT_TYPE_L3):
+        session = self.adminContext.session
+        session.expire_all()
+        return session.query(agents_db.Agent).filter_by(
+            host=host, agent_type=agent_type).one()
+
+    def _age_heartbeat(self, host):
+        agent_db = self._get_agent_db(host)
+        agent_db.heartbeat_timestamp = (timeutils.utcnow() -
+                                        datetime.timedelta(seconds=60))
+        self.adminContext.session.flush()
+        return agent_db.heartbeat_timestamp
+
+    def test_report_unchanged_configurations(self):
+        agents = self._register_agent_states()
+        old_heartbeat = self._age_heartbeat(L3_HOSTA)
+        plugin = manager.QuantumManager.get_plugin()
+        callback = agents_db.AgentExtRpcCallback()
+        with mock.patch.object(plugin,
+                               '_get_agent_by_type_and_host') as get_agent:
+            callback.report_state(self.adminContext,
+                                  agent_state={'agent_state': agents[0]})
+            self.assertFalse(get_agent.called)
+        self.assertTrue(self._get_agent_db(L3_HOSTA).heartbeat_timestamp >
+                        old_heartbeat)
+
+    def test_report_changed_configurations(self):
+        agents = self._register_agent_states()
+        agents[0]['configurations']['router_id'] = 'router_id'
+        callback = agents_db.AgentExtRpcCallback()
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': agents[0]})
+        self.assertIn('router_id',
+                      self._get_agent_db(L3_HOSTA).configurations)
+
+    def test_buffered_heartbeats(self):
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 10)
+        agents = self._register_agent_states()
+        old_heartbeat = self._age_heartbeat(L3_HOSTA)
+        plugin = manager.QuantumManager.get_plugin()
+        callback = agents_db.AgentExtRpcCallback()
+        with mock.patch.object(agents_db.loopingcall,
+                               'LoopingCall') as looping_call:
+            for state in agents[:2]:
+                callback.report_state(self.adminContext,
+                                      agent_state={'agent_state': state})
+            looping_call.assert_called_once_with(
+                plugin._flush_agent_heartbeats)
+            looping_call.return_value.start.assert_called_once_with(
+                interval=10)
+
+        self.assertEqual(self._get_agent_db(L3_HOSTA).heartbeat_timestamp,
+                         old_heartbeat)
+        agents = self._list_agents(
+            query_string='binary=quantum-l3-agent&host=' + L3_HOSTA)
+        self.assertTrue(agents['agents'][0]['alive'])
+
+        with mock.patch.object(agents_db.sql, 'case',
+                               wraps=agents_db.sql.case) as case:
+            plugin._flush_agent_heartbeats()
+            self.assertEqual(case.call_count, 1)
+            self.assertEqual(len(case.call_args[0][0]), 2)
+        self.assertTrue(self._get_agent_db(L3_HOSTA).heartbeat_timestamp >
+                        old_heartbeat)
+        self.assertFalse(plugin._agent_heartbeats().pending)
+
+    def test_report_after_delete(self):
+        agents = self._register_agent_states()
+        agent_id = self._get_agent_db(L3_HOSTA).id
+        self._delete('agents', agent_id)
+        callback = agents_db.AgentExtRpcCallback()
+        callback.report_state(self.adminContext,
+                              agent_state={'agent_state': agents[0]})
+        self.assertNotEqual(self._get_agent_db(L3_HOSTA).id, agent_id)
+
 
 class AgentDBTestCaseXML(AgentDBTestCase):
     fmt = 'xml'
@@ -41,6 +41,9 @@ class AgentRPCPluginApi(unittest.TestCase):
     def test_get_device_details(self):
         self._test_rpc_call('get_device_details')
 
+    def test_get_devices_details_list(self):
+        self._test_rpc_call('get_devices_details_list')
+
     def test_update_device_down(self):
         self._test_rpc_call('update_device_down')
 
@@ -571,6 +571,27 @@ class JSONV2TestCase(APIv2TestBase, testlib_api.WebTestCase):
         tenant_id = _uuid()
         self._test_list(tenant_id + "bad", tenant_id)
 
+    def test_list_pushes_tenant_filter(self):
+        tenant_id = _uuid()
+        env = {'quantum.context': context.Context('', tenant_id)}
+        instance = self.plugin.return_value
+        instance.get_ports.return_value = []
+
+        self.api.get(_get_path('ports', fmt=self.fmt), extra_environ=env)
+        filters = instance.get_ports.call_args[1]['filters']
+        self.assertEqual(filters, {'tenant_id': [tenant_id]})
+
+    def test_list_keeps_tenant_filter(self):
+        tenant_id = _uuid()
+        env = {'quantum.context': context.Context('', tenant_id)}
+        instance = self.plugin.return_value
+        instance.get_ports.return_value = []
+
+        self.api.get(_get_path('ports', fmt=self.fmt),
+                     {'tenant_id': 'other'}, extra_environ=env)
+        filters = instance.get_ports.call_args[1]['filters']
+        self.assertEqual(filters, {'tenant_id': ['other']})
+
     def test_list_pagination(self):
         id1 = str(_uuid())
         id2 = str(_uuid())
@@ -100,6 +100,23 @@ class RequestTestCase(unittest.TestCase):
 
 
 class ResourceTestCase(unittest.TestCase):
+    def test_index_is_streamed(self):
+        controller = mock.MagicMock()
+        controller.index.return_value = {'networks': [{'id': 'a'},
+                                                      {'id': 'b'}]}
+
+        resource = webtest.TestApp(wsgi_resource.Resource(controller))
+
+        environ = {'wsgiorg.routing_args': (None, {'action': 'index',
+                                                   'format': 'json'})}
+        with mock.patch.object(wsgi.JSONDictSerializer, 'serialize_iter',
+                               wraps=wsgi.JSONDictSerializer().
+                               serialize_iter) as serialize_iter:
+            res = resource.get('', extra_environ=environ)
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.json, controller.index.return_value)
+        self.assertTrue(serialize_iter.called)
+
     def test_unmapped_quantum_error(self):
         controller = mock.MagicMock()
         controller.test.side_effect = q_exc.QuantumException()
@@ -15,6 +15,7 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import mock
 import unittest2
 
 from quantum.api.v2 import attributes
@@ -645,3 +646,54 @@ class TestConvertToList(unittest2.TestCase):
     def test_convert_to_list_non_iterable(self):
         for item in (True, False, 1, 1.2, object()):
             self.assertEquals(attributes.convert_to_list(item), [item])
+
+
+class TestFastPaths(unittest2.TestCase):
+
+    def _assert_same_as_parser(self, validator, values):
+        for value in values:
+            msg = validator(value)
+            with mock.patch.object(attributes, '_is_fast_match',
+                                   return_value=False):
+                self.assertEqual(msg, validator(value))
+
+    def test_validate_uuid(self):
+        self._assert_same_as_parser(attributes._validate_uuid, [
+            '00000000-ffff-ffff-ffff-000000000000',
+            '00000000-FFFF-ffff-ffff-000000000000',
+            '00000000-ffff-ffff-ffff-000000000000\n',
+            '00000000ffffffffffff000000000000', None, 1])
+
+    def test_validate_mac_address(self):
+        self._assert_same_as_parser(attributes._validate_mac_address, [
+            'fa:16:3e:4f:00:00', 'FA:16:3E:4F:00:00', 'fa-16-3e-4f-00-00',
+            'fa:16:3e:4f:00:00\n', 'ffa:16:3e:4f:00:00', None])
+
+    def test_validate_ip_address(self):
+        self._assert_same_as_parser(attributes._validate_ip_address, [
+            '10.0.0.1', '255.255.255.255', '256.0.0.1', '10.0.0.1\n',
+            '1111.1.1.1', 'fe80::1', '10.0.0', None, 3])
+
+    def test_validate_subnet(self):
+        self._assert_same_as_parser(attributes._validate_subnet, [
+            '10.0.0.0/24', '10.0.0.1/32', '10.0.0.0/0', '10.0.0.0/33',
+            '10.0.0.0', '10.0.0.0/24\n', 'fe80::/64', None])
+
+
+class TestCompileValidators(unittest2.TestCase):
+
+    def test_compile_validators(self):
+        attr_info = {'name': {'validate': {'type:regex': '^a+$'}},
+                     'flag': {'convert_to': attributes.convert_to_boolean},
+                     'other': {'is_visible': True}}
+        pipeline = dict((attr, (convert_to, rules)) for attr, convert_to, rules
+                        in attributes.compile_validators(attr_info))
+        self.assertEqual(sorted(pipeline), ['flag', 'name'])
+        self.assertEqual(pipeline['flag'],
+                         (attributes.convert_to_boolean, []))
+        convert_to, rules = pipeline['name']
+        self.assertIsNone(convert_to)
+        [(rule, regex)] = rules
+        self.assertEqual(rule, 'type:regex')
+        self.assertIsNone(attributes.validators[rule]('aaa', regex))
+        self.assertIsNotNone(attributes.validators[rule]('b', regex))
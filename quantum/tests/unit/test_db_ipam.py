@@ -0,0 +1,138 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import netaddr
+from oslo.config import cfg
+import unittest2
+
+from quantum.common import exceptions as q_exc
+from quantum import context
+from quantum.db import ipam
+from quantum.db import models_v2
+from quantum.tests.unit import test_db_plugin
+
+
+class TestMergeIntervals(unittest2.TestCase):
+
+    def test_merge_adjacent_and_overlapping(self):
+        self.assertEqual(ipam.merge_intervals([(5, 7), (1, 3), (4, 4),
+                                               (10, 12), (11, 15)]),
+                         [(1, 7), (10, 15)])
+
+    def test_merge_disjoint(self):
+        self.assertEqual(ipam.merge_intervals([(3, 3), (1, 1)]),
+                         [(1, 1), (3, 3)])
+
+    def test_merge_empty(self):
+        self.assertEqual(ipam.merge_intervals([]), [])
+
+
+class IpamDriverTestCase(test_db_plugin.QuantumDbPluginV2TestCase):
+
+    driver = 'quantum.db.ipam.RangeTableIpamDriver'
+
+    def setUp(self):
+        super(IpamDriverTestCase, self).setUp()
+        cfg.CONF.set_override('ipam_driver', self.driver)
+        cfg.CONF.set_override('ipam_shard_count', 4)
+        self.context = context.get_admin_context()
+
+    def _get_ranges(self, subnet_id):
+        query = self.context.session.query(
+            models_v2.IPAvailabilityRange).join(models_v2.IPAllocationPool)
+        return sorted((int(netaddr.IPAddress(r['first_ip'])),
+                       int(netaddr.IPAddress(r['last_ip'])))
+                      for r in query.filter_by(subnet_id=subnet_id))
+
+    def _allocate_all(self, subnet):
+        driver = ipam.get_driver()
+        ips = []
+        with self.context.session.begin(subtransactions=True):
+            while True:
+                try:
+                    ips.append(driver.generate_ip(
+                        self.context, [subnet])['ip_address'])
+                except q_exc.IpAddressGenerationFailure:
+                    break
+        return ips
+
+    def test_allocate_whole_pool(self):
+        with self.subnet(cidr='10.0.0.0/26') as subnet:
+            ips = self._allocate_all(subnet['subnet'])
+            pool = netaddr.IPRange('10.0.0.2', '10.0.0.62')
+            self.assertEqual(len(ips), pool.size)
+            self.assertEqual(set(ips), set(str(ip) for ip in pool))
+            self.assertEqual(self._get_ranges(subnet['subnet']['id']), [])
+
+    def test_release_ips_merges_ranges(self):
+        with self.subnet(cidr='10.0.0.0/26') as subnet:
+            subnet_id = subnet['subnet']['id']
+            ips = self._allocate_all(subnet['subnet'])
+            driver = ipam.get_driver()
+            with self.context.session.begin(subtransactions=True):
+                driver.release_ips(self.context, subnet_id, ips[::2])
+            with self.context.session.begin(subtransactions=True):
+                driver.release_ips(self.context, subnet_id, ips[1::2])
+            pool = netaddr.IPRange('10.0.0.2', '10.0.0.62')
+            self.assertEqual(self._get_ranges(subnet_id),
+                             [(pool.first, pool.last)])
+
+    def test_release_ips_outside_pool(self):
+        with self.subnet(cidr='10.0.0.0/26') as subnet:
+            self.assertRaises(q_exc.InvalidInput,
+                              ipam.get_driver().release_ips,
+                              self.context, subnet['subnet']['id'],
+                              ['10.0.1.5'])
+
+    def test_generate_ips(self):
+        with self.subnet(cidr='10.0.0.0/28') as subnet:
+            with self.context.session.begin(subtransactions=True):
+                ips = ipam.get_driver().generate_ips(
+                    self.context, [subnet['subnet']], 10)
+            self.assertEqual(len(set(ip['ip_address'] for ip in ips)), 10)
+            self.assertEqual(len(self._get_ranges(subnet['subnet']['id'])),
+                             1)
+            self.assertRaises(q_exc.IpAddressGenerationFailure,
+                              ipam.get_driver().generate_ips,
+                              self.context, [subnet['subnet']], 4)
+
+    def test_create_port(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                ips = port['port']['fixed_ips']
+                self.assertEqual(len(ips), 1)
+                self.assertEqual(ips[0]['subnet_id'], subnet['subnet']['id'])
+                self.assertIn(netaddr.IPAddress(ips[0]['ip_address']),
+                              netaddr.IPRange('10.0.0.2', '10.0.0.254'))
+
+
+class ShardedIpamDriverTestCase(IpamDriverTestCase):
+
+    driver = 'quantum.db.ipam.ShardedRangeIpamDriver'
+
+    def test_pool_split_into_shards(self):
+        with self.subnet(cidr='10.0.0.0/24') as subnet:
+            driver = ipam.get_driver()
+            subnet_id = subnet['subnet']['id']
+            with self.context.session.begin(subtransactions=True):
+                for i in range(8):
+                    driver.generate_ip(self.context, [subnet['subnet']])
+            ranges = self._get_ranges(subnet_id)
+            self.assertTrue(1 < len(ranges) <= 5)
+            pool = netaddr.IPRange('10.0.0.2', '10.0.0.254')
+            self.assertEqual(sum(last - first + 1 for first, last in ranges),
+                             pool.size - 8)
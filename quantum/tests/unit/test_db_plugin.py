@@ -42,6 +42,7 @@ from quantum.db import db_base_plugin_v2
 from quantum.db import models_v2
 from quantum.manager import QuantumManager
 from quantum.openstack.common import timeutils
+from quantum.openstack.common import uuidutils
 from quantum.tests.unit import test_extensions
 from quantum.tests.unit import testlib_api
 
@@ -834,6 +835,71 @@ class TestPortsV2(QuantumDbPluginV2TestCase):
             for p in self.deserialize(self.fmt, res)['ports']:
                 self._delete('ports', p['id'])
 
+    def test_create_ports_bulk_native_reserves_addresses(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        base_class = db_base_plugin_v2.QuantumDbPluginV2
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            with contextlib.nested(
+                mock.patch.object(base_class, '_generate_mac'),
+                mock.patch.object(base_class, '_generate_ip')
+            ) as (generate_mac, generate_ip):
+                res = self._create_port_bulk(self.fmt, 2, net_id,
+                                             'test', True)
+                self.assertFalse(generate_mac.called)
+                self.assertFalse(generate_ip.called)
+            self._validate_behavior_on_bulk_success(res, 'ports')
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertNotEqual(ports[0]['mac_address'],
+                                ports[1]['mac_address'])
+            self.assertEqual(
+                sorted(p['fixed_ips'][0]['ip_address'] for p in ports),
+                ['10.0.0.2', '10.0.0.3'])
+            for p in ports:
+                self.assertEqual(p['fixed_ips'][0]['subnet_id'],
+                                 subnet['subnet']['id'])
+                self._delete('ports', p['id'])
+
+    def test_create_ports_bulk_native_mixed_addresses(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            override = {0: {'mac_address': '00:11:22:33:44:55',
+                            'fixed_ips': [
+                                {'subnet_id': subnet['subnet']['id'],
+                                 'ip_address': '10.0.0.10'}]}}
+            res = self._create_port_bulk(self.fmt, 2, net_id, 'test', True,
+                                         override=override)
+            self._validate_behavior_on_bulk_success(res, 'ports')
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual(ports[0]['mac_address'], '00:11:22:33:44:55')
+            self.assertEqual(ports[0]['fixed_ips'][0]['ip_address'],
+                             '10.0.0.10')
+            self.assertNotEqual(ports[1]['mac_address'], '00:11:22:33:44:55')
+            self.assertEqual(ports[1]['fixed_ips'][0]['ip_address'],
+                             '10.0.0.2')
+            for p in ports:
+                self._delete('ports', p['id'])
+
+    def test_create_ports_bulk_native_requested_ip_not_generated(self):
+        if self._skip_native_bulk:
+            self.skipTest("Plugin does not support native bulk port create")
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            override = {0: {'fixed_ips': [{'ip_address': '10.0.0.2'}]}}
+            res = self._create_port_bulk(self.fmt, 2, net_id, 'test', True,
+                                         override=override)
+            self._validate_behavior_on_bulk_success(res, 'ports')
+            ports = self.deserialize(self.fmt, res)['ports']
+            self.assertEqual(ports[0]['fixed_ips'][0]['ip_address'],
+                             '10.0.0.2')
+            self.assertEqual(ports[1]['fixed_ips'][0]['ip_address'],
+                             '10.0.0.3')
+            for p in ports:
+                self._delete('ports', p['id'])
+
     def test_create_ports_bulk_emulated(self):
         real_has_attr = hasattr
 
@@ -997,6 +1063,27 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                                             (port1, port2, port3),
                                             ('mac_address', 'asc'), 2, 2)
 
+    def test_list_ports_with_fields_reads_columns(self):
+        plugin = db_base_plugin_v2.QuantumDbPluginV2()
+        ctx = context.get_admin_context()
+        cfg.CONF.set_default('allow_overlapping_ips', True)
+        with contextlib.nested(self.port(mac_address='00:00:00:00:00:01'),
+                               self.port(mac_address='00:00:00:00:00:02')
+                               ) as (port1, port2):
+            with mock.patch.object(plugin, '_make_port_dict') as make_dict:
+                ports = plugin.get_ports(ctx,
+                                         fields=['id', 'mac_address', 'id'],
+                                         sorts=[('mac_address', False),
+                                                ('id', True)],
+                                         limit=1)
+                self.assertFalse(make_dict.called)
+            self.assertEqual(ports, [{'id': port2['port']['id'],
+                                      'mac_address': '00:00:00:00:00:02'}])
+            ports = plugin.get_ports(ctx, fields=['id', 'fixed_ips'])
+            self.assertEqual(len(ports), 2)
+            for port in ports:
+                self.assertEqual(len(port['fixed_ips']), 1)
+
     def test_list_ports_with_pagination_emulated(self):
         helper_patcher = mock.patch(
             'quantum.api.v2.base.Controller._get_pagination_helper',
@@ -1648,6 +1735,64 @@ fixed_ips=ip_address%%3D%s&fixed_ips=ip_address%%3D%s&fixed_ips=subnet_id%%3D%s
                     ip_allocation.expiration - timeutils.utcnow(),
                     datetime.timedelta(seconds=10))
 
+    def _get_ip_allocation(self, port):
+        q = context.get_admin_context().session.query(models_v2.IPAllocation)
+        return q.filter_by(
+            port_id=port['port']['id'],
+            ip_address=port['port']['fixed_ips'][0]['ip_address']).one()
+
+    def test_update_fixed_ip_lease_expirations(self):
+        plugin = QuantumManager.get_plugin()
+        reference = datetime.datetime(2012, 8, 13, 23, 11, 0)
+        with self.subnet() as subnet:
+            with contextlib.nested(self.port(subnet=subnet),
+                                   self.port(subnet=subnet)) as ports:
+                leases = dict((p['port']['fixed_ips'][0]['ip_address'], 300)
+                              for p in ports)
+                with mock.patch.object(timeutils, 'utcnow') as mock_utcnow:
+                    mock_utcnow.return_value = reference
+                    plugin.update_fixed_ip_lease_expirations(
+                        context.get_admin_context(),
+                        subnet['subnet']['network_id'],
+                        leases)
+
+                for port in ports:
+                    self.assertEqual(
+                        self._get_ip_allocation(port).expiration,
+                        reference + datetime.timedelta(seconds=300))
+
+    def test_update_fixed_ip_lease_expirations_within_slack(self):
+        cfg.CONF.set_override('dhcp_lease_update_slack', 10)
+        plugin = QuantumManager.get_plugin()
+        reference = datetime.datetime(2012, 8, 13, 23, 11, 0)
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet) as port:
+                ip_address = port['port']['fixed_ips'][0]['ip_address']
+                network_id = subnet['subnet']['network_id']
+                update_context = context.get_admin_context()
+                with mock.patch.object(timeutils, 'utcnow') as mock_utcnow:
+                    mock_utcnow.return_value = reference
+                    plugin.update_fixed_ip_lease_expirations(
+                        update_context, network_id, {ip_address: 300})
+                    mock_utcnow.return_value = (
+                        reference + datetime.timedelta(seconds=5))
+                    with mock.patch.object(db_base_plugin_v2.sql,
+                                           'case') as case:
+                        plugin.update_fixed_ip_lease_expirations(
+                            update_context, network_id, {ip_address: 300})
+                        self.assertFalse(case.called)
+                    self.assertEqual(
+                        self._get_ip_allocation(port).expiration,
+                        reference + datetime.timedelta(seconds=300))
+
+                    mock_utcnow.return_value = (
+                        reference + datetime.timedelta(seconds=20))
+                    plugin.update_fixed_ip_lease_expirations(
+                        update_context, network_id, {ip_address: 300})
+                    self.assertEqual(
+                        self._get_ip_allocation(port).expiration,
+                        reference + datetime.timedelta(seconds=320))
+
     def test_port_delete_holds_ip(self):
         plugin = QuantumManager.get_plugin()
         base_class = db_base_plugin_v2.QuantumDbPluginV2
@@ -3367,6 +3512,86 @@ class TestSubnetsV2(QuantumDbPluginV2TestCase):
         self.assertEqual(res.status_int, 204)
 
 
+class TestListQueryCount(QuantumDbPluginV2TestCase):
+    """The queries of list calls must not depend on the number of items."""
+
+    def setUp(self, plugin=None):
+        super(TestListQueryCount, self).setUp(plugin)
+        self.plugin = QuantumManager.get_plugin()
+        self.context = context.get_admin_context()
+        self.selects = []
+        sa.event.listen(db._ENGINE, 'before_cursor_execute',
+                        self._count_select)
+
+    def _count_select(self, conn, cursor, statement, parameters, context,
+                      executemany):
+        if statement.lstrip().upper().startswith('SELECT'):
+            self.selects.append(statement)
+
+    def _count_selects(self, func):
+        del self.selects[:]
+        items = func(self.context)
+        return len(items), len(self.selects)
+
+    def _add_ports(self, network, subnet, start, count):
+        network_id = network['network']['id']
+        subnet_id = subnet['subnet']['id']
+        session = self.context.session
+        with session.begin(subtransactions=True):
+            for i in xrange(start, start + count):
+                port_id = uuidutils.generate_uuid()
+                session.add(models_v2.Port(
+                    id=port_id, tenant_id=self._tenant_id, name='',
+                    network_id=network_id,
+                    mac_address='fa:16:3e:%02x:%02x:%02x' % (
+                        i >> 16, (i >> 8) & 0xff, i & 0xff),
+                    admin_state_up=True, status='ACTIVE', device_id='',
+                    device_owner=''))
+                session.add(models_v2.IPAllocation(
+                    port_id=port_id, subnet_id=subnet_id,
+                    network_id=network_id,
+                    ip_address='10.%d.%d.%d' % (
+                        i >> 16, (i >> 8) & 0xff, i & 0xff)))
+
+    def test_list_ports_query_count(self):
+        network = self._make_network(self.fmt, 'net', True)
+        subnet = self._make_subnet(self.fmt, network, '10.0.0.1',
+                                   '10.0.0.0/24')
+        self._add_ports(network, subnet, 0, 1)
+        ports, selects = self._count_selects(self.plugin.get_ports)
+        self.assertEqual(ports, 1)
+        self._add_ports(network, subnet, 1, 999)
+        self.assertEqual(self._count_selects(self.plugin.get_ports),
+                         (1000, selects))
+
+    def test_list_subnets_query_count(self):
+        network = self._make_network(self.fmt, 'net', True)
+        self._make_subnet(self.fmt, network, '10.0.0.1', '10.0.0.0/24',
+                          dns_nameservers=['8.8.8.8'])
+        subnets, selects = self._count_selects(self.plugin.get_subnets)
+        self.assertEqual(subnets, 1)
+        for i in xrange(1, 10):
+            self._make_subnet(self.fmt, network, '10.0.%d.1' % i,
+                              '10.0.%d.0/24' % i,
+                              dns_nameservers=['8.8.8.8'],
+                              host_routes=[{'destination': '12.0.0.0/8',
+                                            'nexthop': '10.0.%d.2' % i}])
+        self.assertEqual(self._count_selects(self.plugin.get_subnets),
+                         (10, selects))
+
+    def test_list_networks_query_count(self):
+        network = self._make_network(self.fmt, 'net', True)
+        self._make_subnet(self.fmt, network, '10.0.0.1', '10.0.0.0/24')
+        networks, selects = self._count_selects(self.plugin.get_networks)
+        self.assertEqual(networks, 1)
+        for i in xrange(1, 10):
+            network = self._make_network(self.fmt, 'net%d' % i, True)
+            self._make_subnet(self.fmt, network, '10.0.%d.1' % i,
+                              '10.0.%d.0/24' % i)
+        self.assertEqual(self._count_selects(self.plugin.get_networks),
+                         (10, selects))
+
+
 class DbModelTestCase(unittest2.TestCase):
     """ DB model tests """
     def test_repr(self):
@@ -63,6 +63,33 @@ class TestDhcpRpcCallackMixin(unittest.TestCase):
         self.assertEqual(retval['subnets'], subnet_retval)
         self.assertEqual(retval['ports'], port_retval)
 
+    def test_get_networks_info(self):
+        self.plugin.get_networks.return_value = [dict(id='a'), dict(id='b')]
+        self.plugin.get_subnets.return_value = [dict(id='s1',
+                                                     network_id='a')]
+        self.plugin.get_ports.return_value = [dict(id='p1', network_id='b'),
+                                              dict(id='p2', network_id='a')]
+
+        retval = self.callbacks.get_networks_info(mock.Mock(),
+                                                  network_ids=['a', 'b'])
+        networks = dict((network['id'], network) for network in retval)
+        self.assertEqual([s['id'] for s in networks['a']['subnets']], ['s1'])
+        self.assertEqual([p['id'] for p in networks['a']['ports']], ['p2'])
+        self.assertEqual(networks['b']['subnets'], [])
+        self.assertEqual([p['id'] for p in networks['b']['ports']], ['p1'])
+        self.plugin.assert_has_calls(
+            [mock.call.get_networks(mock.ANY, filters=dict(id=['a', 'b']))])
+        self.assertEqual(self.plugin.get_subnets.call_count, 1)
+        self.assertEqual(self.plugin.get_ports.call_count, 1)
+
+    def test_get_networks_info_no_networks(self):
+        self.plugin.get_networks.return_value = []
+
+        retval = self.callbacks.get_networks_info(mock.Mock(),
+                                                  network_ids=['a'])
+        self.assertEqual(retval, [])
+        self.assertFalse(self.plugin.get_ports.called)
+
     def _test_get_dhcp_port_helper(self, port_retval, other_expectations=[],
                                    update_port=None, create_port=None):
         subnets_retval = [dict(id='a', enable_dhcp=True),
@@ -147,3 +174,20 @@ class TestDhcpRpcCallackMixin(unittest.TestCase):
                                                        device_id=['devid'])),
             mock.call.update_port(mock.ANY, 'port_id',
                                   dict(port=port_update))])
+
+    def test_update_lease_expirations(self):
+        leases = [dict(network_id='a', ip_address='10.0.0.2',
+                       lease_remaining=60),
+                  dict(network_id='b', ip_address='10.0.1.2',
+                       lease_remaining=30),
+                  dict(network_id='a', ip_address='10.0.0.3',
+                       lease_remaining=90)]
+
+        self.callbacks.update_lease_expirations(mock.Mock(), host='host',
+                                                leases=leases)
+        self.plugin.assert_has_calls(
+            [mock.call.update_fixed_ip_lease_expirations(
+                mock.ANY, 'a', {'10.0.0.2': 60, '10.0.0.3': 90}),
+             mock.call.update_fixed_ip_lease_expirations(
+                 mock.ANY, 'b', {'10.0.1.2': 30})],
+            any_order=True)
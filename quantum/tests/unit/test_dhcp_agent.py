@@ -126,6 +126,10 @@ class TestDhcpAgent(unittest.TestCase):
         cfg.CONF.reset()
 
     def test_dhcp_agent_manager(self):
+        lease_flush_p = mock.patch.object(DhcpAgentWithStateReport,
+                                          'periodic_lease_flush')
+        lease_flush_p.start()
+        self.addCleanup(lease_flush_p.stop)
         state_rpc_str = 'quantum.agent.rpc.PluginReportStateAPI'
         lease_relay_str = 'quantum.agent.dhcp_agent.DhcpLeaseRelay'
         with mock.patch.object(DhcpAgentWithStateReport,
@@ -181,11 +185,13 @@ class TestDhcpAgent(unittest.TestCase):
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
             attrs_to_mock = dict(
                 [(a, mock.DEFAULT) for a in
-                 ['sync_state', 'lease_relay', 'periodic_resync']])
+                 ['sync_state', 'lease_relay', 'periodic_resync',
+                  'periodic_lease_flush']])
             with mock.patch.multiple(dhcp, **attrs_to_mock) as mocks:
                 dhcp.run()
                 mocks['sync_state'].assert_called_once_with()
                 mocks['periodic_resync'].assert_called_once_with()
+                mocks['periodic_lease_flush'].assert_called_once_with()
                 mocks['lease_relay'].assert_has_mock_calls(
                     [mock.call.start()])
 
@@ -233,6 +239,7 @@ class TestDhcpAgent(unittest.TestCase):
                 self.assertTrue(dhcp.needs_resync)
 
     def test_update_lease(self):
+        cfg.CONF.set_override('lease_update_interval', 0)
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
             dhcp.update_lease('net_id', '192.168.1.1', 120)
@@ -241,6 +248,7 @@ class TestDhcpAgent(unittest.TestCase):
                     'net_id', '192.168.1.1', 120)])
 
     def test_update_lease_failure(self):
+        cfg.CONF.set_override('lease_update_interval', 0)
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             plug.return_value.update_lease_expiration.side_effect = Exception
 
@@ -254,10 +262,58 @@ class TestDhcpAgent(unittest.TestCase):
                 self.assertTrue(log.called)
                 self.assertTrue(dhcp.needs_resync)
 
+    def test_update_lease_buffered(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp_agent.time, 'time') as mock_time:
+                mock_time.return_value = 1000.0
+                dhcp.update_lease('net_id', '192.168.1.1', 120)
+                dhcp.update_lease('net_id', '192.168.1.2', 60)
+                dhcp.update_lease('net_id', '192.168.1.1', 100)
+                self.assertFalse(plug.return_value.update_lease_expiration.
+                                 called)
+
+                mock_time.return_value = 1003.0
+                dhcp.flush_leases()
+            leases = plug.return_value.update_lease_expirations.call_args[0][0]
+            self.assertEqual(
+                sorted(leases),
+                sorted([{'network_id': 'net_id', 'ip_address': '192.168.1.1',
+                         'lease_remaining': 97},
+                        {'network_id': 'net_id', 'ip_address': '192.168.1.2',
+                         'lease_remaining': 57}]))
+
+            plug.reset_mock()
+            dhcp.flush_leases()
+            self.assertFalse(plug.return_value.update_lease_expirations.called)
+
+    def test_flush_leases_failure(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            plug.return_value.update_lease_expirations.side_effect = Exception
+
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                dhcp.update_lease('net_id', '192.168.1.1', 120)
+                dhcp.flush_leases()
+
+                self.assertTrue(log.called)
+                self.assertTrue(dhcp.needs_resync)
+                self.assertEqual(dhcp.pending_leases, {})
+
+    def test_periodic_lease_flush_disabled(self):
+        cfg.CONF.set_override('lease_update_interval', 0)
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        with mock.patch.object(dhcp_agent.eventlet, 'spawn') as spawn:
+            dhcp.periodic_lease_flush()
+            self.assertFalse(spawn.called)
+
     def _test_sync_state_helper(self, known_networks, active_networks):
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             mock_plugin = mock.Mock()
             mock_plugin.get_active_networks.return_value = active_networks
+            mock_plugin.get_networks_info.side_effect = (
+                lambda network_ids: [dhcp_agent.DictModel(dict(id=net_id))
+                                     for net_id in network_ids])
             plug.return_value = mock_plugin
 
             dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
@@ -271,14 +327,19 @@ class TestDhcpAgent(unittest.TestCase):
                 dhcp.sync_state()
 
                 exp_refresh = [
-                    mock.call(net_id) for net_id in active_networks]
+                    mock.call(net_id, mock.ANY) for net_id in active_networks]
 
                 diff = set(known_networks) - set(active_networks)
                 exp_disable = [mock.call(net_id) for net_id in diff]
 
                 mocks['cache'].assert_has_calls([mock.call.get_network_ids()])
-                mocks['refresh_dhcp_helper'].assert_has_called(exp_refresh)
-                mocks['disable_dhcp_helper'].assert_has_called(exp_disable)
+                mocks['refresh_dhcp_helper'].assert_has_calls(
+                    exp_refresh, any_order=True)
+                mocks['disable_dhcp_helper'].assert_has_calls(
+                    exp_disable, any_order=True)
+                self.assertEqual(dhcp.get_sync_progress(),
+                                 {'sync_networks': len(active_networks),
+                                  'sync_networks_done': len(active_networks)})
 
     def test_sync_state_initial(self):
         self._test_sync_state_helper([], ['a'])
@@ -289,6 +350,56 @@ class TestDhcpAgent(unittest.TestCase):
     def test_sync_state_disabled_net(self):
         self._test_sync_state_helper(['b'], ['a'])
 
+    def test_sync_state_many_networks(self):
+        active_networks = ['net%d' % i for i in xrange(
+            dhcp_agent.NETWORKS_PER_SYNC_CALL * 3 + 1)]
+        self._test_sync_state_helper([], active_networks)
+
+    def test_sync_state_batches_network_info(self):
+        active_networks = ['net%d' % i for i in xrange(
+            dhcp_agent.NETWORKS_PER_SYNC_CALL + 1)]
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = active_networks
+            mock_plugin.get_networks_info.return_value = []
+            plug.return_value = mock_plugin
+
+            dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+            with mock.patch.object(dhcp, 'cache') as cache:
+                cache.get_network_ids.return_value = []
+                dhcp.sync_state()
+
+            calls = mock_plugin.get_networks_info.call_args_list
+            self.assertEqual(len(calls), 2)
+            fetched = [net_id for call in calls for net_id in call[0][0]]
+            self.assertEqual(sorted(fetched), sorted(active_networks))
+            self.assertFalse(mock_plugin.get_network_info.called)
+
+    def test_sync_state_rpc_error(self):
+        with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
+            mock_plugin = mock.Mock()
+            mock_plugin.get_active_networks.return_value = ['a']
+            mock_plugin.get_networks_info.side_effect = Exception
+            plug.return_value = mock_plugin
+
+            with mock.patch.object(dhcp_agent.LOG, 'exception') as log:
+                dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+                dhcp.sync_state()
+
+                self.assertTrue(log.called)
+                self.assertTrue(dhcp.needs_resync)
+
+    def test_next_sync_networks_priority(self):
+        dhcp = dhcp_agent.DhcpAgent(HOSTNAME)
+        dhcp.sync_queue = ['a', 'b', 'c']
+        dhcp.sync_pending = set(['a', 'b', 'c'])
+        dhcp.sync_priority = set(['a', 'd'])
+        with mock.patch.object(dhcp_agent, 'NETWORKS_PER_SYNC_CALL', 2):
+            self.assertEqual(dhcp._next_sync_networks(), ['a', 'c'])
+            self.assertEqual(dhcp._next_sync_networks(), ['b'])
+            self.assertEqual(dhcp._next_sync_networks(), [])
+        self.assertEqual(dhcp.sync_priority, set(['d']))
+
     def test_sync_state_plugin_error(self):
         with mock.patch('quantum.agent.dhcp_agent.DhcpPluginApi') as plug:
             mock_plugin = mock.Mock()
@@ -603,26 +714,72 @@ class TestDhcpAgentEventHandler(unittest.TestCase):
     def test_port_update_end(self):
         payload = dict(port=vars(fake_port2))
         self.cache.get_network_by_id.return_value = fake_network
-        self.dhcp.port_update_end(None, payload)
+        self.cache.get_port_by_id.return_value = None
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, payload)
         self.cache.assert_has_calls(
             [mock.call.get_network_by_id(fake_port2.network_id),
+             mock.call.get_port_by_id(fake_port2.id),
              mock.call.put_port(mock.ANY)])
+        spawn_after.assert_called_once_with(
+            cfg.CONF.dhcp_reload_delay, self.dhcp._reload_allocations,
+            fake_network.id)
+        self.assertFalse(self.call_driver.called)
+
+        self.dhcp._reload_allocations(fake_network.id)
         self.call_driver.assert_called_once_with('reload_allocations',
                                                  fake_network)
+        self.assertFalse(self.dhcp.pending_reloads)
+
+    def test_port_update_end_without_delay(self):
+        cfg.CONF.set_override('dhcp_reload_delay', 0)
+        self.addCleanup(cfg.CONF.clear_override, 'dhcp_reload_delay')
+        payload = dict(port=vars(fake_port2))
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = None
+        self.dhcp.port_update_end(None, payload)
+        self.call_driver.assert_called_once_with('reload_allocations',
+                                                 fake_network)
+
+    def test_port_updates_share_reload(self):
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = None
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, dict(port=vars(fake_port1)))
+            self.dhcp.port_update_end(None, dict(port=vars(fake_port2)))
+        self.assertEqual(spawn_after.call_count, 1)
+
+    def test_port_update_end_unchanged_allocations(self):
+        fixed_ips = [{'subnet_id': fake_subnet1.id,
+                      'ip_address': '172.9.9.9'}]
+        port = dict(vars(fake_port2), fixed_ips=fixed_ips, name='new')
+        self.cache.get_network_by_id.return_value = fake_network
+        self.cache.get_port_by_id.return_value = dhcp_agent.DictModel(
+            dict(vars(fake_port2), fixed_ips=fixed_ips))
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_update_end(None, dict(port=port))
+        self.cache.put_port.assert_called_once_with(mock.ANY)
+        self.assertFalse(spawn_after.called)
 
     def test_port_delete_end(self):
         payload = dict(port_id=fake_port2.id)
         self.cache.get_network_by_id.return_value = fake_network
         self.cache.get_port_by_id.return_value = fake_port2
 
-        self.dhcp.port_delete_end(None, payload)
+        with mock.patch.object(dhcp_agent.eventlet,
+                               'spawn_after') as spawn_after:
+            self.dhcp.port_delete_end(None, payload)
 
         self.cache.assert_has_calls(
             [mock.call.get_port_by_id(fake_port2.id),
              mock.call.get_network_by_id(fake_network.id),
              mock.call.remove_port(fake_port2)])
-        self.call_driver.assert_called_once_with('reload_allocations',
-                                                 fake_network)
+        spawn_after.assert_called_once_with(
+            cfg.CONF.dhcp_reload_delay, self.dhcp._reload_allocations,
+            fake_network.id)
 
     def test_port_delete_end_unknown_port(self):
         payload = dict(port_id='unknown')
@@ -663,6 +820,16 @@ class TestDhcpPluginApiProxy(unittest.TestCase):
                                               network_id='netid',
                                               host='foo')
 
+    def test_get_networks_info(self):
+        self.call.return_value = [dict(a=1), dict(a=2)]
+        retval = self.proxy.get_networks_info(['netid1', 'netid2'])
+        self.assertEqual([network.a for network in retval], [1, 2])
+        self.assertTrue(self.call.called)
+        self.make_msg.assert_called_once_with('get_networks_info',
+                                              network_ids=['netid1',
+                                                           'netid2'],
+                                              host='foo')
+
     def test_get_dhcp_port(self):
         self.call.return_value = dict(a=1)
         retval = self.proxy.get_dhcp_port('netid', 'devid')
@@ -690,6 +857,16 @@ class TestDhcpPluginApiProxy(unittest.TestCase):
                                               device_id='devid',
                                               host='foo')
 
+    def test_update_lease_expirations(self):
+        leases = [{'network_id': 'netid', 'ip_address': 'ipaddr',
+                   'lease_remaining': 1}]
+        with mock.patch.object(self.proxy, 'cast') as mock_cast:
+            self.proxy.update_lease_expirations(leases)
+            self.assertTrue(mock_cast.called)
+        self.make_msg.assert_called_once_with('update_lease_expirations',
+                                              leases=leases,
+                                              host='foo')
+
     def test_update_lease_expiration(self):
         with mock.patch.object(self.proxy, 'cast') as mock_cast:
             self.proxy.update_lease_expiration('netid', 'ipaddr', 1)
@@ -0,0 +1,66 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest2 as unittest
+
+from quantum.agent.linux import ipset_manager
+
+
+class IpsetManagerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(_execute=self.execute,
+                                                root_helper='sudo')
+
+    def _assert_restore(self, commands):
+        self.execute.assert_called_once_with(
+            ['ipset', 'restore', '-exist'],
+            process_input='\n'.join(commands) + '\n',
+            root_helper='sudo')
+        self.execute.reset_mock()
+
+    def test_get_name(self):
+        name = self.ipset.get_name('fake_sgid' * 5, 'IPv4')
+        self.assertEqual(len(name), ipset_manager.MAX_NAME_LEN)
+        self.assertTrue(name.startswith('IPv4fake_sgid'))
+
+    def test_set_members_creates_set(self):
+        self.ipset.set_members('IPv4sg', 'IPv4', ['10.0.0.2'])
+        self._assert_restore(['create IPv4sg hash:ip family inet',
+                              'flush IPv4sg',
+                              'add IPv4sg 10.0.0.2'])
+        self.assertTrue(self.ipset.set_exists('IPv4sg'))
+
+    def test_set_members_only_applies_changes(self):
+        self.ipset.set_members('IPv6sg', 'IPv6', ['fe80::1', 'fe80::2'])
+        self.execute.reset_mock()
+        self.ipset.set_members('IPv6sg', 'IPv6', ['fe80::2', 'fe80::3'])
+        self._assert_restore(['add IPv6sg fe80::3',
+                              'del IPv6sg fe80::1'])
+        self.ipset.set_members('IPv6sg', 'IPv6', ['fe80::3', 'fe80::2'])
+        self.assertFalse(self.execute.called)
+
+    def test_destroy(self):
+        self.ipset.set_members('IPv4sg', 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy('IPv4sg')
+        self.ipset.destroy('IPv4sg')
+        self.execute.assert_called_once_with(['ipset', 'destroy', 'IPv4sg'],
+                                             root_helper='sudo')
+        self.assertFalse(self.ipset.set_exists('IPv4sg'))
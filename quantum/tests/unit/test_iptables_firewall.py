@@ -17,6 +17,7 @@
 
 import mock
 from mock import call
+from oslo.config import cfg
 import unittest2 as unittest
 
 from quantum.agent.linux.iptables_firewall import IptablesFirewallDriver
@@ -62,8 +63,9 @@ class IptablesFirewallTestCase(unittest.TestCase):
         self.firewall.prepare_port_filter(port)
         calls = [call.add_chain('sg-fallback'),
                  call.add_rule('sg-fallback', '-j DROP'),
-                 call.ensure_remove_chain('sg-chain'),
                  call.add_chain('sg-chain'),
+                 call.add_rule('sg-chain', '-j ACCEPT'),
+                 call.remove_rule('sg-chain', '-j ACCEPT'),
                  call.add_chain('ifake_dev'),
                  call.add_rule('FORWARD',
                                '-m physdev --physdev-is-bridged '
@@ -712,8 +714,9 @@ class IptablesFirewallTestCase(unittest.TestCase):
         self.firewall.prepare_port_filter(port)
         calls = [call.add_chain('sg-fallback'),
                  call.add_rule('sg-fallback', '-j DROP'),
-                 call.ensure_remove_chain('sg-chain'),
                  call.add_chain('sg-chain'),
+                 call.add_rule('sg-chain', '-j ACCEPT'),
+                 call.remove_rule('sg-chain', '-j ACCEPT'),
                  call.add_chain('ifake_dev'),
                  call.add_rule('FORWARD',
                                '-m physdev --physdev-is-bridged '
@@ -784,8 +787,9 @@ class IptablesFirewallTestCase(unittest.TestCase):
         self.firewall.remove_port_filter({'device': 'no-exist-device'})
         calls = [call.add_chain('sg-fallback'),
                  call.add_rule('sg-fallback', '-j DROP'),
-                 call.ensure_remove_chain('sg-chain'),
                  call.add_chain('sg-chain'),
+                 call.add_rule('sg-chain', '-j ACCEPT'),
+                 call.remove_rule('sg-chain', '-j ACCEPT'),
                  call.add_chain('ifake_dev'),
                  call.add_rule(
                      'FORWARD',
@@ -835,9 +839,16 @@ class IptablesFirewallTestCase(unittest.TestCase):
                  call.add_rule('ofake_dev', '-j $sg-fallback'),
                  call.add_rule('sg-chain', '-j ACCEPT'),
                  call.ensure_remove_chain('ifake_dev'),
+                 call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-is-bridged '
+                     '--physdev-out tapfake_dev -j $sg-chain'),
                  call.ensure_remove_chain('ofake_dev'),
-                 call.ensure_remove_chain('sg-chain'),
-                 call.add_chain('sg-chain'),
+                 call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-is-bridged '
+                     '--physdev-in tapfake_dev -j $sg-chain'),
+                 call.remove_rule('sg-chain', '-j ACCEPT'),
                  call.add_chain('ifake_dev'),
                  call.add_rule(
                      'FORWARD',
@@ -885,12 +896,31 @@ class IptablesFirewallTestCase(unittest.TestCase):
                  call.add_rule('ofake_dev', '-j $sg-fallback'),
                  call.add_rule('sg-chain', '-j ACCEPT'),
                  call.ensure_remove_chain('ifake_dev'),
+                 call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-is-bridged '
+                     '--physdev-out tapfake_dev -j $sg-chain'),
                  call.ensure_remove_chain('ofake_dev'),
-                 call.ensure_remove_chain('sg-chain'),
-                 call.add_chain('sg-chain')]
+                 call.remove_rule(
+                     'FORWARD',
+                     '-m physdev --physdev-is-bridged '
+                     '--physdev-in tapfake_dev -j $sg-chain')]
 
         self.v4filter_inst.assert_has_calls(calls)
 
+    def test_update_port_filter_keeps_other_ports(self):
+        port = self._fake_port()
+        other_port = self._fake_port()
+        other_port['device'] = 'tapother_dev'
+        self.firewall.prepare_port_filter(port)
+        self.firewall.prepare_port_filter(other_port)
+        self.v4filter_inst.reset_mock()
+        self.firewall.update_port_filter(port)
+        chains = set(c[1][0] for c in self.v4filter_inst.method_calls)
+        self.assertEqual(chains, set(['ifake_dev', 'ofake_dev', 'FORWARD',
+                                      'INPUT', 'sg-chain']))
+        self.assertEqual(self.iptables_inst.apply.call_count, 3)
+
     def test_remove_unknown_port(self):
         port = self._fake_port()
         self.firewall.remove_port_filter(port)
@@ -911,3 +941,99 @@ class IptablesFirewallTestCase(unittest.TestCase):
             pass
         self.iptables_inst.assert_has_calls([call.defer_apply_on(),
                                              call.defer_apply_off()])
+
+
+class IptablesFirewallRulesTestCase(unittest.TestCase):
+    """Check the rules the driver leaves in a real IptablesManager."""
+
+    def setUp(self):
+        self.utils_exec_p = mock.patch(
+            'quantum.agent.linux.utils.execute', return_value='')
+        self.utils_exec_p.start()
+        self.addCleanup(self.utils_exec_p.stop)
+        self.firewall = IptablesFirewallDriver()
+
+    def _fake_port(self, port_range_min):
+        return {'device': 'tapfake_dev',
+                'mac_address': 'ff:ff:ff:ff',
+                'fixed_ips': [FAKE_IP['IPv4']],
+                'security_group_rules': [{'ethertype': 'IPv4',
+                                          'direction': 'ingress',
+                                          'protocol': 'tcp',
+                                          'port_range_min': port_range_min,
+                                          'port_range_max': port_range_min}]}
+
+    def _rules(self):
+        return [str(rule)
+                for rule in self.firewall.iptables.ipv4['filter'].rules]
+
+    def test_prepare_port_filter_twice(self):
+        self.firewall.prepare_port_filter(self._fake_port(22))
+        rules = self._rules()
+        self.firewall.prepare_port_filter(self._fake_port(80))
+        new_rules = self._rules()
+        self.assertEqual(len(new_rules), len(rules))
+        self.assertFalse([rule for rule in new_rules if '22' in rule])
+        self.assertTrue([rule for rule in new_rules if '80' in rule])
+
+        self.firewall.remove_port_filter(self._fake_port(80))
+        self.assertFalse([rule for rule in self._rules()
+                          if 'tapfake_dev' in rule])
+
+
+class IptablesFirewallIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        self.addCleanup(cfg.CONF.reset)
+        self.ipset_cls_p = mock.patch(
+            'quantum.agent.linux.ipset_manager.IpsetManager')
+        ipset_cls = self.ipset_cls_p.start()
+        self.addCleanup(self.ipset_cls_p.stop)
+        self.ipset_inst = ipset_cls.return_value
+        self.ipset_inst.get_name.side_effect = lambda id, ethertype: (
+            ethertype + id)
+        self.ipset_inst.ipsets = {}
+        super(IptablesFirewallIpsetTestCase, self).setUp()
+
+    def test_filter_ipv4_ingress_source_group(self):
+        rule = {'ethertype': 'IPv4',
+                'direction': 'ingress',
+                'source_group_id': 'fake_sgid'}
+        ingress = call.add_rule('ifake_dev',
+                                '-j RETURN -m set --match-set '
+                                'IPv4fake_sgid src')
+        egress = None
+        self._test_prepare_port_filter(rule, ingress, egress)
+
+    def test_filter_ipv6_egress_source_group(self):
+        rule = {'ethertype': 'IPv6',
+                'direction': 'egress',
+                'protocol': 'tcp',
+                'source_group_id': 'fake_sgid'}
+        ingress = None
+        egress = call.add_rule('ofake_dev',
+                               '-j RETURN -p tcp -m set --match-set '
+                               'IPv6fake_sgid dst')
+        self._test_prepare_port_filter(rule, ingress, egress)
+
+    def test_update_security_group_members(self):
+        self.firewall.update_security_group_members(
+            'fake_sgid', ['10.0.0.2', 'fe80::2', '10.0.0.3'])
+        self.ipset_inst.set_members.assert_has_calls(
+            [call('IPv4fake_sgid', 'IPv4', ['10.0.0.2', '10.0.0.3']),
+             call('IPv6fake_sgid', 'IPv6', ['fe80::2'])])
+
+    def test_remove_unused_ipsets(self):
+        port = self._fake_port()
+        port['security_group_rules'] = [{'ethertype': 'IPv4',
+                                         'direction': 'ingress',
+                                         'source_group_id': 'fake_sgid'}]
+        self.ipset_inst.ipsets = {'IPv4fake_sgid': set(),
+                                  'IPv6fake_sgid': set()}
+        with self.firewall.defer_apply():
+            self.firewall.prepare_port_filter(port)
+        self.ipset_inst.destroy.assert_called_once_with('IPv6fake_sgid')
+        self.ipset_inst.destroy.reset_mock()
+        with self.firewall.defer_apply():
+            self.firewall.remove_port_filter(port)
+        self.assertEqual(self.ipset_inst.destroy.call_count, 2)
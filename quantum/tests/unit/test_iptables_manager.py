@@ -88,13 +88,6 @@ class IptablesManagerStateFulTestCase(unittest.TestCase):
                               bn, bn, bn, bn)), root_helper=self.root_helper
                               ).AndReturn(None)
 
-        self.iptables.execute(['iptables-save', '-t', 'nat'],
-                              root_helper=self.root_helper).AndReturn('')
-
-        self.iptables.execute(['iptables-restore'],
-                              process_input=nat_dump,
-                              root_helper=self.root_helper).AndReturn(None)
-
         self.mox.ReplayAll()
 
         self.iptables.ipv4['filter'].add_chain('filter')
@@ -153,13 +146,6 @@ class IptablesManagerStateFulTestCase(unittest.TestCase):
                               bn)), root_helper=self.root_helper
                               ).AndReturn(None)
 
-        self.iptables.execute(['iptables-save', '-t', 'nat'],
-                              root_helper=self.root_helper).AndReturn('')
-
-        self.iptables.execute(['iptables-restore'],
-                              process_input=nat_dump,
-                              root_helper=self.root_helper).AndReturn(None)
-
         self.mox.ReplayAll()
 
         self.iptables.ipv4['filter'].add_chain('filter')
@@ -217,13 +203,6 @@ class IptablesManagerStateFulTestCase(unittest.TestCase):
                               bn, bn, bn, bn, bn, bn, bn, bn, bn, bn, bn)),
                               root_helper=self.root_helper).AndReturn(None)
 
-        self.iptables.execute(['iptables-save', '-t', 'filter'],
-                              root_helper=self.root_helper).AndReturn('')
-
-        self.iptables.execute(['iptables-restore'],
-                              process_input=filter_dump,
-                              root_helper=self.root_helper).AndReturn(None)
-
         self.iptables.execute(['iptables-save', '-t', 'nat'],
                               root_helper=self.root_helper).AndReturn('')
 
@@ -261,6 +240,54 @@ class IptablesManagerStateFulTestCase(unittest.TestCase):
         self.iptables.apply()
         self.mox.VerifyAll()
 
+    def test_apply_skips_unchanged_tables(self):
+        self.iptables.execute(['iptables-save', '-t', 'filter'],
+                              root_helper=self.root_helper).AndReturn('')
+        self.iptables.execute(['iptables-restore'],
+                              process_input=mox.IgnoreArg(),
+                              root_helper=self.root_helper).AndReturn(None)
+        self.iptables.execute(['iptables-save', '-t', 'nat'],
+                              root_helper=self.root_helper).AndReturn('')
+        self.iptables.execute(['iptables-restore'],
+                              process_input=mox.IgnoreArg(),
+                              root_helper=self.root_helper).AndReturn(None)
+        self.mox.ReplayAll()
+
+        self.iptables.apply()
+        self.iptables.apply()
+        self.iptables.ipv4['filter'].add_chain('INPUT')
+        self.iptables.ipv4['nat'].remove_rule('nat', '-j DROP')
+        self.iptables.apply()
+        self.assertFalse(self.iptables.ipv4['filter'].dirty)
+        self.assertFalse(self.iptables.ipv4['nat'].dirty)
+        self.mox.VerifyAll()
+
+    def test_modify_rules_keeps_foreign_rules(self):
+        bn = iptables_manager.binary_name
+        table = iptables_manager.IptablesTable()
+        table.add_chain('filter')
+        table.add_rule('FORWARD', '-j quantum-filter-top', wrap=False,
+                       top=True)
+        table.add_rule('filter', '-j DROP')
+        current_lines = ['# Generated by iptables-save',
+                         '*filter',
+                         ':INPUT ACCEPT [0:0]',
+                         ':%s-old - [0:0]' % bn,
+                         '-A INPUT -j ACCEPT',
+                         '-A FORWARD -j quantum-filter-top',
+                         '-A %s-old -j DROP' % bn,
+                         '-A INPUT -j ACCEPT',
+                         'COMMIT']
+        self.assertEqual(self.iptables._modify_rules(current_lines, table),
+                         ['# Generated by iptables-save',
+                          '*filter',
+                          ':INPUT ACCEPT [0:0]',
+                          ':%s-filter - [0:0]' % bn,
+                          '-A FORWARD -j quantum-filter-top',
+                          '-A %s-filter -j DROP' % bn,
+                          '-A INPUT -j ACCEPT',
+                          'COMMIT'])
+
     def test_add_rule_to_a_nonexistent_chain(self):
         self.assertRaises(LookupError, self.iptables.ipv4['filter'].add_rule,
                           'nonexistent', '-j DROP')
@@ -284,6 +311,14 @@ class IptablesManagerStateFulTestCase(unittest.TestCase):
         self.iptables.ipv4['filter'].remove_rule('nonexistent', '-j DROP')
         self.mox.VerifyAll()
 
+    def test_remove_rule_with_wrapped_target(self):
+        table = self.iptables.ipv4['filter']
+        table.add_chain('target')
+        rules = table.rules[:]
+        table.add_rule('FORWARD', '-j $target')
+        table.remove_rule('FORWARD', '-j $target')
+        self.assertEqual(table.rules, rules)
+
 
 class IptablesManagerStateLessTestCase(unittest.TestCase):
 
@@ -18,6 +18,7 @@
 import copy
 import unittest2
 
+import eventlet
 import mock
 from oslo.config import cfg
 
@@ -33,6 +34,56 @@ _uuid = uuidutils.generate_uuid
 HOSTNAME = 'myhost'
 
 
+class TestRouterUpdateQueue(unittest2.TestCase):
+
+    def setUp(self):
+        self.queue = l3_agent.RouterUpdateQueue()
+
+    def test_get_by_priority(self):
+        self.queue.put('r1', {'id': 'r1'}, l3_agent.PRIORITY_SYNC)
+        self.queue.put('r2', {'id': 'r2'}, l3_agent.PRIORITY_SYNC)
+        self.queue.put('r3', {'id': 'r3'}, l3_agent.PRIORITY_RPC)
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self.queue.get(), ('r3', {'id': 'r3'}))
+        self.assertEqual(self.queue.get(), ('r1', {'id': 'r1'}))
+        self.assertEqual(self.queue.get(), ('r2', {'id': 'r2'}))
+        self.assertEqual(self.queue.get(), None)
+        self.assertEqual(len(self.queue), 0)
+
+    def test_put_queued_router(self):
+        self.queue.put('r1', {'rev': 1}, l3_agent.PRIORITY_SYNC)
+        self.queue.put('r2', {'rev': 1}, l3_agent.PRIORITY_SYNC)
+        self.queue.put('r2', {'rev': 2}, l3_agent.PRIORITY_RPC)
+        self.queue.put('r2', {'rev': 3}, l3_agent.PRIORITY_SYNC)
+        self.assertEqual(len(self.queue), 2)
+        self.assertEqual(self.queue.get(), ('r2', {'rev': 3}))
+        self.assertEqual(self.queue.get(), ('r1', {'rev': 1}))
+        self.assertEqual(self.queue.get(), None)
+
+    def test_router_in_progress_is_not_returned(self):
+        self.queue.put('r1', {'rev': 1}, l3_agent.PRIORITY_RPC)
+        self.assertEqual(self.queue.get(), ('r1', {'rev': 1}))
+        self.queue.put('r1', None, l3_agent.PRIORITY_RPC)
+        self.queue.put('r2', {'rev': 1}, l3_agent.PRIORITY_SYNC)
+        self.assertEqual(self.queue.get(), ('r2', {'rev': 1}))
+        self.assertEqual(self.queue.get(), None)
+        self.queue.done('r1')
+        self.assertEqual(self.queue.get(), ('r1', None))
+
+    def test_stale_data_does_not_replace_deletion(self):
+        self.queue.put('r1', None, l3_agent.PRIORITY_RPC, 2)
+        self.queue.put('r1', {'revision': 2}, l3_agent.PRIORITY_SYNC)
+        self.queue.put('r2', None, l3_agent.PRIORITY_RPC)
+        self.queue.put('r2', {'revision': 2}, l3_agent.PRIORITY_SYNC)
+        self.assertEqual(self.queue.get(), ('r1', None))
+        self.assertEqual(self.queue.get(), ('r2', None))
+
+    def test_newer_data_replaces_deletion(self):
+        self.queue.put('r1', None, l3_agent.PRIORITY_SYNC, 2)
+        self.queue.put('r1', {'revision': 3}, l3_agent.PRIORITY_SYNC)
+        self.assertEqual(self.queue.get(), ('r1', {'revision': 3}))
+
+
 class TestBasicRouterOperations(unittest2.TestCase):
 
     def setUp(self):
@@ -367,6 +418,7 @@ class TestBasicRouterOperations(unittest2.TestCase):
              'admin_state_up': False,
              'external_gateway_info': {}}]
         agent._process_routers(routers)
+        agent._process_router_queue(wait=True)
         self.assertNotIn(routers[0]['id'], agent.router_info)
 
     def testSingleLoopRouterRemoval(self):
@@ -378,14 +430,276 @@ class TestBasicRouterOperations(unittest2.TestCase):
              'routes': [],
              'external_gateway_info': {}}]
         agent._process_routers(routers)
+        agent._process_router_queue(wait=True)
 
         agent.router_deleted(None, routers[0]['id'])
+        agent.router_pool.waitall()
         # verify that remove is called
         self.assertEqual(self.mock_ip.get_devices.call_count, 1)
 
         self.device_exists.assert_has_calls(
             [mock.call(self.conf.external_network_bridge)])
 
+    def _routers(self, count):
+        return [{'id': 'r%d' % i,
+                 'admin_state_up': True,
+                 'routes': [],
+                 'external_gateway_info': {}} for i in range(count)]
+
+    def testRpcRoutersProcessedBeforeSync(self):
+        self.conf.set_override('router_workers', 1)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = self._routers(3)
+        processed = []
+
+        def process_router_update(router_id, router):
+            processed.append(router_id)
+            if router_id == 'r0':
+                # a router update comes in while the first one is processed
+                agent.router_queue.put('r2', routers[2],
+                                       l3_agent.PRIORITY_RPC)
+
+        agent._process_router_update = process_router_update
+        agent._process_routers(routers, l3_agent.PRIORITY_SYNC)
+        agent._process_router_queue(wait=True)
+        self.assertEqual(processed, ['r0', 'r2', 'r1'])
+        self.assertEqual(agent.routers_processed, 3)
+
+    def testRpcDoesNotWaitForRouters(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        agent._process_router_update = mock.Mock()
+        agent.routers_updated(None, self._routers(2))
+        agent.router_deleted(None, 'r0')
+        self.assertFalse(agent._process_router_update.called)
+        agent.router_pool.waitall()
+        self.assertEqual(sorted(agent._process_router_update.mock_calls),
+                         [mock.call('r0', None),
+                          mock.call('r1', self._routers(2)[1])])
+
+    def testReportStateKeepsConfigurations(self):
+        agent_config.register_agent_state_opts_helper(cfg.CONF)
+        cfg.CONF.set_override('report_interval', 0, 'AGENT')
+        self.addCleanup(cfg.CONF.reset)
+        with mock.patch('quantum.agent.rpc.PluginReportStateAPI'):
+            agent = l3_agent.L3NATAgentWithStateReport(HOSTNAME, self.conf)
+        agent._report_state()
+        configurations = copy.deepcopy(agent.agent_state['configurations'])
+        agent.routers_processed = 2
+        agent.router_process_time = 0.5
+        agent.router_process_time_max = 0.3
+        agent._report_state()
+        self.assertEqual(agent.agent_state['configurations'], configurations)
+        self.assertEqual(agent.routers_processed, 0)
+
+    def testRoutersProcessedConcurrently(self):
+        self.conf.set_override('router_workers', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        events = []
+
+        def process_router_update(router_id, router):
+            events.append(('start', router_id))
+            eventlet.sleep(0)
+            events.append(('end', router_id))
+
+        agent._process_router_update = process_router_update
+        agent._process_routers(self._routers(3))
+        agent._process_router_queue(wait=True)
+        self.assertEqual(events[:2], [('start', 'r0'), ('start', 'r1')])
+        self.assertEqual(len(events), 6)
+
+    def testFailedRouterRequiresFullSync(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.fullsync = False
+        self.plugin_api.get_external_network_id.return_value = None
+        agent._process_router_update = mock.Mock(side_effect=Exception)
+        agent._process_routers(self._routers(2))
+        agent._process_router_queue(wait=True)
+        self.assertEqual(agent._process_router_update.call_count, 2)
+        self.assertTrue(agent.fullsync)
+        self.assertEqual(len(agent.router_queue), 0)
+
+    def testRouterAdminStateDownRemovesRouter(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = self._routers(1)
+        agent._process_routers(routers)
+        agent._process_router_queue(wait=True)
+        self.assertIn('r0', agent.router_info)
+
+        routers[0]['admin_state_up'] = False
+        agent._process_routers(routers)
+        agent._process_router_queue(wait=True)
+        self.assertNotIn('r0', agent.router_info)
+
+    def testSyncRoutersIsIncremental(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = self._routers(3)
+        for i, router in enumerate(routers):
+            router['revision'] = i
+        self.plugin_api.get_changed_routers.return_value = {
+            'routers': routers, 'deleted': []}
+        agent._sync_routers_task(agent.context)
+        self.assertEqual(agent.router_revisions, {'r0': 0, 'r1': 1, 'r2': 2})
+        self.plugin_api.get_changed_routers.assert_called_once_with(
+            agent.context, {}, None)
+
+        routers[1]['revision'] = 5
+        self.plugin_api.get_changed_routers.return_value = {
+            'routers': [routers[1]], 'deleted': ['r2']}
+        agent._process_router_update = mock.Mock()
+        agent.fullsync = True
+        agent._sync_routers_task(agent.context)
+        self.assertEqual(agent.router_revisions, {'r0': 0, 'r1': 5})
+        self.assertEqual(sorted(agent._process_router_update.mock_calls),
+                         [mock.call('r1', routers[1]),
+                          mock.call('r2', None)])
+        self.assertEqual(sorted(agent.router_info), ['r0', 'r1', 'r2'])
+
+    def testFailedRouterIsSyncedAgain(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_external_network_id.return_value = None
+        routers = self._routers(2)
+        for router in routers:
+            router['revision'] = 1
+        agent._process_router_update = mock.Mock(
+            side_effect=lambda router_id, router: router_id == 'r1' and 1 / 0)
+        agent._process_routers(routers)
+        agent._process_router_queue(wait=True)
+        self.assertEqual(agent.router_revisions, {'r0': 1})
+        self.assertTrue(agent.fullsync)
+
+    def _fake_dev(self, name, cidrs):
+        dev = mock.Mock()
+        dev.name = name
+        dev.addr.list.return_value = [{'cidr': cidr} for cidr in cidrs]
+        return dev
+
+    def testLoadRouterNamespaces(self):
+        self.mock_ip.get_namespaces.return_value = ['qrouter-foo',
+                                                    'qrouter-bar', 'other']
+        unreadable = mock.Mock()
+        unreadable.name = 'qr-bbbb'
+        unreadable.addr.list.side_effect = RuntimeError
+        self.mock_ip.get_devices.side_effect = [
+            [self._fake_dev('qr-aaaa', ['10.0.0.1/24']),
+             self._fake_dev('qg-aaaa', ['19.4.4.4/24', '8.8.8.8/32']),
+             self._fake_dev('tap-aaaa', [])],
+            [unreadable],
+            []]
+
+        with mock.patch.object(l3_agent.L3NATAgent,
+                               '_destroy_router_namespace') as destroy:
+            agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+            destroy.assert_called_once_with('qrouter-bar')
+
+        self.assertEqual(agent.observed_routers,
+                         {'foo': {'qr-aaaa': set(['10.0.0.1/24']),
+                                  'qg-aaaa': set(['19.4.4.4/24',
+                                                  '8.8.8.8/32'])}})
+        self.assertEqual(agent.router_revisions, {'foo': None})
+
+    def _observed_router(self):
+        router_id = _uuid()
+        ex_gw_port = {'id': _uuid(),
+                      'network_id': _uuid(),
+                      'mac_address': 'ca:fe:de:ad:be:ee',
+                      'fixed_ips': [{'ip_address': '19.4.4.4',
+                                     'subnet_id': _uuid()}],
+                      'subnet': {'cidr': '19.4.4.0/24',
+                                 'gateway_ip': '19.4.4.1'}}
+        internal_port = {'id': _uuid(),
+                         'network_id': _uuid(),
+                         'admin_state_up': True,
+                         'fixed_ips': [{'ip_address': '35.4.4.4',
+                                        'subnet_id': _uuid()}],
+                         'mac_address': 'ca:fe:de:ad:be:ef',
+                         'subnet': {'cidr': '35.4.4.0/24',
+                                    'gateway_ip': '35.4.4.1'}}
+        floating_ip = {'id': _uuid(),
+                       'floating_ip_address': '8.8.8.8',
+                       'fixed_ip_address': '35.4.4.10',
+                       'port_id': _uuid()}
+        router = {'id': router_id,
+                  'admin_state_up': True,
+                  l3_constants.FLOATINGIP_KEY: [floating_ip],
+                  l3_constants.INTERFACE_KEY: [internal_port],
+                  'routes': [],
+                  'external_gateway_info': {},
+                  'gw_port': ex_gw_port}
+        return router
+
+    def testObservedRouterIsAdopted(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._observed_router()
+        internal_port = router[l3_constants.INTERFACE_KEY][0]
+        ex_gw_port = router['gw_port']
+        internal_dev = agent.get_internal_device_name(internal_port['id'])
+        external_dev = agent.get_external_device_name(ex_gw_port['id'])
+        agent.observed_routers[router['id']] = {
+            internal_dev: set(['35.4.4.4/24']),
+            external_dev: set(['19.4.4.4/24', '8.8.8.8/32', '9.9.9.9/32']),
+            'qr-stale': set(['36.4.4.4/24'])}
+
+        with mock.patch.object(l3_agent.ip_lib, 'IPDevice') as ip_dev:
+            agent._process_router_update(router['id'], router)
+            ip_dev.return_value.addr.delete.assert_called_once_with(
+                4, '9.9.9.9/32')
+            self.assertFalse(ip_dev.return_value.addr.add.called)
+
+        self.assertFalse(self.mock_driver.plug.called)
+        self.assertFalse(self.mock_driver.init_l3.called)
+        self.mock_driver.unplug.assert_called_once_with(
+            'qr-stale', namespace=mock.ANY,
+            prefix=l3_agent.INTERNAL_DEV_PREFIX)
+        # no gratuitous ARP is sent for the adopted addresses
+        self.assertFalse(self.mock_ip.netns.execute.called)
+        ri = agent.router_info[router['id']]
+        self.assertEqual(ri.internal_ports, [internal_port])
+        self.assertEqual(ri.ex_gw_port, ex_gw_port)
+        self.assertEqual(len(ri.floating_ips), 1)
+        nat_rules = [str(rule) for rule in
+                     ri.iptables_manager.ipv4['nat'].rules]
+        self.assertTrue([rule for rule in nat_rules
+                         if '-s 35.4.4.4/24 -j SNAT --to-source 19.4.4.4'
+                         in rule])
+        self.assertTrue([rule for rule in nat_rules
+                         if '-d 8.8.8.8 -j DNAT --to 35.4.4.10' in rule])
+        self.assertNotIn(router['id'], agent.observed_routers)
+
+    def testObservedRouterMissingPartsAreAdded(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = self._observed_router()
+        internal_port = router[l3_constants.INTERFACE_KEY][0]
+        internal_dev = agent.get_internal_device_name(internal_port['id'])
+        agent.observed_routers[router['id']] = {
+            internal_dev: set(['35.4.4.4/24'])}
+        self.device_exists.return_value = False
+
+        agent._process_router_update(router['id'], router)
+        # only the gateway is plugged
+        self.assertEqual(self.mock_driver.plug.call_count, 1)
+        ri = agent.router_info[router['id']]
+        self.assertEqual(ri.ex_gw_port, router['gw_port'])
+
+    def testDeletedObservedRouterIsDestroyed(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.observed_routers['foo'] = {}
+        agent.router_revisions['foo'] = None
+        self.plugin_api.get_changed_routers.return_value = {
+            'routers': [], 'deleted': ['foo']}
+        agent._destroy_router_namespace = mock.Mock()
+
+        agent._sync_routers_task(agent.context)
+        self.plugin_api.get_changed_routers.assert_called_once_with(
+            agent.context, {'foo': None}, None)
+        agent._destroy_router_namespace.assert_called_once_with(
+            'qrouter-foo')
+        self.assertEqual(agent.observed_routers, {})
+
     def testDestroyNamespace(self):
 
         class FakeDev(object):
@@ -36,6 +36,7 @@ from quantum.common.test_lib import test_config
 from quantum import context
 from quantum.db import db_base_plugin_v2
 from quantum.db import l3_db
+from quantum.db import l3_rpc_base
 from quantum.db import l3_rpc_agent_api
 from quantum.db import models_v2
 from quantum.extensions import l3
@@ -1597,6 +1598,64 @@ class L3NatDBTestCase(L3NatTestCaseBase):
             self.assertTrue(floatingips[0]['fixed_ip_address'] is not None)
             self.assertTrue(floatingips[0]['router_id'] is not None)
 
+    def test_router_revision_bumped_by_related_changes(self):
+        plugin = TestL3NatPlugin()
+        ctx = context.get_admin_context()
+        with self.router() as r:
+            router_id = r['router']['id']
+            self.assertEqual(plugin.get_router_revisions(ctx, [router_id]),
+                             {router_id: 0})
+            with self.subnet() as s:
+                self._router_interface_action('add', router_id,
+                                              s['subnet']['id'], None)
+                revisions = plugin.get_router_revisions(ctx)
+                self.assertEqual(revisions[router_id], 1)
+                routers = plugin.get_sync_data(ctx, [router_id])
+                self.assertEqual(routers[0]['revision'], 1)
+
+                self._router_interface_action('remove', router_id,
+                                              s['subnet']['id'], None)
+                revisions = plugin.get_router_revisions(ctx)
+                self.assertEqual(revisions[router_id], 2)
+
+    def test_sync_changed_routers(self):
+        callbacks = l3_rpc_base.L3RpcCallbackMixin()
+        ctx = context.get_admin_context()
+        with contextlib.nested(self.router(),
+                               self.router()) as (r1, r2):
+            r1_id = r1['router']['id']
+            r2_id = r2['router']['id']
+            changes = callbacks.sync_changed_routers(ctx)
+            self.assertEqual(sorted(r['id'] for r in changes['routers']),
+                             sorted([r1_id, r2_id]))
+            self.assertEqual(changes['deleted'], [])
+
+            revisions = dict((r['id'], r['revision'])
+                             for r in changes['routers'])
+            revisions['deleted-router'] = 3
+            self._update('routers', r2_id, {'router': {'name': 'new'}})
+            changes = callbacks.sync_changed_routers(
+                ctx, router_revisions=revisions)
+            self.assertEqual([r['id'] for r in changes['routers']], [r2_id])
+            self.assertEqual(changes['routers'][0]['name'], 'new')
+            self.assertEqual(changes['deleted'], ['deleted-router'])
+
+    def test_sync_data_ports_are_core_attributes(self):
+        with self.floatingip_with_assoc() as fip:
+            plugin = TestL3NatPlugin()
+            routers = plugin.get_sync_data(context.get_admin_context(),
+                                           [fip['floatingip']['router_id']])
+            port_keys = set(['id', 'name', 'network_id', 'tenant_id',
+                             'mac_address', 'admin_state_up', 'status',
+                             'fixed_ips', 'device_id', 'device_owner',
+                             'subnet'])
+            self.assertEqual(set(routers[0]['gw_port']), port_keys)
+            for interface in routers[0][l3_constants.INTERFACE_KEY]:
+                self.assertEqual(set(interface), port_keys)
+                port = plugin.get_port(context.get_admin_context(),
+                                       interface['id'])
+                self.assertEqual(interface['fixed_ips'], port['fixed_ips'])
+
 
 class L3NatDBTestCaseXML(L3NatDBTestCase):
     fmt = 'xml'
@@ -326,3 +326,75 @@ class QuantumPolicyTestCase(unittest.TestCase):
             target = {'network_id': 'whatever'}
             result = policy.enforce(self.context, action, target, self.plugin)
             self.assertTrue(result)
+
+    def test_compiled_rules_match_check_trees(self):
+        policy.init()
+        compiler = policy._get_compiler()
+        admin_context = context.get_admin_context()
+        targets = [{'tenant_id': 'fake', 'shared': False},
+                   {'tenant_id': 'other', 'shared': True},
+                   {'tenant_id': 'other', 'shared': False,
+                    'router:external': True},
+                   {'shared': False}]
+        for name in self.rules:
+            match, _keys = compiler.rule(name)
+            for ctx in (self.context, admin_context):
+                creds = ctx.to_dict()
+                for target in targets:
+                    self.assertEqual(
+                        bool(match(target, creds)),
+                        bool(common_policy.check(name, target, creds)))
+
+    def test_check_collection(self):
+        networks = [{'tenant_id': 'fake', 'shared': False},
+                    {'tenant_id': 'other', 'shared': True},
+                    {'tenant_id': 'other', 'shared': False},
+                    {'tenant_id': 'other', 'shared': False}]
+        allowed = policy.check_collection(self.context, 'get_network',
+                                          networks)
+        self.assertEqual(allowed, networks[:2])
+
+    def test_check_collection_memoizes_evaluations(self):
+        networks = [{'tenant_id': 'other', 'shared': False}] * 10
+        match = mock.Mock(return_value=False)
+        with mock.patch.object(policy._RuleCompiler, 'rule',
+                               return_value=(match,
+                                             frozenset(['tenant_id']))):
+            self.assertEqual(policy.check_collection(
+                self.context, 'get_network', networks), [])
+        self.assertEqual(match.call_count, 1)
+
+    def test_check_collection_looks_parents_up_once(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_network_owner")
+        ports = [{'tenant_id': 'fake', 'network_id': 'net1'},
+                 {'tenant_id': 'fake', 'network_id': 'net2'},
+                 {'tenant_id': 'fake', 'network_id': 'net1'}]
+        with mock.patch.object(self.plugin, 'get_network') as get_network:
+            get_network.side_effect = lambda ctx, net_id, fields: {
+                'tenant_id': 'fake' if net_id == 'net1' else 'other'}
+            allowed = policy.check_collection(self.context, 'get_port',
+                                              ports, self.plugin)
+        self.assertEqual(allowed, [ports[0], ports[2]])
+        self.assertEqual(get_network.call_count, 2)
+
+    def test_check_collection_skips_unneeded_parents(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_owner")
+        ports = [{'tenant_id': 'fake', 'network_id': 'net1'},
+                 {'tenant_id': 'other', 'network_id': 'net2'}]
+        with mock.patch.object(self.plugin, 'get_network') as get_network:
+            allowed = policy.check_collection(self.context, 'get_port',
+                                              ports, self.plugin)
+        self.assertEqual(allowed, ports[:1])
+        self.assertFalse(get_network.called)
+
+    def test_get_tenant_filter(self):
+        self.rules['get_port'] = common_policy.parse_rule(
+            "rule:admin_or_owner")
+        self.assertEqual(policy.get_tenant_filter(self.context, 'get_port'),
+                         ['fake'])
+        self.assertIsNone(policy.get_tenant_filter(
+            context.get_admin_context(), 'get_port'))
+        self.assertIsNone(policy.get_tenant_filter(self.context,
+                                                   'get_network'))
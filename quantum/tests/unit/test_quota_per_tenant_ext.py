@@ -1,8 +1,11 @@
+import datetime
+
 import unittest2 as unittest
 import webtest
 
 import mock
 from oslo.config import cfg
+from sqlalchemy import exc as sa_exc
 
 from quantum.api import extensions
 from quantum.api.v2 import attributes
@@ -10,10 +13,13 @@ from quantum.common import config
 from quantum.common import exceptions
 from quantum import context
 from quantum.db import api as db
+from quantum.db import quota_db
 from quantum import manager
 from quantum.plugins.linuxbridge.db import l2network_db_v2
+from quantum.openstack.common import timeutils
 from quantum import quota
 from quantum.tests.unit import test_api_v2
+from quantum.tests.unit import test_db_plugin
 from quantum.tests.unit import test_extensions
 from quantum.tests.unit import testlib_api
 
@@ -195,5 +201,105 @@ class QuotaExtensionTestCase(testlib_api.WebTestCase):
                                      network=-1)
 
 
+class UsageTrackingQuotaDriverTestCase(
+        test_db_plugin.QuantumDbPluginV2TestCase):
+
+    def setUp(self):
+        super(UsageTrackingQuotaDriverTestCase, self).setUp()
+        driver = quota.QUOTAS._driver
+        quota.QUOTAS._driver = quota_db.UsageTrackingQuotaDriver()
+        self.addCleanup(setattr, quota.QUOTAS, '_driver', driver)
+        cfg.CONF.set_override('quota_port', 3, group='QUOTAS')
+        self.plugin = manager.QuantumManager.get_plugin()
+        self.context = context.get_admin_context()
+
+    def _get_usage(self, resource):
+        self.context.session.expire_all()
+        return self.context.session.query(quota_db.QuotaUsage).filter_by(
+            tenant_id=self._tenant_id, resource=resource).one()
+
+    def test_usage_tracks_creates_and_deletes(self):
+        with self.subnet() as subnet:
+            with mock.patch.object(self.plugin, 'get_ports_count',
+                                   return_value=0) as count:
+                with self.port(subnet=subnet):
+                    with self.port(subnet=subnet):
+                        self.assertEqual(self._get_usage('port').in_use, 2)
+                    self.assertEqual(self._get_usage('port').in_use, 1)
+                # the usage was counted for the first create only
+                self.assertEqual(count.call_count, 1)
+
+    def test_bulk_create_over_quota(self):
+        with self.subnet() as subnet:
+            with self.port(subnet=subnet):
+                res = self._create_bulk(self.fmt, 3, 'port',
+                                        {'port': {
+                                            'network_id':
+                                            subnet['subnet']['network_id'],
+                                            'tenant_id': self._tenant_id}})
+                self.assertEqual(res.status_int, 409)
+                self.assertEqual(self._get_usage('port').in_use, 1)
+
+    def test_stale_usage_is_counted_again(self):
+        with self.subnet() as subnet:
+            net_id = subnet['subnet']['network_id']
+            with self.port(subnet=subnet):
+                usage = self._get_usage('port')
+                usage.in_use = 0
+                self.context.session.flush()
+                res1 = self._create_port(self.fmt, net_id,
+                                         expected_res_status=201)
+                self.assertEqual(self._get_usage('port').in_use, 1)
+
+                usage = self._get_usage('port')
+                usage.counted_at = (timeutils.utcnow() -
+                                    datetime.timedelta(seconds=601))
+                self.context.session.flush()
+                res2 = self._create_port(self.fmt, net_id,
+                                         expected_res_status=201)
+                self.assertEqual(self._get_usage('port').in_use, 3)
+                for res in (res1, res2):
+                    self._delete('ports', self.deserialize(
+                        self.fmt, res)['port']['id'])
+
+    def test_usage_over_quota_is_counted_again(self):
+        cfg.CONF.set_override('quota_subnet', 1, group='QUOTAS')
+        res = self._create_network(self.fmt, 'net1', True)
+        net_id = self.deserialize(self.fmt, res)['network']['id']
+        self._create_subnet(self.fmt, net_id, '10.0.0.0/24',
+                            expected_res_status=201)
+        # the subnets of a network are removed by a query delete
+        self._delete('networks', net_id)
+        self.assertEqual(self._get_usage('subnet').in_use, 1)
+
+        with self.subnet():
+            self.assertEqual(self._get_usage('subnet').in_use, 1)
+
+    def test_unlimited_quota_does_not_count(self):
+        cfg.CONF.set_override('quota_port', -1, group='QUOTAS')
+        with self.subnet() as subnet:
+            with mock.patch.object(self.plugin, 'get_ports_count') as count:
+                with self.port(subnet=subnet):
+                    self.assertFalse(count.called)
+
+    def test_usage_is_unique_per_tenant_and_resource(self):
+        insert = quota_db.QuotaUsage.__table__.insert()
+        usage = {'id': 'u1', 'tenant_id': 't', 'resource': 'port',
+                 'in_use': 0}
+        self.context.session.execute(insert, usage)
+        usage['id'] = 'u2'
+        self.assertRaises(sa_exc.IntegrityError,
+                          self.context.session.execute, insert, usage)
+
+    def test_concurrent_first_count_reads_again(self):
+        error = sa_exc.IntegrityError('INSERT', {}, None)
+        with mock.patch.object(quota_db.UsageTrackingQuotaDriver,
+                               '_lock_usage',
+                               side_effect=[error, True]) as lock:
+            self.assertTrue(quota_db.UsageTrackingQuotaDriver._check_usage(
+                self.context, 't', 'port', mock.Mock(), (), 1, 3))
+            self.assertEqual(lock.call_count, 2)
+
+
 class QuotaExtensionTestCaseXML(QuotaExtensionTestCase):
     fmt = 'xml'
@@ -16,6 +16,8 @@
 #    under the License.
 
 from contextlib import nested
+import copy
+
 import mock
 from mock import call
 import unittest2 as unittest
@@ -37,13 +39,14 @@ from quantum.tests.unit import test_iptables_firewall as test_fw
 
 class FakeSGCallback(sg_db_rpc.SecurityGroupServerRpcCallbackMixin):
     def get_port_from_device(self, device):
-        device = self.devices.get(device)
-        if device:
-            device['security_group_rules'] = []
-            device['security_group_source_groups'] = []
-            device['fixed_ips'] = [ip['ip_address']
-                                   for ip in device['fixed_ips']]
-        return device
+        port = self.devices.get(device)
+        if port:
+            port['device'] = device
+            port['security_group_rules'] = []
+            port['security_group_source_groups'] = []
+            port['fixed_ips'] = [ip['ip_address']
+                                 for ip in port['fixed_ips']]
+        return port
 
 
 class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
@@ -199,6 +202,149 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def _create_source_group_ports(self, n, sg1_id, sg2_id):
+        rule1 = self._build_security_group_rule(
+            sg1_id,
+            'ingress', 'tcp', '24',
+            '25', source_group_id=sg2_id)
+        rules = {
+            'security_group_rules': [rule1['security_group_rule']]}
+        res = self._create_security_group_rule(self.fmt, rules)
+        self.deserialize(self.fmt, res)
+        self.assertEquals(res.status_int, 201)
+
+        res1 = self._create_port(
+            self.fmt, n['network']['id'],
+            security_groups=[sg1_id, sg2_id])
+        port1 = self.deserialize(self.fmt, res1)['port']
+        res2 = self._create_port(
+            self.fmt, n['network']['id'],
+            security_groups=[sg2_id])
+        port2 = self.deserialize(self.fmt, res2)['port']
+        return port1, port2
+
+    def test_security_group_info_for_devices(self):
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                port1, port2 = self._create_source_group_ports(n, sg1_id,
+                                                               sg2_id)
+                self.rpc.devices = {port1['id']: copy.deepcopy(port1)}
+                devices = [port1['id'], 'no_exist_device']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                self.assertEquals(info['devices'].keys(), [port1['id']])
+                self.assertEquals(
+                    info['devices'][port1['id']]['security_group_rules'],
+                    [])
+                expected = {sg1_id: [{'direction': u'ingress',
+                                      'protocol': u'tcp',
+                                      'ethertype': u'IPv4',
+                                      'port_range_max': 25,
+                                      'port_range_min': 24,
+                                      'source_group_id': sg2_id,
+                                      'security_group_id': sg1_id}],
+                            sg2_id: []}
+                self.assertEquals(info['security_groups'], expected)
+                self.assertEquals(
+                    sorted(info['sg_member_ips'][sg2_id]),
+                    [u'10.0.0.2', u'10.0.0.3'])
+                self.assertEquals(info['sg_member_ips'].keys(), [sg2_id])
+
+                # the agent builds the same rules as the server would
+                cache = sg_rpc.SecurityGroupInfoCache()
+                cache.update(info)
+                port = cache.get_port(port1['id'])
+                self.rpc.devices = {port1['id']: copy.deepcopy(port1)}
+                ports_rpc = self.rpc.security_group_rules_for_devices(
+                    ctx, devices=devices)
+                self.assertEquals(
+                    port['security_group_rules'],
+                    ports_rpc[port1['id']]['security_group_rules'])
+                self._delete('ports', port1['id'])
+                self._delete('ports', port2['id'])
+
+    def test_security_group_info_for_groups(self):
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                port1, port2 = self._create_source_group_ports(n, sg1_id,
+                                                               sg2_id)
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_groups(
+                    ctx, security_groups=[sg2_id])
+                self.assertEquals(info['security_groups'], {sg2_id: []})
+                self.assertEquals(
+                    sorted(info['sg_member_ips'][sg2_id]),
+                    [u'10.0.0.2', u'10.0.0.3'])
+                info = self.rpc.security_group_info_for_groups(
+                    ctx, security_groups=[sg1_id])
+                self.assertEquals(len(info['security_groups'][sg1_id]), 1)
+                self.assertEquals(info['sg_member_ips'][sg1_id],
+                                  [u'10.0.0.2'])
+                self.assertEquals(
+                    sorted(info['sg_member_ips'][sg2_id]),
+                    [u'10.0.0.2', u'10.0.0.3'])
+                self._delete('ports', port1['id'])
+                self._delete('ports', port2['id'])
+
+    def test_security_group_rules_for_devices_with_server_cache(self):
+        cfg.CONF.set_override('enable_server_cache', True, 'SECURITYGROUP')
+        self.addCleanup(cfg.CONF.clear_override, 'enable_server_cache',
+                        'SECURITYGROUP')
+        self.addCleanup(sg_db_rpc.SG_CACHE.clear)
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet_v4,
+                                                   sg1,
+                                                   sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                port1, port2 = self._create_source_group_ports(n, sg1_id,
+                                                               sg2_id)
+                devices = [port1['id'], port2['id']]
+                ctx = context.get_admin_context()
+
+                def rules_for_devices():
+                    self.rpc.devices = {port1['id']: copy.deepcopy(port1),
+                                        port2['id']: copy.deepcopy(port2)}
+                    return self.rpc.security_group_rules_for_devices(
+                        ctx, devices=devices)
+
+                ports_rpc = rules_for_devices()
+                self.assertEqual(sorted(sg_db_rpc.SG_CACHE.rules.keys()),
+                                 sorted([sg1_id, sg2_id]))
+                self.assertEqual(sg_db_rpc.SG_CACHE.member_ips.keys(),
+                                 [sg2_id])
+                with nested(
+                    mock.patch.object(self.rpc, '_select_rules_for_groups',
+                                      return_value=[]),
+                    mock.patch.object(self.rpc,
+                                      '_select_ips_for_source_group',
+                                      return_value={})
+                ) as (select_rules, select_ips):
+                    self.assertEqual(rules_for_devices(), ports_rpc)
+                    select_rules.assert_called_once_with(ctx, [])
+                    select_ips.assert_called_once_with(ctx, [])
+
+                cfg.CONF.set_override('enable_server_cache', False,
+                                      'SECURITYGROUP')
+                self.assertEqual(rules_for_devices(), ports_rpc)
+                self._delete('ports', port1['id'])
+                self._delete('ports', port2['id'])
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = test_fw.FAKE_PREFIX['IPv6']
         with self.network() as n:
@@ -370,6 +516,34 @@ class SGServerRpcCallBackMixinTestCaseXML(SGServerRpcCallBackMixinTestCase):
     fmt = 'xml'
 
 
+class SecurityGroupServerCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = sg_db_rpc.SecurityGroupServerCache()
+        generation = self.cache.generation
+        self.cache.update(self.cache.rules, {'sg1': [{'rule': 1}]},
+                          generation)
+        self.cache.update(self.cache.member_ips, {'sg1': ['10.0.0.2']},
+                          generation)
+
+    def test_get(self):
+        self.assertEqual(self.cache.get(self.cache.rules, ['sg1', 'sg2']),
+                         ({'sg1': [{'rule': 1}]}, ['sg2']))
+
+    def test_invalidate(self):
+        self.cache.invalidate_rules(['sg1'])
+        self.assertEqual(self.cache.rules, {})
+        self.assertEqual(self.cache.member_ips, {'sg1': ['10.0.0.2']})
+        self.cache.invalidate_members(['sg1'])
+        self.assertEqual(self.cache.member_ips, {})
+
+    def test_update_after_invalidation_is_ignored(self):
+        generation = self.cache.generation
+        self.cache.invalidate_members(['sg2'])
+        self.cache.update(self.cache.member_ips, {'sg2': ['10.0.0.3']},
+                          generation)
+        self.assertEqual(self.cache.member_ips, {'sg1': ['10.0.0.2']})
+
+
 class SGAgentRpcCallBackMixinTestCase(unittest.TestCase):
     def setUp(self):
         self.rpc = sg_rpc.SecurityGroupAgentRpcCallbackMixin()
@@ -393,6 +567,66 @@ class SGAgentRpcCallBackMixinTestCase(unittest.TestCase):
             [call.security_groups_provider_updated()])
 
 
+class SecurityGroupInfoCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.cache = sg_rpc.SecurityGroupInfoCache()
+        self.dhcp_rule = {'direction': 'ingress',
+                          'ethertype': 'IPv4',
+                          'protocol': 'udp',
+                          'source_ip_prefix': '10.0.0.2/32'}
+        self.source_group_rule = {'security_group_id': 'fake_sgid1',
+                                  'direction': 'ingress',
+                                  'ethertype': 'IPv4',
+                                  'source_group_id': 'fake_sgid2'}
+        self.cache.update(
+            {'devices': {'fake_port_id1': {
+                'device': 'fake_device1',
+                'fixed_ips': ['10.0.0.3'],
+                'security_groups': ['fake_sgid1'],
+                'security_group_rules': [self.dhcp_rule]},
+                'fake_port_id2': {
+                    'device': 'fake_device2',
+                    'fixed_ips': ['10.0.0.4'],
+                    'security_groups': ['fake_sgid2'],
+                    'security_group_rules': []}},
+             'security_groups': {'fake_sgid1': [self.source_group_rule],
+                                 'fake_sgid2': []},
+             'sg_member_ips': {'fake_sgid2': ['10.0.0.3', '10.0.0.4',
+                                              'fe80::4']}})
+
+    def test_get_port(self):
+        port = self.cache.get_port('fake_device1')
+        ip_rule = self.source_group_rule.copy()
+        ip_rule['source_ip_prefix'] = '10.0.0.4/32'
+        self.assertEqual(port['security_group_rules'],
+                         [ip_rule,
+                          {'direction': 'egress', 'ethertype': 'IPv4'},
+                          self.dhcp_rule])
+        self.assertEqual(port['security_group_source_groups'],
+                         ['fake_sgid2'])
+        self.assertIsNone(self.cache.get_port('no_exist_device'))
+
+    def test_devices_for_groups(self):
+        self.assertEqual(self.cache.devices_for_groups(['fake_sgid1']),
+                         ['fake_device1'])
+        self.assertEqual(self.cache.devices_for_groups(['fake_sgid3']), [])
+
+    def test_devices_for_source_groups(self):
+        self.assertEqual(
+            self.cache.devices_for_source_groups(['fake_sgid2']),
+            ['fake_device1'])
+        self.assertEqual(
+            self.cache.devices_for_source_groups(['fake_sgid1']), [])
+
+    def test_remove_device(self):
+        self.cache.remove_device('fake_device2')
+        self.assertEqual(self.cache.security_groups.keys(), ['fake_sgid1'])
+        self.assertEqual(self.cache.sg_member_ips.keys(), ['fake_sgid2'])
+        self.cache.remove_device('fake_device1')
+        self.assertEqual(self.cache.security_groups, {})
+        self.assertEqual(self.cache.sg_member_ips, {})
+
+
 class SecurityGroupAgentRpcTestCase(unittest.TestCase):
     def setUp(self):
         self.agent = sg_rpc.SecurityGroupAgentRpcMixin()
@@ -407,16 +641,24 @@ class SecurityGroupAgentRpcTestCase(unittest.TestCase):
         self.agent.firewall = self.firewall
         rpc = mock.Mock()
         self.agent.plugin_rpc = rpc
+        self.rule = rule = {'security_group_id': 'fake_sgid1',
+                            'direction': 'ingress',
+                            'ethertype': 'IPv4',
+                            'source_group_id': 'fake_sgid2'}
         self.fake_device = {'device': 'fake_device',
                             'security_groups': ['fake_sgid1', 'fake_sgid2'],
-                            'security_group_source_groups': ['fake_sgid2'],
-                            'security_group_rules': [{'security_group_id':
-                                                      'fake_sgid1',
-                                                      'source_group_id':
-                                                      'fake_sgid2'}]}
-        fake_devices = {'fake_device': self.fake_device}
-        self.firewall.ports = fake_devices
-        rpc.security_group_rules_for_devices.return_value = fake_devices
+                            'security_group_rules': []}
+        self.fake_port = {'device': 'fake_device',
+                          'security_groups': ['fake_sgid1', 'fake_sgid2'],
+                          'security_group_source_groups': ['fake_sgid2'],
+                          'security_group_rules': []}
+        self.firewall.ports = {'fake_device': self.fake_port}
+        rpc.security_group_info_for_devices.return_value = {
+            'devices': {'fake_port_id': self.fake_device},
+            'security_groups': {'fake_sgid1': [rule], 'fake_sgid2': []},
+            'sg_member_ips': {'fake_sgid2': []}}
+        rpc.security_group_info_for_groups.return_value = {
+            'security_groups': {}, 'sg_member_ips': {}}
 
     def test_prepare_and_remove_devices_filter(self):
         self.agent.prepare_devices_filter(['fake_device'])
@@ -424,37 +666,46 @@ class SecurityGroupAgentRpcTestCase(unittest.TestCase):
         # ignore device which is not filtered
         self.firewall.assert_has_calls([call.defer_apply(),
                                         call.prepare_port_filter(
-                                            self.fake_device),
+                                            self.fake_port),
                                         call.defer_apply(),
                                         call.remove_port_filter(
-                                            self.fake_device),
+                                            self.fake_port),
                                         ])
+        self.assertEqual(self.agent.sg_cache.devices, {})
 
     def test_security_groups_rule_updated(self):
-        self.agent.refresh_firewall = mock.Mock()
+        self.agent._update_devices_filter = mock.Mock()
         self.agent.prepare_devices_filter(['fake_port_id'])
         self.agent.security_groups_rule_updated(['fake_sgid1', 'fake_sgid3'])
-        self.agent.refresh_firewall.assert_has_calls(
-            [call.refresh_firewall()])
+        self.agent.plugin_rpc.security_group_info_for_groups.assert_has_calls(
+            [call(None, ['fake_sgid1', 'fake_sgid3'])])
+        self.agent._update_devices_filter.assert_has_calls(
+            [call(['fake_device'])])
 
     def test_security_groups_rule_not_updated(self):
-        self.agent.refresh_firewall = mock.Mock()
+        self.agent._update_devices_filter = mock.Mock()
         self.agent.prepare_devices_filter(['fake_port_id'])
         self.agent.security_groups_rule_updated(['fake_sgid3', 'fake_sgid4'])
-        self.agent.refresh_firewall.assert_has_calls([])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_info_for_groups.called)
+        self.assertFalse(self.agent._update_devices_filter.called)
 
     def test_security_groups_member_updated(self):
-        self.agent.refresh_firewall = mock.Mock()
+        self.agent._update_devices_filter = mock.Mock()
         self.agent.prepare_devices_filter(['fake_port_id'])
         self.agent.security_groups_member_updated(['fake_sgid2', 'fake_sgid3'])
-        self.agent.refresh_firewall.assert_has_calls(
-            [call.refresh_firewall()])
+        self.agent.plugin_rpc.security_group_info_for_groups.assert_has_calls(
+            [call(None, ['fake_sgid2', 'fake_sgid3'])])
+        self.agent._update_devices_filter.assert_has_calls(
+            [call(['fake_device'])])
 
     def test_security_groups_member_not_updated(self):
-        self.agent.refresh_firewall = mock.Mock()
+        self.agent._update_devices_filter = mock.Mock()
         self.agent.prepare_devices_filter(['fake_port_id'])
-        self.agent.security_groups_member_updated(['fake_sgid3', 'fake_sgid4'])
-        self.agent.refresh_firewall.assert_has_calls([])
+        self.agent.security_groups_member_updated(['fake_sgid1', 'fake_sgid3'])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_info_for_groups.called)
+        self.assertFalse(self.agent._update_devices_filter.called)
 
     def test_security_groups_provider_updated(self):
         self.agent.refresh_firewall = mock.Mock()
@@ -466,11 +717,40 @@ class SecurityGroupAgentRpcTestCase(unittest.TestCase):
         self.agent.prepare_devices_filter(['fake_port_id'])
         self.agent.refresh_firewall()
         calls = [call.defer_apply(),
-                 call.prepare_port_filter(self.fake_device),
+                 call.prepare_port_filter(self.fake_port),
                  call.defer_apply(),
-                 call.update_port_filter(self.fake_device)]
+                 call.update_port_filter(self.fake_port)]
         self.firewall.assert_has_calls(calls)
 
+    def test_prepare_devices_filter_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        self.addCleanup(cfg.CONF.clear_override, 'enable_ipset',
+                        'SECURITYGROUP')
+        self.agent.prepare_devices_filter(['fake_port_id'])
+        port = dict(self.fake_port, security_group_rules=[self.rule])
+        self.firewall.assert_has_calls(
+            [call.defer_apply(),
+             call.update_security_group_members('fake_sgid2', []),
+             call.prepare_port_filter(port)])
+
+    def test_security_groups_member_updated_with_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, 'SECURITYGROUP')
+        self.addCleanup(cfg.CONF.clear_override, 'enable_ipset',
+                        'SECURITYGROUP')
+        self.agent.prepare_devices_filter(['fake_port_id'])
+        info_for_groups = self.agent.plugin_rpc.security_group_info_for_groups
+        info_for_groups.return_value = {
+            'security_groups': {'fake_sgid2': []},
+            'sg_member_ips': {'fake_sgid2': ['10.0.0.3']}}
+        self.firewall.reset_mock()
+        self.agent.security_groups_member_updated(['fake_sgid2', 'fake_sgid3'])
+        info_for_groups.assert_called_once_with(None, ['fake_sgid2'])
+        self.firewall.assert_has_calls(
+            [call.defer_apply(),
+             call.update_security_group_members('fake_sgid2',
+                                                ['10.0.0.3'])])
+        self.assertFalse(self.firewall.update_port_filter.called)
+
 
 class FakeSGRpcApi(agent_rpc.PluginApi,
                    sg_rpc.SecurityGroupServerRpcApiMixin):
@@ -493,6 +773,28 @@ class SecurityGroupServerRpcApiTestCase(unittest.TestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+             'method':
+                 'security_group_info_for_devices'},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
+    def test_security_group_info_for_groups(self):
+        self.rpc.security_group_info_for_groups(None, ['fake_sgid'])
+        self.rpc.call.assert_has_calls(
+            [call(None,
+             {'args':
+                 {'security_groups': ['fake_sgid']},
+             'method':
+                 'security_group_info_for_groups'},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(proxy.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):
@@ -627,7 +929,7 @@ IPTABLES_FILTER_1_2 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port1 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port1 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port1 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port1 -j RETURN -s 10.0.0.4
+-A %(bn)s-i_port1 -j RETURN -s 10.0.0.4/32
 -A %(bn)s-i_port1 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port1 -j %(bn)s-sg-chain
 -A %(bn)s-sg-chain %(physdev)s --physdev-EGRESS tap_port1 -j %(bn)s-o_port1
@@ -669,7 +971,7 @@ IPTABLES_FILTER_2 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port1 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port1 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port1 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port1 -j RETURN -s 10.0.0.4
+-A %(bn)s-i_port1 -j RETURN -s 10.0.0.4/32
 -A %(bn)s-i_port1 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port1 -j %(bn)s-sg-chain
 -A %(bn)s-sg-chain %(physdev)s --physdev-EGRESS tap_port1 -j %(bn)s-o_port1
@@ -688,7 +990,7 @@ IPTABLES_FILTER_2 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port2 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port2 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port2 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port2 -j RETURN -s 10.0.0.3
+-A %(bn)s-i_port2 -j RETURN -s 10.0.0.3/32
 -A %(bn)s-i_port2 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port2 -j %(bn)s-sg-chain
 -A %(bn)s-sg-chain %(physdev)s --physdev-EGRESS tap_port2 -j %(bn)s-o_port2
@@ -746,7 +1048,7 @@ IPTABLES_FILTER_2_2 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port2 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port2 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port2 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port2 -j RETURN -s 10.0.0.3
+-A %(bn)s-i_port2 -j RETURN -s 10.0.0.3/32
 -A %(bn)s-i_port2 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port2 -j %(bn)s-sg-chain
 -A %(bn)s-sg-chain %(physdev)s --physdev-EGRESS tap_port2 -j %(bn)s-o_port2
@@ -786,7 +1088,7 @@ IPTABLES_FILTER_2_3 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port1 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port1 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port1 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port1 -j RETURN -s 10.0.0.4
+-A %(bn)s-i_port1 -j RETURN -s 10.0.0.4/32
 -A %(bn)s-i_port1 -j RETURN -p icmp
 -A %(bn)s-i_port1 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port1 -j %(bn)s-sg-chain
@@ -806,7 +1108,7 @@ IPTABLES_FILTER_2_3 = """:%(bn)s-(%(chains)s) - [0:0]
 -A %(bn)s-i_port2 -m state --state ESTABLISHED,RELATED -j RETURN
 -A %(bn)s-i_port2 -j RETURN -p udp --dport 68 --sport 67 -s 10.0.0.2
 -A %(bn)s-i_port2 -j RETURN -p tcp --dport 22
--A %(bn)s-i_port2 -j RETURN -s 10.0.0.3
+-A %(bn)s-i_port2 -j RETURN -s 10.0.0.3/32
 -A %(bn)s-i_port2 -j RETURN -p icmp
 -A %(bn)s-i_port2 -j %(bn)s-sg-fallback
 -A %(bn)s-FORWARD %(physdev)s --physdev-EGRESS tap_port2 -j %(bn)s-sg-chain
@@ -969,6 +1271,7 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
 
         self.iptables = self.agent.firewall.iptables
         self.mox.StubOutWithMock(self.iptables, "execute")
+        self.nat_replayed = False
 
         self.rpc = mock.Mock()
         self.agent.plugin_rpc = self.rpc
@@ -987,51 +1290,34 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
                   'port_range_max': 22},
                  {'direction': 'egress',
                   'ethertype': 'IPv4'}]
-        rule2 = rule1[:]
-        rule2 += [{'direction': 'ingress',
-                  'source_ip_prefix': '10.0.0.4',
-                  'ethertype': 'IPv4'}]
-        rule3 = rule2[:]
-        rule3 += [{'direction': 'ingress',
-                  'protocol': 'icmp',
-                  'ethertype': 'IPv4'}]
-        rule4 = rule1[:]
-        rule4 += [{'direction': 'ingress',
-                  'source_ip_prefix': '10.0.0.3',
-                  'ethertype': 'IPv4'}]
-        rule5 = rule4[:]
-        rule5 += [{'direction': 'ingress',
-                  'protocol': 'icmp',
-                  'ethertype': 'IPv4'}]
-        self.devices1 = {'tap_port1': self._device('tap_port1',
-                                                   '10.0.0.3',
-                                                   '12:34:56:78:9a:bc',
-                                                   rule1)}
-        self.devices2 = {'tap_port1': self._device('tap_port1',
-                                                   '10.0.0.3',
-                                                   '12:34:56:78:9a:bc',
-                                                   rule2),
-                         'tap_port2': self._device('tap_port2',
-                                                   '10.0.0.4',
-                                                   '12:34:56:78:9a:bd',
-                                                   rule4)}
-        self.devices3 = {'tap_port1': self._device('tap_port1',
-                                                   '10.0.0.3',
-                                                   '12:34:56:78:9a:bc',
-                                                   rule3),
-                         'tap_port2': self._device('tap_port2',
-                                                   '10.0.0.4',
-                                                   '12:34:56:78:9a:bd',
-                                                   rule5)}
-
-    def _device(self, device, ip, mac_address, rule):
+        source_group_rule = {'direction': 'ingress',
+                             'source_group_id': 'security_group1',
+                             'ethertype': 'IPv4'}
+        icmp_rule = {'direction': 'ingress',
+                     'protocol': 'icmp',
+                     'ethertype': 'IPv4'}
+        self.security_groups1 = {
+            'security_group1': rule1 + [source_group_rule]}
+        self.security_groups2 = {
+            'security_group1': rule1 + [source_group_rule, icmp_rule]}
+        self.port1 = self._device('tap_port1',
+                                  '10.0.0.3',
+                                  '12:34:56:78:9a:bc')
+        self.port2 = self._device('tap_port2',
+                                  '10.0.0.4',
+                                  '12:34:56:78:9a:bd')
+
+    def _device(self, device, ip, mac_address):
         return {'device': device,
                 'fixed_ips': [ip],
                 'mac_address': mac_address,
                 'security_groups': ['security_group1'],
-                'security_group_rules': rule,
-                'security_group_source_groups': [
-                    'security_group1']}
+                'security_group_rules': []}
+
+    def _info(self, devices, security_groups, member_ips):
+        return {'devices': dict((port['device'], port) for port in devices),
+                'security_groups': security_groups,
+                'sg_member_ips': {'security_group1': member_ips}}
 
     def _regex(self, value):
         value = value.replace('physdev-INGRESS', self.PHYSDEV_INGRESS)
@@ -1051,14 +1337,18 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
             process_input=self._regex(v4_filter),
             root_helper=self.root_helper).AndReturn('')
 
-        self.iptables.execute(
-            ['iptables-save', '-t', 'nat'],
-            root_helper=self.root_helper).AndReturn('')
+        # The firewall leaves the nat table alone, so it is only applied
+        # the first time.
+        if not self.nat_replayed:
+            self.iptables.execute(
+                ['iptables-save', '-t', 'nat'],
+                root_helper=self.root_helper).AndReturn('')
 
-        self.iptables.execute(
-            ['iptables-restore'],
-            process_input=self._regex(IPTABLES_NAT),
-            root_helper=self.root_helper).AndReturn('')
+            self.iptables.execute(
+                ['iptables-restore'],
+                process_input=self._regex(IPTABLES_NAT),
+                root_helper=self.root_helper).AndReturn('')
+            self.nat_replayed = True
 
         self.iptables.execute(
             ['ip6tables-save', '-t', 'filter'],
@@ -1070,7 +1360,8 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
             root_helper=self.root_helper).AndReturn('')
 
     def test_prepare_remove_port(self):
-        self.rpc.security_group_rules_for_devices.return_value = self.devices1
+        self.rpc.security_group_info_for_devices.return_value = self._info(
+            [self.port1], self.security_groups1, ['10.0.0.3'])
         self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_EMPTY, IPTABLES_FILTER_V6_EMPTY)
         self.mox.ReplayAll()
@@ -1080,7 +1371,10 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
         self.mox.VerifyAll()
 
     def test_security_group_member_updated(self):
-        self.rpc.security_group_rules_for_devices.return_value = self.devices1
+        info_for_devices = self.rpc.security_group_info_for_devices
+        info_for_groups = self.rpc.security_group_info_for_groups
+        info_for_devices.return_value = self._info(
+            [self.port1], self.security_groups1, ['10.0.0.3'])
         self._replay_iptables(IPTABLES_FILTER_1, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_1_2, IPTABLES_FILTER_V6_1)
         self._replay_iptables(IPTABLES_FILTER_2, IPTABLES_FILTER_V6_2)
@@ -1090,10 +1384,14 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
         self.mox.ReplayAll()
 
         self.agent.prepare_devices_filter(['tap_port1'])
-        self.rpc.security_group_rules_for_devices.return_value = self.devices2
+        info_for_groups.return_value = self._info(
+            [], self.security_groups1, ['10.0.0.3', '10.0.0.4'])
         self.agent.security_groups_member_updated(['security_group1'])
+        info_for_devices.return_value = self._info(
+            [self.port2], self.security_groups1, ['10.0.0.3', '10.0.0.4'])
         self.agent.prepare_devices_filter(['tap_port2'])
-        self.rpc.security_group_rules_for_devices.return_value = self.devices1
+        info_for_groups.return_value = self._info(
+            [], self.security_groups1, ['10.0.0.3'])
         self.agent.security_groups_member_updated(['security_group1'])
         self.agent.remove_devices_filter(['tap_port2'])
         self.agent.remove_devices_filter(['tap_port1'])
@@ -1101,13 +1399,16 @@ class TestSecurityGroupAgentWithIptables(unittest.TestCase):
         self.mox.VerifyAll()
 
     def test_security_group_rule_udpated(self):
-        self.rpc.security_group_rules_for_devices.return_value = self.devices2
+        self.rpc.security_group_info_for_devices.return_value = self._info(
+            [self.port1, self.port2], self.security_groups1,
+            ['10.0.0.3', '10.0.0.4'])
         self._replay_iptables(IPTABLES_FILTER_2, IPTABLES_FILTER_V6_2)
         self._replay_iptables(IPTABLES_FILTER_2_3, IPTABLES_FILTER_V6_2)
         self.mox.ReplayAll()
 
         self.agent.prepare_devices_filter(['tap_port1', 'tap_port3'])
-        self.rpc.security_group_rules_for_devices.return_value = self.devices3
+        self.rpc.security_group_info_for_groups.return_value = self._info(
+            [], self.security_groups2, ['10.0.0.3', '10.0.0.4'])
         self.agent.security_groups_rule_updated(['security_group1'])
 
         self.mox.VerifyAll()
@@ -1163,6 +1464,50 @@ class SGNotificationTestMixin():
                          call.security_groups_member_updated(
                              mock.ANY, [security_group_id])])
 
+    def test_security_group_changes_invalidate_server_cache(self):
+        cache = sg_db_rpc.SG_CACHE
+        self.addCleanup(cache.clear)
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group()) as (subnet, sg):
+                security_group_id = sg['security_group']['id']
+                cache.rules[security_group_id] = []
+                with self.security_group_rule(security_group_id):
+                    self.assertNotIn(security_group_id, cache.rules)
+                cache.member_ips[security_group_id] = []
+                res = self._create_port(self.fmt, n['network']['id'],
+                                        security_groups=[security_group_id])
+                port = self.deserialize(self.fmt, res)
+                self.assertNotIn(security_group_id, cache.member_ips)
+                cache.member_ips[security_group_id] = []
+                self._delete('ports', port['port']['id'])
+                self.assertNotIn(security_group_id, cache.member_ips)
+
+    def test_port_changing_groups_invalidates_server_cache(self):
+        cache = sg_db_rpc.SG_CACHE
+        self.addCleanup(cache.clear)
+        with self.network() as n:
+            with nested(self.subnet(n),
+                        self.security_group(),
+                        self.security_group()) as (subnet, sg1, sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                res = self._create_port(self.fmt, n['network']['id'],
+                                        security_groups=[sg1_id])
+                port = self.deserialize(self.fmt, res)
+                cache.member_ips[sg1_id] = ['10.0.0.2']
+                cache.member_ips[sg2_id] = []
+
+                data = {'port': {ext_sg.SECURITYGROUPS: [sg2_id]}}
+                req = self.new_update_request('ports', data,
+                                              port['port']['id'])
+                res = self.deserialize(self.fmt, req.get_response(self.api))
+                self.assertEqual(res['port'][ext_sg.SECURITYGROUPS],
+                                 [sg2_id])
+                self.assertNotIn(sg1_id, cache.member_ips)
+                self.assertNotIn(sg2_id, cache.member_ips)
+                self._delete('ports', port['port']['id'])
+
 
 class TestSecurityGroupAgentWithOVSIptables(
         TestSecurityGroupAgentWithIptables):
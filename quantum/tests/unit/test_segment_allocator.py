@@ -0,0 +1,160 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+import unittest2
+
+from quantum.db import api as db
+from quantum.db import segment_allocator
+from quantum.plugins.openvswitch import ovs_models_v2
+
+PHYS_NET = 'physnet1'
+
+
+class TestSubtractIds(unittest2.TestCase):
+
+    def test_subtract_ids(self):
+        self.assertEqual(
+            segment_allocator._subtract_ids([(1, 5), (10, 12)],
+                                            [0, 1, 3, 5, 11, 20]),
+            [(2, 2), (4, 4), (10, 10), (12, 12)])
+
+    def test_subtract_no_ids(self):
+        self.assertEqual(segment_allocator._subtract_ids([(1, 5)], []),
+                         [(1, 5)])
+
+
+class SegmentAllocatorTestCase(unittest2.TestCase):
+
+    def setUp(self):
+        db.configure_db()
+        self.addCleanup(db.clear_db)
+        self.session = db.get_session()
+        self.allocator = segment_allocator.SegmentAllocator(
+            'test_vlan', ovs_models_v2.VlanAllocation, 'vlan_id',
+            'physical_network')
+
+    def _ranges(self):
+        query = self.session.query(segment_allocator.SegmentRange)
+        return sorted((r.physical_network, r.first_id, r.last_id)
+                      for r in query.filter_by(pool='test_vlan'))
+
+    def test_sync_stores_ranges(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 1 << 24),
+                                                      (100, 200)]})
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 1 << 24)])
+        self.assertFalse(self.session.query(
+            ovs_models_v2.VlanAllocation).count())
+
+    def test_sync_keeps_allocated_ids(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 10)]})
+        self.allocator.reserve_specific(self.session, PHYS_NET, 5)
+        self.allocator.reserve_specific(self.session, PHYS_NET, 20)
+        self.allocator.sync(self.session, {PHYS_NET: [(3, 8)]})
+        self.assertEqual(self._ranges(), [(PHYS_NET, 3, 4), (PHYS_NET, 6, 8)])
+        self.assertTrue(self.allocator.get_allocation(
+            self.session, PHYS_NET, 20).allocated)
+        self.allocator.sync(self.session, {})
+        self.assertEqual(self._ranges(), [])
+        self.assertTrue(self.allocator.get_allocation(
+            self.session, PHYS_NET, 5).allocated)
+
+    def test_sync_removes_unallocated_rows(self):
+        self.session.add(ovs_models_v2.VlanAllocation(PHYS_NET, 3))
+        self.session.flush()
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 5)]})
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 5)])
+        self.assertFalse(self.session.query(
+            ovs_models_v2.VlanAllocation).count())
+
+    def test_reserve_all(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 20)]})
+        ids = set()
+        for i in xrange(20):
+            physical_network, vlan_id = self.allocator.reserve(self.session)
+            self.assertEqual(physical_network, PHYS_NET)
+            ids.add(vlan_id)
+        self.assertEqual(ids, set(xrange(1, 21)))
+        self.assertIsNone(self.allocator.reserve(self.session))
+        self.assertEqual(self._ranges(), [])
+
+    def test_release_merges_ranges(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 20)]})
+        for i in xrange(20):
+            self.allocator.reserve(self.session)
+        for vlan_id in range(1, 21, 2) + range(2, 21, 2):
+            self.assertTrue(self.allocator.release(
+                self.session, PHYS_NET, vlan_id, {PHYS_NET: [(1, 20)]}))
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 20)])
+        self.assertFalse(self.allocator.release(
+            self.session, PHYS_NET, 1, {PHYS_NET: [(1, 20)]}))
+
+    def test_reserve_specific(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 10)]})
+        self.assertFalse(self.allocator.get_allocation(
+            self.session, PHYS_NET, 5).allocated)
+        self.assertTrue(self.allocator.reserve_specific(self.session,
+                                                        PHYS_NET, 5))
+        self.assertFalse(self.allocator.reserve_specific(self.session,
+                                                         PHYS_NET, 5))
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 4), (PHYS_NET, 6, 10)])
+        self.allocator.release(self.session, PHYS_NET, 5,
+                               {PHYS_NET: [(1, 10)]})
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 10)])
+        self.assertIsNone(self.allocator.get_allocation(self.session,
+                                                        PHYS_NET, 11))
+
+    def test_reserve_rereads_range_changed_concurrently(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 10)]})
+        table = segment_allocator.SegmentRange.__table__
+
+        def concurrent_reserve(candidates):
+            # another server takes id 5 once the candidates were read
+            self.session.execute(table.update().values(last_id=4))
+            self.session.execute(table.insert().values(
+                pool='test_vlan', physical_network=PHYS_NET,
+                first_id=6, last_id=10))
+            return candidates[0]
+
+        with mock.patch.object(segment_allocator.random, 'choice',
+                               side_effect=concurrent_reserve):
+            with mock.patch.object(segment_allocator.random, 'randint',
+                                   side_effect=lambda first, last: last):
+                self.assertEqual(self.allocator.reserve(self.session),
+                                 (PHYS_NET, 4))
+        self.assertEqual(self._ranges(), [(PHYS_NET, 1, 3), (PHYS_NET, 6, 10)])
+
+    def test_reserve_picks_again_when_range_taken_concurrently(self):
+        self.allocator.sync(self.session, {PHYS_NET: [(1, 10)]})
+        table = segment_allocator.SegmentRange.__table__
+        candidates_read = []
+
+        def concurrent_reserve(candidates):
+            if not candidates_read:
+                # another server takes id 1 once the candidates were read
+                self.session.execute(table.update().values(first_id=2))
+            candidates_read.append(candidates)
+            return candidates[0]
+
+        with mock.patch.object(segment_allocator.random, 'choice',
+                               side_effect=concurrent_reserve):
+            with mock.patch.object(segment_allocator.random, 'randint',
+                                   side_effect=lambda first, last: first):
+                self.assertEqual(self.allocator.reserve(self.session),
+                                 (PHYS_NET, 2))
+        self.assertEqual(len(candidates_read), 2)
+        self.assertEqual(self._ranges(), [(PHYS_NET, 3, 10)])
@@ -0,0 +1,44 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from oslo.config import cfg
+import unittest2 as unittest
+
+# register the options of the server cache and of the agent heartbeats
+from quantum.db import agents_db
+from quantum.db import securitygroups_rpc_base
+from quantum import service
+
+
+class TestApiWorkersOptions(unittest.TestCase):
+
+    def setUp(self):
+        super(TestApiWorkersOptions, self).setUp()
+        self.addCleanup(cfg.CONF.reset)
+        cfg.CONF.set_override('enable_server_cache', True, 'SECURITYGROUP')
+        cfg.CONF.set_override('agent_heartbeat_flush_interval', 10)
+
+    def test_process_local_state_disabled_with_workers(self):
+        cfg.CONF.set_override('api_workers', 2)
+        service._check_api_workers_options()
+        self.assertFalse(cfg.CONF.SECURITYGROUP.enable_server_cache)
+        self.assertEqual(cfg.CONF.agent_heartbeat_flush_interval, 0)
+
+    def test_process_local_state_kept_without_workers(self):
+        service._check_api_workers_options()
+        self.assertTrue(cfg.CONF.SECURITYGROUP.enable_server_cache)
+        self.assertEqual(cfg.CONF.agent_heartbeat_flush_interval, 10)
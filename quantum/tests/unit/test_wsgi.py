@@ -81,6 +81,32 @@ class TestWSGIServer(unittest.TestCase):
                             mock_listen.return_value)
                     ])
 
+    def test_start_workers(self):
+        server = wsgi.Server("test_workers")
+        with mock.patch.object(wsgi.common_service,
+                               'ProcessLauncher') as launcher_cls:
+            with mock.patch.object(wsgi.api, 'dispose') as dispose:
+                with mock.patch.object(wsgi.rpc, 'cleanup') as cleanup:
+                    server.start(None, 0, host="127.0.0.1", workers=2)
+                    dispose.assert_called_once_with()
+                    cleanup.assert_called_once_with()
+        launcher = launcher_cls.return_value
+        self.assertEqual(launcher.launch_service.call_count, 1)
+        worker, = launcher.launch_service.call_args[0]
+        self.assertEqual(launcher.launch_service.call_args[1],
+                         {'workers': 2})
+        self.assertIsNone(server._server)
+
+        with mock.patch.object(server, 'pool') as mock_pool:
+            worker.start()
+            mock_pool.spawn.assert_called_once_with(server._run, None,
+                                                    server._socket)
+            worker.stop()
+            mock_pool.spawn.return_value.kill.assert_called_once_with()
+        server.wait()
+        launcher.wait.assert_called_once_with()
+        server._socket.close()
+
 
 class SerializerTest(unittest.TestCase):
     def test_serialize_unknown_content_type(self):
@@ -371,3 +397,22 @@ class XMLDictSerializerTest(unittest.TestCase):
         deserializer = wsgi.XMLDeserializer(attributes.get_attr_metadata())
         new_data = deserializer.deserialize(result)['body']
         self.assertEqual(data, new_data)
+
+
+class JSONDictSerializerTest(unittest.TestCase):
+    def test_serialize_iter(self):
+        serializer = wsgi.JSONDictSerializer()
+        serializer.chunk_size = 32
+        data = {'networks': [{'id': str(i), 'name': 'net%d' % i}
+                             for i in range(10)],
+                'networks_links': [{'rel': 'next', 'href': 'x'}],
+                'count': 10}
+        chunks = list(serializer.serialize_iter(data))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), serializer.serialize(data))
+
+    def test_serialize_iter_empty_list(self):
+        serializer = wsgi.JSONDictSerializer()
+        data = {'networks': []}
+        self.assertEqual(''.join(serializer.serialize_iter(data)),
+                         serializer.serialize(data))
@@ -32,8 +32,11 @@ import webob.exc
 from quantum.common import constants
 from quantum.common import exceptions as exception
 from quantum import context
+from quantum.db import api
 from quantum.openstack.common import jsonutils
 from quantum.openstack.common import log as logging
+from quantum.openstack.common import rpc
+from quantum.openstack.common import service as common_service
 
 LOG = logging.getLogger(__name__)
 
@@ -44,15 +47,48 @@ def run_server(application, port):
     eventlet.wsgi.server(sock, application)
 
 
+class WorkerService(object):
+    """Serves an application on the socket of a server in a worker process.
+
+    The worker is started by a ProcessLauncher once forked.
+    """
+
+    def __init__(self, service, application):
+        self._service = service
+        self._application = application
+        self._server = None
+
+    def start(self):
+        self._server = self._service.pool.spawn(self._service._run,
+                                                self._application,
+                                                self._service._socket)
+
+    def wait(self):
+        self._service.pool.waitall()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.kill()
+            self._server = None
+
+
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications."""
 
     def __init__(self, name, threads=1000):
         self.pool = eventlet.GreenPool(threads)
         self.name = name
+        self._server = None
+        self._launcher = None
 
-    def start(self, application, port, host='0.0.0.0', backlog=128):
-        """Run a WSGI server with the given application."""
+    def start(self, application, port, host='0.0.0.0', backlog=128,
+              workers=0):
+        """Run a WSGI server with the given application.
+
+        With workers > 0, the application is served by that many forked
+        processes accepting connections on the same socket. The parent
+        process keeps its RPC consumers and restarts the workers which die.
+        """
         self._host = host
         self._port = port
 
@@ -75,7 +111,17 @@ class Server(object):
                           {'host': host, 'port': port})
             sys.exit(1)
 
-        self._server = self.pool.spawn(self._run, application, self._socket)
+        if workers < 1:
+            self._server = self.pool.spawn(self._run, application,
+                                           self._socket)
+        else:
+            # The pooled database and messaging connections must not be
+            # shared with the workers, each of them opens its own on demand
+            api.dispose()
+            rpc.cleanup()
+            self._launcher = common_service.ProcessLauncher()
+            self._launcher.launch_service(WorkerService(self, application),
+                                          workers=workers)
 
     @property
     def host(self):
@@ -86,12 +132,16 @@ class Server(object):
         return self._socket.getsockname()[1] if self._socket else self._port
 
     def stop(self):
-        self._server.kill()
+        if self._server is not None:
+            self._server.kill()
 
     def wait(self):
         """Wait until all servers have completed running."""
         try:
-            self.pool.waitall()
+            if self._launcher:
+                self._launcher.wait()
+            else:
+                self.pool.waitall()
         except KeyboardInterrupt:
             pass
 
@@ -227,6 +277,10 @@ class DictSerializer(ActionDispatcher):
     def serialize(self, data, action='default'):
         return self.dispatch(data, action=action)
 
+    def serialize_iter(self, data, action='default'):
+        """Serialize data into an iterable of strings."""
+        return [self.serialize(data, action)]
+
     def default(self, data):
         return ""
 
@@ -234,9 +288,53 @@ class DictSerializer(ActionDispatcher):
 class JSONDictSerializer(DictSerializer):
     """Default JSON request body serialization"""
 
+    # size of the strings serialize_iter emits
+    chunk_size = 65536
+
     def default(self, data):
         return jsonutils.dumps(data)
 
+    def serialize_iter(self, data, action='default'):
+        """Serialize data into JSON text emitted in chunks.
+
+        The items of the lists of a collection are encoded one at a time,
+        so that the text of a large collection never is in memory at once.
+        The text is the same as the one serialize returns.
+        """
+        chunk = []
+        size = 0
+        for part in self._iterencode(data):
+            chunk.append(part)
+            size += len(part)
+            if size >= self.chunk_size:
+                yield ''.join(chunk)
+                chunk = []
+                size = 0
+        if chunk:
+            yield ''.join(chunk)
+
+    def _iterencode(self, data):
+        # json.JSONEncoder.iterencode would only use the pure python
+        # encoder, every item is encoded by the C one instead
+        if not isinstance(data, dict):
+            yield self.default(data)
+            return
+        yield '{'
+        for i, (key, value) in enumerate(data.iteritems()):
+            if i:
+                yield ', '
+            yield '%s: ' % self.default(key)
+            if isinstance(value, list):
+                yield '['
+                for j, item in enumerate(value):
+                    if j:
+                        yield ', '
+                    yield self.default(item)
+                yield ']'
+            else:
+                yield self.default(value)
+        yield '}'
+
 
 class XMLDictSerializer(DictSerializer):
 
@@ -23,7 +23,7 @@ depend_links = setup.parse_dependency_links()
 if sys.platform == 'win32':
     requires.append('pywin32')
     requires.append('wmi')
-    requires.remove('pyudev')
+    requires.remove('pyudev>=0.16')
 
 Name = 'quantum'
 Url = "https://launchpad.net/quantum"
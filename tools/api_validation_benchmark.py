@@ -0,0 +1,90 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the validation of bulk port create requests.
+
+Runs the body of a bulk create of ports with fixed IPs through
+Controller.prepare_request_body, with and without the fast paths of the
+UUID, MAC and IPv4 validators, and reports the ports validated per second.
+For example:
+
+    python tools/api_validation_benchmark.py --ports 1000 --ports 10000
+"""
+
+import argparse
+import sys
+import time
+
+from quantum.api.v2 import attributes
+from quantum.api.v2 import base
+from quantum import context
+
+
+NETWORK_ID = '2d9fe5f9-4fd4-4bb9-9b2c-ebd2d6a87b70'
+SUBNET_ID = '7d3e3b55-8d7e-4b1a-8f62-4c9f0e0c1c3a'
+TENANT_ID = 'b8c6e1c2a7e44d8a9e1a4d6e4c1f3b5a'
+
+
+def _make_body(ports):
+    return {'ports': [{'network_id': NETWORK_ID,
+                       'tenant_id': TENANT_ID,
+                       'name': 'port%d' % i,
+                       'admin_state_up': True,
+                       'mac_address': 'fa:16:3e:%02x:%02x:%02x' % (
+                           i >> 16, (i >> 8) & 0xff, i & 0xff),
+                       'fixed_ips': [{'subnet_id': SUBNET_ID,
+                                      'ip_address': '10.%d.%d.%d' % (
+                                          i >> 16, (i >> 8) & 0xff,
+                                          i & 0xff)}],
+                       'device_id': '',
+                       'device_owner': ''}
+                      for i in xrange(ports)]}
+
+
+def run(name, ports):
+    ctx = context.get_admin_context()
+    attr_info = attributes.RESOURCE_ATTRIBUTE_MAP['ports']
+    validators = attributes.compile_validators(attr_info)
+    body = _make_body(ports)
+
+    start = time.time()
+    base.Controller.prepare_request_body(ctx, body, True, 'port', attr_info,
+                                         allow_bulk=True,
+                                         validators=validators)
+    elapsed = time.time() - start
+
+    print ("%-12s ports=%-7d validate=%7.2fs (%8.0f/s)" %
+           (name, ports, elapsed, ports / elapsed))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', type=int, action='append',
+                        help='number of ports in the bulk request')
+    args = parser.parse_args(argv)
+    fast_match = attributes._is_fast_match
+    for ports in args.ports or [1000, 10000]:
+        run('fast paths', ports)
+        attributes._is_fast_match = lambda regex, data: False
+        try:
+            run('parsers', ports)
+        finally:
+            attributes._is_fast_match = fast_match
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compare the IPAM drivers of the DB plugin.
+
+Allocates the requested number of addresses from a single subnet with each
+driver, then returns them all as expired allocations, and reports the time
+spent and the number of availability ranges left behind. Contention between
+concurrent allocations only shows up against a real database server, see
+--connection. For example:
+
+    python tools/ipam_benchmark.py --ports 10000 --ports 100000
+"""
+
+import argparse
+import sys
+import time
+
+import netaddr
+from oslo.config import cfg
+
+from quantum.common import config  # noqa
+from quantum import context
+from quantum.db import api as db
+from quantum.db import ipam
+from quantum.db import models_v2
+
+
+DRIVERS = ['quantum.db.ipam.RangeTableIpamDriver',
+           'quantum.db.ipam.ShardedRangeIpamDriver']
+
+
+def _create_subnet(ctx, ports):
+    prefixlen = 32 - (ports + 2).bit_length()
+    cidr = netaddr.IPNetwork('10.0.0.0/%d' % prefixlen)
+    with ctx.session.begin():
+        network = models_v2.Network(name='bench', admin_state_up=True,
+                                    status='ACTIVE', shared=False)
+        ctx.session.add(network)
+        ctx.session.flush()
+        subnet = models_v2.Subnet(network_id=network.id, ip_version=4,
+                                  cidr=str(cidr), enable_dhcp=False,
+                                  shared=False)
+        ctx.session.add(subnet)
+        ctx.session.flush()
+        pool = models_v2.IPAllocationPool(subnet_id=subnet.id,
+                                          first_ip=str(cidr[1]),
+                                          last_ip=str(cidr[-2]))
+        ctx.session.add(pool)
+        ctx.session.flush()
+        ctx.session.add(models_v2.IPAvailabilityRange(
+            allocation_pool_id=pool.id,
+            first_ip=str(cidr[1]),
+            last_ip=str(cidr[-2])))
+    return {'id': subnet.id, 'cidr': subnet.cidr,
+            'network_id': subnet.network_id}
+
+
+def _count_ranges(ctx):
+    return ctx.session.query(models_v2.IPAvailabilityRange).count()
+
+
+def run(driver_name, ports):
+    cfg.CONF.set_override('ipam_driver', driver_name)
+    db.configure_db()
+    ctx = context.get_admin_context()
+    subnet = _create_subnet(ctx, ports)
+    driver = ipam.get_driver()
+
+    start = time.time()
+    ips = []
+    for i in xrange(ports):
+        with ctx.session.begin():
+            ips.append(driver.generate_ip(ctx, [subnet])['ip_address'])
+    allocate_time = time.time() - start
+    ranges = _count_ranges(ctx)
+
+    start = time.time()
+    with ctx.session.begin():
+        driver.release_ips(ctx, subnet['id'], ips)
+    release_time = time.time() - start
+
+    print ("%-42s ports=%-7d allocate=%8.2fs (%6.0f/s) ranges=%-6d "
+           "release=%6.2fs" % (driver_name, ports, allocate_time,
+                               ports / allocate_time, ranges, release_time))
+    db.clear_db()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ports', type=int, action='append',
+                        help='number of addresses to allocate')
+    parser.add_argument('--connection', default='sqlite://',
+                        help='database connection to run against')
+    args = parser.parse_args(argv)
+    cfg.CONF(args=[], project='quantum')
+    cfg.CONF.set_override('sql_connection', args.connection, 'DATABASE')
+    for ports in args.ports or [10000, 100000]:
+        for driver_name in DRIVERS:
+            run(driver_name, ports)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
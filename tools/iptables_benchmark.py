@@ -0,0 +1,115 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2013 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Measure the cost of applying a large iptables rule set.
+
+Spreads the requested number of rules over per port chains, the way the
+security group firewall does, and times the initial apply, an apply after
+changing a single port, and an apply with nothing changed. iptables-save
+and iptables-restore are simulated in memory, so only the time spent in
+IptablesManager is measured and no privileges are needed. For example:
+
+    python tools/iptables_benchmark.py --rules 10000 --rules-per-port 50
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+
+from oslo.config import cfg
+
+from quantum.agent.linux import iptables_manager
+from quantum.common import config  # noqa
+
+
+class FakeIptables(object):
+    """Keeps the tables restored by the manager and dumps them back."""
+
+    def __init__(self):
+        self.tables = {}
+        self.calls = 0
+
+    def execute(self, args, process_input=None, root_helper=None):
+        self.calls += 1
+        if args[0].endswith('-save'):
+            table = args[2]
+            return '\n'.join(['*%s' % table] +
+                             self.tables.get(table, []) + ['COMMIT'])
+        lines = process_input.split('\n')
+        self.tables[lines[0][1:]] = lines[1:-1]
+
+
+def _add_port(table, port, rules_per_port):
+    chain = 'port-%d' % port
+    table.add_chain(chain)
+    table.add_rule('FORWARD', '-m physdev --physdev-out tap%d -j $%s' %
+                   (port, chain))
+    for i in xrange(rules_per_port):
+        table.add_rule(chain, '-p tcp -m tcp --dport %d -j RETURN' %
+                       (1024 + i))
+    table.add_rule(chain, '-j DROP')
+
+
+def _timed(func, *args):
+    start = time.time()
+    func(*args)
+    return time.time() - start
+
+
+def run(rules, rules_per_port):
+    fake = FakeIptables()
+    manager = iptables_manager.IptablesManager(_execute=fake.execute,
+                                               state_less=True)
+    table = manager.ipv4['filter']
+    ports = max(rules / rules_per_port, 1)
+
+    def build():
+        for port in xrange(ports):
+            _add_port(table, port, rules_per_port)
+        manager.apply()
+
+    def change_port():
+        table.remove_chain('port-0')
+        _add_port(table, 0, rules_per_port)
+        manager.apply()
+
+    results = [('initial apply', _timed(build))]
+    calls = fake.calls
+    results.append(('update one port', _timed(change_port)))
+    results.append(('apply unchanged', _timed(manager.apply)))
+    print "rules=%d ports=%d" % (len(table.rules), ports)
+    for name, seconds in results:
+        print "  %-16s %8.3fs" % (name, seconds)
+    print "  commands run after the initial apply: %d" % (fake.calls - calls)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rules', type=int, action='append',
+                        help='number of rules to install')
+    parser.add_argument('--rules-per-port', type=int, default=50,
+                        help='number of rules in each port chain')
+    args = parser.parse_args(argv)
+    cfg.CONF(args=[], project='quantum')
+    cfg.CONF.set_override('lock_path', tempfile.mkdtemp())
+    for rules in args.rules or [10000]:
+        run(rules, args.rules_per_port)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])